@@ -675,6 +675,18 @@ class CacheConfig:
         cache_dtype: Data type for kv cache storage.
         num_gpu_blocks_override: Number of GPU blocks to use. This overrides the
             profiled num_gpu_blocks if specified. Does nothing if None.
+        prefix_cache_eviction_policy: The policy used to evict unused blocks
+            from the prefix cache. One of "lru", "lfu" and "cost_aware".
+        kv_offload_cpu_gb: Size of the pinned CPU pool (in GiB) that blocks
+            evicted from the GPU prefix cache are demoted to.
+        kv_offload_disk_gb: Size of the file (in GiB) that blocks evicted
+            from the CPU pool are demoted to.
+        kv_offload_disk_path: Directory of the file backing the disk tier.
+        prefix_cache_snapshot_path: Directory that the prefix cache is saved
+            to on shutdown and restored from on startup.
+        prefix_cache_snapshot_max_blocks: The maximum number of the most
+            recently used blocks saved per pipeline stage. Saves all of them
+            if None.
     """
 
     def __init__(
@@ -688,6 +700,12 @@ class CacheConfig:
         sliding_window: Optional[int] = None,
         enable_prefix_caching: bool = False,
         cpu_offload_gb: float = 0.0,
+        prefix_cache_eviction_policy: str = "lru",
+        kv_offload_cpu_gb: float = 0.0,
+        kv_offload_disk_gb: float = 0.0,
+        kv_offload_disk_path: Optional[str] = None,
+        prefix_cache_snapshot_path: Optional[str] = None,
+        prefix_cache_snapshot_max_blocks: Optional[int] = None,
     ) -> None:
         self.block_size = block_size
         self.gpu_memory_utilization = gpu_memory_utilization
@@ -698,13 +716,23 @@ class CacheConfig:
         self.sliding_window = sliding_window
         self.enable_prefix_caching = enable_prefix_caching
         self.cpu_offload_gb = cpu_offload_gb
+        self.prefix_cache_eviction_policy = prefix_cache_eviction_policy
+        self.kv_offload_cpu_bytes = kv_offload_cpu_gb * GiB_bytes
+        self.kv_offload_disk_bytes = kv_offload_disk_gb * GiB_bytes
+        self.kv_offload_disk_path = kv_offload_disk_path
+        self.prefix_cache_snapshot_path = prefix_cache_snapshot_path
+        self.prefix_cache_snapshot_max_blocks = prefix_cache_snapshot_max_blocks
         self._verify_args()
         self._verify_cache_dtype()
         self._verify_prefix_caching()
+        self._verify_kv_offload()
 
         # Will be set after profiling.
         self.num_gpu_blocks = None
         self.num_cpu_blocks = None
+        # Will be set by init_kv_offload_blocks().
+        self.num_kv_offload_cpu_blocks = 0
+        self.num_kv_offload_disk_blocks = 0
 
     def metrics_info(self):
         # convert cache_config to dict(key: str, value: str) for prometheus
@@ -716,6 +744,22 @@ class CacheConfig:
             raise ValueError(
                 "GPU memory utilization must be less than 1.0. Got "
                 f"{self.gpu_memory_utilization}.")
+        if self.prefix_cache_eviction_policy not in ("lru", "lfu",
+                                                     "cost_aware"):
+            raise ValueError(
+                "Unknown prefix cache eviction policy: "
+                f"{self.prefix_cache_eviction_policy}. Must be one of "
+                "'lru', 'lfu' or 'cost_aware'.")
+        if (self.prefix_cache_snapshot_path is not None
+                and not self.enable_prefix_caching):
+            raise ValueError(
+                "Prefix cache snapshots require prefix caching to be "
+                "enabled.")
+        if (self.prefix_cache_snapshot_max_blocks is not None
+                and self.prefix_cache_snapshot_max_blocks < 0):
+            raise ValueError(
+                "prefix_cache_snapshot_max_blocks must be non-negative. Got "
+                f"{self.prefix_cache_snapshot_max_blocks}.")
 
     def _verify_cache_dtype(self) -> None:
         if self.cache_dtype == "auto":
@@ -729,6 +773,31 @@ class CacheConfig:
         else:
             raise ValueError(f"Unknown kv cache dtype: {self.cache_dtype}")
 
+    def _verify_kv_offload(self) -> None:
+        if self.kv_offload_cpu_bytes <= 0:
+            if self.kv_offload_disk_bytes > 0:
+                raise ValueError(
+                    "The KV offload disk tier requires a CPU tier. Set "
+                    "kv_offload_cpu_gb as well.")
+            return
+
+        if not self.enable_prefix_caching:
+            raise ValueError(
+                "KV cache offloading requires prefix caching to be enabled.")
+        if self.kv_offload_disk_bytes > 0 and not self.kv_offload_disk_path:
+            raise ValueError(
+                "kv_offload_disk_path must be set to use the KV offload disk "
+                "tier.")
+
+    def init_kv_offload_blocks(self, cache_block_size: int) -> None:
+        """Sets the number of blocks in the KV offload tiers, given the size
+        of a cache block in bytes. The engine and the workers call this with
+        the same block size so that they agree on the tier sizes."""
+        self.num_kv_offload_cpu_blocks = int(self.kv_offload_cpu_bytes //
+                                             cache_block_size)
+        self.num_kv_offload_disk_blocks = int(self.kv_offload_disk_bytes //
+                                              cache_block_size)
+
     def _verify_prefix_caching(self) -> None:
         if not self.enable_prefix_caching:
             return
@@ -778,17 +847,22 @@ class TokenizerPoolConfig:
 
     Args:
         pool_size: Number of tokenizer workers in the pool.
-        pool_type: Type of the pool.
+        pool_type: Type of the pool. "ray" for Ray actors, "mp" for local
+            worker processes.
         extra_config: Additional config for the pool.
             The way the config will be used depends on the
-            pool type.
+            pool type. For "ray", the options of the Ray actors. For "mp",
+            "max_queue_size", the number of prompts that can wait for a
+            free worker (defaults to pool_size), and "shm_min_tokens", the
+            number of tokens from which token ids are returned through
+            shared memory (defaults to 1024).
     """
     pool_size: int
     pool_type: Union[str, Type["BaseTokenizerGroup"]]
     extra_config: dict
 
     def __post_init__(self):
-        if self.pool_type not in ("ray", ) and not isinstance(
+        if self.pool_type not in ("ray", "mp") and not isinstance(
                 self.pool_type, type):
             raise ValueError(f"Unknown pool type: {self.pool_type}")
         if not isinstance(self.extra_config, dict):
@@ -1045,6 +1119,18 @@ class SchedulerConfig:
             workers instead of an entire data. It should be enabled only
             when SPMD worker architecture is enabled. I.e.,
             APHRODITE_USE_RAY_SPMD_WORKER=1
+        policy: The scheduling policy used to order the waiting, running
+            and swapped queues. One of "fcfs" (first come, first served),
+            "priority" (lower request priority first), "edf" (earliest
+            request deadline first) or "fair" (weighted fair share across
+            LoRA adapters).
+        detokenizer_pool_size: Number of threads that detokenize the tokens
+            of a step while the next step runs, each with its own copy of
+            the tokenizer. Stop strings are then matched one step late. 0
+            detokenizes on the engine thread.
+        async_output_proc: Whether to process the outputs of a step while the
+            model runs the next step. Stop strings then take effect one step
+            late, and so do aborts.
     """
 
     def __init__(self,
@@ -1059,7 +1145,10 @@ class SchedulerConfig:
                  embedding_mode: Optional[bool] = False,
                  preemption_mode: Optional[str] = None,
                  num_scheduler_steps: int = 1,
-                 send_delta_data: bool = False) -> None:
+                 send_delta_data: bool = False,
+                 policy: str = "fcfs",
+                 detokenizer_pool_size: int = 0,
+                 async_output_proc: bool = False) -> None:
         if max_num_batched_tokens is not None:
             self.max_num_batched_tokens = max_num_batched_tokens
         else:
@@ -1093,6 +1182,9 @@ class SchedulerConfig:
         self.preemption_mode = preemption_mode
         self.num_scheduler_steps = num_scheduler_steps
         self.send_delta_data = send_delta_data
+        self.policy = policy
+        self.detokenizer_pool_size = detokenizer_pool_size
+        self.async_output_proc = async_output_proc
 
         self._verify_args()
 
@@ -1125,6 +1217,12 @@ class SchedulerConfig:
                 f"({self.num_scheduler_steps}) must be greater than or "
                 "equal to 1.")
 
+        if self.detokenizer_pool_size < 0:
+            raise ValueError(
+                "detokenizer_pool_size "
+                f"({self.detokenizer_pool_size}) must be greater than or "
+                "equal to 0.")
+
     @property
     def is_multi_step(self) -> bool:
         return self.num_scheduler_steps > 1
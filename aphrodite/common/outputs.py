@@ -4,6 +4,7 @@ from typing import List, Optional
 from typing import Sequence as GenericSequence
 from typing import Union
 
+from aphrodite.common.sampling_params import RequestOutputKind
 from aphrodite.common.sequence import (PromptLogprobs, RequestMetrics,
                                        SampleLogprobs, SequenceGroup,
                                        SequenceStatus)
@@ -137,23 +138,31 @@ class RequestOutput:
         # logprobs are not requested.
         include_logprobs = seq_group.sampling_params.logprobs is not None
         text_buffer_length = seq_group.sampling_params.output_text_buffer_length
-        outputs = [
-            CompletionOutput(
-                seqs.index(seq),
-                seq.get_output_text_to_return(text_buffer_length),
-                seq.data._output_token_ids,
-                seq.get_cumulative_logprob() if include_logprobs else None,
-                seq.output_logprobs if include_logprobs else None,
-                SequenceStatus.get_finished_reason(seq.status),
-                seq.stop_reason) for seq in top_n_seqs
-        ]
+        delta = (seq_group.sampling_params.output_kind ==
+                 RequestOutputKind.DELTA)
+        outputs = []
+        for seq in top_n_seqs:
+            output_token_ids = seq.get_output_token_ids_to_return(delta)
+            output_logprobs = seq.output_logprobs if include_logprobs else None
+            if delta and output_logprobs is not None:
+                output_logprobs = output_logprobs[len(output_logprobs) -
+                                                  len(output_token_ids):]
+            outputs.append(
+                CompletionOutput(
+                    seqs.index(seq),
+                    seq.get_output_text_to_return(text_buffer_length, delta),
+                    output_token_ids,
+                    seq.get_cumulative_logprob() if include_logprobs else None,
+                    output_logprobs,
+                    SequenceStatus.get_finished_reason(seq.status),
+                    seq.stop_reason))
 
         # Every sequence in the sequence group should have the same prompt.
         prompt = seq_group.prompt
         prompt_token_ids = seq_group.prompt_token_ids
         encoder_prompt = seq_group.encoder_prompt
         encoder_prompt_token_ids = seq_group.encoder_prompt_token_ids
-        prompt_logprobs = seq_group.prompt_logprobs
+        prompt_logprobs = seq_group.get_prompt_logprobs_to_return(delta)
         finished = seq_group.is_finished()
         finished_time = time.time() if finished else None
         seq_group.set_finished_time(finished_time)
@@ -23,6 +23,13 @@ class SamplingType(IntEnum):
     RANDOM_SEED = 2
     BEAM = 3
 
+
+class RequestOutputKind(IntEnum):
+    # Every output holds all the tokens generated so far.
+    CUMULATIVE = 0
+    # Every output only holds the tokens generated since the previous one.
+    DELTA = 1
+
 class SamplerID(IntEnum):
     # Mirror these in aphrodite/modeling/layers/sampler.py
     # Values out of order to keep backwards compatibility
@@ -163,6 +170,12 @@ class SamplingParams(
         stop_token_ids: List of tokens that stop the generation when they are
             generated. The returned output will contain the stop tokens unless
             the stop tokens are special tokens.
+        stop_token_sequences: List of token id sequences that stop the
+            generation when they are generated. They are matched on the
+            output token ids, so they also work with detokenize=False. The
+            returned output text will not contain their text unless
+            include_stop_str_in_output is True, and the stop reason is the
+            last token id of the sequence.
         include_stop_str_in_output: Whether to include the stop strings in
             output text. Defaults to False.
         ignore_eos: Whether to ignore the EOS token and continue generating
@@ -222,6 +235,16 @@ class SamplingParams(
             tokens. Defaults to 0 (disabled).
         sampler_priority: A list of integers to control the order in which
             samplers are applied.
+        priority: Scheduling priority of the request. Requests with a lower
+            value are scheduled first when the scheduler runs with the
+            "priority" policy. Defaults to 0.
+        deadline: Time budget in seconds, counted from the arrival of the
+            request, by which it should be scheduled. Used by the "edf"
+            scheduling policy. Defaults to None (no deadline).
+        output_kind: Whether each output of the request holds all the
+            tokens, text and logprobs generated so far (CUMULATIVE), or only
+            those generated since the previous output (DELTA). Not
+            supported with beam search. Defaults to CUMULATIVE.
     """
 
     n: int = 1
@@ -251,6 +274,7 @@ class SamplingParams(
     early_stopping: Union[bool, str] = False
     stop: Union[None, str, List[str]] = None
     stop_token_ids: Optional[List[int]] = None
+    stop_token_sequences: Optional[List[List[int]]] = None
     include_stop_str_in_output: bool = False
     ignore_eos: bool = False
     max_tokens: Optional[int] = 16
@@ -276,6 +300,9 @@ class SamplingParams(
     dry_range: int = 0
     skew: float = 0.0
     sampler_priority: Optional[List[int]] = []
+    priority: int = 0
+    deadline: Optional[float] = None
+    output_kind: RequestOutputKind = RequestOutputKind.CUMULATIVE
     # The below fields are not supposed to be used as an input.
     # They are set in post_init.
     output_text_buffer_length: int = 0
@@ -309,6 +336,7 @@ class SamplingParams(
         "early_stopping": False,
         "stop": [],
         "stop_token_ids": [],
+        "stop_token_sequences": [],
         "ignore_eos": False,
         "max_tokens": 16,
         "min_tokens": 0,
@@ -330,6 +358,9 @@ class SamplingParams(
         "dry_range": 0,
         "skew": 0.0,
         "sampler_priority": [],
+        "priority": 0,
+        "deadline": None,
+        "output_kind": RequestOutputKind.CUMULATIVE,
     }
 
     def __post_init__(self) -> None:
@@ -354,6 +385,13 @@ class SamplingParams(
             self.stop_token_ids = []
         else:
             self.stop_token_ids = list(self.stop_token_ids)
+        if self.stop_token_sequences is None:
+            self.stop_token_sequences = []
+        else:
+            self.stop_token_sequences = [
+                list(stop_token_sequence)
+                for stop_token_sequence in self.stop_token_sequences
+            ]
         self.logprobs = 1 if self.logprobs is True else self.logprobs
         self.prompt_logprobs = (1 if self.prompt_logprobs is True else
                                 self.prompt_logprobs)
@@ -447,6 +485,11 @@ class SamplingParams(
         assert isinstance(self.stop, list)
         if any(not stop_str for stop_str in self.stop):
             raise ValueError("stop cannot contain an empty string.")
+        assert isinstance(self.stop_token_sequences, list)
+        if any(not stop_token_sequence
+               for stop_token_sequence in self.stop_token_sequences):
+            raise ValueError(
+                "stop_token_sequences cannot contain an empty sequence.")
         if self.stop and not self.detokenize:
             raise ValueError(
                 "stop strings are only supported when detokenize is True. "
@@ -483,6 +526,9 @@ class SamplingParams(
             raise ValueError(
                 "skew must be non-negative, got "
                 f"{self.skew}.")
+        if self.deadline is not None and self.deadline <= 0.0:
+            raise ValueError(
+                f"deadline must be positive, got {self.deadline}.")
         
         if self.sampler_priority is not None:
             if not self.sampler_priority:
@@ -526,6 +572,10 @@ class SamplingParams(
             raise ValueError(
                 f"early_stopping must be True, False, or 'never', "
                 f"got {self.early_stopping}.")
+        if self.output_kind == RequestOutputKind.DELTA:
+            raise ValueError(
+                "Delta outputs are not supported with beam search, which "
+                "rewrites its beams.")
 
     def _verify_non_beam_search(self) -> None:
         if self.early_stopping is not False:
@@ -4,6 +4,7 @@ import enum
 from abc import ABC, abstractmethod
 from array import array
 from collections import defaultdict
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import (TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple,
                     Union, cast)
@@ -38,11 +39,145 @@ class Logprob:
     decoded_token: Optional[str] = None
 
 
+# Array types of the columns of FlatLogprobs. They differ from
+# APHRODITE_TOKEN_ID_ARRAY_TYPE, which is serialized as raw bytes.
+_OFFSET_ARRAY_TYPE = "q"
+_LOGPROB_TOKEN_ID_ARRAY_TYPE = "i"
+_LOGPROB_ARRAY_TYPE = "d"
+
+
+class FlatLogprobs(msgspec.Struct, eq=False, omit_defaults=True):
+    """The logprobs of consecutive token positions in flat arrays.
+
+    Behaves like a list with a {token_id -> logprob} dict or None per
+    position, but the dicts and their Logprob objects are only created when
+    a position is accessed, e.g. when a response is serialized, so that
+    long-lived logprobs cost a few bytes per entry instead of several Python
+    objects. The entries of position i are at offsets[i]:offsets[i + 1] of
+    the other columns. A position without entries reads as None, and a
+    token that occurs twice in a position takes the values of its last
+    entry.
+
+    The columns are arrays, and a rank of 0 stands for None. They are
+    declared as lists, which is how they are serialized, and converted back
+    to arrays when decoded.
+    """
+    offsets: List[int] = msgspec.field(
+        default_factory=lambda: array(_OFFSET_ARRAY_TYPE, [0]))
+    token_ids: List[int] = msgspec.field(
+        default_factory=lambda: array(_LOGPROB_TOKEN_ID_ARRAY_TYPE))
+    logprobs: List[float] = msgspec.field(
+        default_factory=lambda: array(_LOGPROB_ARRAY_TYPE))
+    ranks: List[int] = msgspec.field(
+        default_factory=lambda: array(_LOGPROB_TOKEN_ID_ARRAY_TYPE))
+    decoded_tokens: List[Optional[str]] = msgspec.field(
+        default_factory=list)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.offsets, array):
+            self.offsets = array(_OFFSET_ARRAY_TYPE, self.offsets)
+        if not isinstance(self.token_ids, array):
+            self.token_ids = array(_LOGPROB_TOKEN_ID_ARRAY_TYPE,
+                                   self.token_ids)
+        if not isinstance(self.logprobs, array):
+            self.logprobs = array(_LOGPROB_ARRAY_TYPE, self.logprobs)
+        if not isinstance(self.ranks, array):
+            self.ranks = array(_LOGPROB_TOKEN_ID_ARRAY_TYPE,
+                               [rank or 0 for rank in self.ranks])
+
+    def append(self, position_logprobs: Optional[Dict[int, Logprob]]) -> None:
+        if position_logprobs:
+            for token_id, logprob in position_logprobs.items():
+                self.token_ids.append(token_id)
+                self.logprobs.append(logprob.logprob)
+                self.ranks.append(logprob.rank or 0)
+                self.decoded_tokens.append(logprob.decoded_token)
+        self.offsets.append(len(self.token_ids))
+
+    def extend(self, other: "PromptLogprobs") -> None:
+        if not isinstance(other, FlatLogprobs):
+            for position_logprobs in other:
+                self.append(position_logprobs)
+            return
+        num_entries = len(self.token_ids)
+        first = other.offsets[0]
+        self.offsets.extend(num_entries + offset - first
+                            for offset in other.offsets[1:])
+        self.token_ids.extend(other.token_ids)
+        self.logprobs.extend(other.logprobs)
+        self.ranks.extend(other.ranks)
+        self.decoded_tokens.extend(other.decoded_tokens)
+
+    def get_entries(self, index: int) -> slice:
+        """The entries of a position, as a slice of the columns."""
+        return slice(self.offsets[index], self.offsets[index + 1])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                sliced = FlatLogprobs()
+                sliced.extend(self[i] for i in range(start, stop, step))
+                return sliced
+            stop = max(start, stop)
+            first, last = self.offsets[start], self.offsets[stop]
+            offsets = self.offsets[start:stop + 1]
+            if first:
+                offsets = array(_OFFSET_ARRAY_TYPE,
+                                [offset - first for offset in offsets])
+            return FlatLogprobs(offsets, self.token_ids[first:last],
+                                self.logprobs[first:last],
+                                self.ranks[first:last],
+                                self.decoded_tokens[first:last])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("FlatLogprobs index out of range")
+        first, last = self.offsets[index], self.offsets[index + 1]
+        if first == last:
+            return None
+        return {
+            self.token_ids[i]:
+            Logprob(self.logprobs[i], self.ranks[i] or None,
+                    self.decoded_tokens[i])
+            for i in range(first, last)
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __add__(self, other: "PromptLogprobs") -> "FlatLogprobs":
+        result = self[:]
+        result.extend(other)
+        return result
+
+    def __radd__(self, other: "PromptLogprobs") -> "FlatLogprobs":
+        result = FlatLogprobs()
+        result.extend(other)
+        result.extend(self)
+        return result
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (FlatLogprobs, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"FlatLogprobs({list(self)})"
+
+
 # {token_id -> logprob} per each sequence group. None if the corresponding
-# sequence group doesn't require prompt logprob.
-PromptLogprobs = List[Optional[Dict[int, Logprob]]]
-# {token_id -> logprob} for each sequence group.
-SampleLogprobs = List[Dict[int, Logprob]]
+# sequence group doesn't require prompt logprob. The sampler returns them as
+# FlatLogprobs.
+PromptLogprobs = Union[FlatLogprobs, List[Optional[Dict[int, Logprob]]]]
+# {token_id -> logprob} for each sequence group. Sequences store them as
+# FlatLogprobs.
+SampleLogprobs = Union[FlatLogprobs, List[Dict[int, Logprob]]]
 
 
 class SequenceStatus(enum.IntEnum):
@@ -117,8 +252,47 @@ class SequenceDataDelta(
     # overwriting existing `stage`
     new_stage: SequenceStage
 
+class NGramIndex:
+    """The tokens that followed each (n - 1)-gram of a sequence, to ban the
+    tokens that would repeat an n-gram (no_repeat_ngram_size).
+
+    The index is extended with the new tokens of the sequence, so that
+    looking up the banned tokens of a step does not depend on the length of
+    the sequence.
+    """
+
+    def __init__(self, ngram_size: int):
+        assert ngram_size > 0
+        self.ngram_size = ngram_size
+        # The number of tokens of the sequence already indexed.
+        self.num_tokens = 0
+        self._next_tokens: Dict[Tuple[int, ...], Set[int]] = {}
+
+    def update(self, token_ids: List[int]) -> None:
+        """Indexes the n-grams ending with the tokens after the first
+        `num_tokens` of `token_ids`."""
+        n = self.ngram_size
+        for end in range(max(self.num_tokens, n - 1), len(token_ids)):
+            prefix = tuple(token_ids[end - n + 1:end])
+            next_tokens = self._next_tokens.get(prefix)
+            if next_tokens is None:
+                self._next_tokens[prefix] = {token_ids[end]}
+            else:
+                next_tokens.add(token_ids[end])
+        self.num_tokens = len(token_ids)
+
+    def get_banned_tokens(self, token_ids: List[int]) -> Set[int]:
+        """Returns the tokens that would repeat an n-gram if appended to
+        `token_ids`, which must have been indexed."""
+        start = len(token_ids) - self.ngram_size + 1
+        if start < 0:
+            return set()
+        return self._next_tokens.get(tuple(token_ids[start:]), set())
+
+
 class SequenceData(msgspec.Struct,
-                   omit_defaults=True):
+                   omit_defaults=True,
+                   dict=True):
     """Data associated with a sequence.
 
     Args:
@@ -191,6 +365,7 @@ class SequenceData(msgspec.Struct,
         self._output_token_ids = array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
                                        new_output_token_ids)
         self._update_cached_all_tokens()
+        self._ngram_index = None
 
     @property
     def output_token_ids_array(self) -> array:
@@ -209,6 +384,22 @@ class SequenceData(msgspec.Struct,
         self._cached_all_token_ids.append(token_id)
         self._cumulative_logprob += logprob
 
+    def get_banned_ngram_tokens(self, ngram_size: int) -> Set[int]:
+        """Returns the tokens that would repeat an n-gram of the sequence if
+        generated next.
+
+        The n-gram index is kept with the data of the sequence and only
+        indexes the tokens appended since the last call. It is not sent to
+        the workers, which build their own.
+        """
+        token_ids = self._cached_all_token_ids
+        index: Optional[NGramIndex] = getattr(self, "_ngram_index", None)
+        if (index is None or index.ngram_size != ngram_size
+                or index.num_tokens > len(token_ids)):
+            index = self._ngram_index = NGramIndex(ngram_size)
+        index.update(token_ids)
+        return index.get_banned_tokens(token_ids)
+
     def get_len(self) -> int:
         return len(self._output_token_ids) + len(self._prompt_token_ids)
 
@@ -371,7 +562,7 @@ class Sequence:
         self.data = SequenceData(
             array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
             self.prompt_token_ids))
-        self.output_logprobs: SampleLogprobs = []
+        self.output_logprobs = FlatLogprobs()
         self.output_text = ""
 
         self.status = SequenceStatus.WAITING
@@ -382,6 +573,19 @@ class Sequence:
         self.read_offset = 0
         # Input + output tokens
         self.tokens: Optional[List[str]] = None
+        # Used for incremental stop string and stop token sequence
+        # matching: the state of the matcher and the length of the output
+        # text or token ids it was computed for.
+        self.stop_string_match_state: Optional[Tuple[int, int]] = None
+        self.stop_token_match_state: Optional[Tuple[int, int]] = None
+        # Text of the last token, being decoded by the detokenizer pool.
+        # It is added to the output text when the next token is processed.
+        self.pending_token_text: Optional["Future[str]"] = None
+
+        # Lengths of the output text and tokens returned by the previous
+        # delta output.
+        self._last_output_text_offset = 0
+        self._last_output_token_ids_offset = 0
 
     @property
     def n_blocks(self) -> int:
@@ -432,11 +636,34 @@ class Sequence:
         return self.prompt_adapter_request.prompt_adapter_id \
                         if self.prompt_adapter_request else 0
 
-    def get_output_text_to_return(self, buffer_length: int):
+    def get_output_text_to_return(self,
+                                  buffer_length: int,
+                                  delta: bool = False) -> str:
+        """If delta is True, only returns the text that is new since the
+        previous call with delta=True."""
         # We return the full output text if the sequence is finished.
         truncate = buffer_length and not self.is_finished()
-        return self.output_text[:-buffer_length] if truncate else (
-            self.output_text)
+        if not delta:
+            return self.output_text[:-buffer_length] if truncate else (
+                self.output_text)
+        length = len(self.output_text)
+        if truncate:
+            length -= buffer_length
+        last_offset = self._last_output_text_offset
+        if length <= last_offset:
+            return ""
+        self._last_output_text_offset = length
+        return self.output_text[last_offset:length]
+
+    def get_output_token_ids_to_return(
+            self, delta: bool = False) -> array:
+        """If delta is True, only returns the token ids that are new since
+        the previous call with delta=True."""
+        if not delta:
+            return self.data._output_token_ids
+        last_offset = self._last_output_token_ids_offset
+        self._last_output_token_ids_offset = self.get_output_len()
+        return self.data._output_token_ids[last_offset:]
 
     def hash_of_block(self, logical_idx: int) -> int:
         # TODO This can produce incorrect hash when block size > prompt size
@@ -590,6 +817,8 @@ class SequenceGroup:
                                       time_in_queue=None)
         self.lora_request = lora_request
         self.prompt_logprobs: Optional[PromptLogprobs] = None
+        # Number of prompt logprobs returned by the previous delta output.
+        self._last_prompt_logprobs_offset = 0
         self.state = SequenceGroupState()
         self.embeddings = embeddings
         self.pooling_params = pooling_params
@@ -624,6 +853,19 @@ class SequenceGroup:
         return (self.encoder_seq.prompt_token_ids
                 if self.encoder_seq is not None else None)
 
+    def get_prompt_logprobs_to_return(
+            self, delta: bool = False) -> Optional[PromptLogprobs]:
+        """If delta is True, only returns the prompt logprobs that are new
+        since the previous call with delta=True, or None if there are none.
+        With chunked prefill, they are computed one chunk at a time."""
+        if not delta or self.prompt_logprobs is None:
+            return self.prompt_logprobs
+        last_offset = self._last_prompt_logprobs_offset
+        if len(self.prompt_logprobs) <= last_offset:
+            return None
+        self._last_prompt_logprobs_offset = len(self.prompt_logprobs)
+        return self.prompt_logprobs[last_offset:]
+
     @property
     def multi_modal_data(self) -> "MultiModalDataDict":
         # All sequences in the group should have the same multi-modal data.
@@ -1263,6 +1505,10 @@ class ExecuteModelRequest(
     finished_requests_ids: List[str] = msgspec.field(default_factory=list)
     # The last sampled token ids for multi step decoding.
     last_sampled_token_ids: Optional[torch.Tensor] = None
+    # Copies between the device prefix cache and its offload tiers. List of
+    # (KVOffloadOp, src, dst) block numbers, executed in order.
+    kv_offload_ops: List[Tuple[int, int,
+                               int]] = msgspec.field(default_factory=list)
 
     @property
     def is_first_multi_step(self) -> bool:
@@ -1308,4 +1554,5 @@ class ExecuteModelRequest(
             num_steps=self.num_steps,
             finished_requests_ids=self.finished_requests_ids,
             last_sampled_token_ids=self.last_sampled_token_ids.clone()
-            if self.last_sampled_token_ids is not None else None)
+            if self.last_sampled_token_ids is not None else None,
+            kv_offload_ops=self.kv_offload_ops.copy())
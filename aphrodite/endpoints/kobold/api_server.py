@@ -134,6 +134,8 @@ def prepare_engine_payload(
         if kai_payload.use_default_badwordsids else [],
         max_tokens=kai_payload.max_length,
         seed=kai_payload.sampler_seed,
+        priority=kai_payload.priority,
+        deadline=kai_payload.deadline,
     )
 
     max_input_tokens = max(
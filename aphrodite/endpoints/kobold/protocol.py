@@ -87,6 +87,8 @@ class KAIGenerationInputSchema(BaseModel):
     sampler_full_determinism: Optional[bool] = None
     stop_sequence: Optional[List[str]] = None
     include_stop_str_in_output: Optional[bool] = False
+    priority: int = 0
+    deadline: Optional[float] = None
 
     @root_validator(pre=False, skip_on_failure=True)
     def check_context(cls, values):  # pylint: disable=no-self-argument
@@ -38,6 +38,8 @@ from aphrodite.endpoints.openai.protocol import (ChatCompletionRequest,
                                                  EmbeddingRequest,
                                                  ErrorResponse,
                                                  KAIGenerationInputSchema,
+                                                 PrecompileGuidesRequest,
+                                                 PrecompileGuidesResponse,
                                                  TokenizeRequest,
                                                  TokenizeResponse)
 from aphrodite.endpoints.openai.rpc.client import AsyncEngineRPCClient
@@ -54,6 +56,10 @@ from aphrodite.endpoints.openai.serving_tokenization import (
 from aphrodite.engine.args_tools import AsyncEngineArgs
 from aphrodite.engine.async_aphrodite import AsyncAphrodite
 from aphrodite.engine.protocol import AsyncEngineClient
+from aphrodite.modeling.guided_decoding import (
+    precompile_guided_decoding_guides)
+from aphrodite.modeling.guided_decoding.guided_fields import (
+    GuidedDecodingRequest)
 from aphrodite.server import serve_http
 from aphrodite.transformers_utils.tokenizer import get_tokenizer
 from aphrodite.version import __version__ as APHRODITE_VERSION
@@ -130,7 +136,11 @@ async def build_async_engine_client(
     if (model_is_embedding(args.model, args.trust_remote_code)
             or args.disable_frontend_multiprocessing):
         async_engine_client = AsyncAphrodite.from_engine_args(engine_args)
-        yield async_engine_client
+        try:
+            yield async_engine_client
+        finally:
+            async_engine_client.shutdown_background_loop()
+            async_engine_client.save_prefix_cache_snapshot()
         return
 
     # Otherwise, use the multiprocessing AsyncAphrodite.
@@ -369,6 +379,43 @@ async def unload_soft_prompt(soft_prompt_name: str):
     return JSONResponse(content={"status": "success"})
 
 
+@router.post("/v1/guided_decoding/precompile")
+async def precompile_guides(request: PrecompileGuidesRequest):
+    try:
+        num_guides = await _precompile_guides(request)
+    except ValueError as e:
+        err = openai_serving_completion.create_error_response(message=str(e))
+        return JSONResponse(content=err.model_dump(), status_code=err.code)
+    return JSONResponse(content=PrecompileGuidesResponse(
+        num_guides=num_guides).model_dump())
+
+
+async def _precompile_guides(request: PrecompileGuidesRequest) -> int:
+    """Compiles the guides of the request into the guide cache, so that the
+    first requests using them don't wait for them to be compiled."""
+    decoding_config = await async_engine_client.get_decoding_config()
+    guided_decoding_backend = request.guided_decoding_backend \
+        or decoding_config.guided_decoding_backend
+    whitespace_pattern = request.guided_whitespace_pattern
+    guided_options = [
+        GuidedDecodingRequest(guided_json=guided_json,
+                              guided_whitespace_pattern=whitespace_pattern)
+        for guided_json in request.guided_json
+    ] + [
+        GuidedDecodingRequest(guided_regex=guided_regex)
+        for guided_regex in request.guided_regex
+    ] + [
+        GuidedDecodingRequest(guided_choice=guided_choice)
+        for guided_choice in request.guided_choice
+    ] + [
+        GuidedDecodingRequest(guided_grammar=guided_grammar)
+        for guided_grammar in request.guided_grammar
+    ]
+    tokenizer = await async_engine_client.get_tokenizer(None)
+    return await precompile_guided_decoding_guides(guided_decoding_backend,
+                                                   guided_options, tokenizer)
+
+
 # ============ KoboldAI API ============ #
 
 badwordsids: List[int] = []
@@ -659,7 +706,8 @@ def build_app(args: Namespace) -> FastAPI:
             auth_header = request.headers.get("Authorization")
             api_key_header = request.headers.get("x-api-key")
 
-            if request.url.path.startswith(("/v1/lora", "/v1/soft_prompt")):
+            if request.url.path.startswith(
+                ("/v1/lora", "/v1/soft_prompt", "/v1/guided_decoding")):
                 if admin_key is not None and api_key_header == admin_key:
                     return await call_next(request)
                 return JSONResponse(content={"error": "Unauthorized"},
@@ -762,6 +810,13 @@ async def init_app(
 
     if args.launch_kobold_api:
         _set_badwords(tokenizer, model_config.hf_config)
+
+    if args.precompile_guides:
+        with open(args.precompile_guides) as f:
+            precompile_request = PrecompileGuidesRequest(**json.load(f))
+        num_guides = await _precompile_guides(precompile_request)
+        logger.info(f"Precompiled {num_guides} guided decoding guides "
+                    f"from {args.precompile_guides}")
     
     return app
 
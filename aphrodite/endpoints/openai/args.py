@@ -151,6 +151,14 @@ def make_arg_parser(parser: FlexibleArgumentParser) -> FlexibleArgumentParser:
         action="store_true",
         help="If specified, will run the OpenAI frontend server in the same "
         "process as the model serving engine.")
+    parser.add_argument(
+        "--precompile-guides",
+        type=str,
+        default=None,
+        help="The path to a JSON file with the guides to compile at "
+        "startup, in the format of the body of "
+        "/v1/guided_decoding/precompile. Only used with the outlines "
+        "guided decoding backend.")
 
     parser = AsyncEngineArgs.add_cli_args(parser)
     return parser
@@ -143,6 +143,8 @@ class ChatCompletionRequest(OpenAIBaseModel):
     ignore_eos: Optional[bool] = False
     min_tokens: Optional[int] = 0
     stop_token_ids: Optional[List[int]] = Field(default_factory=list)
+    stop_token_sequences: Optional[List[List[int]]] = Field(
+        default_factory=list)
     skip_special_tokens: Optional[bool] = True
     spaces_between_special_tokens: Optional[bool] = True
     truncate_prompt_tokens: Optional[Annotated[int, Field(ge=1)]] = None
@@ -252,6 +254,18 @@ class ChatCompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: int = Field(
+        default=0,
+        description=(
+            "The priority of the request (lower means earlier handling). "
+            "Only has an effect when the server uses the 'priority' "
+            "scheduling policy."))
+    deadline: Optional[float] = Field(
+        default=None,
+        description=(
+            "Time budget in seconds, counted from the arrival of the "
+            "request, by which it should be scheduled. Only has an effect "
+            "when the server uses the 'edf' scheduling policy."))
 
     # doc: end-chat-completion-extra-params
 
@@ -291,6 +305,7 @@ class ChatCompletionRequest(OpenAIBaseModel):
             seed=self.seed,
             stop=self.stop,
             stop_token_ids=self.stop_token_ids,
+            stop_token_sequences=self.stop_token_sequences,
             max_tokens=max_tokens,
             min_tokens=self.min_tokens,
             logprobs=self.top_logprobs if self.logprobs else None,
@@ -328,6 +343,8 @@ class ChatCompletionRequest(OpenAIBaseModel):
             skew=self.skew,
             custom_token_bans=self.custom_token_bans,
             sampler_priority=self.sampler_priority,
+            priority=self.priority,
+            deadline=self.deadline,
         )
 
     @model_validator(mode='before')
@@ -424,6 +441,8 @@ class CompletionRequest(OpenAIBaseModel):
     length_penalty: Optional[float] = 1.0
     early_stopping: Optional[bool] = False
     stop_token_ids: Optional[List[int]] = Field(default_factory=list)
+    stop_token_sequences: Optional[List[List[int]]] = Field(
+        default_factory=list)
     ignore_eos: Optional[bool] = False
     min_tokens: Optional[int] = 0
     skip_special_tokens: Optional[bool] = True
@@ -495,6 +514,18 @@ class CompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: int = Field(
+        default=0,
+        description=(
+            "The priority of the request (lower means earlier handling). "
+            "Only has an effect when the server uses the 'priority' "
+            "scheduling policy."))
+    deadline: Optional[float] = Field(
+        default=None,
+        description=(
+            "Time budget in seconds, counted from the arrival of the "
+            "request, by which it should be scheduled. Only has an effect "
+            "when the server uses the 'edf' scheduling policy."))
 
     # doc: end-completion-extra-params
 
@@ -544,6 +575,7 @@ class CompletionRequest(OpenAIBaseModel):
             seed=self.seed,
             stop=self.stop,
             stop_token_ids=self.stop_token_ids,
+            stop_token_sequences=self.stop_token_sequences,
             ignore_eos=self.ignore_eos,
             max_tokens=max_tokens if not echo_without_generation else 1,
             min_tokens=self.min_tokens,
@@ -573,6 +605,8 @@ class CompletionRequest(OpenAIBaseModel):
             skew=self.skew,
             custom_token_bans=self.custom_token_bans,
             sampler_priority=self.sampler_priority,
+            priority=self.priority,
+            deadline=self.deadline,
         )
 
     @model_validator(mode="before")
@@ -876,6 +910,19 @@ class DetokenizeResponse(OpenAIBaseModel):
     prompt: str
 
 
+class PrecompileGuidesRequest(OpenAIBaseModel):
+    guided_json: List[Union[str, dict]] = Field(default_factory=list)
+    guided_regex: List[str] = Field(default_factory=list)
+    guided_choice: List[List[str]] = Field(default_factory=list)
+    guided_grammar: List[str] = Field(default_factory=list)
+    guided_decoding_backend: Optional[str] = None
+    guided_whitespace_pattern: Optional[str] = None
+
+
+class PrecompileGuidesResponse(OpenAIBaseModel):
+    num_guides: int
+
+
 # ========== KoboldAI ========== #
 
 
@@ -1,9 +1,14 @@
-from dataclasses import dataclass
+from array import array
 from enum import Enum
-from typing import Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import cloudpickle
+import msgspec
+
+from aphrodite.common.outputs import CompletionOutput, RequestOutput
 from aphrodite.common.sampling_params import SamplingParams
-from aphrodite.inputs import PromptInputs
+from aphrodite.common.sequence import (PromptLogprobs, RequestMetrics,
+                                       SampleLogprobs)
 from aphrodite.lora.request import LoRARequest
 from aphrodite.prompt_adapter.request import PromptAdapterRequest
 
@@ -16,19 +21,27 @@ APHRODITE_RPC_HEALTH_TIMEOUT_MS = 10000
 APHRODITE_RPC_SOCKET_LIMIT_CUTOFF = 2000
 # HWM is set to Infinity.
 APHRODITE_RPC_ZMQ_HWM = 0
+# Identity of the frames with the outputs of generate requests, which the
+# client dispatches to the requests instead of routing them to a socket.
+APHRODITE_RPC_OUTPUTS_IDENTITY = b""
+# msgpack extension type of values without a schema, which are pickled.
+APHRODITE_RPC_PICKLE_EXT_CODE = 1
 
 
-@dataclass
-class RPCGenerateRequest:
-    inputs: PromptInputs
+class RPCGenerateRequest(msgspec.Struct,
+                         array_like=True,
+                         omit_defaults=True,
+                         tag=True):
+    # PromptInputs. Values that msgpack can't represent, such as images in
+    # the multi-modal data, are pickled.
+    inputs: Any
     sampling_params: SamplingParams
     request_id: str
     lora_request: Optional[LoRARequest] = None
     prompt_adapter_request: Optional[PromptAdapterRequest] = None
 
 
-@dataclass
-class RPCAbortRequest:
+class RPCAbortRequest(msgspec.Struct, array_like=True, tag=True):
     request_id: str
 
 
@@ -45,3 +58,253 @@ class RPCUtilityRequest(Enum):
 
 RPC_REQUEST_TYPE = Union[RPCGenerateRequest, RPCAbortRequest,
                          RPCUtilityRequest]
+
+
+class RPCCompletionDelta(msgspec.Struct, array_like=True, omit_defaults=True):
+    """The part of a CompletionOutput that is new since the previous frame
+    of its request."""
+    index: int
+    text: str
+    token_ids: List[int]
+    cumulative_logprob: Optional[float]
+    logprobs: Optional[SampleLogprobs]
+    finish_reason: Optional[str] = None
+    stop_reason: Union[int, str, None] = None
+
+
+class RPCRequestOutputDelta(msgspec.Struct,
+                            array_like=True,
+                            omit_defaults=True):
+    """The part of a RequestOutput that is new since the previous frame of
+    its request. The prompt is only sent with the first delta."""
+    request_id: str
+    outputs: List[RPCCompletionDelta]
+    finished: bool
+    metrics: Optional[RequestMetrics] = None
+    # The outputs replace the previous ones instead of extending them.
+    reset: bool = False
+    # Prompt logprobs computed since the previous frame, if any.
+    prompt_logprobs: Optional[PromptLogprobs] = None
+    prompt: Optional[str] = None
+    prompt_token_ids: Optional[List[int]] = None
+    lora_request: Optional[LoRARequest] = None
+    encoder_prompt: Optional[str] = None
+    encoder_prompt_token_ids: Optional[List[int]] = None
+
+
+class RPCOutputFrame(msgspec.Struct, array_like=True, omit_defaults=True):
+    """The outputs of all requests produced by an engine step. Requests
+    that failed have their exception in `errors`, raised after their
+    outputs."""
+    outputs: List[RPCRequestOutputDelta]
+    errors: Dict[str, Any] = msgspec.field(default_factory=dict)
+
+
+class RequestOutputDeltaTracker:
+    """Turns the cumulative outputs of a request into the deltas sent to the
+    client, so that the cost of a frame is proportional to the number of new
+    tokens rather than to the length of the outputs.
+
+    Args:
+        use_beam_search: Beam search rewrites its beams, so their outputs
+            are always sent in full.
+        delta_outputs: The request uses RequestOutputKind.DELTA, so the
+            engine outputs are deltas already and are sent as is.
+    """
+
+    def __init__(self,
+                 use_beam_search: bool = False,
+                 delta_outputs: bool = False):
+        self.use_beam_search = use_beam_search
+        self.delta_outputs = delta_outputs
+        self.first = True
+        self.num_prompt_logprobs = 0
+        # Completion index -> (number of tokens, length of text) sent.
+        self.sent: Dict[int, Tuple[int, int]] = {}
+
+    def get_delta(self, request_output: RequestOutput) -> tuple:
+        """Returns the delta as a tuple in the field order of
+        RPCRequestOutputDelta, which avoids building the structs on the hot
+        path."""
+        if self.delta_outputs:
+            reset = False
+            completions = [
+                (completion.index, completion.text, completion.token_ids,
+                 completion.cumulative_logprob, completion.logprobs,
+                 completion.finish_reason, completion.stop_reason)
+                for completion in request_output.outputs
+            ]
+            prompt_logprobs = request_output.prompt_logprobs
+        else:
+            reset, completions, prompt_logprobs = self._diff(request_output)
+
+        delta = (request_output.request_id, completions,
+                 request_output.finished, request_output.metrics, reset,
+                 prompt_logprobs)
+        if self.first:
+            self.first = False
+            delta += (request_output.prompt, request_output.prompt_token_ids,
+                      request_output.lora_request,
+                      request_output.encoder_prompt,
+                      request_output.encoder_prompt_token_ids)
+        return delta
+
+    def _diff(
+        self, request_output: RequestOutput
+    ) -> Tuple[bool, List[tuple], Optional[PromptLogprobs]]:
+        sent = self.sent
+        reset = self.use_beam_search or any(
+            len(completion.token_ids) < sent.get(completion.index, (0, 0))[0]
+            or len(completion.text) < sent.get(completion.index, (0, 0))[1]
+            for completion in request_output.outputs)
+        if reset:
+            sent.clear()
+
+        completions = []
+        for completion in request_output.outputs:
+            num_tokens, text_len = sent.get(completion.index, (0, 0))
+            token_ids = completion.token_ids
+            logprobs = completion.logprobs
+            if num_tokens:
+                token_ids = token_ids[num_tokens:]
+                if logprobs is not None:
+                    logprobs = logprobs[num_tokens:]
+            completions.append(
+                (completion.index, completion.text[text_len:], token_ids,
+                 completion.cumulative_logprob, logprobs,
+                 completion.finish_reason, completion.stop_reason))
+            sent[completion.index] = (len(completion.token_ids),
+                                      len(completion.text))
+
+        prompt_logprobs = request_output.prompt_logprobs
+        new_prompt_logprobs = None
+        if (prompt_logprobs is not None
+                and len(prompt_logprobs) > self.num_prompt_logprobs):
+            new_prompt_logprobs = prompt_logprobs[self.num_prompt_logprobs:]
+            self.num_prompt_logprobs = len(prompt_logprobs)
+        return reset, completions, new_prompt_logprobs
+
+
+class RequestOutputAccumulator:
+    """Rebuilds the outputs of a request from its deltas.
+
+    The token ids and logprobs lists of cumulative outputs are extended in
+    place and shared between the returned outputs, like the engine shares
+    them between the outputs of a sequence. With `delta_outputs`, the
+    request uses RequestOutputKind.DELTA and only the prompt is carried over
+    from the first output.
+    """
+
+    def __init__(self, delta_outputs: bool = False):
+        self.delta_outputs = delta_outputs
+        self.request_output: Optional[RequestOutput] = None
+        self.completions: Dict[int, CompletionOutput] = {}
+
+    def add(self, delta: RPCRequestOutputDelta) -> RequestOutput:
+        if delta.reset or self.delta_outputs:
+            self.completions = {}
+        outputs = []
+        for completion_delta in delta.outputs:
+            previous = self.completions.get(completion_delta.index)
+            if previous is None:
+                completion = CompletionOutput(
+                    completion_delta.index, completion_delta.text,
+                    completion_delta.token_ids,
+                    completion_delta.cumulative_logprob,
+                    completion_delta.logprobs, completion_delta.finish_reason,
+                    completion_delta.stop_reason)
+            else:
+                previous.token_ids.extend(completion_delta.token_ids)
+                if (previous.logprobs is not None
+                        and completion_delta.logprobs):
+                    previous.logprobs.extend(completion_delta.logprobs)
+                completion = CompletionOutput(
+                    completion_delta.index,
+                    previous.text + completion_delta.text,
+                    previous.token_ids, completion_delta.cumulative_logprob,
+                    previous.logprobs, completion_delta.finish_reason,
+                    completion_delta.stop_reason)
+            if not self.delta_outputs:
+                self.completions[completion_delta.index] = completion
+            outputs.append(completion)
+
+        previous_output = self.request_output
+        if previous_output is None:
+            self.request_output = RequestOutput(
+                delta.request_id,
+                delta.prompt,
+                delta.prompt_token_ids,
+                delta.prompt_logprobs,
+                outputs,
+                delta.finished,
+                delta.metrics,
+                lora_request=delta.lora_request,
+                encoder_prompt=delta.encoder_prompt,
+                encoder_prompt_token_ids=delta.encoder_prompt_token_ids,
+            )
+            return self.request_output
+
+        prompt_logprobs = previous_output.prompt_logprobs
+        if self.delta_outputs:
+            prompt_logprobs = delta.prompt_logprobs
+        elif delta.prompt_logprobs is not None:
+            if prompt_logprobs is None:
+                prompt_logprobs = delta.prompt_logprobs
+            else:
+                prompt_logprobs.extend(delta.prompt_logprobs)
+        self.request_output = RequestOutput(
+            delta.request_id,
+            previous_output.prompt,
+            previous_output.prompt_token_ids,
+            prompt_logprobs,
+            outputs,
+            delta.finished,
+            delta.metrics,
+            lora_request=previous_output.lora_request,
+            encoder_prompt=previous_output.encoder_prompt,
+            encoder_prompt_token_ids=previous_output.encoder_prompt_token_ids,
+        )
+        return self.request_output
+
+
+def _encode_hook(obj: Any) -> Any:
+    if isinstance(obj, array):
+        return obj.tolist()
+    # Fall back to pickle for values without a schema, e.g. exceptions,
+    # logits processors or multi-modal data.
+    return msgspec.msgpack.Ext(APHRODITE_RPC_PICKLE_EXT_CODE,
+                               cloudpickle.dumps(obj))
+
+
+def _ext_hook(code: int, data: memoryview) -> Any:
+    if code == APHRODITE_RPC_PICKLE_EXT_CODE:
+        return cloudpickle.loads(data)
+    raise NotImplementedError(f"Unknown msgpack extension type {code}")
+
+
+_encoder = msgspec.msgpack.Encoder(enc_hook=_encode_hook)
+_request_decoder = msgspec.msgpack.Decoder(RPC_REQUEST_TYPE,
+                                           ext_hook=_ext_hook)
+_output_frame_decoder = msgspec.msgpack.Decoder(RPCOutputFrame,
+                                                ext_hook=_ext_hook)
+
+
+def encode_rpc_request(request: RPC_REQUEST_TYPE) -> bytes:
+    return _encoder.encode(request)
+
+
+def decode_rpc_request(data: bytes) -> RPC_REQUEST_TYPE:
+    return _request_decoder.decode(data)
+
+
+def encode_output_frame(deltas: List[tuple],
+                        errors: Dict[str, BaseException]) -> bytes:
+    """Encodes the deltas returned by RequestOutputDeltaTracker.get_delta
+    and the exceptions of failed requests, by request id."""
+    if not errors:
+        return _encoder.encode((deltas, ))
+    return _encoder.encode((deltas, errors))
+
+
+def decode_output_frame(data: bytes) -> RPCOutputFrame:
+    return _output_frame_decoder.decode(data)
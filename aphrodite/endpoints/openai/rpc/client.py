@@ -1,6 +1,6 @@
 import asyncio
 from contextlib import contextmanager
-from typing import Any, AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Dict, Optional
 from uuid import uuid4
 
 import cloudpickle
@@ -11,12 +11,13 @@ from loguru import logger
 from aphrodite.common.config import (DecodingConfig, LoRAConfig, ModelConfig,
                                      ParallelConfig, SchedulerConfig)
 from aphrodite.common.outputs import EmbeddingRequestOutput, RequestOutput
-from aphrodite.common.sampling_params import SamplingParams
+from aphrodite.common.sampling_params import RequestOutputKind, SamplingParams
 from aphrodite.endpoints.openai.rpc import (
-    APHRODITE_RPC_HEALTH_TIMEOUT_MS, APHRODITE_RPC_SERVER_START_TIMEOUT_MS,
-    APHRODITE_RPC_SOCKET_LIMIT_CUTOFF, APHRODITE_RPC_SUCCESS_STR,
-    APHRODITE_RPC_ZMQ_HWM, RPC_REQUEST_TYPE, RPCAbortRequest,
-    RPCGenerateRequest, RPCUtilityRequest)
+    APHRODITE_RPC_HEALTH_TIMEOUT_MS, APHRODITE_RPC_OUTPUTS_IDENTITY,
+    APHRODITE_RPC_SERVER_START_TIMEOUT_MS, APHRODITE_RPC_SOCKET_LIMIT_CUTOFF,
+    APHRODITE_RPC_SUCCESS_STR, APHRODITE_RPC_ZMQ_HWM, RPC_REQUEST_TYPE,
+    RequestOutputAccumulator, RPCAbortRequest, RPCGenerateRequest,
+    RPCUtilityRequest, decode_output_frame, encode_rpc_request)
 from aphrodite.inputs import PromptInputs
 from aphrodite.lora.request import LoRARequest
 from aphrodite.prompt_adapter.request import PromptAdapterRequest
@@ -45,8 +46,11 @@ class AsyncEngineRPCClient:
         - make a DEALER socket that connects to from_api_server via inproc
         - send a RCPGenerateRequest to the inproc socket
         - background proxy forwards the request from inproc -> ipc
-        - RPCServer responds to the request one token at a time over ipc
-        - background proxy forwards the response from ipc -> inproc
+        - RPCServer streams the outputs of all requests in one frame per
+            engine step over ipc, with only the tokens that are new since
+            the previous frame
+        - background proxy dispatches the outputs to the asyncio queues of
+            the requests
     The connection looks like this:
         DEALER <- inproc -> [ ROUTER | DEALER ] <- ipc -> DEALER
     
@@ -94,6 +98,8 @@ class AsyncEngineRPCClient:
         self.from_api_server = self.context.socket(zmq.constants.ROUTER)
         self.from_api_server.set_hwm(APHRODITE_RPC_ZMQ_HWM)
         self.from_api_server.bind(INPROC_PROXY_PATH)
+        # Output deltas of the running generate requests, by request id.
+        self._output_queues: Dict[str, asyncio.Queue] = {}
         # Asyncio background task for the proxy.
         self.proxy_task = asyncio.create_task(
             self.run_proxy(self.from_api_server, self.to_rpc_server))
@@ -118,7 +124,22 @@ class AsyncEngineRPCClient:
                 await socket_to.send_multipart([identity, msg])
             if socket_to in events:
                 identity, msg = await socket_to.recv_multipart()
-                await socket_from.send_multipart([identity, msg])
+                if identity == APHRODITE_RPC_OUTPUTS_IDENTITY:
+                    self._dispatch_outputs(msg)
+                else:
+                    await socket_from.send_multipart([identity, msg])
+
+    def _dispatch_outputs(self, message: bytes) -> None:
+        frame = decode_output_frame(message)
+        for delta in frame.outputs:
+            queue = self._output_queues.get(delta.request_id)
+            # The request may have been aborted in the meantime.
+            if queue is not None:
+                queue.put_nowait(delta)
+        for request_id, error in frame.errors.items():
+            queue = self._output_queues.get(request_id)
+            if queue is not None:
+                queue.put_nowait(error)
 
     async def setup(self):
         """Setup the client before it starts sending server requests."""
@@ -169,7 +190,7 @@ class AsyncEngineRPCClient:
 
         with self.to_proxy_socket() as socket:
             # Ping RPCServer with a request.
-            await socket.send_multipart([cloudpickle.dumps(request)])
+            await socket.send_multipart([encode_rpc_request(request)])
 
             # Await the data from the Server.
             data = cloudpickle.loads(await socket.recv())
@@ -197,7 +218,7 @@ class AsyncEngineRPCClient:
         async def do_rpc_call(socket: zmq.asyncio.Socket,
                               request: RPC_REQUEST_TYPE,
                               timeout=None):
-            await socket.send_multipart([cloudpickle.dumps(request)])
+            await socket.send_multipart([encode_rpc_request(request)])
             if timeout is not None and await socket.poll(timeout=timeout) == 0:
                 raise TimeoutError(f"Server didn't reply within {timeout} ms")
             return cloudpickle.loads(await socket.recv())
@@ -310,13 +331,18 @@ class AsyncEngineRPCClient:
     ) -> AsyncGenerator[RequestOutput, None]:
         """Send an RPCGenerateRequest to the RPCServer and stream responses."""
 
+        if request_id in self._output_queues:
+            raise KeyError(f"Request {request_id} already exists.")
+        queue: asyncio.Queue = asyncio.Queue()
+        self._output_queues[request_id] = queue
+
         finished = False
         try:
             with self.to_proxy_socket() as socket:
 
                 # Send RPCGenerateRequest to the RPCServer.
                 await socket.send_multipart([
-                    cloudpickle.dumps(
+                    encode_rpc_request(
                         RPCGenerateRequest(
                             inputs=inputs,
                             sampling_params=sampling_params,
@@ -325,12 +351,14 @@ class AsyncEngineRPCClient:
                             prompt_adapter_request=prompt_adapter_request))
                 ])
 
-                # Stream back the results from the RPC Server.
+                # Stream back the results from the RPC Server, which only
+                # sends what is new since the previous output.
+                accumulator = RequestOutputAccumulator(
+                    sampling_params.output_kind == RequestOutputKind.DELTA)
                 while not finished:
-                    message = await socket.recv()
-                    request_output = cloudpickle.loads(message)
+                    delta = await queue.get()
 
-                    if isinstance(request_output, Exception):
+                    if isinstance(delta, BaseException):
                         # On exception, check if the server is still healthy
                         # possibly setting the `errored` property.
                         if not self._errored:
@@ -341,11 +369,13 @@ class AsyncEngineRPCClient:
                                 logger.exception(repr(e))
                         # NB: do before raising here so that the flag is set
                         # by the time the caller receives this exception
-                        raise request_output
+                        raise delta
 
+                    request_output = accumulator.add(delta)
                     finished = request_output.finished
                     yield request_output
         finally:
+            del self._output_queues[request_id]
             # Request was canceled by the client.
             if not finished and not self._errored:
                 await self.abort(request_id)
@@ -1,6 +1,6 @@
 import asyncio
 import signal
-from typing import Any, Coroutine, Union
+from typing import Any, Coroutine, Dict, Iterable, List, Optional, Set, Union
 
 import cloudpickle
 import zmq
@@ -11,12 +11,17 @@ from typing_extensions import Never
 from aphrodite import AsyncAphrodite, AsyncEngineArgs
 from aphrodite.common.config import (DecodingConfig, LoRAConfig, ModelConfig,
                                      ParallelConfig, SchedulerConfig)
+from aphrodite.common.sampling_params import RequestOutputKind
 from aphrodite.common.utils import in_windows
-from aphrodite.endpoints.openai.rpc import (APHRODITE_RPC_SUCCESS_STR,
+from aphrodite.endpoints.openai.rpc import (APHRODITE_RPC_OUTPUTS_IDENTITY,
+                                            APHRODITE_RPC_SUCCESS_STR,
                                             APHRODITE_RPC_ZMQ_HWM,
+                                            RequestOutputDeltaTracker,
                                             RPCAbortRequest,
                                             RPCGenerateRequest,
-                                            RPCUtilityRequest)
+                                            RPCUtilityRequest,
+                                            decode_rpc_request,
+                                            encode_output_frame)
 
 if in_windows():
     import winloop as uvloop
@@ -42,11 +47,24 @@ class AsyncEngineRPCServer:
         self.socket.set_hwm(APHRODITE_RPC_ZMQ_HWM)
         self.socket.connect(rpc_path)
 
+        # Output deltas and exceptions of generate requests that are waiting
+        # to be sent. They are sent once per event loop iteration, so that
+        # the outputs of all requests of an engine step share a frame.
+        self._pending_outputs: List[tuple] = []
+        self._pending_errors: Dict[str, Exception] = {}
+        self._send_scheduled = False
+        # The tasks sending the frames, which take the lock in the order
+        # they are created so that the frames are sent in order. The lock is
+        # created in the event loop of the server.
+        self._send_tasks: Set[asyncio.Task] = set()
+        self._send_lock: Optional[asyncio.Lock] = None
+
     def cleanup(self):
         """Cleanup all resources."""
         self.socket.close()
         self.context.destroy()
         self.engine.shutdown_background_loop()
+        self.engine.save_prefix_cache_snapshot()
         # Clear the engine reference so that it can be GC'ed.
         self.engine = None
 
@@ -103,13 +121,65 @@ class AsyncEngineRPCServer:
                 lora_request=generate_request.lora_request,
                 prompt_adapter_request=generate_request.prompt_adapter_request)
 
+            sampling_params = generate_request.sampling_params
+            tracker = RequestOutputDeltaTracker(
+                sampling_params.use_beam_search,
+                sampling_params.output_kind == RequestOutputKind.DELTA)
             async for request_output in results_generator:
-                await self.socket.send_multipart(
-                    [identity, cloudpickle.dumps(request_output)])
+                self._pending_outputs.append(
+                    tracker.get_delta(request_output))
+                self._schedule_send()
 
         except Exception as e:
             ### Notify client of all failures
-            await self.socket.send_multipart([identity, cloudpickle.dumps(e)])
+            self._pending_errors[generate_request.request_id] = e
+            self._schedule_send()
+
+    def _schedule_send(self) -> None:
+        if not self._send_scheduled:
+            self._send_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_outputs)
+
+    def _flush_outputs(self) -> None:
+        outputs, errors = self._pending_outputs, self._pending_errors
+        self._pending_outputs, self._pending_errors = [], {}
+        self._send_scheduled = False
+        task = asyncio.create_task(self._send_outputs(outputs, errors))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _send_outputs(self, outputs: List[tuple],
+                            errors: Dict[str, Exception]) -> None:
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()
+        async with self._send_lock:
+            try:
+                frame = encode_output_frame(outputs, errors)
+                await self.socket.send_multipart(
+                    [APHRODITE_RPC_OUTPUTS_IDENTITY, frame], copy=False)
+            except Exception as e:
+                request_ids = {output[0] for output in outputs}
+                request_ids.update(errors)
+                logger.error(f"Failed to send the outputs of requests "
+                             f"{sorted(request_ids)}: {e}")
+                await self._fail_requests(request_ids, e)
+
+    async def _fail_requests(self, request_ids: Iterable[str],
+                             e: Exception) -> None:
+        """Aborts requests whose outputs could not be sent, and tries to
+        notify the client of the failure."""
+        error = RuntimeError(f"Failed to send the request outputs: {e}")
+        for request_id in request_ids:
+            await self.engine.abort(request_id)
+        try:
+            frame = encode_output_frame(
+                [], {request_id: error
+                     for request_id in request_ids})
+            await self.socket.send_multipart(
+                [APHRODITE_RPC_OUTPUTS_IDENTITY, frame], copy=False)
+        except Exception as send_error:
+            logger.error("Failed to notify the client of the failed "
+                         f"requests: {send_error}")
 
     async def check_health(self, identity):
         try:
@@ -123,7 +193,7 @@ class AsyncEngineRPCServer:
                            message) -> Coroutine[Any, Any, Never]:
         """Route the zmq message to the handler coroutine."""
 
-        request = cloudpickle.loads(message)
+        request = decode_rpc_request(message)
 
         if isinstance(request, RPCGenerateRequest):
             return self.generate(identity, request)
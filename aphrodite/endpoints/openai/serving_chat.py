@@ -10,6 +10,7 @@ from transformers import PreTrainedTokenizer
 
 from aphrodite.common.config import ModelConfig
 from aphrodite.common.outputs import RequestOutput
+from aphrodite.common.sampling_params import RequestOutputKind
 from aphrodite.common.sequence import Logprob
 from aphrodite.common.utils import iterate_with_cancellation, random_uuid
 from aphrodite.endpoints.chat_utils import (ConversationMessage,
@@ -157,6 +158,9 @@ class OpenAIServingChat(OpenAIServing):
                 guided_decode_logits_processor,
                 default_max_tokens=self.max_model_len -
                 len(prompt_inputs["prompt_token_ids"]))
+            if request.stream and not sampling_params.use_beam_search:
+                # Only the new tokens are needed to stream the response.
+                sampling_params.output_kind = RequestOutputKind.DELTA
 
             self._log_inputs(request_id,
                              prompt_inputs,
@@ -188,7 +192,13 @@ class OpenAIServingChat(OpenAIServing):
         # Streaming response
         if request.stream:
             return self.chat_completion_stream_generator(
-                request, result_generator, request_id, conversation, tokenizer)
+                request,
+                result_generator,
+                request_id,
+                conversation,
+                tokenizer,
+                delta_outputs=(
+                    sampling_params.output_kind == RequestOutputKind.DELTA))
         try:
             return await self.chat_completion_full_generator(
                 request, result_generator, request_id, conversation, tokenizer)
@@ -209,6 +219,7 @@ class OpenAIServingChat(OpenAIServing):
         request_id: str,
         conversation: List[ConversationMessage],
         tokenizer: PreTrainedTokenizer,
+        delta_outputs: bool = False,
     ) -> AsyncGenerator[str, None]:
         model_name = self.served_model_names[0]
         created_time = int(time.time())
@@ -217,7 +228,7 @@ class OpenAIServingChat(OpenAIServing):
 
         # Send response for each token for each request.n (index)
         num_choices = 1 if request.n is None else request.n
-        previous_texts = [""] * num_choices
+        previous_text_lens = [0] * num_choices
         previous_num_tokens = [0] * num_choices
         finish_reason_sent = [False] * num_choices
         try:
@@ -302,9 +313,19 @@ class OpenAIServingChat(OpenAIServing):
                     if finish_reason_sent[i]:
                         continue
 
-                    delta_token_ids = output.token_ids[previous_num_tokens[i]:]
-                    out_logprobs = output.logprobs[
-                        previous_num_tokens[i]:] if output.logprobs else None
+                    if delta_outputs:
+                        # The outputs only hold what is new since the
+                        # previous one (RequestOutputKind.DELTA).
+                        delta_text = output.text
+                        delta_token_ids = output.token_ids
+                        out_logprobs = output.logprobs
+                    else:
+                        delta_text = output.text[previous_text_lens[i]:]
+                        delta_token_ids = output.token_ids[
+                            previous_num_tokens[i]:]
+                        out_logprobs = (
+                            output.logprobs[previous_num_tokens[i]:]
+                            if output.logprobs else None)
 
                     if request.logprobs and request.top_logprobs is not None:
                         assert out_logprobs is not None, (
@@ -318,9 +339,8 @@ class OpenAIServingChat(OpenAIServing):
                     else:
                         logprobs = None
 
-                    delta_text = output.text[len(previous_texts[i]):]
-                    previous_texts[i] = output.text
-                    previous_num_tokens[i] = len(output.token_ids)
+                    previous_text_lens[i] += len(delta_text)
+                    previous_num_tokens[i] += len(delta_token_ids)
 
                     if request.tool_choice and type(
                             request.tool_choice
@@ -351,7 +371,7 @@ class OpenAIServingChat(OpenAIServing):
                                 and request.stream_options.include_usage):
                             if (request.stream_options.continuous_usage_stats):
                                 prompt_tokens = len(res.prompt_token_ids)
-                                completion_tokens = len(output.token_ids)
+                                completion_tokens = previous_num_tokens[i]
                                 usage = UsageInfo(
                                     prompt_tokens=prompt_tokens,
                                     completion_tokens=completion_tokens,
@@ -382,7 +402,7 @@ class OpenAIServingChat(OpenAIServing):
                                 and request.stream_options.include_usage):
                             if (request.stream_options.continuous_usage_stats):
                                 prompt_tokens = len(res.prompt_token_ids)
-                                completion_tokens = len(output.token_ids)
+                                completion_tokens = previous_num_tokens[i]
                                 usage = UsageInfo(
                                     prompt_tokens=prompt_tokens,
                                     completion_tokens=completion_tokens,
@@ -506,7 +526,9 @@ class OpenAIServingChat(OpenAIServing):
             model=model_name,
             choices=choices,
             usage=usage,
-            prompt_logprobs=final_res.prompt_logprobs,
+            prompt_logprobs=(list(final_res.prompt_logprobs)
+                             if final_res.prompt_logprobs is not None else
+                             None),
         )
 
         return response
@@ -10,6 +10,7 @@ from transformers import PreTrainedTokenizer
 
 from aphrodite.common.config import ModelConfig
 from aphrodite.common.outputs import RequestOutput
+from aphrodite.common.sampling_params import RequestOutputKind
 from aphrodite.common.sequence import Logprob
 from aphrodite.common.utils import merge_async_iterators, random_uuid
 from aphrodite.endpoints.logger import RequestLogger
@@ -85,6 +86,13 @@ class OpenAIServingCompletion(OpenAIServing):
                     f"Prompt_logprobs set to invalid negative "
                     f"value: {request.prompt_logprobs}")
 
+        # Similar to the OpenAI API, when n != best_of, we do not stream the
+        # results. In addition, we do not stream the results when use
+        # beam search.
+        stream = (request.stream
+                  and (request.best_of is None or request.n == request.best_of)
+                  and not request.use_beam_search)
+
         # Schedule the request and get the result generator.
         generators: List[AsyncGenerator[RequestOutput, None]] = []
         try:
@@ -113,6 +121,9 @@ class OpenAIServingCompletion(OpenAIServing):
                     guided_decode_logits_processor,
                     default_max_tokens=self.max_model_len -
                     len(prompt_inputs["prompt_token_ids"]))
+                if stream:
+                    # Only the new tokens are needed to stream the results.
+                    sampling_params.output_kind = RequestOutputKind.DELTA
 
                 request_id_item = f"{request_id}-{i}"
 
@@ -139,13 +150,6 @@ class OpenAIServingCompletion(OpenAIServing):
             int, RequestOutput]] = merge_async_iterators(
                 *generators, is_cancelled=raw_request.is_disconnected)
 
-        # Similar to the OpenAI API, when n != best_of, we do not stream the
-        # results. In addition, we do not stream the results when use
-        # beam search.
-        stream = (request.stream
-                  and (request.best_of is None or request.n == request.best_of)
-                  and not request.use_beam_search)
-
         # Streaming response
         if stream:
             return self.completion_stream_generator(request,
@@ -211,7 +215,7 @@ class OpenAIServingCompletion(OpenAIServing):
         tokenizer: PreTrainedTokenizer,
     ) -> AsyncGenerator[str, None]:
         num_choices = 1 if request.n is None else request.n
-        previous_texts = [""] * num_choices * num_prompts
+        previous_text_lens = [0] * num_choices * num_prompts
         previous_num_tokens = [0] * num_choices * num_prompts
         has_echoed = [False] * num_choices * num_prompts
 
@@ -220,8 +224,6 @@ class OpenAIServingCompletion(OpenAIServing):
 
                 for output in res.outputs:
                     i = output.index + prompt_idx * num_choices
-                    # TODO: optimize the performance by avoiding full
-                    # text O(n^2) sending.
 
                     assert request.max_tokens is not None
                     if request.echo and request.max_tokens == 0:
@@ -240,12 +242,11 @@ class OpenAIServingCompletion(OpenAIServing):
                                                               or [])
                         has_echoed[i] = True
                     else:
-                        # return just the delta
-                        delta_text = output.text[len(previous_texts[i]):]
-                        delta_token_ids = output.token_ids[
-                            previous_num_tokens[i]:]
-                        out_logprobs = output.logprobs[previous_num_tokens[
-                            i]:] if output.logprobs else None
+                        # The outputs only hold what is new since the
+                        # previous one (RequestOutputKind.DELTA).
+                        delta_text = output.text
+                        delta_token_ids = output.token_ids
+                        out_logprobs = output.logprobs
 
                     if request.logprobs is not None:
                         assert out_logprobs is not None, (
@@ -255,13 +256,13 @@ class OpenAIServingCompletion(OpenAIServing):
                             top_logprobs=out_logprobs,
                             num_output_top_logprobs=request.logprobs,
                             tokenizer=tokenizer,
-                            initial_text_offset=len(previous_texts[i]),
+                            initial_text_offset=previous_text_lens[i],
                         )
                     else:
                         logprobs = None
 
-                    previous_texts[i] = output.text
-                    previous_num_tokens[i] = len(output.token_ids)
+                    previous_text_lens[i] += len(output.text)
+                    previous_num_tokens[i] += len(output.token_ids)
                     finish_reason = output.finish_reason
                     stop_reason = output.stop_reason
 
@@ -283,7 +284,7 @@ class OpenAIServingCompletion(OpenAIServing):
                         if (request.stream_options.continuous_usage_stats
                                 or output.finish_reason is not None):
                             prompt_tokens = len(res.prompt_token_ids)
-                            completion_tokens = len(output.token_ids)
+                            completion_tokens = previous_num_tokens[i]
                             usage = UsageInfo(
                                 prompt_tokens=prompt_tokens,
                                 completion_tokens=completion_tokens,
@@ -366,7 +367,9 @@ class OpenAIServingCompletion(OpenAIServing):
                     logprobs=logprobs,
                     finish_reason=output.finish_reason,
                     stop_reason=output.stop_reason,
-                    prompt_logprobs=final_res.prompt_logprobs,
+                    prompt_logprobs=(list(final_res.prompt_logprobs)
+                                     if final_res.prompt_logprobs is not None
+                                     else None),
                 )
                 choices.append(choice_data)
 
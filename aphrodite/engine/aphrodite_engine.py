@@ -1,9 +1,14 @@
+import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List, Optional
+from dataclasses import dataclass
+from typing import (TYPE_CHECKING, Any, Callable, ClassVar, Dict, Iterable,
+                    List, Optional)
 from typing import Sequence as GenericSequence
 from typing import Tuple, Type, TypeVar, Union
 
+import torch
 from loguru import logger
 from transformers import PreTrainedTokenizer
 from typing_extensions import assert_never
@@ -39,6 +44,10 @@ from aphrodite.inputs import (INPUT_REGISTRY, EncoderDecoderLLMInputs,
 from aphrodite.inputs.parse import is_explicit_encoder_decoder_prompt
 from aphrodite.lora.request import LoRARequest
 from aphrodite.multimodal import MultiModalDataDict
+from aphrodite.processing.prefix_cache_snapshot import (get_fingerprint,
+                                                        load_metadata,
+                                                        remove_metadata,
+                                                        save_metadata)
 from aphrodite.processing.scheduler import (ScheduledSequenceGroup, Scheduler,
                                             SchedulerOutputs)
 from aphrodite.prompt_adapter.request import PromptAdapterRequest
@@ -68,6 +77,34 @@ def _load_generation_config_dict(model_config: ModelConfig) -> Dict[str, Any]:
 
 _O = TypeVar("_O", RequestOutput, EmbeddingRequestOutput)
 
+
+@dataclass
+class SchedulerOutputState:
+    """Caches the scheduler outputs for a virtual engine. Used for Multi-Step"""
+    last_output: Optional[SamplerOutput] = None
+    seq_group_metadata_list: Optional[List[SequenceGroupMetadata]] = None
+    scheduler_outputs: Optional[SchedulerOutputs] = None
+
+
+@dataclass
+class _PipelinedStep:
+    """A step of a virtual engine whose microbatch goes through the pipeline
+    stages. Used by `step` for pipeline parallelism."""
+    seq_group_metadata_list: List[SequenceGroupMetadata]
+    scheduler_outputs: SchedulerOutputs
+    # Waits for the model output.
+    get_output: Callable[[], Optional[List[SamplerOutput]]]
+
+
+@dataclass
+class _OverlappedStep:
+    """A step whose model execution runs while the engine processes the
+    outputs of the previous step. Used for asynchronous output processing."""
+    seq_group_metadata_list: List[SequenceGroupMetadata]
+    scheduler_outputs: SchedulerOutputs
+    # The model output and the time the execution ended.
+    output: "Future[Tuple[List[SamplerOutput], float]]"
+
 PromptComponents = Tuple[Optional[str], List[int],
                          Optional[MultiModalDataDict]]
 DecoderPromptComponents = Tuple[Optional[str], Optional[List[int]],
@@ -287,6 +324,9 @@ class AphroditeEngine:
             for _ in range(parallel_config.pipeline_parallel_size)
         ]
 
+        if self.cache_config.prefix_cache_snapshot_path is not None:
+            self._load_prefix_cache_snapshot()
+
         # Metric Logging.
         if self.log_stats:
             if stat_loggers is not None:
@@ -326,6 +366,32 @@ class AphroditeEngine:
                 ),
             ))
 
+        pipeline_parallel_size = self.parallel_config.pipeline_parallel_size
+        self.cached_scheduler_outputs = [
+            SchedulerOutputState() for _ in range(pipeline_parallel_size)
+        ]
+        # With pipeline parallelism, the step of each virtual engine being
+        # executed by the model, and the virtual engine to step next.
+        self._pipelined_steps: List[Optional[_PipelinedStep]] = [
+            None
+        ] * pipeline_parallel_size
+        self._next_virtual_engine = 0
+
+        # With asynchronous output processing, the step being executed by
+        # the model, the sequence groups stopped while it ran, and the
+        # requests aborted while it ran. The last two are freed in the next
+        # step, as the model may be reading their blocks.
+        self._overlapped_step: Optional[_OverlappedStep] = None
+        self._execute_model_thread: Optional[ThreadPoolExecutor] = None
+        self._stopped_seq_groups: List[SequenceGroup] = []
+        self._deferred_aborts: List[str] = []
+
+        # The end of the last model execution, if the engine had requests to
+        # run since, and the times the model waited for the engine between
+        # two executions since the last stats.
+        self._last_execute_model_end: Optional[float] = None
+        self._model_idle_times: List[float] = []
+
     def _initialize_kv_caches(self) -> None:
         """Initialize the KV cache in the worker(s).
 
@@ -344,6 +410,19 @@ class AphroditeEngine:
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
 
+        if self.cache_config.kv_offload_cpu_bytes > 0:
+            from aphrodite.task_handler.cache_engine import CacheEngine
+
+            # The workers size the KV offload tiers the same way.
+            self.cache_config.init_kv_offload_blocks(
+                CacheEngine.get_cache_block_size(self.cache_config,
+                                                 self.model_config,
+                                                 self.parallel_config))
+            logger.info(
+                "KV offload tiers: "
+                f"{self.cache_config.num_kv_offload_cpu_blocks} CPU blocks, "
+                f"{self.cache_config.num_kv_offload_disk_blocks} disk blocks")
+
         self.model_executor.initialize_cache(num_gpu_blocks, num_cpu_blocks)
 
     @classmethod
@@ -432,6 +511,11 @@ class AphroditeEngine:
         # Use getattr since __init__ can fail before the field is set
         if model_executor := getattr(self, "model_executor", None):
             model_executor.shutdown()
+        if output_processor := getattr(self, "output_processor", None):
+            output_processor.shutdown()
+        if execute_model_thread := getattr(self, "_execute_model_thread",
+                                           None):
+            execute_model_thread.shutdown(wait=False)
 
     MISSING_TOKENIZER_GROUP_MSG = ("Unable to get tokenizer because "
                                    "skip_tokenizer_init is True")
@@ -1029,6 +1113,14 @@ class AphroditeEngine:
             >>> # abort the request
             >>> engine.abort_request(request_id)
         """
+        if self._overlapped_step is not None:
+            # The model is running a step of the request, it is aborted once
+            # the step ends.
+            if isinstance(request_id, str):
+                self._deferred_aborts.append(request_id)
+            else:
+                self._deferred_aborts.extend(request_id)
+            return
         for scheduler in self.scheduler:
             scheduler.abort_seq_group(request_id)
 
@@ -1052,6 +1144,85 @@ class AphroditeEngine:
         """Gets the LoRA configuration."""
         return self.lora_config
 
+    def pin_prefix(self, name: str, prompt_token_ids: List[int]) -> None:
+        """Keeps the KV cache of a prompt prefix from ever being evicted.
+
+        Requires prefix caching with block manager v2. The prefix is cached
+        by the first request that computes it, and stays cached until
+        `unpin_prefix` is called with the same name.
+        """
+        for scheduler in self.scheduler:
+            scheduler.pin_prefix(name, prompt_token_ids)
+
+    def unpin_prefix(self, name: str) -> None:
+        """Makes a prefix pinned by `pin_prefix` evictable again."""
+        for scheduler in self.scheduler:
+            scheduler.unpin_prefix(name)
+
+    def save_prefix_cache_snapshot(self) -> None:
+        """Saves the most recently used blocks of the prefix cache to the
+        configured snapshot directory, to be restored by the next engine
+        started with the same model and cache configuration.
+
+        This is meant to be called on shutdown: unfinished requests are
+        aborted first, so that their cached blocks are saved as well. Does
+        nothing if no snapshot directory is configured.
+        """
+        path = self.cache_config.prefix_cache_snapshot_path
+        if path is None:
+            return
+
+        for scheduler in self.scheduler:
+            request_ids = [
+                seq_group.request_id for queue in (scheduler.waiting,
+                                                   scheduler.running,
+                                                   scheduler.swapped)
+                for seq_group in queue
+            ]
+            scheduler.abort_seq_group(request_ids)
+
+        blocks: List[List[Tuple[int, int]]] = []
+        block_ids: List[List[int]] = []
+        for scheduler in self.scheduler:
+            cached_blocks = scheduler.get_cached_blocks(
+                self.cache_config.prefix_cache_snapshot_max_blocks)
+            blocks.append([(content_hash, num_hashed_tokens)
+                           for content_hash, num_hashed_tokens, _ in
+                           cached_blocks])
+            block_ids.append(
+                [block_id for _, _, block_id in cached_blocks])
+
+        os.makedirs(path, exist_ok=True)
+        remove_metadata(path)
+        self.model_executor.save_prefix_cache_snapshot(path, block_ids)
+        save_metadata(path, self._get_prefix_cache_fingerprint(), blocks)
+        logger.info(f"Saved {sum(len(ids) for ids in block_ids)} prefix "
+                    f"cache blocks to {path}")
+
+    def _load_prefix_cache_snapshot(self) -> None:
+        path = self.cache_config.prefix_cache_snapshot_path
+        assert path is not None
+        blocks = load_metadata(path, self._get_prefix_cache_fingerprint())
+        if blocks is None:
+            return
+
+        src_indices: List[List[int]] = []
+        block_ids: List[List[int]] = []
+        for scheduler, ve_blocks in zip(self.scheduler, blocks):
+            restored = scheduler.restore_cached_blocks(ve_blocks)
+            src_indices.append([index for index, _ in restored])
+            block_ids.append([block_id for _, block_id in restored])
+
+        self.model_executor.load_prefix_cache_snapshot(path, src_indices,
+                                                       block_ids)
+        logger.info(f"Restored {sum(len(ids) for ids in block_ids)} of "
+                    f"{sum(len(ve_blocks) for ve_blocks in blocks)} prefix "
+                    f"cache blocks from {path}")
+
+    def _get_prefix_cache_fingerprint(self) -> Dict[str, Any]:
+        return get_fingerprint(self.model_config, self.cache_config,
+                               self.parallel_config)
+
     def get_num_unfinished_requests(self) -> int:
         """Gets the number of unfinished requests."""
         return sum(scheduler.get_num_unfinished_seq_groups()
@@ -1092,19 +1263,42 @@ class AphroditeEngine:
 
         Returns RequestOutputs that can be returned to the client.
         """
+        scheduled_seq_groups = self._apply_model_outputs(
+            output, scheduled_seq_groups, seq_group_metadata_list)
+        return self._create_request_outputs(scheduled_seq_groups,
+                                            ignored_seq_groups)
 
-        now = time.time()
+    def _apply_model_outputs(
+        self,
+        output: GenericSequence[Union[SamplerOutput, PoolerOutput]],
+        scheduled_seq_groups: List[ScheduledSequenceGroup],
+        seq_group_metadata_list: List[SequenceGroupMetadata],
+    ) -> List[ScheduledSequenceGroup]:
+        """Apply the model output to the sequences in the scheduled seq groups
+        and free the finished sequence groups.
 
+        Returns the scheduled seq groups to create RequestOutputs for.
+        """
         # Organize outputs by [sequence group][step] instead of
         # [step][sequence group].
         output_by_sequence_group = create_output_by_sequence_group(
             output, num_seq_groups=len(scheduled_seq_groups))
 
         # Update the scheduled sequence groups with the model outputs.
+        updated_seq_groups: List[ScheduledSequenceGroup] = []
         for scheduled_seq_group, outputs, seq_group_meta in zip(
                 scheduled_seq_groups, output_by_sequence_group,
                 seq_group_metadata_list):
             seq_group = scheduled_seq_group.seq_group
+            if seq_group.is_finished():
+                # Stopped with asynchronous output processing while the model
+                # ran this step, its final output was already returned. The
+                # new token is dropped.
+                for scheduler in self.scheduler:
+                    for seq in seq_group.get_seqs():
+                        scheduler.free_seq(seq)
+                continue
+            updated_seq_groups.append(scheduled_seq_group)
             seq_group.update_num_computed_tokens(
                 scheduled_seq_group.token_chunk_size)
             if self.model_config.embedding_mode:
@@ -1118,8 +1312,14 @@ class AphroditeEngine:
         # Free the finished sequence groups.
         for scheduler in self.scheduler:
             scheduler.free_finished_seq_groups()
+        return updated_seq_groups
 
-        # Create the outputs.
+    def _create_request_outputs(
+        self,
+        scheduled_seq_groups: List[ScheduledSequenceGroup],
+        ignored_seq_groups: List[SequenceGroup],
+    ) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        now = time.time()
         request_outputs: List[Union[RequestOutput,
                                     EmbeddingRequestOutput]] = []
         for scheduled_seq_group in scheduled_seq_groups:
@@ -1132,6 +1332,212 @@ class AphroditeEngine:
             request_outputs.append(request_output)
         return request_outputs
 
+    def _schedule_step(
+        self, virtual_engine: int
+    ) -> Tuple[List[SequenceGroupMetadata], SchedulerOutputs]:
+        # these are cached outputs from previous iterations. None if on first
+        # iteration
+        cached_outputs = self.cached_scheduler_outputs[virtual_engine]
+        seq_group_metadata_list = cached_outputs.seq_group_metadata_list
+        scheduler_outputs = cached_outputs.scheduler_outputs
+        # skip the scheduler if there are any remaining steps in the seq groups.
+        # This ensures that the scheduler is only called again when the current
+        # batch has completed.
+        if not self._has_remaining_steps(seq_group_metadata_list):
+            seq_group_metadata_list, scheduler_outputs = self.scheduler[
+                virtual_engine].schedule()
+            if (self.scheduler_config.is_multi_step
+                    and scheduler_outputs.num_lookahead_slots > 0):
+                # cache the scheduler outputs for the next iteration if we have
+                # lookahead slots
+                self._cache_scheduler_outputs_for_multi_step(
+                    virtual_engine, seq_group_metadata_list, scheduler_outputs)
+        assert seq_group_metadata_list is not None
+        assert scheduler_outputs is not None
+        return seq_group_metadata_list, scheduler_outputs
+
+    def _create_execute_model_req(
+            self,
+            seq_group_metadata_list: List[SequenceGroupMetadata],
+            scheduler_outputs: SchedulerOutputs,
+            virtual_engine: int = 0) -> ExecuteModelRequest:
+        finished_requests_ids = self.scheduler[
+            virtual_engine].get_and_reset_finished_requests_ids()
+        # Check if we have a cached last_output from the previous iteration.
+        # For supporting PP this is probably the best way to pass the
+        # sampled_token_ids, as a separate broadcast over all the PP stages
+        # will cause one virtual engine's microbatch to block the pipeline.
+        last_sampled_token_ids = \
+            self._get_last_sampled_token_ids(virtual_engine)
+        return ExecuteModelRequest(
+            seq_group_metadata_list=seq_group_metadata_list,
+            blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
+            blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
+            blocks_to_copy=scheduler_outputs.blocks_to_copy,
+            virtual_engine=virtual_engine,
+            num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
+            running_queue_size=scheduler_outputs.running_queue_size,
+            finished_requests_ids=finished_requests_ids,
+            # We use ExecuteModelRequest to pass the last sampled_token_ids
+            # to each of the non-last PP stages for in-place prepare_input.
+            last_sampled_token_ids=last_sampled_token_ids,
+            kv_offload_ops=scheduler_outputs.kv_offload_ops,
+        )
+
+    def _finish_step(
+        self, virtual_engine: int, output: List[SamplerOutput],
+        seq_group_metadata_list: List[SequenceGroupMetadata],
+        scheduler_outputs: SchedulerOutputs
+    ) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        # Finish the current step for all the sequence groups.
+        if self.scheduler_config.is_multi_step:
+            for seq_group in seq_group_metadata_list:
+                seq_group.finish_step()
+        if self._has_remaining_steps(seq_group_metadata_list):
+            return []
+        # clear the cache if we have finished all the steps
+        if self.scheduler_config.is_multi_step:
+            self.cached_scheduler_outputs[
+                virtual_engine] = SchedulerOutputState()
+        return self._process_model_outputs(
+            output, scheduler_outputs.scheduled_seq_groups,
+            scheduler_outputs.ignored_seq_groups, seq_group_metadata_list)
+
+    def _has_remaining_steps(
+        self, seq_group_metadata_list: Optional[List[SequenceGroupMetadata]]
+    ) -> bool:
+        if (not self.scheduler_config.is_multi_step
+                or not seq_group_metadata_list):
+            return False
+        # TODO: this is a sanity check for now to make sure that all the
+        # seqs are on the same steps. Eventually we will want to do some sort of
+        # dynamic scheduling when doing multi-step decoding.
+        ref_remaining_steps = seq_group_metadata_list[0].state.remaining_steps
+        if any([
+                seq_group.state.remaining_steps != ref_remaining_steps
+                for seq_group in seq_group_metadata_list[1:]
+        ]):
+            raise AssertionError(("All running sequence groups should "
+                                  "have the same remaining steps."))
+        return ref_remaining_steps > 0
+
+    def _cache_scheduler_outputs_for_multi_step(
+            self, virtual_engine: int,
+            seq_group_metadata_list: Optional[List[SequenceGroupMetadata]],
+            scheduler_outputs: SchedulerOutputs) -> None:
+        self.cached_scheduler_outputs[
+            virtual_engine].seq_group_metadata_list = seq_group_metadata_list
+        self.cached_scheduler_outputs[virtual_engine].scheduler_outputs = \
+            scheduler_outputs
+        self.cached_scheduler_outputs[virtual_engine].last_output = None
+
+    def _get_last_sampled_token_ids(
+            self, virtual_engine: int) -> Optional[torch.Tensor]:
+        cached_last_output = self.cached_scheduler_outputs[
+            virtual_engine].last_output
+        if (self.scheduler_config.is_multi_step
+                and self.parallel_config.pipeline_parallel_size > 1
+                and cached_last_output is not None
+                and cached_last_output.sampled_token_ids_cpu is not None):
+            return cached_last_output.sampled_token_ids_cpu
+        return None
+
+    def _update_cached_scheduler_output(
+            self, virtual_engine: int,
+            output: List[Optional[SamplerOutput]]) -> None:
+        if (self.parallel_config.pipeline_parallel_size > 1 and len(output) > 0
+                and output[0] is not None):
+            last_output = output[-1]
+            assert last_output is not None
+            assert last_output.sampled_token_ids_cpu is not None
+            assert last_output.sampled_token_ids is None
+            assert last_output.sampled_token_probs is None
+            self.cached_scheduler_outputs[
+                virtual_engine].last_output = last_output
+
+    def _record_model_idle_time(self) -> None:
+        if self.log_stats and self._last_execute_model_end is not None:
+            self._model_idle_times.append(time.perf_counter() -
+                                          self._last_execute_model_end)
+
+    def _execute_model_and_time(
+        self, execute_model_req: ExecuteModelRequest
+    ) -> Tuple[List[SamplerOutput], float]:
+        output = self.model_executor.execute_model(
+            execute_model_req=execute_model_req)
+        return output, time.perf_counter()
+
+    def _free_deferred_requests(self) -> None:
+        """Frees the sequence groups stopped and aborted while the model ran
+        the last step, once the model doesn't read their blocks anymore."""
+        for seq_group in self._stopped_seq_groups:
+            for scheduler in self.scheduler:
+                for seq in seq_group.get_finished_seqs():
+                    scheduler.free_seq(seq)
+                # Removes the group if it was preempted meanwhile.
+                scheduler.abort_seq_group(seq_group.request_id)
+        self._stopped_seq_groups = []
+        if self._deferred_aborts:
+            for scheduler in self.scheduler:
+                scheduler.abort_seq_group(self._deferred_aborts)
+            self._deferred_aborts = []
+
+    def _abandon_overlapped_step(self, step: _OverlappedStep) -> None:
+        """Forgets the step run by the model if it failed, so that the
+        requests aborted while it ran are aborted now, and the next ones
+        right away. A step still running, e.g. when waiting for it was
+        interrupted, is kept."""
+        if not step.output.done():
+            return
+        self._overlapped_step = None
+        self._free_deferred_requests()
+
+    def _finish_overlapped_step(
+        self, step: Optional[_OverlappedStep],
+        output: Optional[List[SamplerOutput]]
+    ) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Applies the output of the step run by the model, launches the
+        next step, and processes the rest of the outputs while the model runs.
+
+        Used for asynchronous output processing, once the model output of
+        `step` is available.
+        """
+        scheduled_seq_groups: List[ScheduledSequenceGroup] = []
+        if step is not None:
+            assert output is not None
+            scheduled_seq_groups = self._apply_model_outputs(
+                output, step.scheduler_outputs.scheduled_seq_groups,
+                step.seq_group_metadata_list)
+        self._overlapped_step = None
+        self._free_deferred_requests()
+
+        seq_group_metadata_list, scheduler_outputs = self.scheduler[
+            0].schedule()
+        if not scheduler_outputs.is_empty():
+            execute_model_req = self._create_execute_model_req(
+                seq_group_metadata_list, scheduler_outputs)
+            if self._execute_model_thread is None:
+                self._execute_model_thread = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="execute_model")
+            self._record_model_idle_time()
+            self._overlapped_step = _OverlappedStep(
+                seq_group_metadata_list, scheduler_outputs,
+                self._execute_model_thread.submit(self._execute_model_and_time,
+                                                  execute_model_req))
+        else:
+            self._last_execute_model_end = None
+
+        # The model runs the next step from here on. Detokenize the deferred
+        # tokens and create the outputs of the previous step meanwhile.
+        self._stopped_seq_groups = (
+            self.output_processor.process_deferred_outputs())
+        request_outputs = self._create_request_outputs(
+            scheduled_seq_groups, scheduler_outputs.ignored_seq_groups)
+
+        # Log stats.
+        self.do_log_stats(step.scheduler_outputs if step else None, output)
+        return request_outputs
+
     def step(self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
         """Performs one decoding iteration and returns newly generated results.
 
@@ -1160,6 +1566,10 @@ class AphroditeEngine:
 
             - Finally, it creates and returns the newly generated results.
 
+            With pipeline parallelism, each call steps the next virtual
+            engine, and returns once the microbatch of its next iteration is
+            in the first pipeline stage.
+
         Example:
             >>> # Please see the example/ folder for more detailed examples.
             >>>
@@ -1183,37 +1593,40 @@ class AphroditeEngine:
             >>>     if not (engine.has_unfinished_requests() or example_inputs):
             >>>         break
         """
+        if self.scheduler_config.async_output_proc:
+            step = self._overlapped_step
+            output = None
+            if step is not None:
+                try:
+                    output, self._last_execute_model_end = (
+                        step.output.result())
+                finally:
+                    if output is None:
+                        self._abandon_overlapped_step(step)
+            request_outputs = self._finish_overlapped_step(step, output)
+            if (self._overlapped_step is None
+                    and not self.has_unfinished_requests()):
+                self.model_executor.stop_remote_worker_execution_loop()
+            return request_outputs
         if self.parallel_config.pipeline_parallel_size > 1:
-            raise NotImplementedError(
-                "Pipeline parallelism is only supported through AsyncAphrodite "
-                "as performance will be severely degraded otherwise.")
-        if self.scheduler_config.num_scheduler_steps > 1:
-            raise NotImplementedError(
-                "Multiple scheduler steps (multi-step) are only supported "
-                "through AsyncAphrodite.")
-        seq_group_metadata_list, scheduler_outputs = self.scheduler[
-            0].schedule()
+            return self._step_pipelined()
+
+        seq_group_metadata_list, scheduler_outputs = self._schedule_step(0)
 
         if not scheduler_outputs.is_empty():
-            finished_requests_ids = self.scheduler[
-                0].get_and_reset_finished_requests_ids()
-            execute_model_req = ExecuteModelRequest(
-                seq_group_metadata_list=seq_group_metadata_list,
-                blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
-                blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
-                blocks_to_copy=scheduler_outputs.blocks_to_copy,
-                num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
-                running_queue_size=scheduler_outputs.running_queue_size,
-                finished_requests_ids=finished_requests_ids,
-            )
-            output = self.model_executor.execute_model(
-                execute_model_req=execute_model_req)
+            execute_model_req = self._create_execute_model_req(
+                seq_group_metadata_list, scheduler_outputs)
+            self._record_model_idle_time()
+            output, self._last_execute_model_end = (
+                self._execute_model_and_time(execute_model_req))
+            if self.scheduler_config.is_multi_step:
+                self._update_cached_scheduler_output(0, output)
         else:
             output = []
+            self._last_execute_model_end = None
 
-        request_outputs = self._process_model_outputs(
-            output, scheduler_outputs.scheduled_seq_groups,
-            scheduler_outputs.ignored_seq_groups, seq_group_metadata_list)
+        request_outputs = self._finish_step(0, output, seq_group_metadata_list,
+                                            scheduler_outputs)
 
         # Log stats.
         self.do_log_stats(scheduler_outputs, output)
@@ -1228,6 +1641,57 @@ class AphroditeEngine:
 
         return request_outputs
 
+    def _step_pipelined(
+            self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Performs one decoding iteration of the next virtual engine, with
+        pipeline parallelism.
+
+        The model output of the previous iteration of the virtual engine is
+        processed, and its next iteration is started without waiting for the
+        later pipeline stages, which run the microbatches of the other
+        virtual engines meanwhile.
+        """
+        virtual_engine = self._next_virtual_engine
+        self._next_virtual_engine = (
+            (virtual_engine + 1) % self.parallel_config.pipeline_parallel_size)
+
+        request_outputs: List[Union[RequestOutput,
+                                    EmbeddingRequestOutput]] = []
+        pipelined_step = self._pipelined_steps[virtual_engine]
+        if pipelined_step is not None:
+            self._pipelined_steps[virtual_engine] = None
+            output = pipelined_step.get_output()
+            assert output is not None
+            if self.scheduler_config.is_multi_step:
+                self._update_cached_scheduler_output(virtual_engine, output)
+            request_outputs = self._finish_step(
+                virtual_engine, output,
+                pipelined_step.seq_group_metadata_list,
+                pipelined_step.scheduler_outputs)
+            # Log stats.
+            self.do_log_stats(pipelined_step.scheduler_outputs, output)
+
+        seq_group_metadata_list, scheduler_outputs = self._schedule_step(
+            virtual_engine)
+        if not scheduler_outputs.is_empty():
+            execute_model_req = self._create_execute_model_req(
+                seq_group_metadata_list, scheduler_outputs, virtual_engine)
+            self._pipelined_steps[virtual_engine] = _PipelinedStep(
+                seq_group_metadata_list, scheduler_outputs,
+                self.model_executor.start_execute_model(execute_model_req))
+        else:
+            request_outputs.extend(
+                self._finish_step(virtual_engine, [], seq_group_metadata_list,
+                                  scheduler_outputs))
+
+        if (all(step is None for step in self._pipelined_steps)
+                and not self.has_unfinished_requests()):
+            # Stop the execute model loop in parallel workers until there are
+            # more requests to process.
+            self.model_executor.stop_remote_worker_execution_loop()
+
+        return request_outputs
+
     def add_logger(self, logger_name: str, logger: StatLoggerBase) -> None:
         if logger_name in self.stat_loggers:
             raise KeyError(f"Logger with name {logger_name} already exists.")
@@ -1308,10 +1772,14 @@ class AphroditeEngine:
         time_per_output_tokens_iter: List[float] = []
         num_preemption_iter = (0 if scheduler_outputs is None else
                                scheduler_outputs.preempted)
+        time_model_idle_iter = self._model_idle_times
+        self._model_idle_times = []
 
         # Request stats
         #   Latency
         time_e2e_requests: List[float] = []
+        time_tokenization_requests = (self.tokenizer.pop_tokenization_times()
+                                      if self.tokenizer else [])
         #   Metadata
         num_prompt_tokens_requests: List[int] = []
         num_generation_tokens_requests: List[int] = []
@@ -1422,10 +1890,12 @@ class AphroditeEngine:
             time_per_output_tokens_iter=time_per_output_tokens_iter,
             spec_decode_metrics=spec_decode_metrics,
             num_preemption_iter=num_preemption_iter,
+            time_model_idle_iter=time_model_idle_iter,
 
             # Request stats
             #   Latency
             time_e2e_requests=time_e2e_requests,
+            time_tokenization_requests=time_tokenization_requests,
             #   Metadata
             num_prompt_tokens_requests=num_prompt_tokens_requests,
             num_generation_tokens_requests=num_generation_tokens_requests,
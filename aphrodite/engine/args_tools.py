@@ -106,6 +106,12 @@ class EngineArgs:
     kv_cache_dtype: str = "auto"
     block_size: int = 16
     enable_prefix_caching: Optional[bool] = False
+    prefix_cache_eviction_policy: str = "lru"
+    kv_offload_cpu_gb: float = 0  # GiB
+    kv_offload_disk_gb: float = 0  # GiB
+    kv_offload_disk_path: Optional[str] = None
+    prefix_cache_snapshot_path: Optional[str] = None
+    prefix_cache_snapshot_max_blocks: Optional[int] = None
     num_gpu_blocks_override: Optional[int] = None
     disable_sliding_window: bool = False
     gpu_memory_utilization: float = 0.90
@@ -115,6 +121,9 @@ class EngineArgs:
     use_v2_block_manager: bool = False
     scheduler_delay_factor: float = 0.0
     enable_chunked_prefill: bool = False
+    scheduling_policy: str = "fcfs"
+    detokenizer_pool_size: int = 0
+    async_output_proc: bool = False
     guided_decoding_backend: str = 'lm-format-enforcer'
     max_num_batched_tokens: Optional[int] = None
     max_num_seqs: int = 256
@@ -318,8 +327,9 @@ class EngineArgs:
                             default=EngineArgs.tokenizer_pool_type,
                             help="Category: Model Options\n"
                             "The type of tokenizer pool to use for "
-                            "asynchronous tokenization. Ignored if "
-                            "tokenizer_pool_size is 0.")
+                            "asynchronous tokenization, 'ray' or 'mp' "
+                            "(local processes, doesn't require Ray). "
+                            "Ignored if tokenizer_pool_size is 0.")
         parser.add_argument("--tokenizer-pool-extra-config",
                             type=str,
                             default=EngineArgs.tokenizer_pool_extra_config,
@@ -545,6 +555,63 @@ class EngineArgs:
             help="Category: Cache Options\n"
             "Enable automatic prefix caching.",
         )
+        parser.add_argument(
+            "--prefix-cache-eviction-policy",
+            type=str,
+            default=EngineArgs.prefix_cache_eviction_policy,
+            choices=["lru", "lfu", "cost_aware"],
+            help="Category: Cache Options\n"
+            "The policy used to evict unused blocks from the prefix cache. "
+            "'lru' evicts the least recently used block, 'lfu' the least "
+            "frequently used one with aging, and 'cost_aware' the block "
+            "that is cheapest to recompute, i.e. the one with the longest "
+            "prefix. Policies other than 'lru' require "
+            "--use-v2-block-manager.",
+        )
+        parser.add_argument(
+            "--kv-offload-cpu-gb",
+            type=float,
+            default=EngineArgs.kv_offload_cpu_gb,
+            help="Category: Cache Options\n"
+            "Size of the pinned CPU pool (in GiB) per GPU that blocks evicted "
+            "from the prefix cache are demoted to, so that later requests can "
+            "copy them back instead of recomputing them. Requires "
+            "--enable-prefix-caching and --use-v2-block-manager.",
+        )
+        parser.add_argument(
+            "--kv-offload-disk-gb",
+            type=float,
+            default=EngineArgs.kv_offload_disk_gb,
+            help="Category: Cache Options\n"
+            "Size of the file (in GiB) per GPU that blocks evicted from the "
+            "CPU offload pool are demoted to. Requires --kv-offload-cpu-gb "
+            "and --kv-offload-disk-path.",
+        )
+        parser.add_argument(
+            "--kv-offload-disk-path",
+            type=str,
+            default=EngineArgs.kv_offload_disk_path,
+            help="Category: Cache Options\n"
+            "Directory on a local disk for the KV offload file.",
+        )
+        parser.add_argument(
+            "--prefix-cache-snapshot-path",
+            type=str,
+            default=EngineArgs.prefix_cache_snapshot_path,
+            help="Category: Cache Options\n"
+            "Directory to save the prefix cache to on a graceful shutdown. "
+            "A snapshot found there on startup is loaded before the server "
+            "reports healthy, if it was saved for the same model and cache "
+            "configuration. Requires --enable-prefix-caching.",
+        )
+        parser.add_argument(
+            "--prefix-cache-snapshot-max-blocks",
+            type=int,
+            default=EngineArgs.prefix_cache_snapshot_max_blocks,
+            help="Category: Cache Options\n"
+            "The maximum number of the most recently used prefix cache "
+            "blocks to save in the snapshot. Saves all of them by default.",
+        )
         parser.add_argument(
             "--num-gpu-blocks-override",
             type=int,
@@ -611,6 +678,40 @@ class EngineArgs:
             help="Category: Scheduler Options\n"
             "If True, the prefill requests can be chunked based on the "
             "max_num_batched_tokens.")
+        parser.add_argument(
+            "--scheduling-policy",
+            type=str,
+            default=EngineArgs.scheduling_policy,
+            choices=["fcfs", "priority", "edf", "fair"],
+            help="Category: Scheduler Options\n"
+            "The scheduling policy to use. 'fcfs' (first come, first served) "
+            "is the default. 'priority' schedules requests by their "
+            "`priority` field (lower first), 'edf' by their `deadline` "
+            "field (earliest first), and 'fair' shares the batch fairly "
+            "across LoRA adapters. With any policy other than 'fcfs', "
+            "running requests may be preempted in favor of more urgent "
+            "waiting requests.")
+        parser.add_argument(
+            "--detokenizer-pool-size",
+            type=int,
+            default=EngineArgs.detokenizer_pool_size,
+            help="Category: Scheduler Options\n"
+            "Number of threads that detokenize the tokens of a step while "
+            "the model runs the next step, instead of the engine thread "
+            "between steps. Each thread keeps its own copy of the "
+            "tokenizer. Stop strings are then matched one step late, and "
+            "the streamed text lags the tokens by one step. 0 (the "
+            "default) disables it.")
+        parser.add_argument(
+            "--async-output-proc",
+            action="store_true",
+            help="Category: Scheduler Options\n"
+            "Process the outputs of a step (detokenization, stop strings, "
+            "building the responses and stats) while the model runs the "
+            "next step, so that the GPU doesn't wait for them. Stop strings "
+            "and aborts take effect one step late. Not supported with "
+            "pipeline parallelism, multi-step scheduling, speculative "
+            "decoding or embedding models.")
         parser.add_argument(
             '--guided-decoding-backend',
             type=str,
@@ -930,6 +1031,13 @@ class EngineArgs:
             sliding_window=model_config.get_sliding_window(),
             enable_prefix_caching=self.enable_prefix_caching,
             cpu_offload_gb=self.cpu_offload_gb,
+            prefix_cache_eviction_policy=self.prefix_cache_eviction_policy,
+            kv_offload_cpu_gb=self.kv_offload_cpu_gb,
+            kv_offload_disk_gb=self.kv_offload_disk_gb,
+            kv_offload_disk_path=self.kv_offload_disk_path,
+            prefix_cache_snapshot_path=self.prefix_cache_snapshot_path,
+            prefix_cache_snapshot_max_blocks=self.
+            prefix_cache_snapshot_max_blocks,
         )
 
         parallel_config = ParallelConfig(
@@ -1016,6 +1124,21 @@ class EngineArgs:
             disable_logprobs=self.disable_logprobs_during_spec_decoding,
         )
 
+        if self.async_output_proc:
+            if parallel_config.pipeline_parallel_size > 1:
+                raise ValueError("Asynchronous output processing is not "
+                                 "supported with pipeline parallelism.")
+            if self.num_scheduler_steps > 1:
+                raise ValueError("Asynchronous output processing is not "
+                                 "supported with multi-step "
+                                 "(--num-scheduler-steps > 1)")
+            if speculative_config is not None:
+                raise ValueError("Asynchronous output processing is not "
+                                 "supported with speculative decoding.")
+            if model_config.embedding_mode:
+                raise ValueError("Asynchronous output processing is not "
+                                 "supported for embedding models.")
+
         if self.num_scheduler_steps > 1:
             if speculative_config is not None:
                 raise ValueError("Speculative decoding is not supported with "
@@ -1046,6 +1169,9 @@ class EngineArgs:
             num_scheduler_steps=self.num_scheduler_steps,
             send_delta_data=(APHRODITE_USE_RAY_SPMD_WORKER and
                              parallel_config.use_ray),
+            policy=self.scheduling_policy,
+            detokenizer_pool_size=self.detokenizer_pool_size,
+            async_output_proc=self.async_output_proc,
         )
 
         if not HAS_TRITON and self.enable_lora:
@@ -112,6 +112,15 @@ class Metrics:
                 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75,
                 1.0, 2.5
             ])
+        self.histogram_model_idle_time = self._histogram_cls(
+            name="aphrodite:model_idle_time_seconds",
+            documentation="Histogram of the time the model waits for the "
+            "engine between two steps in seconds.",
+            labelnames=labelnames,
+            buckets=[
+                0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25
+            ])
 
         # Request stats
         #   Latency
@@ -120,6 +129,15 @@ class Metrics:
             documentation="Histogram of end to end request latency in seconds.",
             labelnames=labelnames,
             buckets=[1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 40.0, 50.0, 60.0])
+        self.histogram_tokenization_time_request = self._histogram_cls(
+            name="aphrodite:request_tokenization_latency_seconds",
+            documentation="Histogram of prompt tokenization latency in "
+            "seconds, including the time waiting for the tokenizer pool.",
+            labelnames=labelnames,
+            buckets=[
+                0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                2.5
+            ])
         #   Metadata
         self.histogram_num_prompt_tokens_request = self._histogram_cls(
             name="aphrodite:request_prompt_tokens",
@@ -453,11 +471,15 @@ class PrometheusStatLogger(StatLoggerBase):
                             stats.time_to_first_tokens_iter)
         self._log_histogram(self.metrics.histogram_time_per_output_token,
                             stats.time_per_output_tokens_iter)
+        self._log_histogram(self.metrics.histogram_model_idle_time,
+                            stats.time_model_idle_iter)
 
         # Request level data
         # Latency
         self._log_histogram(self.metrics.histogram_e2e_time_request,
                             stats.time_e2e_requests)
+        self._log_histogram(self.metrics.histogram_tokenization_time_request,
+                            stats.time_tokenization_requests)
         # Metadata
         finished_reason_counter = CollectionsCounter(
             stats.finished_reason_requests)
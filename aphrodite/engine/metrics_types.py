@@ -37,9 +37,11 @@ class Stats:
     time_to_first_tokens_iter: List[float]
     time_per_output_tokens_iter: List[float]
     num_preemption_iter: int
+    time_model_idle_iter: List[float]
     # Request stats (should have _requests suffix)
     #   Latency
     time_e2e_requests: List[float]
+    time_tokenization_requests: List[float]
     #   Metadata
     num_prompt_tokens_requests: List[int]
     num_generation_tokens_requests: List[int]
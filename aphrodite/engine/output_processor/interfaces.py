@@ -75,3 +75,15 @@ class SequenceGroupOutputProcessor(ABC):
                                outputs: List[SequenceGroupOutput]) -> None:
         """Update prompt logprobs received from outputs to seq_group."""
         pass
+
+    def shutdown(self) -> None:  # noqa: B027
+        """Stops the threads the processor started, if any."""
+
+    def process_deferred_outputs(self) -> List[SequenceGroup]:
+        """Detokenize and stop check the new tokens whose processing was
+        deferred by `process_outputs`, e.g. to run while the model executes
+        the next step. The sequences that are stopped are not freed.
+
+        Returns the sequence groups with sequences that were stopped.
+        """
+        return []
@@ -1,4 +1,7 @@
-from typing import Dict, List, Tuple, Union
+import copy
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
 from aphrodite.common.config import SchedulerConfig
 from aphrodite.common.sampling_params import SamplingParams
@@ -9,9 +12,56 @@ from aphrodite.common.utils import Counter
 from aphrodite.engine.output_processor.interfaces import (
     SequenceGroupOutputProcessor)
 from aphrodite.engine.output_processor.stop_checker import StopChecker
+from aphrodite.lora.request import LoRARequest
 from aphrodite.processing.scheduler import Scheduler
 from aphrodite.transformers_utils.detokenizer import Detokenizer
 
+# The most tokenizers a detokenizer worker keeps a copy of, e.g. for LoRA
+# adapters with their own tokenizer.
+_MAX_WORKER_TOKENIZERS = 8
+
+
+class _DetokenizerWorker:
+    """A thread that detokenizes new tokens with its own copies of the
+    tokenizers.
+
+    The tokenizers are not shared with the engine thread or the other
+    workers: the Rust backend of the fast tokenizers raises "Already
+    borrowed" when a thread uses a tokenizer while another one changes its
+    truncation or padding, as encoding the prompt of a new request does.
+    """
+
+    def __init__(self, detokenizer: Detokenizer):
+        self.detokenizer = detokenizer
+        self.executor = ThreadPoolExecutor(
+            1, thread_name_prefix="aphrodite-detokenizer")
+        # id of the shared tokenizer -> (shared tokenizer, copy). Holding
+        # the shared tokenizer keeps its id from being reused.
+        self._tokenizers: "OrderedDict[int, Tuple[object, object]]" = (
+            OrderedDict())
+
+    def submit(self, seq: Sequence, sampling_params: SamplingParams) -> Future:
+        """Detokenizes the new token of `seq` in the worker thread. Must be
+        called from the engine thread, which copies the tokenizer."""
+        return self.executor.submit(self.detokenizer.decode_new_token, seq,
+                                    sampling_params, self._get_tokenizer(seq))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def _get_tokenizer(self, seq: Sequence):
+        tokenizer = self.detokenizer.get_tokenizer_for_seq(seq)
+        key = id(tokenizer)
+        entry = self._tokenizers.get(key)
+        if entry is None:
+            entry = (tokenizer, copy.deepcopy(tokenizer))
+            self._tokenizers[key] = entry
+            if len(self._tokenizers) > _MAX_WORKER_TOKENIZERS:
+                self._tokenizers.popitem(last=False)
+        else:
+            self._tokenizers.move_to_end(key)
+        return entry[1]
+
 
 class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
     """SequenceGroupOutputProcessor which handles "output processing" logic,
@@ -25,6 +75,18 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
     such as speculative decoding or multi-step decoding. This enables beam
     search sampling, which requires forking/finishing/freeing sequences in a way
     that is currently difficult to schedule multiple steps ahead of time.
+
+    With a detokenizer pool, the new token of a sequence that can only be
+    stopped by a stop string is detokenized by the pool while the next step
+    runs. Its text is added, and matched against the stop strings, when the
+    next token of the sequence is processed. If it matches, that next token
+    is dropped and the sequence is finished. Each worker of the pool uses
+    its own copies of the tokenizers, see `_DetokenizerWorker`.
+
+    With asynchronous output processing, such tokens are instead detokenized
+    and stop checked by `process_deferred_outputs`, which the engine calls
+    while the model runs the next step. A sequence stopped there is freed,
+    and its token of the next step dropped, when that token is processed.
     """
 
     def __init__(
@@ -40,6 +102,19 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
         self.scheduler = scheduler
         self.seq_counter = seq_counter
         self.stop_checker = stop_checker
+        self.detokenizer_pool: List[_DetokenizerWorker] = []
+        if detokenizer:
+            self.detokenizer_pool = [
+                _DetokenizerWorker(detokenizer)
+                for _ in range(scheduler_config.detokenizer_pool_size)
+            ]
+        # Sequences whose new token is processed by process_deferred_outputs.
+        self._deferred_seqs: List[Tuple[Sequence, SequenceGroup]] = []
+
+    def shutdown(self) -> None:
+        for worker in self.detokenizer_pool:
+            worker.shutdown()
+        self.detokenizer_pool = []
 
     def process_outputs(self, sequence_group: SequenceGroup,
                         outputs: List[SequenceGroupOutput]) -> None:
@@ -67,7 +142,9 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
         if prompt_logprobs is not None:
             if not seq_group.prompt_logprobs:
                 prompt_logprobs = [None] + prompt_logprobs
-                seq_group.prompt_logprobs = []
+                # An empty container of the same type, FlatLogprobs from
+                # the sampler.
+                seq_group.prompt_logprobs = prompt_logprobs[:0]
             if seq_group.sampling_params.detokenize and self.detokenizer:
                 self.detokenizer.decode_prompt_logprobs_inplace(
                     seq_group,
@@ -83,8 +160,35 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
             sample = outputs.samples[0]
             # only have one sequence
             seq = seq_group.seqs[0]
+            if seq.pending_token_text is not None:
+                self._add_pending_token_text(seq, sampling_params,
+                                             seq_group.lora_request)
+            if seq.is_finished():
+                # The previous token stopped the sequence, so the new one is
+                # dropped.
+                for scheduler in self.scheduler:
+                    scheduler.free_seq(seq)
+                return
             seq.append_token_id(sample.output_token, sample.logprobs)
             if sampling_params.detokenize and self.detokenizer:
+                # The text of the last token of a sequence must be in its
+                # final output, so only tokens that can't stop the sequence
+                # without a stop string are deferred.
+                if not self.stop_checker.may_stop_without_text(
+                        seq, sampling_params,
+                        lora_req=seq_group.lora_request):
+                    # The logprobs are returned with the step's outputs, so
+                    # their decoded tokens can't be late.
+                    if (self.detokenizer_pool
+                            and sampling_params.logprobs is None):
+                        worker = self.detokenizer_pool[
+                            seq.seq_id % len(self.detokenizer_pool)]
+                        seq.pending_token_text = worker.submit(
+                            seq, sampling_params)
+                        return
+                    if self.scheduler_config.async_output_proc:
+                        self._deferred_seqs.append((seq, seq_group))
+                        return
                 new_char_count = self.detokenizer.decode_sequence_inplace(
                     seq, sampling_params)
             else:
@@ -280,6 +384,38 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
                 for scheduler in self.scheduler:
                     scheduler.free_seq(seq)
 
+    def process_deferred_outputs(self) -> List[SequenceGroup]:
+        stopped_seq_groups: List[SequenceGroup] = []
+        for seq, seq_group in self._deferred_seqs:
+            if seq.is_finished():
+                # Aborted meanwhile.
+                continue
+            sampling_params = seq_group.sampling_params
+            new_char_count = self.detokenizer.decode_sequence_inplace(
+                seq, sampling_params)
+            self.stop_checker.maybe_stop_sequence(
+                seq,
+                new_char_count,
+                sampling_params,
+                lora_req=seq_group.lora_request,
+            )
+            if seq.is_finished():
+                stopped_seq_groups.append(seq_group)
+        self._deferred_seqs.clear()
+        return stopped_seq_groups
+
+    def _add_pending_token_text(self, seq: Sequence,
+                                sampling_params: SamplingParams,
+                                lora_req: Optional[LoRARequest]) -> None:
+        assert seq.pending_token_text is not None
+        new_text = seq.pending_token_text.result()
+        seq.pending_token_text = None
+        seq.output_text += new_text
+        self.stop_checker.maybe_stop_sequence(seq,
+                                              len(new_text),
+                                              sampling_params,
+                                              lora_req=lora_req)
+
     def _check_beam_search_early_stopping(
         self,
         early_stopping: Union[bool, str],
@@ -1,4 +1,8 @@
-from typing import Callable, Optional
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, Optional
+from typing import Sequence as GenericSequence
+from typing import Tuple
 
 from transformers import PreTrainedTokenizer
 
@@ -7,6 +11,94 @@ from aphrodite.common.sequence import Sequence, SequenceStatus
 from aphrodite.lora.request import LoRARequest
 
 
+class StopSequenceMatcher:
+    """Aho-Corasick automaton that matches a set of stop strings, or of stop
+    token id sequences, at once. The cost of checking a new token is
+    proportional to the number of new characters or tokens rather than to
+    the number of stop sequences. Use `get_stop_string_matcher` and
+    `get_stop_token_sequence_matcher` to share matchers between requests.
+    """
+
+    def __init__(self, stop: Tuple[GenericSequence[Hashable], ...]):
+        self.stop = stop
+        self.max_stop_len = max(len(stop_seq) for stop_seq in stop)
+        # Trie transitions and failure links of each state.
+        self.goto: List[Dict[Hashable, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Smallest index of the stop sequences that end in each state,
+        # including through failure links, or -1.
+        self.output: List[int] = [-1]
+        for index, stop_seq in enumerate(stop):
+            state = 0
+            for item in stop_seq:
+                next_state = self.goto[state].get(item)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][item] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(-1)
+                state = next_state
+            if self.output[state] == -1:
+                self.output[state] = index
+
+        # Breadth-first, so that failure links point to computed states.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for item, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and item not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(item, 0)
+                self.fail[next_state] = fail
+                if self.output[fail] != -1 and (
+                        self.output[next_state] == -1
+                        or self.output[fail] < self.output[next_state]):
+                    self.output[next_state] = self.output[fail]
+
+    def match(self,
+              text: GenericSequence[Hashable],
+              start: int,
+              state: int,
+              min_end: int = 0) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """Feeds `text[start:]`, a string or a sequence of token ids, to the
+        automaton, starting from `state`.
+
+        Returns:
+            The new state, and the index of the first stop sequence in the
+            stop list that was matched, ending at or after `min_end`, along
+            with the position of its first match, or None if no stop
+            sequence was matched.
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        match = None
+        for pos in range(start, len(text)):
+            item = text[pos]
+            while state and item not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(item, 0)
+            index = output[state]
+            if index != -1 and pos >= min_end - 1 and (match is None
+                                                       or index < match[0]):
+                match = (index, pos + 1 - len(self.stop[index]))
+        return state, match
+
+
+@lru_cache(maxsize=1024)
+def get_stop_string_matcher(stop: Tuple[str, ...]) -> StopSequenceMatcher:
+    return StopSequenceMatcher(stop)
+
+
+@lru_cache(maxsize=1024)
+def get_stop_token_sequence_matcher(
+        stop: Tuple[Tuple[int, ...], ...]) -> StopSequenceMatcher:
+    return StopSequenceMatcher(stop)
+
+
 class StopChecker:
     """AphroditeEngine helper class which separates out the logic involving
     stop checking. This checks things such as: whether the eos token was
@@ -68,6 +160,19 @@ class StopChecker:
             seq.stop_reason = last_token_id
             return
 
+        # Check if a stop token sequence was encountered.
+        stop_token_sequence = self._check_stop_token_sequences(
+            seq, sampling_params)
+        if stop_token_sequence is not None:
+            if seq.output_text and (
+                    not sampling_params.include_stop_str_in_output):
+                self._remove_stop_token_sequence_text(seq,
+                                                      stop_token_sequence,
+                                                      sampling_params)
+            seq.status = SequenceStatus.FINISHED_STOPPED
+            seq.stop_reason = stop_token_sequence[-1]
+            return
+
         # Check if any stop strings are matched.
         stop_str = self._check_stop_strings(seq, new_char_count,
                                             sampling_params)
@@ -86,6 +191,70 @@ class StopChecker:
             seq.status = SequenceStatus.FINISHED_LENGTH_CAPPED
             return
 
+    def may_stop_without_text(
+        self,
+        seq: Sequence,
+        sampling_params: SamplingParams,
+        lora_req: Optional[LoRARequest] = None,
+    ) -> bool:
+        """Whether the new token of the sequence may stop it by a check that
+        doesn't match its output text, i.e. all checks of
+        `maybe_stop_sequence` except the stop strings. Stop token sequences
+        are assumed to match, since their text is removed from the output.
+        """
+        if seq.get_output_len() < sampling_params.min_tokens:
+            return False
+        last_token_id = seq.get_last_token_id()
+        return ((not sampling_params.ignore_eos
+                 and last_token_id == seq.eos_token_id)
+                or last_token_id in sampling_params.stop_token_ids
+                or bool(sampling_params.stop_token_sequences)
+                or seq.get_len() > self._get_max_model_len(lora_req)
+                or seq.get_output_len() == sampling_params.max_tokens)
+
+    @staticmethod
+    def _check_stop_token_sequences(
+            seq: Sequence,
+            sampling_params: SamplingParams) -> Optional[List[int]]:
+        """Check if the output token ids end with a stop token sequence.
+
+        Returns the stop token sequence if matched or else None.
+        """
+        stop_token_sequences = sampling_params.stop_token_sequences
+        if not stop_token_sequences:
+            return None
+
+        matcher = get_stop_token_sequence_matcher(
+            tuple(
+                tuple(stop_token_sequence)
+                for stop_token_sequence in stop_token_sequences))
+        output_token_ids = seq.data.output_token_ids_array
+        start = min_end = len(output_token_ids) - 1
+        state = 0
+        if (seq.stop_token_match_state is not None
+                and seq.stop_token_match_state[1] == start):
+            # Only match the new token.
+            state = seq.stop_token_match_state[0]
+        else:
+            # The previous tokens were not matched, e.g. because of
+            # min_tokens, so also match those that may start a sequence.
+            start = max(0, start - matcher.max_stop_len)
+        state, match = matcher.match(output_token_ids, start, state, min_end)
+        if match is None:
+            seq.stop_token_match_state = (state, len(output_token_ids))
+            return None
+        return stop_token_sequences[match[0]]
+
+    def _remove_stop_token_sequence_text(
+            self, seq: Sequence, stop_token_sequence: List[int],
+            sampling_params: SamplingParams) -> None:
+        tokenizer = self.get_tokenizer_for_seq(seq)
+        stop_text = tokenizer.decode(
+            stop_token_sequence,
+            skip_special_tokens=sampling_params.skip_special_tokens)
+        if stop_text and seq.output_text.endswith(stop_text):
+            seq.output_text = seq.output_text[:-len(stop_text)]
+
     @staticmethod
     def _check_stop_strings(seq: Sequence, new_char_count: int,
                             sampling_params: SamplingParams) -> Optional[str]:
@@ -94,26 +263,36 @@ class StopChecker:
 
         Returns the stop string if matched or else None.
         """
-        if not new_char_count:
+        if not new_char_count or not sampling_params.stop:
             return None
 
-        for stop_str in sampling_params.stop:
-            stop_string_len = len(stop_str)
-            # Avoid searching already-searched text.
-            stop_index = seq.output_text.find(
-                stop_str, -new_char_count - stop_string_len)
-            if stop_index == -1:
-                continue
-
-            if sampling_params.include_stop_str_in_output:
-                # Truncate to end of stop string.
-                stop_index += stop_string_len
-                if stop_index >= len(seq.output_text):
-                    # No truncation required.
-                    return stop_str
-
-            # Truncate the output text to either the beginning
-            # or end of the stop string.
-            seq.output_text = seq.output_text[:stop_index]
-            return stop_str
-        return None
+        matcher = get_stop_string_matcher(tuple(sampling_params.stop))
+        start = min_end = len(seq.output_text) - new_char_count
+        state = 0
+        if (seq.stop_string_match_state is not None
+                and seq.stop_string_match_state[1] == start):
+            # Only match the new characters.
+            state = seq.stop_string_match_state[0]
+        else:
+            # The previous characters were not matched, e.g. because of
+            # min_tokens, so also match those that may start a stop string.
+            start = max(0, start - matcher.max_stop_len)
+        state, match = matcher.match(seq.output_text, start, state, min_end)
+        if match is None:
+            seq.stop_string_match_state = (state, len(seq.output_text))
+            return None
+
+        index, stop_index = match
+        stop_str = sampling_params.stop[index]
+        stop_string_len = len(stop_str)
+        if sampling_params.include_stop_str_in_output:
+            # Truncate to end of stop string.
+            stop_index += stop_string_len
+            if stop_index >= len(seq.output_text):
+                # No truncation required.
+                return stop_str
+
+        # Truncate the output text to either the beginning
+        # or end of the stop string.
+        seq.output_text = seq.output_text[:stop_index]
+        return stop_str
@@ -54,6 +54,9 @@ if TYPE_CHECKING:
     APHRODITE_TEST_FORCE_FP8_MARLIN: bool = False
     APHRODITE_ALLOW_ENGINE_USE_RAY: bool = False
     APHRODITE_PLUGINS: Optional[List[str]] = None
+    APHRODITE_GUIDED_DECODING_CACHE_SIZE: int = 64
+    APHRODITE_GUIDED_DECODING_CACHE_DIR: str = os.path.join(
+        APHRODITE_CACHE_ROOT, "guided_decoding")
 
 
 def get_default_cache_root():
@@ -372,6 +375,24 @@ environment_variables: Dict[str, Callable[[], Any]] = {
     "APHRODITE_PLUGINS":
     lambda: None if "APHRODITE_PLUGINS" not in os.environ else os.environ[
         "APHRODITE_PLUGINS"].split(","),
+
+    # The most guides compiled by outlines kept in memory and shared by the
+    # requests using the same regex, JSON schema or grammar.
+    "APHRODITE_GUIDED_DECODING_CACHE_SIZE":
+    lambda: int(os.getenv("APHRODITE_GUIDED_DECODING_CACHE_SIZE", "64")),
+
+    # Path to the directory the compiled regex guides are saved to, so that
+    # they survive restarts. Set it to an empty string to only cache them in
+    # memory. The guides are pickled, so the directory must be private to
+    # the user running the server: it is created with mode 0o700, and one
+    # writable by other users is not used.
+    "APHRODITE_GUIDED_DECODING_CACHE_DIR":
+    lambda: os.path.expanduser(
+        os.getenv(
+            "APHRODITE_GUIDED_DECODING_CACHE_DIR",
+            os.path.join(get_default_cache_root(), "aphrodite",
+                         "guided_decoding"),
+        )),
 }
 
 # end-env-vars-definition
@@ -1,6 +1,7 @@
 import asyncio
 from abc import abstractmethod
-from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple, Union
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple,
+                    Union)
 
 from loguru import logger
 
@@ -66,22 +67,28 @@ class DistributedGPUExecutor(GPUExecutor):
     def execute_model(
             self,
             execute_model_req: ExecuteModelRequest) -> List[SamplerOutput]:
+        driver_outputs = self.start_execute_model(execute_model_req)()
+        assert driver_outputs is not None
+        return driver_outputs
+
+    def start_execute_model(
+        self, execute_model_req: ExecuteModelRequest
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
         if self.parallel_worker_tasks is None:
             self.parallel_worker_tasks = self._run_workers(
                 "start_worker_execution_loop",
                 async_run_tensor_parallel_workers_only=True,
                 **self.extra_execute_model_run_workers_kwargs)
 
-        # Only the driver worker returns the sampling results.
-        driver_outputs = self._driver_execute_model(execute_model_req)
-        assert driver_outputs is not None
-        return driver_outputs
+        # Only the driver worker (of the last pipeline stage) returns the
+        # sampling results.
+        return self._driver_start_execute_model(execute_model_req)
 
     def stop_remote_worker_execution_loop(self) -> None:
         if self.parallel_worker_tasks is None:
             return
 
-        self._driver_execute_model(execute_model_req=None)
+        self._driver_start_execute_model(execute_model_req=None)()
         parallel_worker_tasks = self.parallel_worker_tasks
         self.parallel_worker_tasks = None
         # Ensure that workers exit model loop cleanly
@@ -123,6 +130,20 @@ class DistributedGPUExecutor(GPUExecutor):
                           pattern=pattern,
                           max_size=max_size)
 
+    def save_prefix_cache_snapshot(self, path: str,
+                                   block_ids: List[List[int]]) -> None:
+        self._run_workers("save_prefix_cache_snapshot",
+                          path=path,
+                          block_ids=block_ids)
+
+    def load_prefix_cache_snapshot(self, path: str,
+                                   src_indices: List[List[int]],
+                                   block_ids: List[List[int]]) -> None:
+        self._run_workers("load_prefix_cache_snapshot",
+                          path=path,
+                          src_indices=src_indices,
+                          block_ids=block_ids)
+
     @abstractmethod
     def _driver_execute_model(
         self, execute_model_req: Optional[ExecuteModelRequest]
@@ -134,6 +155,17 @@ class DistributedGPUExecutor(GPUExecutor):
         """
         raise NotImplementedError
 
+    def _driver_start_execute_model(
+        self, execute_model_req: Optional[ExecuteModelRequest]
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
+        """Run execute_model in the driver worker of each pipeline stage, and
+        return a function waiting for the output of the last stage.
+        Passing None will cause the drivers to stop the model execution loop
+        running in each of the remote workers.
+        """
+        output = self._driver_execute_model(execute_model_req)
+        return lambda: output
+
     @abstractmethod
     def _run_workers(
         self,
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Set, Tuple
+from typing import Callable, List, Optional, Set, Tuple
 
 from aphrodite.common.config import (CacheConfig, DeviceConfig, LoadConfig,
                                      LoRAConfig, ModelConfig, ParallelConfig,
@@ -78,6 +78,19 @@ class ExecutorBase(ABC):
         """Executes at least one model step on the given sequences."""
         raise NotImplementedError
 
+    def start_execute_model(
+        self, execute_model_req: ExecuteModelRequest
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
+        """Starts executing at least one model step on the given sequences,
+        and returns a function waiting for the output.
+
+        Executors running pipeline parallelism return before the later stages
+        are done, so that the engine can start the microbatches of the other
+        virtual engines meanwhile.
+        """
+        output = self.execute_model(execute_model_req)
+        return lambda: output
+
     def stop_remote_worker_execution_loop(self) -> None:
         """Releases parallel workers from model loop."""
         return
@@ -121,6 +134,22 @@ class ExecutorBase(ABC):
         exception."""
         raise NotImplementedError
 
+    def save_prefix_cache_snapshot(self, path: str,
+                                   block_ids: List[List[int]]) -> None:
+        """Saves the KV cache of the given GPU blocks of each virtual engine
+        to the prefix cache snapshot directory `path`."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support prefix cache snapshots.")
+
+    def load_prefix_cache_snapshot(self, path: str,
+                                   src_indices: List[List[int]],
+                                   block_ids: List[List[int]]) -> None:
+        """Loads the blocks at `src_indices` of each virtual engine's saved
+        blocks from the prefix cache snapshot directory `path` into the
+        GPU blocks `block_ids`."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support prefix cache snapshots.")
+
     def shutdown(self) -> None:
         """Shutdown the executor."""
         return
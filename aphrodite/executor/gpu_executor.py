@@ -165,6 +165,16 @@ class GPUExecutor(ExecutorBase):
     def list_prompt_adapters(self) -> Set[int]:
         return self.driver_worker.list_prompt_adapters()
 
+    def save_prefix_cache_snapshot(self, path: str,
+                                   block_ids: List[List[int]]) -> None:
+        self.driver_worker.save_prefix_cache_snapshot(path, block_ids)
+
+    def load_prefix_cache_snapshot(self, path: str,
+                                   src_indices: List[List[int]],
+                                   block_ids: List[List[int]]) -> None:
+        self.driver_worker.load_prefix_cache_snapshot(path, src_indices,
+                                                      block_ids)
+
     def check_health(self) -> None:
         # GPUExecutor will always be healthy as long as
         # it's running.
@@ -9,9 +9,9 @@ def encode_hook(obj: Any) -> Any:
     See https://jcristharif.com/msgspec/api.html#msgspec.msgpack.Encoder
     """
     if isinstance(obj, array):
-        assert obj.typecode == APHRODITE_TOKEN_ID_ARRAY_TYPE, (
-            f"Aphrodite array type should use '{APHRODITE_TOKEN_ID_ARRAY_TYPE}'"
-            f" type. Given array has a type code of {obj.typecode}.")
+        if obj.typecode != APHRODITE_TOKEN_ID_ARRAY_TYPE:
+            # Arrays declared as lists, like the columns of FlatLogprobs.
+            return obj.tolist()
         return obj.tobytes()
 
 def decode_hook(type: Type, obj: Any) -> Any:
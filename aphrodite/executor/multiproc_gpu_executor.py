@@ -4,7 +4,7 @@ import signal
 import threading
 import weakref
 from functools import partial
-from typing import Any, List, Optional
+from typing import Any, Callable, List, Optional
 
 import torch
 from loguru import logger
@@ -152,6 +152,24 @@ class MultiprocessingGPUExecutor(DistributedGPUExecutor):
         """
         return self.driver_worker.execute_model(execute_model_req)
 
+    def _driver_start_execute_model(
+        self, execute_model_req: Optional[ExecuteModelRequest]
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
+        if not self.tp_driver_workers:
+            return super()._driver_start_execute_model(execute_model_req)
+
+        # Each worker runs its tasks in order, so the stages get the
+        # microbatches of the virtual engines in the same order. The later
+        # stages wait for the output of the previous one.
+        stage_outputs = [
+            driver_worker.execute_method("execute_model", execute_model_req)
+            for driver_worker in self.tp_driver_workers
+        ]
+        self.driver_worker.execute_model(execute_model_req)
+
+        # Only the last PP stage has the final results.
+        return lambda: [output.get() for output in stage_outputs][-1]
+
     def _run_workers(
         self,
         method: str,
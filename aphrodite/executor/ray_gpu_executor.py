@@ -2,7 +2,7 @@ import asyncio
 import os
 from collections import defaultdict
 from itertools import islice, repeat
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 import msgspec
 from loguru import logger
@@ -314,6 +314,33 @@ class RayGPUExecutor(DistributedGPUExecutor):
         return self.driver_worker.execute_method("execute_model",
                                                  execute_model_req)
 
+    def _driver_start_execute_model(
+        self, execute_model_req: Optional[ExecuteModelRequest]
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
+        if not self.tp_driver_workers:
+            return super()._driver_start_execute_model(execute_model_req)
+
+        # Actors run the tasks of a caller in order, so the stages get the
+        # microbatches of the virtual engines in the same order. The later
+        # stages wait for the output of the previous one.
+        stage_outputs = [
+            driver_worker.execute_method.remote("execute_model",
+                                                execute_model_req)
+            for driver_worker in self.tp_driver_workers
+        ]
+        self._driver_execute_model(execute_model_req)
+
+        # Only the last PP stage has the final results.
+        return lambda: ray.get(stage_outputs)[-1]
+
+    def start_execute_model(
+        self, execute_model_req: ExecuteModelRequest
+    ) -> Callable[[], Optional[List[SamplerOutput]]]:
+        if not self.use_ray_spmd_worker:
+            return super().start_execute_model(execute_model_req)
+        output = self.execute_model(execute_model_req)
+        return lambda: output
+
     def execute_model(
             self,
             execute_model_req: ExecuteModelRequest) -> List[SamplerOutput]:
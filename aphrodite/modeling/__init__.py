@@ -1,12 +1,14 @@
 from aphrodite.modeling.parameter import (BaseAphroditeParameter,
                                           PackedAphroditeParameter)
 from aphrodite.modeling.sampling_metadata import (SamplingMetadata,
-                                                  SamplingMetadataCache)
+                                                  SamplingMetadataCache,
+                                                  TokenCountCache)
 from aphrodite.modeling.utils import set_random_seed
 
 __all__ = [
     "SamplingMetadata",
     "SamplingMetadataCache",
+    "TokenCountCache",
     "set_random_seed",
     "BaseAphroditeParameter",
     "PackedAphroditeParameter",
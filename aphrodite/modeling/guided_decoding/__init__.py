@@ -1,4 +1,4 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 from aphrodite.common.sampling_params import LogitsProcessorFunc
 from aphrodite.endpoints.openai.protocol import (
@@ -11,7 +11,8 @@ from aphrodite.triton_utils import HAS_TRITON
 if HAS_TRITON:
     from aphrodite.modeling.guided_decoding.outlines_decoding import (
         get_local_outlines_guided_decoding_logits_processor,
-        get_outlines_guided_decoding_logits_processor)
+        get_outlines_guided_decoding_logits_processor,
+        precompile_outlines_guides)
 
 
 async def get_guided_decoding_logits_processor(
@@ -55,6 +56,19 @@ def get_local_guided_decoding_logits_processor(
         "Must be one of 'outlines, 'lm-format-enforcer'")
 
 
+async def precompile_guided_decoding_guides(
+        guided_decoding_backend: str,
+        guided_options: List[GuidedDecodingRequest], tokenizer) -> int:
+    """Compiles the guides of `guided_options` ahead of the requests using
+    them. Returns the number of guides compiled or already cached."""
+    if guided_decoding_backend == 'outlines' and HAS_TRITON:
+        return await precompile_outlines_guides(guided_options, tokenizer)
+
+    raise ValueError(
+        "Precompiling guides is only supported by the 'outlines' guided "
+        f"decoding backend, not '{guided_decoding_backend}'")
+
+
 def _adapt_request_for_tool_use(request: Union[CompletionRequest,
                                                ChatCompletionRequest]):
     # the legacy completion API does not support tool use
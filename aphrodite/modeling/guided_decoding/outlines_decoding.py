@@ -3,7 +3,7 @@ import concurrent.futures
 from enum import Enum
 from json import dumps as json_dumps
 from re import escape as regex_escape
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 
 from pydantic import BaseModel
 from transformers import PreTrainedTokenizerBase
@@ -61,20 +61,16 @@ async def get_outlines_guided_decoding_logits_processor(
     """
     Given an OpenAI-compatible request, check for guided decoding parameters
     and get the necessary logits processor for the given guide.
-    We cache logit processors by (guide, tokenizer), and on cache hit
-    we make a shallow copy to reuse the same underlying FSM.
+    The compiled guides are cached by (guide, tokenizer fingerprint), so
+    the requests using the same guide share the same underlying FSM.
     """
-    global global_thread_pool
     guide, mode = _get_guide_and_mode(request)
     if not guide or not mode:
         return None
 
-    if global_thread_pool is None:
-        global_thread_pool = concurrent.futures.ThreadPoolExecutor(
-            max_workers=2)
     loop = asyncio.get_running_loop()
 
-    return await loop.run_in_executor(global_thread_pool,
+    return await loop.run_in_executor(_get_thread_pool(),
                                       _get_logits_processor, guide, tokenizer,
                                       mode, request.guided_whitespace_pattern)
 
@@ -86,8 +82,8 @@ def get_local_outlines_guided_decoding_logits_processor(
     """
     Given an OpenAI-compatible request, check for guided decoding parameters
     and get the necessary logits processor for the given guide.
-    We cache logit processors by (guide, tokenizer), and on cache hit
-    we make a shallow copy to reuse the same underlying FSM.
+    The compiled guides are cached by (guide, tokenizer fingerprint), so
+    the requests using the same guide share the same underlying FSM.
     """
     guide, mode = _get_guide_and_mode(guided_options)
     if not guide or not mode:
@@ -97,6 +93,36 @@ def get_local_outlines_guided_decoding_logits_processor(
                                  guided_options.guided_whitespace_pattern)
 
 
+async def precompile_outlines_guides(
+        guided_options: List[GuidedDecodingRequest],
+        tokenizer: PreTrainedTokenizerBase) -> int:
+    """
+    Compile the guides of the given guided decoding options into the guide
+    cache, so that the first requests using them don't wait for them.
+    Returns the number of guides compiled or found in the cache.
+    """
+    loop = asyncio.get_running_loop()
+    futures = []
+    for options in guided_options:
+        guide, mode = _get_guide_and_mode(options)
+        if not guide or not mode:
+            continue
+        futures.append(
+            loop.run_in_executor(_get_thread_pool(), _get_logits_processor,
+                                 guide, tokenizer, mode,
+                                 options.guided_whitespace_pattern))
+    await asyncio.gather(*futures)
+    return len(futures)
+
+
+def _get_thread_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global global_thread_pool
+    if global_thread_pool is None:
+        global_thread_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2)
+    return global_thread_pool
+
+
 def _get_guide_and_mode(
     request: Union[CompletionRequest, ChatCompletionRequest,
                    GuidedDecodingRequest]
@@ -0,0 +1,286 @@
+"""A cache of the guides compiled by outlines, shared by all the requests
+using the same regex, JSON schema or grammar with the same vocabulary.
+
+Compiling the FSM of a regex against the vocabulary can take seconds for a
+large JSON schema. The compiled guides are kept in a bounded in-memory LRU
+and, for regexes, saved to a directory so that they survive restarts.
+
+The saved guides are pickles, and loading a pickle can run arbitrary code,
+so the directory must only be writable by the user running the server. It
+is created with mode 0o700, and a directory writable by its group or by
+others, or owned by another user, is not used.
+"""
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+from transformers import PreTrainedTokenizerBase
+
+from aphrodite import envs
+
+# Bump when the saved guides can no longer be loaded by this version.
+_DISK_CACHE_VERSION = 1
+
+
+@lru_cache(maxsize=32)
+def get_tokenizer_fingerprint(tokenizer: PreTrainedTokenizerBase) -> str:
+    """Hashes what compiling a guide reads from the tokenizer, so that
+    tokenizers with the same vocabulary share their guides."""
+    vocab = sorted(tokenizer.get_vocab().items(), key=lambda item: item[1])
+    fingerprint = hashlib.sha256()
+    fingerprint.update(type(tokenizer).__name__.encode())
+    fingerprint.update(repr(tokenizer.eos_token_id).encode())
+    fingerprint.update(repr(sorted(tokenizer.all_special_tokens)).encode())
+    for token, token_id in vocab:
+        fingerprint.update(f"{token_id}\0{token}\0".encode(
+            "utf-8", "surrogatepass"))
+    return fingerprint.hexdigest()
+
+
+class _GuideCacheMetrics:
+    """Prometheus metrics of the guide cache.
+
+    They are created on first use, as the OpenAI server only sets up
+    prometheus_client for multiprocessing once it starts the engine.
+    """
+
+    def __init__(self):
+        import prometheus_client
+
+        self.counter_hits = prometheus_client.Counter(
+            name="aphrodite:guided_decoding_cache_hits",
+            documentation="Number of guides found in the guided decoding "
+            "cache, by where they were found.",
+            labelnames=["source"])
+        self.counter_misses = prometheus_client.Counter(
+            name="aphrodite:guided_decoding_cache_misses",
+            documentation="Number of guides compiled because they were not "
+            "in the guided decoding cache.",
+            labelnames=["kind"])
+        self.histogram_compile_time = prometheus_client.Histogram(
+            name="aphrodite:guided_decoding_compile_time_seconds",
+            documentation="Histogram of the time to compile a guide in "
+            "seconds.",
+            labelnames=["kind"],
+            buckets=[0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0])
+
+
+class _CompileLock:
+    """The lock of a guide being compiled and the number of threads holding
+    or waiting for it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.num_users = 0
+
+
+class GuideCache:
+    """A thread-safe LRU of compiled guides, keyed by a hash of the kind of
+    guide, its regex or grammar, and the tokenizer fingerprint.
+
+    When `cache_dir` is set, the guides that are persisted are also pickled
+    to it and loaded back from it before being compiled again. Only one
+    thread compiles a given guide; the others asking for it wait for it.
+    """
+
+    def __init__(self, max_size: int, cache_dir: Optional[str] = None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir or None
+        self._cache_dir_checked = False
+        self._guides: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._compile_locks: Dict[str, _CompileLock] = {}
+
+    def get(self,
+            kind: str,
+            source: str,
+            tokenizer: PreTrainedTokenizerBase,
+            compile_guide: Callable[[], object],
+            persist: bool = False):
+        """Returns the guide of `kind` for `source`, calling
+        `compile_guide` if it is neither in memory nor on disk."""
+        key = self.get_key(kind, source, tokenizer)
+        guide = self._get_from_memory(key)
+        if guide is not None:
+            self._get_metrics().counter_hits.labels("memory").inc()
+            return guide
+
+        with self._lock:
+            compile_lock = self._compile_locks.get(key)
+            if compile_lock is None:
+                compile_lock = self._compile_locks[key] = _CompileLock()
+            compile_lock.num_users += 1
+        try:
+            with compile_lock.lock:
+                guide = self._get_from_memory(key)
+                if guide is not None:
+                    self._get_metrics().counter_hits.labels("memory").inc()
+                    return guide
+                if persist:
+                    guide = self._load(key)
+                if guide is not None:
+                    self._get_metrics().counter_hits.labels("disk").inc()
+                else:
+                    guide = self._compile(kind, compile_guide)
+                    if persist:
+                        self._save(key, guide)
+                self._put(key, guide)
+                return guide
+        finally:
+            # Only the last user removes the lock, so that a thread arriving
+            # while others still wait for it does not compile the guide again.
+            with self._lock:
+                compile_lock.num_users -= 1
+                if compile_lock.num_users == 0:
+                    del self._compile_locks[key]
+
+    def clear(self) -> None:
+        """Drops the guides kept in memory."""
+        with self._lock:
+            self._guides.clear()
+
+    def __len__(self) -> int:
+        return len(self._guides)
+
+    def get_key(self, kind: str, source: str,
+                tokenizer: PreTrainedTokenizerBase) -> str:
+        """Returns the key of a guide, the same in every process for the
+        same kind, source and tokenizer vocabulary."""
+        key = hashlib.sha256()
+        key.update(f"{_DISK_CACHE_VERSION}\0{kind}\0".encode())
+        key.update(source.encode("utf-8", "surrogatepass"))
+        key.update(b"\0" + get_tokenizer_fingerprint(tokenizer).encode())
+        return key.hexdigest()
+
+    def _get_from_memory(self, key: str):
+        with self._lock:
+            guide = self._guides.get(key)
+            if guide is not None:
+                self._guides.move_to_end(key)
+            return guide
+
+    def _put(self, key: str, guide) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._guides[key] = guide
+            self._guides.move_to_end(key)
+            while len(self._guides) > self.max_size:
+                self._guides.popitem(last=False)
+
+    def _compile(self, kind: str, compile_guide: Callable[[], object]):
+        metrics = self._get_metrics()
+        metrics.counter_misses.labels(kind).inc()
+        start = time.perf_counter()
+        guide = compile_guide()
+        elapsed = time.perf_counter() - start
+        metrics.histogram_compile_time.labels(kind).observe(elapsed)
+        if elapsed > 1.0:
+            logger.info(f"Compiled a {kind} guide in {elapsed:.2f}s")
+        return guide
+
+    def _get_path(self, key: str) -> str:
+        assert self.cache_dir is not None
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _check_cache_dir(self) -> bool:
+        """Creates the cache directory private to the current user if it
+        does not exist, and disables the disk cache if it is not private,
+        as anyone able to write to it could make us unpickle their files."""
+        with self._lock:
+            if self._cache_dir_checked:
+                return self.cache_dir is not None
+            self._cache_dir_checked = True
+            if self.cache_dir is None:
+                return False
+            try:
+                os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+                dir_stat = os.stat(self.cache_dir)
+            except OSError as e:
+                logger.warning("Failed to create the guided decoding cache "
+                               f"directory {self.cache_dir}, only caching "
+                               f"guides in memory: {e}")
+                self.cache_dir = None
+                return False
+            if dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                reason = "is writable by other users"
+            elif (hasattr(os, "getuid")
+                  and dir_stat.st_uid != os.getuid()):
+                reason = "is owned by another user"
+            else:
+                return True
+            logger.warning(
+                f"The guided decoding cache directory {self.cache_dir} "
+                f"{reason}, only caching guides in memory. Make it private "
+                "with `chmod 700` or set APHRODITE_GUIDED_DECODING_CACHE_DIR "
+                "to a private directory.")
+            self.cache_dir = None
+            return False
+
+    def _load(self, key: str):
+        if not self._check_cache_dir():
+            return None
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to load the guide cached at {path}, "
+                           f"compiling it again: {e}")
+            return None
+
+    def _save(self, key: str, guide) -> None:
+        if not self._check_cache_dir():
+            return
+        try:
+            # Write to a temporary file first so that other processes never
+            # read a partially written guide.
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                            suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(guide, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._get_path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.warning(
+                f"Failed to save a guide to {self.cache_dir}: {e}")
+
+    def _get_metrics(self) -> _GuideCacheMetrics:
+        global _metrics
+        if _metrics is None:
+            with _guide_cache_lock:
+                if _metrics is None:
+                    _metrics = _GuideCacheMetrics()
+        return _metrics
+
+
+_guide_cache: Optional[GuideCache] = None
+_metrics: Optional[_GuideCacheMetrics] = None
+_guide_cache_lock = threading.Lock()
+
+
+def get_guide_cache() -> GuideCache:
+    """Returns the guide cache of the process, configured with
+    APHRODITE_GUIDED_DECODING_CACHE_SIZE and
+    APHRODITE_GUIDED_DECODING_CACHE_DIR."""
+    global _guide_cache
+    if _guide_cache is None:
+        with _guide_cache_lock:
+            if _guide_cache is None:
+                _guide_cache = GuideCache(
+                    envs.APHRODITE_GUIDED_DECODING_CACHE_SIZE,
+                    envs.APHRODITE_GUIDED_DECODING_CACHE_DIR)
+    return _guide_cache
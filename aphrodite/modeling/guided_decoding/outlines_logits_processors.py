@@ -16,43 +16,65 @@
 import copy
 import json
 import math
-from collections import defaultdict
+import weakref
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Callable, DefaultDict, Dict, List, Union
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import torch
 from pydantic import BaseModel
 from transformers import PreTrainedTokenizerBase
 
+from aphrodite import envs
+from aphrodite.modeling.guided_decoding.outlines_guide_cache import (
+    get_guide_cache)
 from aphrodite.triton_utils import HAS_TRITON
 
 if HAS_TRITON:
-    from outlines.caching import cache
     from outlines.fsm.guide import CFGGuide, Generate, Guide, RegexGuide, Write
     from outlines.fsm.json_schema import build_regex_from_schema
 
 
-class BaseLogitsProcessor:
-
-    def __init__(self, guide: Guide):
-        self._guide: Guide = guide
-        self._fsm_state: DefaultDict[int, int] = defaultdict(int)
-
-    def __call__(self, input_ids: List[int],
-                 scores: torch.Tensor) -> torch.Tensor:
-        """Use the FSM to bias the logits before sampling the next token."""
-
-        seq_id = hash(tuple(input_ids))
-
-        if len(input_ids) > 0:
-            last_token = input_ids[-1]
-            last_seq_id = hash(tuple(input_ids[:-1]))
-            self._fsm_state[seq_id] = self._guide.get_next_state(
-                state=self._fsm_state[last_seq_id], token_id=last_token)
-
-        instruction = self._guide.get_next_instruction(
-            state=self._fsm_state[seq_id])
-
+# The most sequences whose FSM state a logits processor keeps. The state of
+# a sequence that was evicted is rebuilt from its tokens.
+_MAX_TRACKED_SEQS = 4096
+
+# The number of last tokens checked to tell that a sequence id was reused for
+# other tokens, e.g. by the temporary sequences of speculative decoding.
+_NUM_CHECKED_TOKENS = 8
+
+# The most allowed tokens masks cached per guide, at vocab_size / 8 bytes
+# each.
+_MAX_CACHED_MASKS = 1024
+
+
+class _AllowedTokensMasks:
+    """The tokens allowed in the FSM states of a guide, packed one bit per
+    token (in little bit order), with the masks of the least recently used
+    states evicted first."""
+
+    def __init__(self, guide: "Guide", max_size: int):
+        self._guide = guide
+        self._max_size = max_size
+        self._masks: "OrderedDict[Tuple[int, int], torch.Tensor]" = (
+            OrderedDict())
+
+    def get(self, state: int, vocab_size: int) -> torch.Tensor:
+        key = (state, vocab_size)
+        mask = self._masks.get(key)
+        if mask is not None:
+            self._masks.move_to_end(key)
+            return mask
+        mask = self.compute(state, vocab_size)
+        if self._max_size > 0:
+            self._masks[key] = mask
+            if len(self._masks) > self._max_size:
+                self._masks.popitem(last=False)
+        return mask
+
+    def compute(self, state: int, vocab_size: int) -> torch.Tensor:
+        instruction = self._guide.get_next_instruction(state=state)
         if type(instruction) == Generate:
             allowed_tokens = instruction.tokens
         elif type(instruction) == Write:
@@ -61,12 +83,120 @@ class BaseLogitsProcessor:
         else:
             raise TypeError(
                 f"Unsupported instruction type {type(instruction)}")
+        allowed = np.zeros(vocab_size, dtype=np.bool_)
+        allowed[np.asarray(allowed_tokens, dtype=np.int64)] = True
+        return torch.from_numpy(np.packbits(allowed, bitorder="little"))
+
+
+# The masks of a guide are shared by the logits processors using it. They
+# are kept by the key of the guide in the guide cache rather than by the
+# guide object, as the OpenAI server pickles the logits processors of each
+# request, so each of them unpickles its own copy of the guide. The least
+# recently used guides are evicted first.
+_guide_masks: "OrderedDict[str, _AllowedTokensMasks]" = OrderedDict()
+# The masks of the guides without a key, e.g. not from the guide cache.
+_unkeyed_guide_masks: ("weakref.WeakKeyDictionary[Guide, "
+                       "_AllowedTokensMasks]") = weakref.WeakKeyDictionary()
+
+
+def _get_allowed_tokens_masks(guide: "Guide",
+                              guide_key: Optional[str]) -> _AllowedTokensMasks:
+    if guide_key is None:
+        masks = _unkeyed_guide_masks.get(guide)
+        if masks is None:
+            masks = _unkeyed_guide_masks[guide] = _AllowedTokensMasks(
+                guide, _MAX_CACHED_MASKS)
+        return masks
+    masks = _guide_masks.get(guide_key)
+    if masks is not None:
+        _guide_masks.move_to_end(guide_key)
+        return masks
+    masks = _guide_masks[guide_key] = _AllowedTokensMasks(
+        guide, _MAX_CACHED_MASKS)
+    if len(_guide_masks) > max(1, envs.APHRODITE_GUIDED_DECODING_CACHE_SIZE):
+        _guide_masks.popitem(last=False)
+    return masks
 
-        mask = torch.full((scores.shape[-1], ),
-                          -math.inf,
-                          device=scores.device)
-        mask[allowed_tokens] = 0
-        scores.add_(mask)
+
+class BaseLogitsProcessor:
+    """Biases the logits with the FSM of a guide.
+
+    The FSM state of each sequence is kept by sequence id, with the number of
+    tokens it accounts for, and advanced by the tokens appended since the
+    last call. A sequence seen for the first time, e.g. forked for `n > 1`
+    or beam search, gets its state from its tokens once. Preemption doesn't
+    change the tokens of a sequence, so its state stays valid. If the last
+    tokens the state accounts for no longer match, the sequence id was
+    reused for other tokens and the state is rebuilt from them.
+    """
+
+    # Whether the tokens allowed in an FSM state only depend on the state,
+    # so that their masks can be cached.
+    _cache_masks = True
+
+    def __init__(self, guide: Guide, guide_key: Optional[str] = None):
+        self._guide: Guide = guide
+        # The key of the guide in the guide cache, which identifies it
+        # across processes.
+        self._guide_key = guide_key
+        # Sequence id -> (number of tokens, their last tokens, FSM state),
+        # least recently used first.
+        self._fsm_states: ("OrderedDict[int, Tuple[int, Tuple[int, ...], "
+                           "int]]") = OrderedDict()
+
+    def _get_fsm_state(self, input_ids: Sequence[int],
+                       seq_id: Optional[int]) -> int:
+        entry = None if seq_id is None else self._fsm_states.pop(seq_id, None)
+        num_tokens, state = 0, 0
+        if entry is not None:
+            cached_num_tokens, last_tokens, cached_state = entry
+            if (cached_num_tokens <= len(input_ids) and last_tokens == tuple(
+                    input_ids[cached_num_tokens -
+                              len(last_tokens):cached_num_tokens])):
+                num_tokens, state = cached_num_tokens, cached_state
+        for token_id in input_ids[num_tokens:]:
+            state = self._guide.get_next_state(state=state, token_id=token_id)
+        if seq_id is not None:
+            num_tokens = len(input_ids)
+            last_tokens = tuple(
+                input_ids[max(0, num_tokens -
+                              _NUM_CHECKED_TOKENS):num_tokens])
+            self._fsm_states[seq_id] = (num_tokens, last_tokens, state)
+            if len(self._fsm_states) > _MAX_TRACKED_SEQS:
+                self._fsm_states.popitem(last=False)
+        return state
+
+    def get_allowed_tokens_mask(self,
+                                input_ids: Sequence[int],
+                                vocab_size: int,
+                                seq_id: Optional[int] = None) -> torch.Tensor:
+        """Returns the tokens the FSM allows next, as a CPU uint8 tensor of
+        `ceil(vocab_size / 8)` bytes with one bit per token in little bit
+        order.
+
+        `_apply_logits_processors` uses it to mask the logits of all the
+        guided sequences at once.
+        """
+        state = self._get_fsm_state(input_ids, seq_id)
+        if self._cache_masks:
+            masks = _get_allowed_tokens_masks(self._guide, self._guide_key)
+            return masks.get(state, vocab_size)
+        return _AllowedTokensMasks(self._guide, 0).compute(state, vocab_size)
+
+    def __call__(self,
+                 input_ids: Sequence[int],
+                 scores: torch.Tensor,
+                 seq_id: Optional[int] = None) -> torch.Tensor:
+        """Use the FSM to bias the logits before sampling the next token.
+
+        Without a `seq_id`, the FSM state is computed from all the tokens.
+        """
+        vocab_size = scores.shape[-1]
+        packed = self.get_allowed_tokens_mask(input_ids, vocab_size, seq_id)
+        allowed = torch.from_numpy(
+            np.unpackbits(packed.numpy(), count=vocab_size,
+                          bitorder="little").astype(np.bool_))
+        scores.masked_fill_(~allowed.to(scores.device), -math.inf)
 
         return scores
 
@@ -74,11 +204,14 @@ class BaseLogitsProcessor:
 class RegexLogitsProcessor(BaseLogitsProcessor):
 
     @classmethod
-    @cache()
     def _get_guide(cls, regex_string: str,
                    tokenizer: PreTrainedTokenizerBase) -> Guide:
-        tokenizer = _adapt_tokenizer(tokenizer)
-        return RegexGuide(regex_string, tokenizer)
+        return get_guide_cache().get(
+            "regex",
+            regex_string,
+            tokenizer,
+            lambda: RegexGuide(regex_string, _adapt_tokenizer(tokenizer)),
+            persist=True)
 
     def __init__(self, regex_string: str, tokenizer: PreTrainedTokenizerBase):
         """Compile the FSM that drives the regex-structured generation.
@@ -92,7 +225,8 @@ class RegexLogitsProcessor(BaseLogitsProcessor):
 
         """
         super().__init__(
-            RegexLogitsProcessor._get_guide(regex_string, tokenizer))
+            RegexLogitsProcessor._get_guide(regex_string, tokenizer),
+            get_guide_cache().get_key("regex", regex_string, tokenizer))
 
 
 class JSONLogitsProcessor(RegexLogitsProcessor):
@@ -132,11 +266,16 @@ class JSONLogitsProcessor(RegexLogitsProcessor):
 
 class CFGLogitsProcessor(BaseLogitsProcessor):
 
+    # The guide keeps the state of the parser besides the FSM state.
+    _cache_masks = False
+
     @classmethod
-    @cache()
     def _get_guide(cls, cfg: str, tokenizer: PreTrainedTokenizerBase) -> Guide:
-        tokenizer = _adapt_tokenizer(tokenizer)
-        return CFGGuide(cfg, tokenizer)
+        # The guide holds the adapted tokenizer, which can't be pickled, and
+        # is cheap to build, so it is only cached in memory.
+        return get_guide_cache().get(
+            "cfg", cfg, tokenizer,
+            lambda: CFGGuide(cfg, _adapt_tokenizer(tokenizer)))
 
     def __init__(self, cfg: str, tokenizer: PreTrainedTokenizerBase):
         """Compile the FSM that drives the context free grammar generation.
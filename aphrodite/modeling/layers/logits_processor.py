@@ -1,6 +1,6 @@
 """A layer that compute logits from hidden_stats."""
 import inspect
-from typing import Optional
+from typing import List, Optional
 
 import torch
 import torch.nn as nn
@@ -119,6 +119,11 @@ def _apply_logits_processors(
 ) -> torch.Tensor:
     found_logits_processors = False
     logits_processed = 0
+    # Rows masked by processors that only allow some tokens, and their packed
+    # masks, applied to all the rows at once.
+    masked_rows: List[int] = []
+    packed_masks: List[torch.Tensor] = []
+    vocab_size = logits.shape[-1]
     for seq_group in sampling_metadata.seq_groups:
         seq_ids = seq_group.seq_ids
         sampling_params = seq_group.sampling_params
@@ -126,29 +131,83 @@ def _apply_logits_processors(
 
         if logits_processors:
             found_logits_processors = True
+            mask_processors = []
+            row_processors = []
+            for logits_processor in logits_processors:
+                if hasattr(logits_processor, "get_allowed_tokens_mask"):
+                    mask_processors.append(logits_processor)
+                else:
+                    row_processors.append(
+                        (logits_processor,
+                         inspect.signature(logits_processor).parameters))
 
             for seq_id, logits_row_idx in zip(seq_ids,
                                               seq_group.sample_indices):
+                seq_data = seq_group.seq_data[seq_id]
+
+                # The masks are applied after the other processors of the
+                # row, which can't make a token disallowed by them allowed.
+                packed_mask = None
+                for logits_processor in mask_processors:
+                    mask = logits_processor.get_allowed_tokens_mask(
+                        seq_data.output_token_ids_array,
+                        vocab_size,
+                        seq_id=seq_id)
+                    packed_mask = (mask if packed_mask is None else
+                                   packed_mask & mask)
+                if packed_mask is not None:
+                    masked_rows.append(logits_row_idx)
+                    packed_masks.append(packed_mask)
+
+                if not row_processors:
+                    continue
+
                 logits_row = logits[logits_row_idx]
-                past_tokens_ids = seq_group.seq_data[seq_id].output_token_ids
-                prompt_tokens_ids = seq_group.seq_data[seq_id].prompt_token_ids
-
-                for logits_processor in logits_processors:
-                    parameters = inspect.signature(logits_processor).parameters
-                    if len(parameters) == 3:
-                        logits_row = logits_processor(prompt_tokens_ids,
-                                                      past_tokens_ids,
-                                                      logits_row)
+                for logits_processor, parameters in row_processors:
+                    if "seq_id" in parameters:
+                        # Processors keeping state per sequence only read
+                        # the new tokens, so they get them without a copy.
+                        logits_row = logits_processor(
+                            seq_data.output_token_ids_array,
+                            logits_row,
+                            seq_id=seq_id)
+                    elif len(parameters) == 3:
+                        logits_row = logits_processor(
+                            seq_data.prompt_token_ids,
+                            seq_data.output_token_ids, logits_row)
                     else:
-                        logits_row = logits_processor(past_tokens_ids,
-                                                      logits_row)
+                        logits_row = logits_processor(
+                            seq_data.output_token_ids, logits_row)
 
                 logits[logits_row_idx] = logits_row
 
         logits_processed += len(seq_group.sample_indices) + len(
             seq_group.prompt_logprob_indices)
 
+    if masked_rows:
+        _apply_allowed_tokens_masks(logits, masked_rows, packed_masks)
+
     if found_logits_processors:
         # verifies that no rows in logits were missed unexpectedly
         assert logits_processed == logits.shape[0]
     return logits
+
+
+def _apply_allowed_tokens_masks(
+    logits: torch.Tensor,
+    rows: List[int],
+    packed_masks: List[torch.Tensor],
+) -> None:
+    """Sets the logits of the tokens a row doesn't allow to -inf.
+
+    Each mask has one bit per token in little bit order. They are copied to
+    the device packed and unpacked there, in one go for all the rows.
+    """
+    vocab_size = logits.shape[-1]
+    packed = torch.stack(packed_masks).to(logits.device, non_blocking=True)
+    shifts = torch.arange(8, dtype=torch.uint8, device=logits.device)
+    allowed = ((packed.unsqueeze(-1) >> shifts) & 1).flatten(1)
+    allowed = allowed[:, :vocab_size].bool()
+    row_indices = torch.tensor(rows, dtype=torch.long, device=logits.device)
+    logits[row_indices] = logits[row_indices].masked_fill(
+        ~allowed, -float("inf"))
@@ -3,7 +3,7 @@ import itertools
 import warnings
 from enum import IntEnum
 from math import inf
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import torch
 import torch.nn as nn
@@ -11,10 +11,11 @@ from loguru import logger
 
 import aphrodite._custom_ops as ops
 from aphrodite import envs
-from aphrodite.common.sampling_params import SamplingType
-from aphrodite.common.sequence import (CompletionSequenceGroupOutput, Logprob,
-                                       PromptLogprobs, SampleLogprobs,
-                                       SamplerOutput, SequenceOutput)
+from aphrodite.common.sampling_params import SamplingParams, SamplingType
+from aphrodite.common.sequence import (CompletionSequenceGroupOutput,
+                                       FlatLogprobs, Logprob, PromptLogprobs,
+                                       SampleLogprobs, SamplerOutput,
+                                       SequenceOutput)
 from aphrodite.triton_utils import HAS_TRITON
 
 if HAS_TRITON:
@@ -36,6 +37,9 @@ _TEMPERATURE_MINIMUM = 2e-5
 # of top-k and top-p
 APHRODITE_USE_SAMPLING_KERNELS = envs.APHRODITE_USE_SAMPLING_KERNELS
 
+# The number of logprobs that are compared at once to compute the ranks.
+_RANKS_CHUNK_NUMEL = 1 << 26
+
 
 class SamplerID(IntEnum):
     # Mirror these in aphrodite/common/sampling_params.py
@@ -57,6 +61,37 @@ class SamplerID(IntEnum):
     XTC = 13
 
 
+_DEFAULT_SAMPLER_ORDER = (
+    SamplerID.DRY,
+    SamplerID.PENALTIES,
+    SamplerID.NO_REPEAT_NGRAM,
+    SamplerID.TEMPERATURE,
+    SamplerID.TOP_NSIGMA,
+    SamplerID.TOP_P_TOP_K,
+    SamplerID.TOP_A,
+    SamplerID.MIN_P,
+    SamplerID.TFS,
+    SamplerID.ETA_CUTOFF,
+    SamplerID.EPSILON_CUTOFF,
+    SamplerID.TYPICAL_P,
+    SamplerID.QUADRATIC,
+    SamplerID.XTC,
+)
+
+# The samplers that only mask out tokens, with the names of their sampling
+# tensors. Runs of them are applied in one pass by _apply_truncation_samplers.
+_TRUNCATION_SAMPLERS: Dict[SamplerID, Tuple[str, ...]] = {
+    SamplerID.TOP_NSIGMA: ("nsigmas", ),
+    SamplerID.TOP_P_TOP_K: ("top_ps", "top_ks"),
+    SamplerID.TOP_A: ("top_as", ),
+    SamplerID.MIN_P: ("min_ps", ),
+    SamplerID.TFS: ("tfss", ),
+    SamplerID.ETA_CUTOFF: ("eta_cutoffs", ),
+    SamplerID.EPSILON_CUTOFF: ("epsilon_cutoffs", ),
+    SamplerID.TYPICAL_P: ("typical_ps", ),
+}
+
+
 class Sampler(nn.Module):
     """Samples the next tokens from the model's outputs.
 
@@ -145,7 +180,8 @@ class Sampler(nn.Module):
         # Prepare sampling tensors with pinned memory to avoid blocking.
         if not sampling_metadata.reuse_sampling_tensors:
             self._init_sampling_tensors(logits, sampling_metadata)
-        elif self._do_penalties or self._do_dry:
+        elif self._do_dry or (self._do_penalties and
+                              sampling_metadata.token_count_cache is None):
             # In this case, the sampling tensors logic depends on
             # "output_tokens" of a sequence. As a result, we cannot
             # reuse sampling tensors, since "output_tokens" changes
@@ -156,6 +192,124 @@ class Sampler(nn.Module):
         sampling_tensors = self._sampling_tensors
         do_penalties = self._do_penalties
         do_no_repeat_ngrams = self._do_no_repeat_ngrams
+        do_skew = self._do_skew
+
+        logits = _apply_min_tokens_penalty(logits, sampling_metadata)
+        banned_tokens = _get_custom_token_bans(sampling_metadata)
+        logits = _apply_token_bans(logits, banned_tokens)
+
+        # The samplers that need the token history of the sequences are
+        # prepared once for the whole batch.
+        penalty_counts = None
+        if do_penalties and sampling_metadata.token_count_cache is not None:
+            token_count_cache = sampling_metadata.token_count_cache
+            if sampling_metadata.reuse_sampling_tensors:
+                # The sequences don't have the tokens of the previous steps
+                # yet, which were added to the counts on device.
+                penalty_counts = token_count_cache.get_last_counts(
+                    sampling_metadata, *logits.shape, logits.device)
+            else:
+                penalty_counts = token_count_cache.get_counts(
+                    sampling_metadata, *logits.shape, logits.device)
+        ngram_bans = None
+        if do_no_repeat_ngrams:
+            ngram_bans = _get_no_repeat_ngram_bans(sampling_metadata,
+                                                   logits.device)
+
+        # Each request can apply the samplers in its own order. The rows of
+        # the logits are grouped by order, and each group goes through its
+        # samplers as one batch.
+        rows_by_order = _get_rows_by_sampler_order(sampling_metadata)
+        if len(rows_by_order) <= 1:
+            sampler_order = next(iter(rows_by_order), _DEFAULT_SAMPLER_ORDER)
+            logits = self._apply_samplers(logits, sampler_order,
+                                          sampling_tensors, sampling_metadata,
+                                          penalty_counts, ngram_bans)
+        else:
+            for sampler_order, rows in rows_by_order.items():
+                rows_t = torch.tensor(rows, device=logits.device)
+                logits[rows_t] = self._apply_samplers(
+                    logits[rows_t], sampler_order,
+                    sampling_tensors.select_rows(rows_t), sampling_metadata,
+                    None if penalty_counts is None else
+                    (penalty_counts[0][rows_t], penalty_counts[1][rows_t]),
+                    None if ngram_bans is None else _select_ban_rows(
+                        ngram_bans, rows_t, logits.shape[0]))
+
+        # We use float32 for probabilities and log probabilities.
+        # Compute the probabilities.
+        probs = torch.softmax(logits, dim=-1, dtype=torch.float)
+
+        # skew needs to be applied post-softmax
+        if do_skew:
+            if (sampling_metadata.seq_groups and
+                sampling_metadata.seq_groups[0].is_prompt):
+                logger.debug(
+                    "Applying Skew sampling with skew: "
+                    f"{sampling_tensors.skews}.")
+            # reference: https://github.com/turboderp/exllamav2/commit/1de4cdd70b09208e7b4f17ee322c190e16f60efd
+            cum_probs = torch.cumsum(probs, dim=-1)
+            cum_probs = torch.pow(cum_probs, torch.exp(
+                sampling_tensors.skews).unsqueeze(dim=1))
+            probs = torch.diff(cum_probs, dim=-1,
+                               prepend=torch.zeros_like(cum_probs[..., :1]))
+            logits = torch.log(probs)
+
+        # Compute the log probabilities.
+        logprobs = torch.log_softmax(logits, dim=-1, dtype=torch.float)
+
+        # Sample the next tokens.
+        sample_results, maybe_sampled_tokens_tensor = _sample(
+            probs,
+            logprobs,
+            sampling_metadata,
+            sampling_tensors,
+            include_gpu_probs_tensor=self.include_gpu_probs_tensor,
+            modify_greedy_probs=self._should_modify_greedy_probs_inplace,
+        )
+
+        if self.include_gpu_probs_tensor:
+            assert maybe_sampled_tokens_tensor is not None
+            on_device_tensors = (probs, logprobs, maybe_sampled_tokens_tensor)
+        else:
+            on_device_tensors = None
+
+        # Get the logprobs query results.
+        prompt_logprobs = None
+        sample_logprobs = None
+        if not sampling_metadata.skip_sampler_cpu_output:
+            prompt_logprobs, sample_logprobs = _get_logprobs(
+                logprobs, sampling_metadata, sample_results)
+
+        return _build_sampler_output(
+            sample_results,
+            sampling_metadata,
+            prompt_logprobs,
+            sample_logprobs,
+            on_device_tensors=on_device_tensors,
+            skip_sampler_cpu_output=sampling_metadata.skip_sampler_cpu_output)
+
+    def _apply_samplers(
+        self,
+        logits: torch.Tensor,
+        sampler_order: Tuple[SamplerID, ...],
+        sampling_tensors: SamplingTensors,
+        sampling_metadata: SamplingMetadata,
+        penalty_counts: Optional[Tuple[torch.Tensor, torch.Tensor]],
+        ngram_bans: Optional[torch.Tensor],
+    ) -> torch.Tensor:
+        """Applies the samplers to the logits in the given order.
+
+        Args:
+            logits: The rows of the logits that use `sampler_order`.
+            sampling_tensors: The sampling tensors of these rows.
+            penalty_counts: The prompt mask and output token counts of these
+                rows, if they are kept by a TokenCountCache.
+            ngram_bans: (row, token id) pairs to ban in these rows for
+                no_repeat_ngram_size.
+        """
+        do_penalties = self._do_penalties
+        do_no_repeat_ngrams = self._do_no_repeat_ngrams
         do_temperatures = self._do_temperatures
         do_top_p_top_k = self._do_top_p_top_k
         do_top_as = self._do_top_as
@@ -169,53 +323,6 @@ class Sampler(nn.Module):
         do_nsigmas = self._do_nsgimas
         do_dry = self._do_dry
         do_skew = self._do_skew
-        do_temp_last = self._do_temp_last
-
-        logits = _apply_min_tokens_penalty(logits, sampling_metadata)
-        banned_tokens = _get_custom_token_bans(sampling_metadata)
-        logits = _apply_token_bans(logits, banned_tokens)
-
-        sampler_order = None
-        if sampling_metadata.seq_groups:
-            sampler_order = sampling_metadata.seq_groups[
-                0].sampling_params.sampler_priority
-
-            # Warn if both custom order and temp_last are specified
-            if (sampling_metadata.seq_groups and 
-                sampling_metadata.seq_groups[0].is_prompt and
-                sampler_order is not None and 
-                do_temp_last):
-                logger.warning(
-                    "Both sampler_priority and temperature_last=True "
-                    "were specified. Using custom sampler_priority order "
-                    "and ignoring temperature_last.")
-
-        if sampler_order is None:
-            default_order = [
-                SamplerID.DRY,
-                SamplerID.PENALTIES,
-                SamplerID.NO_REPEAT_NGRAM,
-                SamplerID.TEMPERATURE,
-                SamplerID.TOP_NSIGMA,
-                SamplerID.TOP_P_TOP_K,
-                SamplerID.TOP_A,
-                SamplerID.MIN_P,
-                SamplerID.TFS,
-                SamplerID.ETA_CUTOFF,
-                SamplerID.EPSILON_CUTOFF,
-                SamplerID.TYPICAL_P,
-                SamplerID.QUADRATIC,
-                SamplerID.XTC,
-            ]
-
-            sampler_order = []
-            for sampler_id in default_order:
-                if sampler_id == SamplerID.TEMPERATURE and do_temp_last:
-                    continue
-                sampler_order.append(sampler_id)
-
-                if sampler_id == SamplerID.XTC and do_temp_last:
-                    sampler_order.append(SamplerID.TEMPERATURE)
 
         if sampling_metadata.seq_groups and sampling_metadata.seq_groups[
             0].is_prompt:
@@ -242,8 +349,36 @@ class Sampler(nn.Module):
             if do_skew: enabled_samplers.append("SKEW")
             logger.debug(f"Enabled samplers: {', '.join(enabled_samplers)}")
 
-        for sampler_id in sampler_order:
-            if sampler_id == SamplerID.DRY and do_dry:
+        enabled_truncation_samplers = {
+            sampler_id
+            for sampler_id, enabled in (
+                (SamplerID.TOP_NSIGMA, do_nsigmas),
+                (SamplerID.TOP_P_TOP_K, do_top_p_top_k and
+                 not APHRODITE_USE_SAMPLING_KERNELS),
+                (SamplerID.TOP_A, do_top_as),
+                (SamplerID.MIN_P, do_min_p),
+                (SamplerID.TFS, do_tfss),
+                (SamplerID.ETA_CUTOFF, do_eta_cutoffs),
+                (SamplerID.EPSILON_CUTOFF, do_epsilon_cutoffs),
+                (SamplerID.TYPICAL_P, do_typical_ps),
+            ) if enabled
+        }
+        for sampler_id in _plan_truncation_samplers(
+                sampler_order, enabled_truncation_samplers):
+            if isinstance(sampler_id, tuple):
+                if (sampling_metadata.seq_groups and
+                    sampling_metadata.seq_groups[0].is_prompt):
+                    logger.debug(
+                        "Applying truncation samplers in one pass: "
+                        f"{', '.join(s.name for s in sampler_id)}.")
+                logits = _apply_truncation_samplers(logits, [
+                    (s, tuple(
+                        getattr(sampling_tensors, name)
+                        for name in _TRUNCATION_SAMPLERS[s]))
+                    for s in sampler_id
+                ])
+
+            elif sampler_id == SamplerID.DRY and do_dry:
                 if (sampling_metadata.seq_groups and
                     sampling_metadata.seq_groups[0].is_prompt):
                     logger.debug(
@@ -267,9 +402,16 @@ class Sampler(nn.Module):
                         f"pres_pen: {sampling_tensors.presence_penalties}, "
                         f"freq_pen: {sampling_tensors.frequency_penalties}, "
                         f"rep_pen: {sampling_tensors.repetition_penalties}.")
+                if penalty_counts is not None:
+                    prompt_mask, output_bin_counts = penalty_counts
+                else:
+                    num_seqs, vocab_size = logits.shape
+                    _, prompt_mask = _get_bin_counts_and_mask(
+                        sampling_tensors.prompt_tokens, vocab_size, num_seqs)
+                    output_bin_counts, _ = _get_bin_counts_and_mask(
+                        sampling_tensors.output_tokens, vocab_size, num_seqs)
                 logits = _apply_penalties(
-                    logits, sampling_tensors.prompt_tokens,
-                    sampling_tensors.output_tokens,
+                    logits, prompt_mask, output_bin_counts,
                     sampling_tensors.presence_penalties,
                     sampling_tensors.frequency_penalties,
                     sampling_tensors.repetition_penalties)
@@ -278,13 +420,15 @@ class Sampler(nn.Module):
                 do_no_repeat_ngrams:
                 if (sampling_metadata.seq_groups and
                     sampling_metadata.seq_groups[0].is_prompt):
+                    ngram_sizes = [
+                        sg.sampling_params.no_repeat_ngram_size
+                        for sg in sampling_metadata.seq_groups
+                    ]
                     logger.debug(
                         "Applying no_repeat_ngram with no_repeat_ngram_size: "
-                        f"{sampling_tensors.no_repeat_ngram_sizes}.")
-                logits = _apply_no_repeat_ngram(
-                    logits,
-                    sampling_tensors.prompt_tokens,
-                    sampling_tensors.no_repeat_ngram_sizes)
+                        f"{ngram_sizes}.")
+                assert ngram_bans is not None
+                logits = _apply_no_repeat_ngram(logits, ngram_bans)
 
             elif sampler_id == SamplerID.TEMPERATURE and do_temperatures:
                 if (sampling_metadata.seq_groups and
@@ -401,59 +545,7 @@ class Sampler(nn.Module):
                     logits, sampling_tensors.xtc_thresholds,
                     sampling_tensors.xtc_probabilities)
 
-
-        # We use float32 for probabilities and log probabilities.
-        # Compute the probabilities.
-        probs = torch.softmax(logits, dim=-1, dtype=torch.float)
-
-        # skew needs to be applied post-softmax
-        if do_skew:
-            if (sampling_metadata.seq_groups and
-                sampling_metadata.seq_groups[0].is_prompt):
-                logger.debug(
-                    "Applying Skew sampling with skew: "
-                    f"{sampling_tensors.skews}.")
-            # reference: https://github.com/turboderp/exllamav2/commit/1de4cdd70b09208e7b4f17ee322c190e16f60efd
-            cum_probs = torch.cumsum(probs, dim=-1)
-            cum_probs = torch.pow(cum_probs, torch.exp(
-                sampling_tensors.skews).unsqueeze(dim=1))
-            probs = torch.diff(cum_probs, dim=-1,
-                               prepend=torch.zeros_like(cum_probs[..., :1]))
-            logits = torch.log(probs)
-
-        # Compute the log probabilities.
-        logprobs = torch.log_softmax(logits, dim=-1, dtype=torch.float)
-
-        # Sample the next tokens.
-        sample_results, maybe_sampled_tokens_tensor = _sample(
-            probs,
-            logprobs,
-            sampling_metadata,
-            sampling_tensors,
-            include_gpu_probs_tensor=self.include_gpu_probs_tensor,
-            modify_greedy_probs=self._should_modify_greedy_probs_inplace,
-        )
-
-        if self.include_gpu_probs_tensor:
-            assert maybe_sampled_tokens_tensor is not None
-            on_device_tensors = (probs, logprobs, maybe_sampled_tokens_tensor)
-        else:
-            on_device_tensors = None
-
-        # Get the logprobs query results.
-        prompt_logprobs = None
-        sample_logprobs = None
-        if not sampling_metadata.skip_sampler_cpu_output:
-            prompt_logprobs, sample_logprobs = _get_logprobs(
-                logprobs, sampling_metadata, sample_results)
-
-        return _build_sampler_output(
-            sample_results,
-            sampling_metadata,
-            prompt_logprobs,
-            sample_logprobs,
-            on_device_tensors=on_device_tensors,
-            skip_sampler_cpu_output=sampling_metadata.skip_sampler_cpu_output)
+        return logits
 
     @property
     def _should_modify_greedy_probs_inplace(self) -> bool:
@@ -503,16 +595,13 @@ def _get_custom_token_bans(
     return banned_tokens
 
 
-def _apply_penalties(logits: torch.Tensor, prompt_tokens_tensor: torch.Tensor,
-                     output_tokens_tensor: torch.Tensor,
+def _apply_penalties(logits: torch.Tensor, prompt_mask: torch.Tensor,
+                     output_bin_counts: torch.Tensor,
                      presence_penalties: torch.Tensor,
                      frequency_penalties: torch.Tensor,
                      repetition_penalties: torch.Tensor) -> torch.Tensor:
-    num_seqs, vocab_size = logits.shape
-    _, prompt_mask = _get_bin_counts_and_mask(prompt_tokens_tensor, vocab_size,
-                                              num_seqs)
-    output_bin_counts, output_mask = _get_bin_counts_and_mask(
-        output_tokens_tensor, vocab_size, num_seqs)
+    _, vocab_size = logits.shape
+    output_mask = output_bin_counts > 0
 
     repetition_penalties = repetition_penalties[:, None].repeat(1, vocab_size)
     repetition_penalties[~(prompt_mask | output_mask)] = 1.0
@@ -521,8 +610,8 @@ def _apply_penalties(logits: torch.Tensor, prompt_tokens_tensor: torch.Tensor,
 
     # We follow the definition in OpenAI API.
     # Refer to https://platform.openai.com/docs/api-reference/parameter-details
-    logits -= frequency_penalties.unsqueeze_(dim=1) * output_bin_counts
-    logits -= presence_penalties.unsqueeze_(dim=1) * output_mask
+    logits -= frequency_penalties.unsqueeze(dim=1) * output_bin_counts
+    logits -= presence_penalties.unsqueeze(dim=1) * output_mask
     return logits
 
 
@@ -632,6 +721,12 @@ def _apply_dry(
     Apply Don't Repeat Yourself (DRY) sampling to the logits.
 
     Reference: https://github.com/oobabooga/text-generation-webui/pull/5677
+
+    The whole batch is processed at once: the context of each row is
+    right-aligned so that the suffixes to match line up, and all earlier
+    occurrences of the last token of each row are extended backwards
+    together, one token per step. The only host syncs are for the number of
+    candidate ngrams and the longest one to check.
     """
 
     VOCAB_SIZE = logits.size(-1)
@@ -639,100 +734,165 @@ def _apply_dry(
 
     # Process each sequence that has a nonzero multiplier
     applies_to = multipliers.nonzero(as_tuple=True)[0]
-    for irow in applies_to.tolist():
-        # DRY applies to input AND output tokens, so concat w/o padding tokens
-        prompt_len = (len(input_token_ids[irow]) - 
-                      (input_token_ids[irow] == VOCAB_SIZE).sum().item())
-        ouput_len = (len(output_token_ids[irow]) - 
-                     (output_token_ids[irow] == VOCAB_SIZE).sum().item())
-        token_seq = torch.cat((input_token_ids[irow][:prompt_len],
-                               output_token_ids[irow][:ouput_len]), dim=0)
-        
-        range_limit = ranges[irow].item()
-        if range_limit:  # could this be done in cat? yes. do i care? no.
-            token_seq = token_seq[-range_limit:]
-        
-        last_token = token_seq[-1].item()
-        if last_token in sequence_breakers_ids[irow]:
-            continue  # early out for everything up to the min_ngram check?
-        
-        # Build a mask of all the breaking tokens in the context
-        break_mask = torch.zeros(len(token_seq), dtype=torch.bool,
-                                 device=logits.device)
-        for break_tok in sequence_breakers_ids[irow]:
-            break_mask.logical_or_(token_seq == break_tok)
-
-        # Find the most recent breaking token (sets ngram limit)
-        max_ngram = 0
-        for max_ngram in range(min(len(break_mask), MAX_NGRAM + 1)):
-            if break_mask[-max_ngram - 1]:
-                break
+    input_token_ids = input_token_ids[applies_to]
+    output_token_ids = output_token_ids[applies_to]
+    allowed_lengths = allowed_lengths[applies_to].long()
+    sequence_breakers_ids = sequence_breakers_ids[applies_to]
+    ranges = ranges[applies_to].long()
+
+    # DRY applies to input AND output tokens, so concat w/o padding tokens
+    prompt_lens = (input_token_ids != VOCAB_SIZE).sum(dim=1, keepdim=True)
+    seq_lens = prompt_lens + (output_token_ids != VOCAB_SIZE).sum(
+        dim=1, keepdim=True)
+    context_lens = torch.where(ranges.unsqueeze(1) > 0,
+                               torch.minimum(seq_lens, ranges.unsqueeze(1)),
+                               seq_lens)
+
+    # Right-align the contexts, padding them on the left with -1.
+    prompt_width = input_token_ids.size(1)
+    width = prompt_width + output_token_ids.size(1)
+    dists_to_end = torch.arange(width - 1, -1, -1, device=logits.device)
+    in_context = dists_to_end < context_lens
+    positions = seq_lens - 1 - dists_to_end
+    positions = torch.where(positions < prompt_lens, positions,
+                            positions - prompt_lens + prompt_width)
+    token_seqs = torch.cat((input_token_ids, output_token_ids), dim=1).gather(
+        1, positions.clamp(0, width - 1))
+    token_seqs.masked_fill_(~in_context, -1)
+
+    # Build a mask of all the breaking tokens in the context
+    break_mask = torch.zeros_like(token_seqs, dtype=torch.bool)
+    for i in range(sequence_breakers_ids.size(1)):
+        break_mask.logical_or_(
+            token_seqs == sequence_breakers_ids[:, i].unsqueeze(1))
+
+    # Find the most recent breaking token (sets ngram limit)
+    recent_breaks = (break_mask | ~in_context).flip(1)[:, :MAX_NGRAM + 1]
+    max_ngrams = torch.where(recent_breaks.any(dim=1),
+                             recent_breaks.int().argmax(dim=1), MAX_NGRAM)
+    max_ngrams = torch.minimum(max_ngrams, context_lens.squeeze(1) - 1)
+
+    # Skip the rows ending with a break, or too close to a break to match
+    # anything.
+    rows_to_match = ~break_mask[:, -1] & (max_ngrams > allowed_lengths)
+
+    # Find all instances of the last token- potential ngrams!
+    endpoints = ((token_seqs[:, :-1] == token_seqs[:, -1:])
+                 & rows_to_match.unsqueeze(1))
+    rows, endpoint_cols = endpoints.nonzero(as_tuple=True)
+    if rows.numel() == 0:
+        return logits
 
-        min_ngram = allowed_lengths[irow].item()
-        if max_ngram <= min_ngram:  # Too close to a break to match anything
-            continue
-            
-        # If [token] is picked, what's the longest ngram that would match?
-        ngram_lens = torch.zeros(VOCAB_SIZE, dtype=torch.int32,
-                                 device=logits.device)
-        
-        # Find all instances of the last token- potential ngrams!
-        endpoint_indexes = torch.nonzero(token_seq == last_token,
-                                         as_tuple=True)[0].tolist()
-        # NOTE: This seems like the slow part. Haven't benchmarked.
-        for idx in endpoint_indexes[:-1]:  # Skip the last_token match
-            unwind = 0
-            # Check up to max_ngram tokens prior to idx (we know idx matches)
-            for unwind in range(1, min(idx, max_ngram) + 1):
-                if break_mask[idx - unwind]:
-                    break
-                if token_seq[idx - unwind] != token_seq[-unwind - 1]:
-                    break
-            next_tok = token_seq[idx+1]
-            # The repeated tokens BEFORE next_tok (+1 to include [idx]).
-            ngram_lens[next_tok] = max(ngram_lens[next_tok].item(), unwind + 1)
-
-        # Convert ngram lengths to penalty exponents
-        penalty_mask = ngram_lens > 0
-        scales = bases[irow] ** (ngram_lens[penalty_mask] - min_ngram)
-
-        # Calculate and apply penalties
-        logits[irow][penalty_mask] -= multipliers[irow] * scales
+    # Check up to max_ngram tokens prior to each endpoint (we know it
+    # matches), and no further than the start of the context.
+    limits = torch.minimum(
+        endpoint_cols - (width - context_lens[rows, 0]), max_ngrams[rows])
+    match_lens = torch.zeros_like(endpoint_cols)
+    matching = torch.ones_like(endpoint_cols, dtype=torch.bool)
+    for unwind in range(1, int(limits.max()) + 1):
+        cols = (endpoint_cols - unwind).clamp(min=0)
+        matching &= ((token_seqs[rows, cols]
+                      == token_seqs[rows, width - 1 - unwind])
+                     & ~break_mask[rows, cols])
+        match_lens += matching
+    # The repeated tokens BEFORE next_tok (+1 to include the endpoint). The
+    # first mismatching token is counted too, as in the reference
+    # implementation.
+    ngram_lens = torch.minimum(match_lens + 1, limits) + 1
+    next_toks = token_seqs[rows, endpoint_cols + 1]
+
+    # If [token] is picked, what's the longest ngram that would match?
+    keys, key_indices = torch.unique(rows * VOCAB_SIZE + next_toks,
+                                     return_inverse=True)
+    ngram_lens = torch.zeros_like(keys).scatter_reduce_(
+        0, key_indices, ngram_lens, reduce="amax")
+    rows = keys // VOCAB_SIZE
+    irows = applies_to[rows]
+
+    # Convert ngram lengths to penalty exponents
+    scales = bases[irows]**(ngram_lens - allowed_lengths[rows])
+
+    # Calculate and apply penalties
+    logits[irows, keys % VOCAB_SIZE] -= multipliers[irows] * scales
 
     return logits
 
+def _get_no_repeat_ngram_bans(sampling_metadata: SamplingMetadata,
+                              device: torch.device) -> torch.Tensor:
+    """Returns the (row, token id) pairs of the tokens that would create a
+    repeated n-gram, as a (2, num_bans) tensor.
+
+    The banned tokens are looked up in the n-gram index of each sequence,
+    which is extended by the new tokens only.
+    """
+    rows: List[int] = []
+    banned_tokens: List[int] = []
+    for seq_group in sampling_metadata.seq_groups:
+        ngram_size = seq_group.sampling_params.no_repeat_ngram_size
+        if ngram_size <= 0:
+            continue
+        for seq_id, row in zip(seq_group.seq_ids, seq_group.sample_indices):
+            banned = seq_group.seq_data[seq_id].get_banned_ngram_tokens(
+                ngram_size)
+            rows += [row] * len(banned)
+            banned_tokens += banned
+    return torch.tensor([rows, banned_tokens], dtype=torch.long,
+                        device=device)
+
+
 def _apply_no_repeat_ngram(
     logits: torch.Tensor,
-    input_ids: torch.Tensor,
-    ngram_size: torch.Tensor,
+    ngram_bans: torch.Tensor,
 ) -> torch.Tensor:
     """Apply no-repeat-ngram penalty which sets logits to -inf for tokens that 
-    would create a repeated n-gram.
+    would create a repeated n-gram, in one scatter.
     """
-    if torch.all(ngram_size == 0):
-        return logits
-
-    batch_size = logits.shape[0]
-
-    for i in range(batch_size):
-        size = int(ngram_size[i].item())
-        if size == 0:
-            continue
-
-        cur_len = len(input_ids[i])
-        if cur_len < size:
-            continue
+    logits[ngram_bans[0], ngram_bans[1]] = -float("inf")
+    return logits
 
-        banned_tokens = _calc_banned_ngram_tokens(
-            ngram_size=size,
-            prev_input_ids=input_ids[i],
-            cur_len=cur_len-1
-        )
 
-        if banned_tokens:
-            logits[i, banned_tokens] = -float("inf")
+def _select_ban_rows(bans: torch.Tensor, rows: torch.Tensor,
+                     num_rows: int) -> torch.Tensor:
+    """Returns the (row, token id) pairs of `bans` in the given rows,
+    renumbered as the rows of `logits[rows]`."""
+    new_rows = torch.full((num_rows, ), -1, dtype=torch.long,
+                          device=rows.device)
+    new_rows[rows] = torch.arange(len(rows), device=rows.device)
+    bans = torch.stack((new_rows[bans[0]], bans[1]))
+    return bans[:, bans[0] >= 0]
+
+
+def _get_sampler_order(params: SamplingParams) -> Tuple[SamplerID, ...]:
+    if params.sampler_priority is not None:
+        return tuple(
+            SamplerID(int(sampler_id))
+            for sampler_id in params.sampler_priority)
+    if params.temperature_last:
+        return tuple(sampler_id for sampler_id in _DEFAULT_SAMPLER_ORDER
+                     if sampler_id != SamplerID.TEMPERATURE) + (
+                         SamplerID.TEMPERATURE, )
+    return _DEFAULT_SAMPLER_ORDER
+
+
+def _get_rows_by_sampler_order(
+    sampling_metadata: SamplingMetadata
+) -> Dict[Tuple[SamplerID, ...], List[int]]:
+    """Groups the rows of the logits by the order in which their requests
+    apply the samplers."""
+    rows_by_order: Dict[Tuple[SamplerID, ...], List[int]] = {}
+    for seq_group in sampling_metadata.seq_groups:
+        params = seq_group.sampling_params
+        if (seq_group.is_prompt and params.sampler_priority is not None
+                and params.temperature_last):
+            logger.warning(
+                "Both sampler_priority and temperature_last=True "
+                "were specified. Using custom sampler_priority order "
+                "and ignoring temperature_last.")
+        rows = rows_by_order.setdefault(_get_sampler_order(params), [])
+        rows += seq_group.prompt_logprob_indices
+        rows += seq_group.sample_indices
+    return rows_by_order
 
-    return logits
 
 def _apply_top_k_top_p(
     logits: torch.Tensor,
@@ -776,7 +936,7 @@ def _apply_min_p(
     """
     probs = torch.softmax(logits, dim=-1)
     top_probs, _ = probs.max(dim=-1, keepdim=True)
-    scaled_min_p = min_p.unsqueeze_(dim=1) * top_probs
+    scaled_min_p = min_p.unsqueeze(dim=1) * top_probs
     tokens_to_remove = probs < scaled_min_p
     logits = logits.masked_fill_(tokens_to_remove, -float("inf"))
 
@@ -789,7 +949,7 @@ def _apply_top_a(
 ) -> torch.Tensor:
     probs = torch.softmax(logits, dim=-1)
     top_probs, _ = probs.max(dim=-1, keepdim=True)
-    threshold = torch.pow(top_probs, 2) * top_a.unsqueeze_(dim=1)
+    threshold = torch.pow(top_probs, 2) * top_a.unsqueeze(dim=1)
     tokens_to_remove = probs < threshold
     logits = logits.masked_fill_(tokens_to_remove, -float("inf"))
 
@@ -817,6 +977,8 @@ def _apply_tfs(
         ),
         dim=-1,
     )
+    # Rows without tail-free sampling keep all their tokens.
+    tfs_mask[tfs >= 1] = False
 
     logits_sort[tfs_mask] = -float("inf")
     logits = torch.gather(logits_sort,
@@ -878,6 +1040,9 @@ def _apply_typical_sampling(
     reordered_probs = probs.gather(-1, indices)
     typ_mask_sorted = reordered_probs.cumsum(dim=-1) >= typical_p.unsqueeze(
         dim=1)
+    # Rows without typical sampling would otherwise lose the tokens where
+    # the cumulative sum rounds up to 1.
+    typ_mask_sorted[typical_p >= 1] = False
 
     min_tokens_to_keep = 1
     # Keep at least min_tokens_to_keep
@@ -991,11 +1156,228 @@ def _apply_top_nsigma(
     std = logits.std(dim=-1, keepdim=True) 
     threshold = (logits.max(dim=-1, keepdim=True).values -
                  nsigma.unsqueeze(dim=1) * std)
-    logits[logits < threshold] = float("-inf")
+    # Rows without top-nsigma would otherwise keep only the top token.
+    logits[(logits < threshold) & (nsigma > 0).unsqueeze(dim=1)] = float(
+        "-inf")
 
     return logits
 
 
+def _plan_truncation_samplers(
+    sampler_order: Tuple[SamplerID, ...],
+    enabled: Set[SamplerID],
+) -> List[Union[SamplerID, Tuple[SamplerID, ...]]]:
+    """Replaces the runs of enabled truncation samplers in `sampler_order`
+    by tuples, which are applied in one pass.
+
+    Disabled truncation samplers are left out, so they don't split a run.
+    Locally typical sampling can mask out the most likely tokens, so it ends
+    its run.
+    """
+    plan: List[Union[SamplerID, Tuple[SamplerID, ...]]] = []
+    run: List[SamplerID] = []
+
+    def end_run():
+        if len(run) > 1:
+            plan.append(tuple(run))
+        else:
+            plan.extend(run)
+        run.clear()
+
+    for sampler_id in sampler_order:
+        if sampler_id not in _TRUNCATION_SAMPLERS:
+            end_run()
+            plan.append(sampler_id)
+        elif sampler_id in enabled:
+            run.append(sampler_id)
+            if sampler_id == SamplerID.TYPICAL_P:
+                end_run()
+    end_run()
+    return plan
+
+
+def _apply_truncation_samplers(
+    logits: torch.Tensor,
+    samplers: List[Tuple[SamplerID, Tuple[torch.Tensor, ...]]],
+) -> torch.Tensor:
+    """Applies several truncation samplers with at most one sort.
+
+    Gives the same logits as applying the samplers one after another, which
+    softmaxes and often sorts the whole vocabulary once per sampler. Each of
+    these samplers keeps the most likely tokens, so the tokens that are kept
+    are the ones above a threshold. The samplers that only need a threshold
+    are applied first as masks, with one softmax. From the first sampler
+    that needs the tokens in order (top-p, TFS and typical sampling), the
+    tokens that are still kept are sorted once, and the kept tokens become
+    a prefix that each sampler shortens. Locally typical sampling can mask
+    out the most likely tokens, so it can only be the last sampler.
+
+    Args:
+        logits: (num_tokens, vocab_size) The input logits.
+        samplers: The samplers to apply in order, with their sampling
+            tensors in the order of `_TRUNCATION_SAMPLERS`.
+    """
+    vocab_size = logits.shape[-1]
+    dtype = torch.promote_types(logits.dtype, torch.float32)
+    max_logits, top_idx = logits.max(dim=-1, keepdim=True)
+    shifted_logits = logits.to(dtype) - max_logits
+    # The probabilities of the kept tokens are exps / kept_sums.
+    exps = shifted_logits.exp()
+    kept = torch.ones_like(logits, dtype=torch.bool)
+
+    def get_neg_entropy(exps: torch.Tensor, shifted_logits: torch.Tensor,
+                        kept_sums: torch.Tensor) -> torch.Tensor:
+        # The sum of p * log(p) over the kept tokens, given that the masked
+        # out tokens have no exps.
+        exp_logits = torch.where(exps > 0, exps * shifted_logits, 0)
+        return (exp_logits.sum(dim=-1, keepdim=True) / kept_sums -
+                kept_sums.log())
+
+    num_masked_samplers = 0
+    for sampler_id, args in samplers:
+        params = tuple(arg.unsqueeze(dim=1) for arg in args)
+        kept_sums = exps.sum(dim=-1, keepdim=True)
+        if sampler_id == SamplerID.TOP_NSIGMA:
+            nsigma = params[0]
+            std = logits.masked_fill(~kept, -float("inf")).std(dim=-1,
+                                                               keepdim=True)
+            # A NaN std, from masked out tokens, keeps every token.
+            kept &= ~(logits < max_logits - nsigma * std) | (nsigma <= 0)
+        elif sampler_id == SamplerID.TOP_P_TOP_K:
+            top_p, top_k = params
+            top_k = top_k.to(torch.long)
+            has_top_k = top_k < vocab_size
+            max_top_k = int(torch.where(has_top_k, top_k, 0).max())
+            if max_top_k > 0:
+                kth_logits = logits.masked_fill(~kept, -float("inf")).topk(
+                    max_top_k, dim=-1).values.gather(
+                        1, top_k.clamp(max=max_top_k) - 1)
+                kept &= ~has_top_k | (logits >= kth_logits)
+            if bool((top_p < 1).any()):
+                break
+        elif sampler_id == SamplerID.TOP_A:
+            # p >= top_a * max(p)^2, with max(p) = 1 / kept_sums.
+            kept &= exps * kept_sums >= params[0]
+        elif sampler_id == SamplerID.MIN_P:
+            kept &= exps >= params[0]
+        elif sampler_id in (SamplerID.ETA_CUTOFF, SamplerID.EPSILON_CUTOFF):
+            cutoff = params[0]
+            if sampler_id == SamplerID.ETA_CUTOFF:
+                cutoff = torch.min(
+                    cutoff,
+                    torch.sqrt(cutoff) * torch.exp(
+                        get_neg_entropy(exps, shifted_logits, kept_sums)))
+            kept &= exps >= cutoff * kept_sums
+            kept.scatter_(1, top_idx, True)
+        elif sampler_id in (SamplerID.TFS, SamplerID.TYPICAL_P):
+            break
+        else:
+            raise ValueError(f"{sampler_id.name} is not a truncation sampler")
+        exps = exps.masked_fill(~kept, 0)
+        num_masked_samplers += 1
+    else:
+        return logits.masked_fill_(~kept, -float("inf"))
+
+    # Sort the kept tokens, or only the top ones if there are few of them.
+    num_kept = kept.sum(dim=-1, keepdim=True)
+    window = int(num_kept.max())
+    masked_logits = logits.masked_fill(~kept, -float("inf"))
+    if window < vocab_size:
+        sorted_logits, sorted_idx = masked_logits.topk(window, dim=-1)
+    else:
+        sorted_logits, sorted_idx = masked_logits.sort(dim=-1,
+                                                       descending=True)
+    positions = torch.arange(window, device=logits.device)
+    shifted_logits = sorted_logits.to(dtype) - sorted_logits[:, :1]
+    exps = shifted_logits.exp()
+    cum_exps = exps.cumsum(dim=-1)
+    kept = None
+
+    def get_kept_probs() -> torch.Tensor:
+        return exps.masked_fill(positions >= num_kept, 0) / kept_sums
+
+    for sampler_id, args in samplers[num_masked_samplers:]:
+        assert kept is None, "Typical sampling must be the last sampler."
+        params = tuple(arg.unsqueeze(dim=1) for arg in args)
+        kept_sums = cum_exps.gather(1, num_kept - 1)
+        if sampler_id == SamplerID.TOP_NSIGMA:
+            nsigma = params[0]
+            std = sorted_logits.masked_fill(positions >= num_kept,
+                                            -float("inf")).std(dim=-1,
+                                                               keepdim=True)
+            threshold = sorted_logits[:, :1] - nsigma * std
+            # Masked out tokens make the std NaN, which keeps every token.
+            new_num_kept = torch.where(
+                (num_kept < vocab_size) | (nsigma <= 0), window,
+                (~(sorted_logits < threshold)).sum(dim=-1, keepdim=True))
+        elif sampler_id == SamplerID.TOP_P_TOP_K:
+            top_p, top_k = params
+            kth_logits = sorted_logits.gather(
+                1, top_k.to(torch.long).clamp(max=window) - 1)
+            num_kept = torch.minimum(
+                num_kept,
+                (sorted_logits >= kth_logits).sum(dim=-1, keepdim=True))
+            kept_sums = cum_exps.gather(1, num_kept - 1)
+            # The probability of each token and the less likely ones.
+            tail_probs = get_kept_probs().flip(-1).cumsum(dim=-1).flip(-1)
+            new_num_kept = (tail_probs > 1 - top_p).sum(
+                dim=-1, keepdim=True).clamp(min=1)
+        elif sampler_id == SamplerID.TOP_A:
+            new_num_kept = (exps * kept_sums >= params[0]).sum(dim=-1,
+                                                               keepdim=True)
+        elif sampler_id == SamplerID.MIN_P:
+            new_num_kept = (exps >= params[0]).sum(dim=-1, keepdim=True)
+        elif sampler_id == SamplerID.TFS:
+            tfs = params[0]
+            probs = get_kept_probs()
+            if window < vocab_size:
+                # The tokens after the window have no probability.
+                probs = torch.nn.functional.pad(probs, (0, 2))
+            d2 = probs.diff().diff().abs()
+            curvature_cdf = torch.cumsum(d2 / d2.sum(dim=-1, keepdim=True),
+                                         dim=-1)
+            # The top token is kept and the last one is always masked out.
+            new_num_kept = torch.where(
+                tfs >= 1, window, 1 + (~(curvature_cdf[:, :window - 1] > tfs)
+                                      ).sum(dim=-1, keepdim=True))
+        elif sampler_id in (SamplerID.ETA_CUTOFF, SamplerID.EPSILON_CUTOFF):
+            cutoff = params[0]
+            if sampler_id == SamplerID.ETA_CUTOFF:
+                cutoff = torch.min(
+                    cutoff,
+                    torch.sqrt(cutoff) * torch.exp(
+                        get_neg_entropy(
+                            exps.masked_fill(positions >= num_kept, 0),
+                            shifted_logits, kept_sums)))
+            new_num_kept = (exps >= cutoff * kept_sums).sum(
+                dim=-1, keepdim=True).clamp(min=1)
+        elif sampler_id == SamplerID.TYPICAL_P:
+            typical_p = params[0]
+            log_probs = (shifted_logits - kept_sums.log()).masked_fill(
+                positions >= num_kept, -float("inf"))
+            neg_entropy = get_neg_entropy(
+                exps.masked_fill(positions >= num_kept, 0), shifted_logits,
+                kept_sums)
+            surprisal_deviations = (neg_entropy - log_probs).abs()
+            _, indices = torch.sort(surprisal_deviations)
+            typ_mask_sorted = get_kept_probs().gather(-1, indices).cumsum(
+                dim=-1) >= typical_p
+            typ_mask_sorted[..., :1] = False
+            typ_mask_sorted[(typical_p >= 1).squeeze(dim=1)] = False
+            kept = (positions < num_kept) & ~typ_mask_sorted.scatter(
+                1, indices, typ_mask_sorted)
+            continue
+        else:
+            raise ValueError(f"{sampler_id.name} is not a truncation sampler")
+        num_kept = torch.minimum(num_kept, new_num_kept)
+
+    if kept is None:
+        kept = positions < num_kept
+    return logits.masked_fill_(
+        ~torch.zeros_like(logits, dtype=torch.bool).scatter_(
+            1, sorted_idx, kept), -float("inf"))
+
+
 def _greedy_sample(
     selected_seq_groups: List[SequenceGroupToSample],
     samples: torch.Tensor,
@@ -1424,21 +1806,31 @@ def _sample(
     #                                   sampling_tensors)
 
 
-def _get_ranks(x: torch.Tensor, indices: torch.Tensor) -> torch.Tensor:
+def _get_ranks(x: torch.Tensor, query_indices: torch.Tensor,
+               indices: torch.Tensor) -> torch.Tensor:
     """
     This function calculates the ranks of the chosen tokens in a logprob tensor.
     Args:
         x (torch.Tensor): 2D logprob tensor of shape (N, M)
                         where N is the no. of tokens and M is the vocab dim.
+        query_indices (torch.Tensor): The rows of x of the chosen tokens.
         indices (torch.Tensor): List of chosen token indices.
     Returns:
-        torch.Tensor: 1D tensor of shape (N,) where N is the no. of tokens.
-                    Each element in the returned tensor represents the rank 
-                    of the chosen token in the input logprob tensor.
+        torch.Tensor: 1D tensor of shape (len(indices),). Each element in the
+                    returned tensor represents the rank of the chosen token
+                    in its row of the input logprob tensor.
     """
-    vals = x[torch.arange(0, len(x), device=x.device, dtype=indices.dtype),
-             indices]
-    return (x > vals[:, None]).long().sum(1).add_(1)
+    vals = x[query_indices, indices]
+    ranks = torch.empty_like(indices)
+    # The rows are compared in chunks, so that long prompts with prompt
+    # logprobs don't copy the logprobs of the whole prompt at once.
+    chunk_size = max(1, _RANKS_CHUNK_NUMEL // x.shape[-1])
+    for start in range(0, len(indices), chunk_size):
+        end = start + chunk_size
+        torch.sum(x[query_indices[start:end]] > vals[start:end, None],
+                  dim=1,
+                  out=ranks[start:end])
+    return ranks.add_(1)
 
 
 def _get_logprobs(
@@ -1449,7 +1841,7 @@ def _get_logprobs(
     """Return sample lobprobs and prompt logprobs.
     The logic consists of 3 parts.
     - Select indices to compute logprob from, ranks of token ids, and
-        the top k token ids from logprobs.
+        the top k token ids from logprobs, and copy them to the CPU at once.
     - Compute prompt logprobs if required.
     - Compute sample logprobs if required.
     Args:
@@ -1468,6 +1860,8 @@ def _get_logprobs(
             BEAM_WIDTH number of seq_ids).
     Returns:
         A tuple of prompt and sample logprobs per sequence group in a batch.
+        The prompt logprobs are FlatLogprobs, which only create the Logprob
+        objects when they are accessed.
     """
     # The index of query token to calculate logprobs. It includes both
     # prompt and sample logprob indices.
@@ -1537,11 +1931,9 @@ def _get_logprobs(
             query_indices_gpu,
             next_token_ids_gpu,
         ]]
-        ranks = _get_ranks(
-            logprobs[query_indices_gpu],
-            next_token_ids_gpu,
-        )
+        ranks = _get_ranks(logprobs, query_indices_gpu, next_token_ids_gpu)
         assert selected_logprobs.shape[0] == ranks.shape[0]
+        columns = [selected_logprobs[:, None], ranks[:, None]]
 
         # We need to compute top k only if there exists logprobs > 0.
         if largest_num_logprobs > 0:
@@ -1550,30 +1942,37 @@ def _get_logprobs(
             top_logprobs, top_token_ids = torch.topk(logprobs,
                                                      largest_num_logprobs,
                                                      dim=-1)
-            top_logprobs = top_logprobs.to('cpu')
-            top_token_ids = top_token_ids.to('cpu')
+            columns += [
+                top_logprobs[query_indices_gpu],
+                top_token_ids[query_indices_gpu]
+            ]
 
-        selected_logprobs = selected_logprobs.to('cpu')
-        ranks = ranks.to('cpu')
+        # Copy everything to the CPU at once, as float32 in which the token
+        # ids and ranks are exact.
+        assert logprobs.shape[-1] <= 1 << 24
+        packed = torch.cat([column.to(torch.float32) for column in columns],
+                           dim=1).cpu()
+        selected_logprobs = packed[:, 0]
+        ranks = packed[:, 1].long()
+        if largest_num_logprobs > 0:
+            top_logprobs = packed[:, 2:2 + largest_num_logprobs]
+            top_token_ids = packed[:, 2 + largest_num_logprobs:].long()
 
     # Find prompt/sample logprobs.
     prompt_logprobs_per_seq_group: List[Optional[PromptLogprobs]] = []
     sample_logprobs_per_seq_group: List[SampleLogprobs] = []
-    top_logprob_idx = 0
-    selected_logprobs_idx = 0
+    query_idx = 0
 
     for seq_group, sample_result in zip(sampling_metadata.seq_groups,
                                         sample_results):
-        (prompt_logprobs, top_logprob_idx,
-         selected_logprobs_idx) = _get_prompt_logprob_if_needed(
-             seq_group, selected_logprobs, ranks, top_token_ids, top_logprobs,
-             selected_logprobs_idx, top_logprob_idx)
+        (prompt_logprobs, query_idx) = _get_prompt_logprob_if_needed(
+            seq_group, selected_logprobs, ranks, top_token_ids, top_logprobs,
+            query_idx)
         prompt_logprobs_per_seq_group.append(prompt_logprobs)
 
-        (sampled_logprobs, top_logprob_idx,
-         selected_logprobs_idx) = _get_sampled_logprob_if_needed(
-             seq_group, sample_result, selected_logprobs, ranks, top_token_ids,
-             top_logprobs, selected_logprobs_idx, top_logprob_idx)
+        (sampled_logprobs, query_idx) = _get_sampled_logprob_if_needed(
+            seq_group, sample_result, selected_logprobs, ranks, top_token_ids,
+            top_logprobs, query_idx)
         sample_logprobs_per_seq_group.append(sampled_logprobs)
 
     return prompt_logprobs_per_seq_group, sample_logprobs_per_seq_group
@@ -1585,58 +1984,47 @@ def _get_prompt_logprob_if_needed(
     ranks: torch.Tensor,
     top_token_ids: torch.Tensor,
     top_logprobs: torch.Tensor,
-    selected_logprobs_idx: int,
-    top_logprob_idx: int,
+    query_idx: int,
 ):
     """Compute the prompt logprob from a sequence group if needed."""
     sampling_params = seq_group.sampling_params
     is_prompt = seq_group.is_prompt
 
     # Find prompt logprobs
-    prompt_logprobs: Optional[PromptLogprobs] = None
+    prompt_logprobs: Optional[FlatLogprobs] = None
     if is_prompt and sampling_params.prompt_logprobs is not None:
-        prompt_logprobs = []
         num_logprobs = sampling_params.prompt_logprobs
         next_prompt_tokens = _get_next_prompt_tokens(seq_group)
-        # Pre-select indexes and create a list. It is faster than calling .item
-        # repetitively.
-        selected_logprob_items = selected_logprobs[
-            selected_logprobs_idx:selected_logprobs_idx +
-            len(next_prompt_tokens)].tolist()
-        rank_items = ranks[selected_logprobs_idx:selected_logprobs_idx +
-                           len(next_prompt_tokens)].tolist()
-
-        for idx, token_id in enumerate(next_prompt_tokens):
-            # Calculate the prompt logprob of the real prompt tokens.
-            # {token_id: (logprob, rank_from_vocab)}
-            prompt_logprobs_dict: Dict[int, Tuple[float, int]] = {
-                token_id: (selected_logprob_items[idx], rank_items[idx])
-            }
-
-            # Add top K prompt logprobs along with its rank.
-            if num_logprobs > 0:
-                top_ids = top_token_ids[
-                    top_logprob_idx, :num_logprobs].tolist()
-                top_probs = top_logprobs[
-                    top_logprob_idx, :num_logprobs].tolist()
-                # Top K is already sorted by rank, so we can use 1 ~
-                # num_logprobs + 1 for rank.
-                top_ranks = range(1, num_logprobs + 1)
-                prompt_logprobs_dict.update({
-                    top_id: (top_prob, rank)
-                    for top_id, top_prob, rank in zip(top_ids, top_probs,
-                                                      top_ranks)
-                })
-            prompt_logprobs.append({
-                token_id: Logprob(*logprob_and_rank)
-                for token_id, logprob_and_rank in prompt_logprobs_dict.items()
-            })
-            # + 1 to go to the next prompt token.
-            top_logprob_idx += 1
+        num_tokens = len(next_prompt_tokens)
+        rows = slice(query_idx, query_idx + num_tokens)
+
+        # The logprob and rank of each real prompt token, followed by the
+        # top K prompt logprobs. Top K is already sorted by rank, so we can
+        # use 1 ~ num_logprobs + 1 for rank.
+        token_ids = torch.tensor(next_prompt_tokens,
+                                 dtype=torch.long).unsqueeze(1)
+        logprobs = selected_logprobs[rows].unsqueeze(1)
+        logprob_ranks = ranks[rows].unsqueeze(1)
+        if num_logprobs > 0:
+            token_ids = torch.cat(
+                (token_ids, top_token_ids[rows, :num_logprobs]), dim=1)
+            logprobs = torch.cat((logprobs, top_logprobs[rows, :num_logprobs]),
+                                 dim=1)
+            logprob_ranks = torch.cat(
+                (logprob_ranks,
+                 torch.arange(1, num_logprobs + 1).expand(num_tokens, -1)),
+                dim=1)
+        width = num_logprobs + 1
+        prompt_logprobs = FlatLogprobs(
+            offsets=list(range(0, num_tokens * width + 1, width)),
+            token_ids=token_ids.flatten().tolist(),
+            logprobs=logprobs.flatten().tolist(),
+            ranks=logprob_ranks.flatten().tolist(),
+            decoded_tokens=[None] * (num_tokens * width))
 
         # + len(next_prompt_tokens) to go to the next prompt.
-        selected_logprobs_idx += len(next_prompt_tokens)
-    return prompt_logprobs, top_logprob_idx, selected_logprobs_idx
+        query_idx += num_tokens
+    return prompt_logprobs, query_idx
 
 
 def _get_sampled_logprob_if_needed(
@@ -1646,11 +2034,9 @@ def _get_sampled_logprob_if_needed(
     ranks: torch.Tensor,
     top_token_ids: torch.Tensor,
     top_logprobs: torch.Tensor,
-    selected_logprobs_idx: int,
-    top_logprob_idx: int,
+    query_idx: int,
 ):
     """Compute the sample logprob if needed."""
-    seq_ids = seq_group.seq_ids
     num_logprobs = seq_group.sampling_params.logprobs
     use_beam_search = seq_group.sampling_params.use_beam_search
     sampled_logprobs: SampleLogprobs = []
@@ -1665,31 +2051,26 @@ def _get_sampled_logprob_if_needed(
         else:
             # Pre-select items from tensor. tolist() is faster than repetitive
             # `.item()` calls.
-            selected_logprob_items = selected_logprobs[
-                selected_logprobs_idx:selected_logprobs_idx +
-                len(next_token_ids)].tolist()
-            rank_items = ranks[selected_logprobs_idx:selected_logprobs_idx +
-                               len(next_token_ids)].tolist()
-            for idx, (next_token_id, parent_id) in enumerate(
-                    zip(next_token_ids, parent_seq_ids)):
+            rows = slice(query_idx, query_idx + len(next_token_ids))
+            selected_logprob_items = selected_logprobs[rows].tolist()
+            rank_items = ranks[rows].tolist()
+            if num_logprobs is not None and num_logprobs > 0:
+                top_id_items = top_token_ids[rows, :num_logprobs].tolist()
+                top_prob_items = top_logprobs[rows, :num_logprobs].tolist()
+            for idx, next_token_id in enumerate(next_token_ids):
                 # Get the logprob of a sampled token.
                 sampled_logprobs_dict = {
                     next_token_id:
                     (selected_logprob_items[idx], rank_items[idx])
                 }
                 if num_logprobs is not None and num_logprobs > 0:
-                    # Get top K logprobs.
-                    top_ids = top_token_ids[top_logprob_idx +
-                                            parent_id, :num_logprobs].tolist()
-                    top_probs = top_logprobs[
-                        top_logprob_idx + parent_id, :num_logprobs].tolist()
-                    # Top K is already sorted by rank, so we can use 1 ~
-                    # num_logprobs + 1 for rank.
+                    # Get top K logprobs. Top K is already sorted by rank, so
+                    # we can use 1 ~ num_logprobs + 1 for rank.
                     top_ranks = range(1, num_logprobs + 1)
                     sampled_logprobs_dict.update({
                         top_id: (top_prob, rank)
                         for top_id, top_prob, rank in zip(
-                            top_ids, top_probs, top_ranks)
+                            top_id_items[idx], top_prob_items[idx], top_ranks)
                     })
 
                 sampled_logprobs.append({
@@ -1698,15 +2079,9 @@ def _get_sampled_logprob_if_needed(
                     sampled_logprobs_dict.items()
                 })
 
-        # NOTE: This part of code is not intuitive. `selected_logprobs` include
-        # logprobs for the current step, which has len(next_token_ids) tokens
-        # per sequence group. `logprobs` includes logprobs from the previous
-        # steps, which has len(seq_ids) tokens per sequence group.
-        # Iterate to the next sequence group in a batch.
-        selected_logprobs_idx += len(next_token_ids)
-        # Iterate to the next sequence group in a batch.
-        top_logprob_idx += len(seq_ids)
-    return sampled_logprobs, top_logprob_idx, selected_logprobs_idx
+        # The rows of the sampled tokens of the next sequence group.
+        query_idx += len(next_token_ids)
+    return sampled_logprobs, query_idx
 
 
 def _modify_greedy_probs_inplace(logprobs: torch.Tensor, probs: torch.Tensor,
@@ -1834,85 +2209,6 @@ def _get_next_prompt_tokens(seq_group: SequenceGroupToSample) -> List[str]:
         next_token_index_start:next_token_index_end]
     return next_prompt_tokens
 
-def _get_ngrams(
-    ngram_size: int, 
-    prev_input_ids: torch.Tensor
-) -> Dict[Tuple[int, ...], List[int]]:
-    """Get dictionary of ngrams and the tokens that followed them.
-
-    Args:
-        ngram_size: Size of ngrams to track
-        prev_input_ids: 1D tensor of previous token ids
-
-    Returns:
-        Dictionary mapping ngram tuples to list of tokens that followed them
-    """
-    generated_ngrams = {}
-    gen_tokens = prev_input_ids.tolist()
-
-    for i in range(len(gen_tokens) - ngram_size + 1):
-        ngram = tuple(gen_tokens[i:i + ngram_size - 1])
-        next_token = gen_tokens[i + ngram_size - 1]
-        if ngram in generated_ngrams:
-            generated_ngrams[ngram].append(next_token)
-        else:
-            generated_ngrams[ngram] = [next_token]
-
-    return generated_ngrams
-
-def _get_generated_ngrams(
-    banned_ngrams: Dict[Tuple[int, ...], List[int]], 
-    prev_input_ids: torch.Tensor,
-    ngram_size: int, 
-    cur_len: int
-) -> List[int]:
-    """Get list of tokens that would create a repeated ngram if generated next.
-
-    Args:
-        banned_ngrams: Dictionary of previously seen ngrams and their next
-            tokens
-        prev_input_ids: Previous token ids
-        ngram_size: Size of ngrams to check
-        cur_len: Current position in sequence
-
-    Returns:
-        List of token ids that would create a repeat ngram
-    """
-    start_idx = cur_len + 1 - ngram_size
-    current_ngram = tuple(prev_input_ids[start_idx:cur_len].tolist())
-
-    return banned_ngrams.get(current_ngram, [])
-
-def _calc_banned_ngram_tokens(
-    ngram_size: int,
-    prev_input_ids: torch.Tensor,
-    cur_len: int
-) -> List[int]:
-    """Calculate tokens that would create repeated ngrams if generated next.
-
-    Args:
-        ngram_size: Size of ngrams to prevent repeating
-        prev_input_ids: Previous token ids in sequence
-        cur_len: Current position in sequence
-
-    Returns:
-        List of token ids that should be banned to prevent ngram repetition
-    """
-    if cur_len + 1 < ngram_size:
-        return []
-
-    generated_ngrams = _get_ngrams(ngram_size, prev_input_ids)
-
-    banned_tokens = _get_generated_ngrams(
-        generated_ngrams,
-        prev_input_ids, 
-        ngram_size,
-        cur_len
-    )
-
-    return banned_tokens
-
-
 # def _apply_mirostat_v2(logits: torch.Tensor,
 #                        sampling_tensors: SamplingTensors) -> torch.Tensor:
 #     # Reduce our view to just the affected logits
@@ -1,7 +1,8 @@
 import random
 from array import array
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Set, Tuple
 
 import torch
 
@@ -96,6 +97,242 @@ class SamplingMetadataCache:
             cache.reset()
 
 
+def _has_penalties(params: SamplingParams) -> bool:
+    return (abs(params.presence_penalty) >= _SAMPLING_EPS
+            or abs(params.frequency_penalty) >= _SAMPLING_EPS
+            or params.repetition_penalty > 1.0)
+
+
+class TokenCountCache:
+    """Keeps the token counts of the sequences with presence, frequency or
+    repetition penalties on device between steps.
+
+    Each sequence gets a row of `prompt_mask` (whether a token is in the
+    prompt) and of `output_counts` (how many times a token was generated),
+    which is updated with the tokens appended since the previous step only.
+    The rows of a request are freed when it finishes, and the least recently
+    used rows are reused once `max_num_seqs` sequences are cached. A reused
+    row is rebuilt from the whole token history if its sequence comes back.
+
+    Row 0 is always empty, for the logits of the prompt logprobs.
+
+    The steps of a multi-step decode after the first reuse the rows of the
+    first one, as their sequences only get the sampled tokens on the CPU
+    after the last step. The tokens sampled by each step are added to the
+    rows on device instead.
+    """
+
+    def __init__(self, max_num_seqs: int, pin_memory: bool):
+        self.max_num_seqs = max_num_seqs
+        self.pin_memory = pin_memory
+        # Allocated on first use, when the vocabulary size is known.
+        self.prompt_mask: Optional[torch.Tensor] = None
+        self.output_counts: Optional[torch.Tensor] = None
+        # seq_id -> [row, number of output tokens counted], least recently
+        # used first.
+        self._rows: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self._seq_ids_by_request: Dict[str, List[int]] = {}
+        # The batch of the last call to get_counts, the cache row of each
+        # of its logits rows, and the logits rows, cache rows and entries of
+        # its sequences with penalties.
+        self._last_sampling_metadata: Optional["SamplingMetadata"] = None
+        self._last_rows: Optional[torch.Tensor] = None
+        self._last_penalized_logits_rows: Optional[torch.Tensor] = None
+        self._last_penalized_rows: Optional[torch.Tensor] = None
+        self._last_penalized_entries: List[List[int]] = []
+
+    def add_requests(
+            self, seq_group_metadata_list: List[SequenceGroupMetadata]) -> None:
+        """Records the sequences of each request, to free their rows when
+        the request finishes."""
+        for seq_group_metadata in seq_group_metadata_list:
+            if not _has_penalties(seq_group_metadata.sampling_params):
+                continue
+            seq_ids = self._seq_ids_by_request.setdefault(
+                seq_group_metadata.request_id, [])
+            for seq_id in seq_group_metadata.seq_data:
+                if seq_id not in seq_ids:
+                    seq_ids.append(seq_id)
+
+    def release_finished_requests(
+            self, finished_requests_ids: Optional[List[str]]) -> None:
+        for request_id in finished_requests_ids or ():
+            for seq_id in self._seq_ids_by_request.pop(request_id, ()):
+                row = self._rows.pop(seq_id, None)
+                if row is not None:
+                    self._free_rows.append(row[0])
+
+    def _grow(self, num_rows: int) -> None:
+        assert self.prompt_mask is not None and self.output_counts is not None
+        old_num_rows, vocab_size = self.prompt_mask.shape
+        prompt_mask = self.prompt_mask.new_zeros((num_rows, vocab_size))
+        output_counts = self.output_counts.new_zeros((num_rows, vocab_size))
+        prompt_mask[:old_num_rows] = self.prompt_mask
+        output_counts[:old_num_rows] = self.output_counts
+        self.prompt_mask = prompt_mask
+        self.output_counts = output_counts
+        self._free_rows.extend(range(old_num_rows, num_rows))
+
+    def _allocate_row(self, seq_ids_in_batch: Set[int]) -> int:
+        if not self._free_rows:
+            assert self.prompt_mask is not None
+            num_seqs = self.prompt_mask.shape[0] - 1
+            evictable = next((seq_id for seq_id in self._rows
+                              if seq_id not in seq_ids_in_batch), None)
+            if num_seqs >= self.max_num_seqs and evictable is not None:
+                self._free_rows.append(self._rows.pop(evictable)[0])
+            else:
+                # Double the rows, up to max_num_seqs unless the batch needs
+                # more.
+                self._grow(
+                    max(min(2 * num_seqs, self.max_num_seqs), num_seqs + 1) +
+                    1)
+        return self._free_rows.pop()
+
+    def get_counts(
+        self,
+        sampling_metadata: "SamplingMetadata",
+        num_rows: int,
+        vocab_size: int,
+        device: torch.device,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Updates the rows of the sequences to sample with their new tokens.
+
+        Returns:
+            The prompt mask and the output token counts of each of the
+            `num_rows` rows of the logits, of shape (num_rows, vocab_size).
+        """
+        if (self.prompt_mask is None
+                or self.prompt_mask.shape[1] != vocab_size
+                or self.prompt_mask.device != device):
+            self.prompt_mask = torch.zeros((1, vocab_size),
+                                           dtype=torch.bool,
+                                           device=device)
+            self.output_counts = torch.zeros((1, vocab_size),
+                                             dtype=torch.int,
+                                             device=device)
+            self._rows.clear()
+            self._free_rows.clear()
+        assert self.output_counts is not None
+
+        seq_ids_in_batch = {
+            seq_id
+            for seq_group in sampling_metadata.seq_groups
+            for seq_id in seq_group.seq_ids
+        }
+        cache_rows = [0] * num_rows
+        reset_rows: List[int] = []
+        # (row, token id) to add to the prompt mask and the output counts.
+        prompt_updates: Tuple[List[int], List[int]] = ([], [])
+        output_updates: Tuple[List[int], List[int]] = ([], [])
+        penalized_logits_rows: List[int] = []
+        penalized_entries: List[List[int]] = []
+        for seq_group in sampling_metadata.seq_groups:
+            if not _has_penalties(seq_group.sampling_params):
+                continue
+            for seq_id, logits_row in zip(seq_group.seq_ids,
+                                          seq_group.sample_indices):
+                seq_data = seq_group.seq_data[seq_id]
+                output_token_ids = seq_data.output_token_ids_array
+                row = self._rows.get(seq_id)
+                if row is None or row[1] > len(output_token_ids):
+                    if row is None:
+                        row = self._rows[seq_id] = [
+                            self._allocate_row(seq_ids_in_batch), 0
+                        ]
+                    row[1] = 0
+                    reset_rows.append(row[0])
+                    prompt_token_ids = seq_data.prompt_token_ids_array
+                    prompt_updates[0].extend([row[0]] * len(prompt_token_ids))
+                    prompt_updates[1].extend(prompt_token_ids)
+                else:
+                    self._rows.move_to_end(seq_id)
+                new_token_ids = output_token_ids[row[1]:]
+                output_updates[0].extend([row[0]] * len(new_token_ids))
+                output_updates[1].extend(new_token_ids)
+                row[1] = len(output_token_ids)
+                cache_rows[logits_row] = row[0]
+                penalized_logits_rows.append(logits_row)
+                penalized_entries.append(row)
+
+        pin_memory = self.pin_memory
+        if reset_rows:
+            reset_rows_t = async_tensor_h2d(reset_rows, torch.long, device,
+                                            pin_memory)
+            self.prompt_mask[reset_rows_t] = False
+            self.output_counts[reset_rows_t] = 0
+        if prompt_updates[0]:
+            rows_t, token_ids_t = async_tensor_h2d(list(prompt_updates),
+                                                   torch.long, device,
+                                                   pin_memory)
+            self.prompt_mask[rows_t, token_ids_t] = True
+        if output_updates[0]:
+            rows_t, token_ids_t = async_tensor_h2d(list(output_updates),
+                                                   torch.long, device,
+                                                   pin_memory)
+            self.output_counts.index_put_(
+                (rows_t, token_ids_t),
+                torch.ones_like(token_ids_t, dtype=torch.int),
+                accumulate=True)
+
+        cache_rows_t = async_tensor_h2d(cache_rows, torch.long, device,
+                                        pin_memory)
+        self._last_sampling_metadata = sampling_metadata
+        self._last_rows = cache_rows_t
+        self._last_penalized_entries = penalized_entries
+        if penalized_entries:
+            self._last_penalized_logits_rows, self._last_penalized_rows = (
+                async_tensor_h2d([
+                    penalized_logits_rows,
+                    [row[0] for row in penalized_entries]
+                ], torch.long, device, pin_memory))
+        return self.prompt_mask[cache_rows_t], self.output_counts[cache_rows_t]
+
+    def get_last_counts(
+        self,
+        sampling_metadata: "SamplingMetadata",
+        num_rows: int,
+        vocab_size: int,
+        device: torch.device,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Like `get_counts`, but without reading the new tokens of the
+        sequences if the batch is the one of the last call, e.g. for the
+        next steps of a multi-step decode."""
+        if sampling_metadata is not self._last_sampling_metadata:
+            return self.get_counts(sampling_metadata, num_rows, vocab_size,
+                                   device)
+        assert self.prompt_mask is not None and self.output_counts is not None
+        return (self.prompt_mask[self._last_rows],
+                self.output_counts[self._last_rows])
+
+    def add_sampled_tokens(self, sampling_metadata: "SamplingMetadata",
+                           sampled_token_ids: torch.Tensor) -> None:
+        """Counts the tokens sampled for the batch of the last `get_counts`
+        call on device, without syncing with the GPU.
+
+        Args:
+            sampling_metadata: The batch the tokens were sampled for. The
+                call is a no-op for another batch.
+            sampled_token_ids: The sampled token ids, of shape
+                (num_rows, 1) and indexed by logits row.
+        """
+        if (sampling_metadata is not self._last_sampling_metadata
+                or not self._last_penalized_entries):
+            return
+        assert self.output_counts is not None
+        token_ids = sampled_token_ids[self._last_penalized_logits_rows,
+                                      0].long()
+        self.output_counts.index_put_(
+            (self._last_penalized_rows, token_ids),
+            torch.ones_like(token_ids, dtype=torch.int),
+            accumulate=True)
+        # The sequences get the tokens on the CPU later, and they must not be
+        # counted again then.
+        for row in self._last_penalized_entries:
+            row[1] += 1
+
+
 class SamplingMetadata:
     """Metadata for input sequences. Used in sampler.
 
@@ -128,6 +365,9 @@ class SamplingMetadata:
         reuse_sampling_tensors: Indicates if we want to reuse sampling 
             tensors that are part of the sampler forward pass. Currently,
             it is mainly used for multi-step decode.
+        token_count_cache: The token counts kept between steps for the
+            penalties. If None, they are counted from the token ids of the
+            sequences every step.
     """
 
     def __init__(
@@ -138,6 +378,7 @@ class SamplingMetadata:
         num_prompts: int,
         skip_sampler_cpu_output: bool = False,
         reuse_sampling_tensors: bool = False,
+        token_count_cache: Optional[TokenCountCache] = None,
     ) -> None:
         self.seq_groups = seq_groups
         self.selected_token_indices = selected_token_indices
@@ -145,6 +386,7 @@ class SamplingMetadata:
         self.num_prompts = num_prompts
         self.skip_sampler_cpu_output = skip_sampler_cpu_output
         self.reuse_sampling_tensors = reuse_sampling_tensors
+        self.token_count_cache = token_count_cache
 
     @staticmethod
     def prepare(
@@ -154,7 +396,8 @@ class SamplingMetadata:
         device: str,
         pin_memory: bool,
         generators: Optional[Dict[str, torch.Generator]] = None,
-        cache: Optional[SamplingMetadataCache] = None
+        cache: Optional[SamplingMetadataCache] = None,
+        token_count_cache: Optional[TokenCountCache] = None,
     ) -> "SamplingMetadata":
         (
             seq_groups,
@@ -181,6 +424,7 @@ class SamplingMetadata:
             selected_token_indices=selected_token_indices,
             categorized_sample_indices=categorized_sample_indices,
             num_prompts=num_prompts,
+            token_count_cache=token_count_cache,
         )
         return sampling_metadata
 
@@ -379,7 +623,6 @@ class SamplingTensors:
     presence_penalties: torch.Tensor
     frequency_penalties: torch.Tensor
     repetition_penalties: torch.Tensor
-    no_repeat_ngram_sizes: torch.Tensor
     tfss: torch.Tensor
     eta_cutoffs: torch.Tensor
     epsilon_cutoffs: torch.Tensor
@@ -401,6 +644,19 @@ class SamplingTensors:
     prompt_tokens: torch.Tensor
     output_tokens: torch.Tensor
 
+    def select_rows(self, rows: torch.Tensor) -> "SamplingTensors":
+        """Returns the tensors of the given rows of the logits, to apply the
+        samplers to a subset of the batch. The seeds are only used to sample
+        from the whole batch and are kept as is."""
+        selected = {}
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if (field.name not in ("sampling_seeds", "sample_indices",
+                                   "extra_seeds") and value.numel() > 0):
+                value = value[rows]
+            selected[field.name] = value
+        return SamplingTensors(**selected)
+
     @classmethod
     def from_sampling_metadata(
         cls,
@@ -432,7 +688,6 @@ class SamplingTensors:
         presence_penalties: List[float] = []
         frequency_penalties: List[float] = []
         repetition_penalties: List[float] = []
-        no_repeat_ngram_sizes: List[int] = []
         tfss: List[float] = []
         eta_cutoffs: List[float] = []
         epsilon_cutoffs: List[float] = []
@@ -498,9 +753,7 @@ class SamplingTensors:
                                top_k != vocab_size)
             do_top_as |= params.top_a > 0.0
             do_min_p |= params.min_p > _SAMPLING_EPS
-            do_penalties |= (abs(params.presence_penalty) >= _SAMPLING_EPS or
-                             abs(params.frequency_penalty) >= _SAMPLING_EPS or
-                             params.repetition_penalty > 1.0)
+            do_penalties |= _has_penalties(params)
             do_no_repeat_ngrams |= params.no_repeat_ngram_size > 0
             do_tfss |= params.tfs < 1.0 - _SAMPLING_EPS
             do_eta_cutoffs |= params.eta_cutoff > _SAMPLING_EPS
@@ -539,7 +792,6 @@ class SamplingTensors:
             presence_penalties += [params.presence_penalty] * n_seqs
             frequency_penalties += [params.frequency_penalty] * n_seqs
             repetition_penalties += [params.repetition_penalty] * n_seqs
-            no_repeat_ngram_sizes += [params.no_repeat_ngram_size] * n_seqs
             tfss += [params.tfs] * n_seqs
             eta_cutoffs += [params.eta_cutoff] * n_seqs
             epsilon_cutoffs += [params.epsilon_cutoff] * n_seqs
@@ -579,7 +831,10 @@ class SamplingTensors:
                     sampling_seeds.append(seq_seeds)
                 sample_indices.extend(seq_group.sample_indices)
 
-        if do_penalties or do_dry or do_no_repeat_ngrams:
+        # The penalties only need the token ids if they are not counted by
+        # a TokenCountCache.
+        if do_dry or (do_penalties
+                      and sampling_metadata.token_count_cache is None):
             for seq_group in sampling_metadata.seq_groups:
                 seq_ids = seq_group.seq_ids
                 if (seq_group.is_prompt
@@ -601,12 +856,12 @@ class SamplingTensors:
             temperatures, dynatemp_mins, dynatemp_maxs, dynatemp_exps,
             temperature_lasts, top_ps, top_ks, top_as, min_ps,
             presence_penalties, frequency_penalties, repetition_penalties,
-            no_repeat_ngram_sizes, tfss, eta_cutoffs, epsilon_cutoffs,
-            typical_ps, smoothing_factors, smoothing_curves, xtc_thresholds,
-            xtc_probabilities, nsigmas, dry_multipliers, dry_bases,
-            dry_allowed_lengths, dry_sequence_breaker_ids, dry_ranges, skews,
-            sampling_seeds, sample_indices, prompt_tokens, output_tokens,
-            vocab_size, extra_seeds_to_generate, device, dtype)
+            tfss, eta_cutoffs, epsilon_cutoffs, typical_ps, smoothing_factors,
+            smoothing_curves, xtc_thresholds, xtc_probabilities, nsigmas,
+            dry_multipliers, dry_bases, dry_allowed_lengths,
+            dry_sequence_breaker_ids, dry_ranges, skews, sampling_seeds,
+            sample_indices, prompt_tokens, output_tokens, vocab_size,
+            extra_seeds_to_generate, device, dtype)
         return (sampling_tensors, do_penalties, do_no_repeat_ngrams,
                 do_temperatures, do_top_p_top_k, do_top_as, do_min_p,
                 do_tfss, do_eta_cutoffs, do_epsilon_cutoffs, do_typical_ps,
@@ -620,8 +875,7 @@ class SamplingTensors:
                    top_ks: List[int], top_as: List[float],
                    min_ps: List[float], presence_penalties: List[float],
                    frequency_penalties: List[float],
-                   repetition_penalties: List[float],
-                   no_repeat_ngram_sizes: List[int], tfss: List[float],
+                   repetition_penalties: List[float], tfss: List[float],
                    eta_cutoffs: List[float], epsilon_cutoffs: List[float],
                    typical_ps: List[float], smoothing_factors: List[float],
                    smoothing_curves: List[float], xtc_thresholds: List[float],
@@ -724,12 +978,6 @@ class SamplingTensors:
             dtype=dtype,
             pin_memory=pin_memory,
         )
-        no_repeat_ngram_sizes_t = torch.tensor(
-            no_repeat_ngram_sizes,
-            device="cpu",
-            dtype=torch.int,
-            pin_memory=pin_memory,
-        )
         top_ks_t = torch.tensor(
             top_ks,
             device="cpu",
@@ -855,8 +1103,6 @@ class SamplingTensors:
                                                          non_blocking=True),
             repetition_penalties=repetition_penalties_t.to(device=device,
                                                            non_blocking=True),
-            no_repeat_ngram_sizes=no_repeat_ngram_sizes_t.to(device=device,
-                                                             non_blocking=True),
             tfss=tfss_t.to(device=device, non_blocking=True),
             eta_cutoffs=eta_cutoffs_t.to(device=device, non_blocking=True),
             epsilon_cutoffs=epsilon_cutoffs_t.to(device=device,
@@ -4,10 +4,12 @@ from aphrodite.common.utils import Device
 from aphrodite.processing.block.interfaces import (Block, BlockAllocator,
                                                    BlockId,
                                                    DeviceAwareBlockAllocator)
+from aphrodite.processing.block.kv_offload import KVOffloadTier
 from aphrodite.processing.block.naive_block import (NaiveBlock,
                                                     NaiveBlockAllocator)
 from aphrodite.processing.block.prefix_caching_block import (
     PrefixCachingBlockAllocator)
+from aphrodite.processing.evictor_v2 import EvictionPolicy
 
 
 class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
@@ -28,6 +30,8 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         num_gpu_blocks: int,
         num_cpu_blocks: int,
         block_size: int,
+        eviction_policy: EvictionPolicy = EvictionPolicy.LRU,
+        kv_offload_tier: Optional[KVOffloadTier] = None,
     ) -> DeviceAwareBlockAllocator:
         """Creates a CpuGpuBlockAllocator instance with the specified
         configuration.
@@ -46,6 +50,11 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
             num_cpu_blocks (int): The number of blocks to allocate for CPU
                 memory.
             block_size (int): The size of each block in number of tokens.
+            eviction_policy (EvictionPolicy): The policy used to evict cached
+                blocks. Only used by the "prefix_caching" allocator type.
+            kv_offload_tier (Optional[KVOffloadTier]): The tier that blocks
+                evicted from the GPU prefix cache are demoted to. Only used
+                by the "prefix_caching" allocator type.
 
         Returns:
             DeviceAwareBlockAllocator: A CpuGpuBlockAllocator instance with the
@@ -78,12 +87,15 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
                 num_blocks=num_gpu_blocks,
                 block_size=block_size,
                 block_ids=gpu_block_ids,
+                eviction_policy=eviction_policy,
+                kv_offload_tier=kv_offload_tier,
             )
 
             cpu_allocator = PrefixCachingBlockAllocator(
                 num_blocks=num_cpu_blocks,
                 block_size=block_size,
                 block_ids=cpu_block_ids,
+                eviction_policy=eviction_policy,
             )
         else:
             raise ValueError(f"Unknown allocator type {allocator_type=}")
@@ -331,6 +343,26 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         assert device in self._allocators
         return self._allocators[device].get_prefix_cache_hit_rate()
 
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        # Only blocks evicted from the GPU are offloaded.
+        return self._allocators[Device.GPU].get_and_reset_kv_offload_ops()
+
+    def pin_prefix(self, name: str, token_ids: List[int],
+                   device: Device) -> None:
+        self._allocators[device].pin_prefix(name, token_ids)
+
+    def unpin_prefix(self, name: str, device: Device) -> None:
+        self._allocators[device].unpin_prefix(name)
+
+    def get_cached_blocks(self, device: Device,
+                          max_blocks: Optional[int] = None
+                          ) -> List[Tuple[int, int, int]]:
+        return self._allocators[device].get_cached_blocks(max_blocks)
+
+    def restore_cached_blocks(self, blocks: List[Tuple[int, int]],
+                              device: Device) -> List[Tuple[int, int]]:
+        return self._allocators[device].restore_cached_blocks(blocks)
+
     def get_and_reset_swaps(self) -> List[Tuple[int, int]]:
         """Returns and clears the mapping of source to destination block IDs.
         Will be called after every swapping operations for now, and after every
@@ -191,6 +191,36 @@ class BlockAllocator(ABC):
         """Prefix cache hit rate. -1 means not supported or disabled."""
         pass
 
+    @abstractmethod
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        """Returns the copies to and from the KV offload tiers recorded since
+        the last call, as (op, src_block, dst_block) rows."""
+        pass
+
+    @abstractmethod
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        """Never evict the cached blocks of the given prefix."""
+        pass
+
+    @abstractmethod
+    def unpin_prefix(self, name: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """Returns (content hash, number of hashed tokens, block id) of the
+        unused cached blocks, most recently used first."""
+        pass
+
+    @abstractmethod
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Adds cached blocks from (content hash, number of hashed tokens)
+        and returns (index into blocks, block id) of the added blocks."""
+        pass
+
     class NoFreeBlocksError(ValueError):
         pass
 
@@ -288,3 +318,34 @@ class DeviceAwareBlockAllocator(ABC):
     def get_prefix_cache_hit_rate(self, device: Device) -> float:
         """Prefix cache hit rate. -1 means not supported or disabled."""
         pass
+
+    @abstractmethod
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        """Returns the copies to and from the KV offload tiers recorded since
+        the last call, as (op, src_block, dst_block) rows."""
+        pass
+
+    @abstractmethod
+    def pin_prefix(self, name: str, token_ids: List[int],
+                   device: Device) -> None:
+        """Never evict the cached blocks of the given prefix."""
+        pass
+
+    @abstractmethod
+    def unpin_prefix(self, name: str, device: Device) -> None:
+        pass
+
+    @abstractmethod
+    def get_cached_blocks(self, device: Device,
+                          max_blocks: Optional[int] = None
+                          ) -> List[Tuple[int, int, int]]:
+        """Returns (content hash, number of hashed tokens, block id) of the
+        unused cached blocks, most recently used first."""
+        pass
+
+    @abstractmethod
+    def restore_cached_blocks(self, blocks: List[Tuple[int, int]],
+                              device: Device) -> List[Tuple[int, int]]:
+        """Adds cached blocks from (content hash, number of hashed tokens)
+        and returns (index into blocks, block id) of the added blocks."""
+        pass
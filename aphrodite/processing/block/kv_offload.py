@@ -0,0 +1,128 @@
+"""Bookkeeping for the offload tiers of the prefix cache."""
+import enum
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from aphrodite.processing.block.common import CacheMetricData
+
+PrefixHash = int
+
+
+class KVOffloadOp(enum.IntEnum):
+    """Block copies between the device KV cache and the offload tiers.
+
+    Each op is sent to the workers as a (op, src_block, dst_block) row. The
+    workers execute the ops in order before the forward pass, so a block
+    can be read by one op and overwritten by a later one within a step.
+    """
+    DEVICE_TO_CPU = 0
+    CPU_TO_DISK = 1
+    DISK_TO_CPU = 2
+    CPU_TO_DEVICE = 3
+
+
+class KVOffloadTier:
+    """Keeps the KV cache of prefix cached blocks evicted from the device.
+
+    Evicted blocks are demoted to a pinned CPU pool. Once the CPU pool is
+    full, its least recently used blocks are demoted to a memory-mapped file
+    on local disk, if one is configured, and dropped otherwise. Blocks are
+    keyed by their content hash, so a request that misses on the device but
+    hits in a lower tier gets its block promoted back with a copy instead of
+    recomputing it.
+
+    The tiers are inclusive: a promoted block keeps its copy in the lower
+    tiers, so demoting it again does not need another copy.
+
+    Args:
+        num_cpu_blocks (int): The number of blocks in the CPU pool.
+        num_disk_blocks (int): The number of blocks in the disk file. 0
+            disables the disk tier.
+    """
+
+    def __init__(self, num_cpu_blocks: int, num_disk_blocks: int = 0):
+        assert num_cpu_blocks > 0
+
+        # Content hash to CPU/disk block, in least recently used order.
+        self._cpu_blocks: OrderedDict[PrefixHash, int] = OrderedDict()
+        self._disk_blocks: OrderedDict[PrefixHash, int] = OrderedDict()
+        self._free_cpu_blocks: List[int] = list(range(num_cpu_blocks))
+        self._free_disk_blocks: List[int] = list(range(num_disk_blocks))
+
+        self._ops: List[Tuple[int, int, int]] = []
+
+        self.metric_data = CacheMetricData()
+
+    def __contains__(self, content_hash: PrefixHash) -> bool:
+        return (content_hash in self._cpu_blocks
+                or content_hash in self._disk_blocks)
+
+    def demote(self, content_hash: PrefixHash, device_block_id: int) -> None:
+        """Keeps a copy of a block that is evicted from the device."""
+        if content_hash in self._cpu_blocks:
+            self._cpu_blocks.move_to_end(content_hash)
+            return
+
+        cpu_block_id = self._allocate_cpu_block()
+        self._cpu_blocks[content_hash] = cpu_block_id
+        self._ops.append(
+            (KVOffloadOp.DEVICE_TO_CPU, device_block_id, cpu_block_id))
+
+    def promote(self, content_hash: PrefixHash, device_block_id: int) -> bool:
+        """Copies a block back into a newly allocated device block.
+
+        Returns:
+            bool: Whether the block was found in one of the tiers. If not,
+                the device block has to be computed.
+        """
+        cpu_block_id = self._cpu_blocks.get(content_hash)
+        if cpu_block_id is not None:
+            self._cpu_blocks.move_to_end(content_hash)
+        elif content_hash in self._disk_blocks:
+            # Touch the disk block first so that making room in the CPU pool
+            # can't push it out of the disk tier.
+            self._disk_blocks.move_to_end(content_hash)
+            disk_block_id = self._disk_blocks[content_hash]
+            cpu_block_id = self._allocate_cpu_block()
+            self._cpu_blocks[content_hash] = cpu_block_id
+            self._ops.append(
+                (KVOffloadOp.DISK_TO_CPU, disk_block_id, cpu_block_id))
+        else:
+            self.metric_data.query(hit=False)
+            return False
+
+        self.metric_data.query(hit=True)
+        self._ops.append(
+            (KVOffloadOp.CPU_TO_DEVICE, cpu_block_id, device_block_id))
+        return True
+
+    def get_and_reset_ops(self) -> List[Tuple[int, int, int]]:
+        """Returns the ops recorded since the last call and clears them."""
+        ops = self._ops
+        self._ops = []
+        return ops
+
+    def get_hit_rate(self) -> float:
+        return self.metric_data.get_hit_rate()
+
+    def _allocate_cpu_block(self) -> int:
+        if self._free_cpu_blocks:
+            return self._free_cpu_blocks.pop()
+
+        content_hash, cpu_block_id = self._cpu_blocks.popitem(last=False)
+        if content_hash not in self._disk_blocks:
+            disk_block_id = self._allocate_disk_block()
+            if disk_block_id is not None:
+                self._disk_blocks[content_hash] = disk_block_id
+                self._ops.append(
+                    (KVOffloadOp.CPU_TO_DISK, cpu_block_id, disk_block_id))
+        return cpu_block_id
+
+    def _allocate_disk_block(self) -> Optional[int]:
+        if self._free_disk_blocks:
+            return self._free_disk_blocks.pop()
+        if not self._disk_blocks:
+            # The disk tier is disabled.
+            return None
+        _, disk_block_id = self._disk_blocks.popitem(last=False)
+        return disk_block_id
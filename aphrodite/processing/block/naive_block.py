@@ -346,6 +346,26 @@ class NaiveBlockAllocator(BlockAllocator):
     def get_prefix_cache_hit_rate(self) -> float:
         return -1
 
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        return []
+
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        raise NotImplementedError(
+            "Pinning prefixes requires prefix caching to be enabled")
+
+    def unpin_prefix(self, name: str) -> None:
+        raise NotImplementedError(
+            "Pinning prefixes requires prefix caching to be enabled")
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        return []
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return []
+
 
 class NaiveBlock(Block):
     """An implementation of the Block class that does not support prefix
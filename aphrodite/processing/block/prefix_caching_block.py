@@ -9,6 +9,7 @@ from aphrodite.processing.block.common import (CacheMetricData,
                                                get_all_blocks_recursively)
 from aphrodite.processing.block.interfaces import (Block, BlockAllocator,
                                                    BlockId, Device)
+from aphrodite.processing.block.kv_offload import KVOffloadTier
 from aphrodite.processing.block.naive_block import (BlockPool, NaiveBlock,
                                                     NaiveBlockAllocator)
 from aphrodite.processing.evictor_v2 import (EvictionPolicy, Evictor,
@@ -59,6 +60,11 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         block_ids(Optional[Iterable[int]], optional): An optional iterable of
             block IDs. If not provided, block IDs will be assigned sequentially
             from 0 to num_blocks - 1.
+        eviction_policy (EvictionPolicy): The policy used to evict cached
+            blocks.
+        kv_offload_tier (Optional[KVOffloadTier]): If given, evicted blocks
+            are demoted to it and promoted back on a cache hit. The block
+            IDs must be the physical block IDs on the device.
     """
 
     def __init__(
@@ -67,6 +73,7 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         block_size: int,
         block_ids: Optional[Iterable[int]] = None,
         eviction_policy: EvictionPolicy = EvictionPolicy.LRU,
+        kv_offload_tier: Optional[KVOffloadTier] = None,
     ):
         if block_ids is None:
             block_ids = range(num_blocks)
@@ -101,6 +108,7 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         # Evitor used to maintain how we want to handle those computed blocks
         # if we find memory pressure is high.
         self.evictor: Evictor = make_evictor(eviction_policy)
+        self._kv_offload_tier = kv_offload_tier
 
         # We share the refcounter between allocators. This allows us to promote
         # blocks originally allocated in the hashless allocator to immutable
@@ -112,6 +120,11 @@ class PrefixCachingBlockAllocator(BlockAllocator):
 
         self.metric_data = CacheMetricData()
 
+        # Content hashes of the named prefixes that must never be evicted,
+        # and how many named prefixes pin each of the hashes.
+        self._pinned_prefixes: Dict[str, List[PrefixHash]] = {}
+        self._pinned_hash_refcounts: Dict[PrefixHash, int] = {}
+
     # Implements Block.Factory.
     def _create_block(
         self,
@@ -170,6 +183,14 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         # No cached block => Allocate a new block
         block = self.allocate_mutable_block(prev_block)
         block.append_token_ids(token_ids)
+
+        # The block may still be cached in an offload tier, in which case it
+        # is copied into the new block before the next forward pass.
+        if (self._kv_offload_tier is not None
+                and self._kv_offload_tier.promote(block.content_hash,
+                                                  block.block_id)):
+            block.computed = True
+            self._block_tracker[block.block_id].computed = True
         return block
 
     def allocate_immutable_blocks(
@@ -313,6 +334,9 @@ class PrefixCachingBlockAllocator(BlockAllocator):
 
         self._cached_blocks.pop(content_hash_to_evict)
 
+        if self._kv_offload_tier is not None:
+            self._kv_offload_tier.demote(content_hash_to_evict, block_id)
+
         self._refcounter.incr(block_id)
         self._track_block_id(block_id, computed=False)
 
@@ -414,6 +438,127 @@ class PrefixCachingBlockAllocator(BlockAllocator):
     def get_prefix_cache_hit_rate(self) -> float:
         return self.metric_data.get_hit_rate()
 
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        if self._kv_offload_tier is None:
+            return []
+        return self._kv_offload_tier.get_and_reset_ops()
+
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        """Pins the full blocks of the given prefix so they are never evicted.
+
+        The blocks do not need to be cached yet; they are pinned as soon as
+        a request computes them. Pinned blocks that are not used by any
+        sequence are not counted as free blocks.
+
+        Args:
+            name (str): Name of the prefix, used to unpin it.
+            token_ids (List[int]): The token ids of the prefix. A trailing
+                partial block is not pinned.
+        """
+        if name in self._pinned_prefixes:
+            raise ValueError(f"Prefix {name} is already pinned")
+
+        content_hashes: List[PrefixHash] = []
+        prev_block_hash: Optional[PrefixHash] = None
+        num_full_blocks = len(token_ids) // self._block_size
+        for i in range(num_full_blocks):
+            prev_block_hash = PrefixCachingBlock.hash_block_tokens(
+                is_first_block=prev_block_hash is None,
+                prev_block_hash=prev_block_hash,
+                cur_block_token_ids=token_ids[i * self._block_size:(i + 1) *
+                                              self._block_size])
+            content_hashes.append(prev_block_hash)
+
+        self._pinned_prefixes[name] = content_hashes
+        for content_hash in content_hashes:
+            refcount = self._pinned_hash_refcounts.get(content_hash, 0)
+            if refcount == 0:
+                self.evictor.pin(content_hash)
+            self._pinned_hash_refcounts[content_hash] = refcount + 1
+
+    def unpin_prefix(self, name: str) -> None:
+        """Makes the blocks of a prefix pinned by pin_prefix() evictable
+        again, unless another pinned prefix shares them."""
+        if name not in self._pinned_prefixes:
+            raise ValueError(f"Prefix {name} is not pinned")
+
+        for content_hash in self._pinned_prefixes.pop(name):
+            refcount = self._pinned_hash_refcounts.pop(content_hash) - 1
+            if refcount == 0:
+                self.evictor.unpin(content_hash)
+            else:
+                self._pinned_hash_refcounts[content_hash] = refcount
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """Returns the cached blocks that are not used by any sequence,
+        most recently used first.
+
+        Blocks of the same prefix that were last used at the same time are
+        ordered by depth, so that a truncated list keeps whole prefixes.
+
+        Args:
+            max_blocks (Optional[int]): The maximum number of blocks to
+                return. Defaults to all of them.
+
+        Returns:
+            List[Tuple[int, int, int]]: (content hash, number of hashed
+                tokens, block id) of each block.
+        """
+        cached_blocks = []
+        for content_hash, block_id in self._cached_blocks.items():
+            if block_id not in self.evictor:
+                continue
+            block = self.evictor.get_metadata(block_id)
+            cached_blocks.append((-block.last_accessed,
+                                  block.num_hashed_tokens, content_hash,
+                                  block_id))
+        cached_blocks.sort()
+        if max_blocks is not None:
+            cached_blocks = cached_blocks[:max_blocks]
+        return [(content_hash, num_hashed_tokens, block_id)
+                for _, num_hashed_tokens, content_hash, block_id in
+                cached_blocks]
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Adds cached blocks whose KV cache is loaded by the caller, e.g.
+        from a snapshot of the prefix cache.
+
+        The blocks are added as unused cached blocks in the given order,
+        until there are no unallocated blocks left; cached blocks are never
+        evicted to make room. Blocks are expected most recently used first,
+        as returned by get_cached_blocks(), and the first block is the last
+        one to be evicted.
+
+        Args:
+            blocks (List[Tuple[int, int]]): (content hash, number of hashed
+                tokens) of each block.
+
+        Returns:
+            List[Tuple[int, int]]: (index into blocks, block id) of every
+                block that was added. The caller has to fill these blocks
+                before they are used.
+        """
+        restored: List[Tuple[int, int]] = []
+        for i, (content_hash, num_hashed_tokens) in enumerate(blocks):
+            if content_hash in self._cached_blocks:
+                continue
+            block_id = self._maybe_allocate_hashless_block_id()
+            if block_id is None:
+                break
+
+            self._cached_blocks[content_hash] = block_id
+            self._refcounter.decr(block_id)
+            self._untrack_block_id(block_id)
+            # Restored blocks are older than any block used after the
+            # restore, and keep their order among each other.
+            self.evictor.add(block_id, content_hash, num_hashed_tokens,
+                             last_accessed=_DEFAULT_LAST_ACCESSED_TIME - i)
+            restored.append((i, block_id))
+        return restored
+
     def is_block_cached(self, block: Block) -> bool:
         assert block.content_hash is not None
         if block.content_hash in self._cached_blocks:
@@ -237,6 +237,9 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         watermark: float = 0.01,
         sliding_window: Optional[int] = None,
         enable_caching: bool = False,
+        eviction_policy: str = "lru",
+        num_kv_offload_cpu_blocks: int = 0,
+        num_kv_offload_disk_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
         self.num_total_gpu_blocks = num_gpu_blocks
@@ -246,6 +249,17 @@ class BlockSpaceManagerV1(BlockSpaceManager):
             raise NotImplementedError(
                 "Sliding window is not allowed with prefix caching enabled!")
 
+        if enable_caching and eviction_policy != "lru":
+            raise NotImplementedError(
+                f"The {eviction_policy} prefix cache eviction policy is only "
+                "supported by block manager v2. Run with "
+                "--use-v2-block-manager.")
+
+        if enable_caching and num_kv_offload_cpu_blocks > 0:
+            raise NotImplementedError(
+                "KV cache offloading is only supported by block manager v2. "
+                "Run with --use-v2-block-manager.")
+
         self.block_sliding_window = None
         if sliding_window is not None:
             # Round up to nearest block size to regularize sliding window
@@ -735,3 +749,25 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         if device == Device.CPU:
             return self.cpu_allocator.get_prefix_cache_hit_rate()
         raise ValueError(f"Invalid device: {device}")
+
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        return []
+
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        raise NotImplementedError(
+            "Pinning prefixes is only supported by block manager v2.")
+
+    def unpin_prefix(self, name: str) -> None:
+        raise NotImplementedError(
+            "Pinning prefixes is only supported by block manager v2.")
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        raise NotImplementedError(
+            "Prefix cache snapshots are only supported by block manager v2.")
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        raise NotImplementedError(
+            "Prefix cache snapshots are only supported by block manager v2.")
@@ -10,10 +10,12 @@ from aphrodite.processing.block.block_table import BlockTable
 from aphrodite.processing.block.cpu_gpu_block_allocator import (
     CpuGpuBlockAllocator)
 from aphrodite.processing.block.interfaces import Block
+from aphrodite.processing.block.kv_offload import KVOffloadTier
 from aphrodite.processing.block.prefix_caching_block import (
     ComputedBlocksTracker, LastAccessBlocksTracker)
 from aphrodite.processing.block.utils import (
     check_no_caching_or_swa_for_blockmgr_encdec)
+from aphrodite.processing.evictor_v2 import EvictionPolicy
 from aphrodite.processing.interfaces import AllocStatus, BlockSpaceManager
 
 SeqId = int
@@ -55,6 +57,14 @@ class BlockSpaceManagerV2(BlockSpaceManager):
             window. Defaults to None.
         enable_caching (bool, optional): Flag indicating whether caching is
             enabled. Defaults to False.
+        eviction_policy (str, optional): The policy used to evict cached
+            blocks when caching is enabled. One of "lru", "lfu" and
+            "cost_aware". Defaults to "lru".
+        num_kv_offload_cpu_blocks (int, optional): The number of blocks in
+            the CPU tier that blocks evicted from the GPU prefix cache are
+            demoted to. 0 disables offloading. Defaults to 0.
+        num_kv_offload_disk_blocks (int, optional): The number of blocks in
+            the disk tier below the CPU tier. Defaults to 0.
     """
 
     def __init__(
@@ -65,6 +75,9 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         watermark: float = 0.01,
         sliding_window: Optional[int] = None,
         enable_caching: bool = False,
+        eviction_policy: str = "lru",
+        num_kv_offload_cpu_blocks: int = 0,
+        num_kv_offload_disk_blocks: int = 0,
     ) -> None:
         self.block_size = block_size
         self.num_total_gpu_blocks = num_gpu_blocks
@@ -90,11 +103,18 @@ class BlockSpaceManagerV2(BlockSpaceManager):
 
         self.watermark_blocks = int(watermark * num_gpu_blocks)
 
+        kv_offload_tier = None
+        if enable_caching and num_kv_offload_cpu_blocks > 0:
+            kv_offload_tier = KVOffloadTier(num_kv_offload_cpu_blocks,
+                                            num_kv_offload_disk_blocks)
+
         self.block_allocator = CpuGpuBlockAllocator.create(
             allocator_type="prefix_caching" if enable_caching else "naive",
             num_gpu_blocks=num_gpu_blocks,
             num_cpu_blocks=num_cpu_blocks,
             block_size=block_size,
+            eviction_policy=EvictionPolicy[eviction_policy.upper()],
+            kv_offload_tier=kv_offload_tier,
         )
 
         self.block_tables: Dict[SeqId, BlockTable] = {}
@@ -443,6 +463,24 @@ class BlockSpaceManagerV2(BlockSpaceManager):
     def get_prefix_cache_hit_rate(self, device: Device) -> float:
         return self.block_allocator.get_prefix_cache_hit_rate(device)
 
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        return self.block_allocator.get_and_reset_kv_offload_ops()
+
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        self.block_allocator.pin_prefix(name, token_ids, Device.GPU)
+
+    def unpin_prefix(self, name: str) -> None:
+        self.block_allocator.unpin_prefix(name, Device.GPU)
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        return self.block_allocator.get_cached_blocks(Device.GPU, max_blocks)
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return self.block_allocator.restore_cached_blocks(blocks, Device.GPU)
+
     def _can_swap(self,
                   seq_group: SequenceGroup,
                   device: Device,
@@ -1,6 +1,7 @@
 import enum
+import heapq
 from abc import ABC, abstractmethod
-from typing import OrderedDict, Tuple
+from typing import Dict, List, Set, Tuple
 
 
 class EvictionPolicy(enum.Enum):
@@ -8,6 +9,8 @@ class EvictionPolicy(enum.Enum):
        Evictor subclass.
     """
     LRU = enum.auto()
+    LFU = enum.auto()
+    COST_AWARE = enum.auto()
 
 
 class Evictor(ABC):
@@ -46,6 +49,23 @@ class Evictor(ABC):
         """Remove a given block id from the cache."""
         pass
 
+    @abstractmethod
+    def get_metadata(self, block_id: int) -> "BlockMetaData":
+        """Returns the metadata of a block in the evictor."""
+        pass
+
+    @abstractmethod
+    def pin(self, content_hash: int):
+        """Never evict blocks with the given content hash, including blocks
+        that are added later on. Pinned blocks are still contained in the
+        evictor but are not counted in num_blocks."""
+        pass
+
+    @abstractmethod
+    def unpin(self, content_hash: int):
+        """Make blocks with the given content hash evictable again."""
+        pass
+
     @property
     @abstractmethod
     def num_blocks(self) -> int:
@@ -65,68 +85,223 @@ class BlockMetaData():
         self.content_hash = content_hash
         self.num_hashed_tokens = num_hashed_tokens
         self.last_accessed = last_accessed
+        # Sort key of the block's latest entry in the eviction heap.
+        self.priority: Tuple[float, ...] = ()
 
 
-class LRUEvictor(Evictor):
-    """Evicts in a least-recently-used order using the last_accessed timestamp
-    that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
-    the same last_accessed time, then the one with the largest num_hashed_tokens
-    will be evicted. If two blocks each have the lowest last_accessed time and
-    highest num_hashed_tokens value, then one will be chose arbitrarily
+class HeapEvictor(Evictor):
+    """Base class for evictors that keep their eviction order in a heap.
+
+    Subclasses define the order through `_get_priority`; the block with the
+    smallest priority is evicted first. Updates and removals don't touch the
+    heap; stale entries are skipped lazily when evicting, and the heap is
+    rebuilt once it grows too large relative to the free table.
     """
 
+    # Maximum size of the heap relative to the number of free blocks before
+    # it is rebuilt from the free table.
+    CLEANUP_THRESHOLD = 50
+
     def __init__(self):
-        self.free_table: OrderedDict[int, BlockMetaData] = OrderedDict()
+        self.free_table: Dict[int, BlockMetaData] = {}
+        self.priority_queue: List[Tuple[Tuple[float, ...], int, int]] = []
+        # Free blocks whose content hash is pinned. They are kept out of the
+        # heap until they are unpinned.
+        self.pinned_table: Dict[int, BlockMetaData] = {}
+        self.pinned_hashes: Set[int] = set()
+
+    @abstractmethod
+    def _get_priority(self, block_id: int,
+                      block: BlockMetaData) -> Tuple[float, ...]:
+        pass
+
+    def _on_evict(self, block_id: int, block: BlockMetaData):
+        pass
 
     def __contains__(self, block_id: int) -> bool:
-        return block_id in self.free_table
+        return block_id in self.free_table or block_id in self.pinned_table
 
     def evict(self) -> Tuple[int, int]:
         if len(self.free_table) == 0:
             raise ValueError("No usable cache memory left")
 
-        evicted_block, evicted_block_id = None, None
-        # The blocks with the lowest timestamps should be placed consecutively
-        # at the start of OrderedDict. Loop through all these blocks to
-        # find the one with maximum number of hashed tokens.
-        for _id, block in self.free_table.items():
-            if evicted_block is None:
-                evicted_block, evicted_block_id = block, _id
-                continue
-            if evicted_block.last_accessed < block.last_accessed:
-                break
-            if evicted_block.num_hashed_tokens < block.num_hashed_tokens:
-                evicted_block, evicted_block_id = block, _id
-
-        assert evicted_block is not None
-        assert evicted_block_id is not None
-
-        self.free_table.pop(evicted_block_id)
+        while self.priority_queue:
+            priority, block_id, content_hash = heapq.heappop(
+                self.priority_queue)
+            # Entries are outdated if the block was removed from the free
+            # table or its metadata changed after the entry was pushed.
+            block = self.free_table.get(block_id)
+            if (block is not None and block.priority == priority
+                    and block.content_hash == content_hash):
+                self.free_table.pop(block_id)
+                self._on_evict(block_id, block)
+                return block_id, content_hash
 
-        return evicted_block_id, evicted_block.content_hash
+        raise AssertionError("Evictor heap is out of sync with free table")
 
     def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
             last_accessed: float):
-        self.free_table[block_id] = BlockMetaData(content_hash,
-                                                  num_hashed_tokens,
-                                                  last_accessed)
+        block = BlockMetaData(content_hash, num_hashed_tokens, last_accessed)
+        if content_hash in self.pinned_hashes:
+            self.pinned_table[block_id] = block
+            return
+        self.free_table[block_id] = block
+        self._push(block_id, block)
 
     def update(self, block_id: int, last_accessed: float):
-        self.free_table[block_id].last_accessed = last_accessed
+        block = self.pinned_table.get(block_id)
+        if block is not None:
+            block.last_accessed = last_accessed
+            return
+        block = self.free_table[block_id]
+        if block.last_accessed == last_accessed:
+            return
+        block.last_accessed = last_accessed
+        self._push(block_id, block)
 
     def remove(self, block_id: int):
+        if block_id in self.pinned_table:
+            self.pinned_table.pop(block_id)
+            return
         if block_id not in self.free_table:
             raise ValueError(
                 "Attempting to remove block that's not in the evictor")
         self.free_table.pop(block_id)
 
+    def get_metadata(self, block_id: int) -> BlockMetaData:
+        block = self.free_table.get(block_id)
+        if block is None:
+            block = self.pinned_table[block_id]
+        return block
+
+    def pin(self, content_hash: int):
+        self.pinned_hashes.add(content_hash)
+        for block_id, block in list(self.free_table.items()):
+            if block.content_hash == content_hash:
+                # The heap entry becomes stale and is skipped lazily.
+                self.pinned_table[block_id] = self.free_table.pop(block_id)
+
+    def unpin(self, content_hash: int):
+        self.pinned_hashes.discard(content_hash)
+        for block_id, block in list(self.pinned_table.items()):
+            if block.content_hash == content_hash:
+                self.free_table[block_id] = self.pinned_table.pop(block_id)
+                self._push(block_id, block)
+
+    def _push(self, block_id: int, block: BlockMetaData):
+        block.priority = self._get_priority(block_id, block)
+        heapq.heappush(self.priority_queue,
+                       (block.priority, block_id, block.content_hash))
+        self._cleanup_if_necessary()
+
+    def _cleanup_if_necessary(self):
+        if len(self.priority_queue) > self.CLEANUP_THRESHOLD * max(
+                len(self.free_table), 1):
+            self._cleanup()
+
+    def _cleanup(self):
+        self.priority_queue = [(block.priority, block_id, block.content_hash)
+                               for block_id, block in self.free_table.items()]
+        heapq.heapify(self.priority_queue)
+
     @property
     def num_blocks(self) -> int:
         return len(self.free_table)
 
 
+class LRUEvictor(HeapEvictor):
+    """Evicts in a least-recently-used order using the last_accessed timestamp
+    that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
+    the same last_accessed time, then the one with the largest num_hashed_tokens
+    will be evicted. If two blocks each have the lowest last_accessed time and
+    highest num_hashed_tokens value, then one will be chose arbitrarily
+    """
+
+    def _get_priority(self, block_id: int,
+                      block: BlockMetaData) -> Tuple[float, ...]:
+        return (block.last_accessed, -block.num_hashed_tokens)
+
+
+class LFUEvictor(HeapEvictor):
+    """Evicts the least frequently used block, with dynamic aging (LFU-DA).
+
+    A block's frequency is the number of times it was released to the
+    evictor or touched while in it since it was cached, i.e. how many times
+    its content was used. The key of a block is its frequency plus the
+    current age of the cache, where the age is the key of the last evicted
+    block. Without aging, blocks that were hot a long time ago would never
+    be evicted. Ties are broken in LRU order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.age = 0.0
+        # Maps block id to (content hash, frequency). Entries outlive the
+        # block's stay in the evictor so reuses keep adding up, and are
+        # dropped once the block is evicted.
+        self.frequencies: Dict[int, Tuple[int, int]] = {}
+
+    def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
+            last_accessed: float):
+        self._count_access(block_id, content_hash)
+        super().add(block_id, content_hash, num_hashed_tokens, last_accessed)
+
+    def update(self, block_id: int, last_accessed: float):
+        block = self.free_table.get(block_id) or self.pinned_table[block_id]
+        if block.last_accessed != last_accessed:
+            self._count_access(block_id, block.content_hash)
+        super().update(block_id, last_accessed)
+
+    def _count_access(self, block_id: int, content_hash: int):
+        prev_hash, frequency = self.frequencies.get(block_id, (None, 0))
+        if prev_hash != content_hash:
+            frequency = 0
+        self.frequencies[block_id] = (content_hash, frequency + 1)
+
+    def _get_priority(self, block_id: int,
+                      block: BlockMetaData) -> Tuple[float, ...]:
+        frequency = self.frequencies[block_id][1]
+        return (self.age + frequency, block.last_accessed,
+                -block.num_hashed_tokens)
+
+    def _on_evict(self, block_id: int, block: BlockMetaData):
+        self.age = block.priority[0]
+        self.frequencies.pop(block_id, None)
+
+
+class CostAwareEvictor(HeapEvictor):
+    """Evicts by recompute cost with GreedyDual aging.
+
+    Evicting a block invalidates the cached prefix beyond it: a request
+    that misses on the block has to recompute it and every later block of
+    its prompt, even if those are still cached. The cost of losing a block
+    therefore shrinks with its prefix depth, and we use the inverse of
+    num_hashed_tokens. A block's key is its cost plus the age of the cache,
+    where the age is the key of the last evicted block, so blocks that have
+    not been used for a long time are eventually evicted no matter how
+    shallow they are. Ties are broken in LRU order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.age = 0.0
+
+    def _get_priority(self, block_id: int,
+                      block: BlockMetaData) -> Tuple[float, ...]:
+        cost = 1.0 / max(block.num_hashed_tokens, 1)
+        return (self.age + cost, block.last_accessed,
+                -block.num_hashed_tokens)
+
+    def _on_evict(self, block_id: int, block: BlockMetaData):
+        self.age = block.priority[0]
+
+
 def make_evictor(eviction_policy: EvictionPolicy) -> Evictor:
     if eviction_policy == EvictionPolicy.LRU:
         return LRUEvictor()
+    elif eviction_policy == EvictionPolicy.LFU:
+        return LFUEvictor()
+    elif eviction_policy == EvictionPolicy.COST_AWARE:
+        return CostAwareEvictor()
     else:
         raise ValueError(f"Unknown cache eviction policy: {eviction_policy}")
@@ -1,6 +1,6 @@
 import enum
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 from typing import Sequence as GenericSequence
 from typing import Tuple
 
@@ -124,3 +124,35 @@ class BlockSpaceManager(ABC):
     def get_prefix_cache_hit_rate(self, device: Device) -> float:
         """Prefix cache hit rate. -1 means not supported or disabled."""
         pass
+
+    @abstractmethod
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        """Returns the copies between the GPU prefix cache and its offload
+        tiers that the workers need to execute before the next forward
+        pass."""
+        pass
+
+    @abstractmethod
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        """Never evict the cached blocks of the given prefix on GPU."""
+        pass
+
+    @abstractmethod
+    def unpin_prefix(self, name: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """Returns (content hash, number of hashed tokens, block id) of the
+        unused cached blocks on GPU, most recently used first."""
+        pass
+
+    @abstractmethod
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Adds cached blocks on GPU from (content hash, number of hashed
+        tokens) and returns (index into blocks, block id) of the added
+        blocks."""
+        pass
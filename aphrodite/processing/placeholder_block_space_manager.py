@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from aphrodite.common.sequence import Sequence, SequenceGroup
 from aphrodite.common.utils import Device
@@ -86,3 +86,21 @@ class PlaceholderBlockSpaceManager(BlockSpaceManager):
 
     def get_prefix_cache_hit_rate(self, device: Device) -> float:
         return -1
+
+    def get_and_reset_kv_offload_ops(self) -> List[Tuple[int, int, int]]:
+        return []
+
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        pass
+
+    def unpin_prefix(self, name: str) -> None:
+        pass
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        return []
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return []
@@ -0,0 +1,153 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from aphrodite.common.sequence import SequenceGroup
+
+
+class Policy:
+    """Orders sequence groups for scheduling.
+
+    A policy maps every sequence group to a sort key; groups with smaller
+    keys are scheduled first and preempted last. The scheduler keeps its
+    queues as deque objects, so a policy re-sorts them once per scheduling
+    step. Since the queues are mostly sorted between steps, this is close
+    to linear in practice.
+    """
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple:
+        raise NotImplementedError
+
+    def sort_by_priority(
+        self,
+        now: float,
+        seq_groups: Deque[SequenceGroup],
+    ) -> Deque[SequenceGroup]:
+        return deque(
+            sorted(seq_groups,
+                   key=lambda seq_group: self.get_priority(now, seq_group)))
+
+    def update(self, seq_group: SequenceGroup, num_tokens: int) -> None:
+        """Notify the policy that `num_tokens` tokens of `seq_group` were
+        scheduled in the current step."""
+        pass
+
+
+class FCFS(Policy):
+    """First come, first served. This is the default policy."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple:
+        return (seq_group.metrics.arrival_time, )
+
+    def sort_by_priority(
+        self,
+        now: float,
+        seq_groups: Deque[SequenceGroup],
+    ) -> Deque[SequenceGroup]:
+        # The scheduler already keeps the queues in arrival order.
+        return seq_groups
+
+
+class StrictPriority(Policy):
+    """Schedules requests with a lower `priority` value first. Requests with
+    the same priority are served in arrival order."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple:
+        return (_get_request_priority(seq_group),
+                seq_group.metrics.arrival_time)
+
+
+class EarliestDeadlineFirst(Policy):
+    """Schedules the request with the earliest deadline first. Requests
+    without a deadline are scheduled after all requests that have one, by
+    priority and then arrival order."""
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple:
+        arrival_time = seq_group.metrics.arrival_time
+        sampling_params = seq_group.sampling_params
+        deadline = (sampling_params.deadline
+                    if sampling_params is not None else None)
+        if deadline is None:
+            return (float("inf"), _get_request_priority(seq_group),
+                    arrival_time)
+        return (arrival_time + deadline, _get_request_priority(seq_group),
+                arrival_time)
+
+
+class FairShare(Policy):
+    """Weighted fair share across tenants.
+
+    Tenants are identified by their LoRA adapter (the base model is tenant
+    0). The policy tracks the number of tokens scheduled for each tenant and
+    serves the tenant with the lowest weighted usage first. A tenant seen
+    for the first time starts from the lowest usage among known tenants, so
+    it cannot starve the existing ones.
+
+    Args:
+        tenant_weights: Optional mapping from LoRA int ID to weight. Tenants
+            that are not listed get a weight of 1.
+    """
+
+    def __init__(self,
+                 tenant_weights: Optional[Dict[int, float]] = None) -> None:
+        self.tenant_weights = tenant_weights or {}
+        self._usage: Dict[int, float] = {}
+
+    def _get_usage(self, tenant: int) -> float:
+        usage = self._usage.get(tenant)
+        if usage is None:
+            usage = min(self._usage.values()) if self._usage else 0.0
+            self._usage[tenant] = usage
+        return usage
+
+    def get_priority(
+        self,
+        now: float,
+        seq_group: SequenceGroup,
+    ) -> Tuple:
+        return (self._get_usage(seq_group.lora_int_id),
+                _get_request_priority(seq_group),
+                seq_group.metrics.arrival_time)
+
+    def update(self, seq_group: SequenceGroup, num_tokens: int) -> None:
+        tenant = seq_group.lora_int_id
+        weight = self.tenant_weights.get(tenant, 1.0)
+        self._usage[tenant] = self._get_usage(tenant) + num_tokens / weight
+
+
+def _get_request_priority(seq_group: SequenceGroup) -> int:
+    sampling_params = seq_group.sampling_params
+    return sampling_params.priority if sampling_params is not None else 0
+
+
+class PolicyFactory:
+
+    _POLICY_REGISTRY = {
+        "fcfs": FCFS,
+        "priority": StrictPriority,
+        "edf": EarliestDeadlineFirst,
+        "fair": FairShare,
+    }
+
+    @classmethod
+    def get_policy(cls, policy_name: str, **kwargs) -> Policy:
+        if policy_name not in cls._POLICY_REGISTRY:
+            raise ValueError(f"Unknown scheduling policy {policy_name}. "
+                             "Must be one of "
+                             f"{list(cls._POLICY_REGISTRY.keys())}.")
+        return cls._POLICY_REGISTRY[policy_name](**kwargs)
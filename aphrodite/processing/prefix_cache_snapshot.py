@@ -0,0 +1,114 @@
+"""On-disk snapshots of the prefix cache.
+
+A snapshot is a directory with a `metadata.json` file written by the engine
+and one safetensors file per worker rank with the KV cache of the saved
+blocks. The metadata lists the content hash and number of hashed tokens of
+the saved blocks of each virtual engine, most recently used first, along
+with a fingerprint of the model and cache configuration. A snapshot is only
+restored if the fingerprint matches, since the KV cache is meaningless for
+any other model, dtype or parallel layout.
+
+Content hashes are Python hashes of tuples of token ids, which only depend
+on the Python version, so the Python version is part of the fingerprint.
+"""
+import contextlib
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from aphrodite.common.config import CacheConfig, ModelConfig, ParallelConfig
+
+SNAPSHOT_VERSION = 1
+METADATA_FILE_NAME = "metadata.json"
+
+
+def get_kv_cache_file(path: str, rank: int) -> str:
+    return os.path.join(path, f"kv_cache_rank_{rank}.safetensors")
+
+
+def get_fingerprint(model_config: ModelConfig, cache_config: CacheConfig,
+                    parallel_config: ParallelConfig) -> Dict[str, Any]:
+    """Returns the configuration that the KV cache of a snapshot is only
+    valid for."""
+    return {
+        "model": model_config.model,
+        "revision": model_config.revision,
+        "tokenizer": model_config.tokenizer,
+        "tokenizer_revision": model_config.tokenizer_revision,
+        "quantization": model_config.quantization,
+        "dtype": str(model_config.dtype),
+        "cache_dtype": cache_config.cache_dtype,
+        "block_size": cache_config.block_size,
+        "tensor_parallel_size": parallel_config.tensor_parallel_size,
+        "pipeline_parallel_size": parallel_config.pipeline_parallel_size,
+        "python_version": list(sys.version_info[:2]),
+    }
+
+
+def remove_metadata(path: str) -> None:
+    """Invalidates the snapshot in `path`, if any. Called before the KV
+    cache files are overwritten, so that a partially written snapshot is
+    never restored."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(path, METADATA_FILE_NAME))
+
+
+def save_metadata(path: str, fingerprint: Dict[str, Any],
+                  blocks: List[List[Tuple[int, int]]]) -> None:
+    """Writes the metadata of a snapshot, once its KV cache files are
+    complete.
+
+    Args:
+        path: The snapshot directory.
+        fingerprint: See `get_fingerprint`.
+        blocks: (content hash, number of hashed tokens) of the saved blocks
+            of each virtual engine, in the order of the KV cache files.
+    """
+    metadata = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "blocks": blocks,
+    }
+    metadata_file = os.path.join(path, METADATA_FILE_NAME)
+    tmp_file = metadata_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(metadata, f)
+    os.replace(tmp_file, metadata_file)
+
+
+def load_metadata(
+        path: str,
+        fingerprint: Dict[str, Any]) -> Optional[List[List[Tuple[int, int]]]]:
+    """Reads the metadata of the snapshot in `path`.
+
+    Returns:
+        The saved blocks of each virtual engine as passed to
+        `save_metadata`, or None if there is no snapshot or it does not
+        match the fingerprint.
+    """
+    metadata_file = os.path.join(path, METADATA_FILE_NAME)
+    if not os.path.exists(metadata_file):
+        logger.info(f"No prefix cache snapshot found in {path}")
+        return None
+
+    with open(metadata_file) as f:
+        metadata = json.load(f)
+    if metadata.get("version") != SNAPSHOT_VERSION:
+        logger.warning(
+            f"Ignoring the prefix cache snapshot in {path}: it has version "
+            f"{metadata.get('version')}, expected {SNAPSHOT_VERSION}.")
+        return None
+    # Round-trip through JSON so that tuples and lists compare equal.
+    expected = json.loads(json.dumps(fingerprint))
+    if metadata.get("fingerprint") != expected:
+        logger.warning(
+            f"Ignoring the prefix cache snapshot in {path}: it was saved "
+            f"for {metadata.get('fingerprint')}, but the engine runs with "
+            f"{expected}.")
+        return None
+    return [[(content_hash, num_hashed_tokens)
+             for content_hash, num_hashed_tokens in ve_blocks]
+            for ve_blocks in metadata["blocks"]]
@@ -16,6 +16,7 @@ from aphrodite.common.sequence import (Sequence, SequenceData, SequenceGroup,
 from aphrodite.common.utils import Device, PyObjectCache
 from aphrodite.lora.request import LoRARequest
 from aphrodite.processing.interfaces import AllocStatus, BlockSpaceManager
+from aphrodite.processing.policy import PolicyFactory
 from aphrodite.prompt_adapter.request import PromptAdapterRequest
 
 # Test-only. If configured, decode is preempted with
@@ -132,6 +133,9 @@ class SchedulerOutputs:
     # The number of requests in the running queue
     running_queue_size: int
     preempted: int
+    # Copies between the GPU prefix cache and its offload tiers, as
+    # (KVOffloadOp, src, dst) rows to execute in order.
+    kv_offload_ops: List[Tuple[int, int, int]] = field(default_factory=list)
 
     def __post_init__(self):
         # Swap in and swap out should never happen at the same time.
@@ -146,7 +150,8 @@ class SchedulerOutputs:
     def is_empty(self) -> bool:
         # NOTE: We do not consider the ignored sequence groups.
         return (not self.scheduled_seq_groups and not self.blocks_to_swap_in
-                and not self.blocks_to_swap_out and not self.blocks_to_copy)
+                and not self.blocks_to_swap_out and not self.blocks_to_copy
+                and not self.kv_offload_ops)
 
     def _sort_by_lora_ids(self):
         assert 0 <= self.num_prefill_groups <= len(self.scheduled_seq_groups)
@@ -340,7 +345,14 @@ class Scheduler:
             num_gpu_blocks=num_gpu_blocks,
             num_cpu_blocks=num_cpu_blocks,
             sliding_window=self.cache_config.sliding_window,
-            enable_caching=self.cache_config.enable_prefix_caching)
+            enable_caching=self.cache_config.enable_prefix_caching,
+            eviction_policy=self.cache_config.prefix_cache_eviction_policy,
+            num_kv_offload_cpu_blocks=(
+                self.cache_config.num_kv_offload_cpu_blocks //
+                pipeline_parallel_size),
+            num_kv_offload_disk_blocks=(
+                self.cache_config.num_kv_offload_disk_blocks //
+                pipeline_parallel_size))
 
         # Sequence groups in the WAITING state.
         # Contain new prefill or preempted requests.
@@ -351,6 +363,10 @@ class Scheduler:
         # Sequence groups in the SWAPPED state.
         # Contain decode requests that are swapped out.
         self.swapped: Deque[SequenceGroup] = deque()
+        # Orders the queues above. Requests earlier in a queue are scheduled
+        # first, and running requests at the end are preempted first.
+        self.policy = PolicyFactory.get_policy(
+            policy_name=scheduler_config.policy)
         # Sequence groups finished requests ids since last step iteration.
         # It lets the model know that any state associated with these requests
         # can and must be released after the current step.
@@ -458,8 +474,25 @@ class Scheduler:
             self.swapped) != 0
 
     def get_prefix_cache_hit_rate(self, device: Device) -> float:
+        """Hit rate of the prefix cache under the configured eviction
+        policy. -1 means prefix caching is disabled."""
         return self.block_manager.get_prefix_cache_hit_rate(device)
 
+    def pin_prefix(self, name: str, token_ids: List[int]) -> None:
+        self.block_manager.pin_prefix(name, token_ids)
+
+    def unpin_prefix(self, name: str) -> None:
+        self.block_manager.unpin_prefix(name)
+
+    def get_cached_blocks(
+            self,
+            max_blocks: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        return self.block_manager.get_cached_blocks(max_blocks)
+
+    def restore_cached_blocks(
+            self, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return self.block_manager.restore_cached_blocks(blocks)
+
     def get_num_unfinished_seq_groups(self) -> int:
         return len(self.waiting) + len(self.running) + len(self.swapped)
 
@@ -834,6 +867,90 @@ class Scheduler:
             ignored_seq_groups=ignored_seq_groups,
             num_lookahead_slots=self._get_num_lookahead_slots(is_prefill=True))
 
+    def _schedule_priority_preemption(
+        self,
+        budget: SchedulingBudget,
+        enable_chunking: bool = False,
+    ) -> int:
+        """Preempt running requests that are behind the head of the waiting
+        queue in the scheduling policy order.
+
+        The head of the waiting queue is compared against the tail of the
+        running queue (its least urgent request). While the waiting request
+        cannot be allocated and the tail is less urgent, the tail is
+        preempted by recomputation and put back into the waiting queue.
+
+        Args:
+            budget: The scheduling budget. The argument is in-place updated
+                when any running requests are preempted.
+            enable_chunking: If True, the waiting request only needs the
+                budget for its first chunk instead of its whole prompt.
+
+        Returns:
+            The number of requests that were preempted.
+        """
+        waiting_queue = self.waiting
+        running_queue = self.running
+        if not waiting_queue or not running_queue:
+            return 0
+
+        now = time.time()
+        seq_group = waiting_queue.popleft()
+        priority = self.policy.get_priority(now, seq_group)
+        num_new_seqs = seq_group.get_max_num_running_seqs()
+        num_new_tokens = self._get_num_new_tokens(seq_group,
+                                                  SequenceStatus.WAITING,
+                                                  enable_chunking, budget)
+
+        # Don't preempt anything for a request that can't be scheduled even
+        # on its own.
+        if (num_new_tokens == 0
+                or num_new_tokens > self._get_prompt_limit(seq_group)
+                or num_new_tokens > budget.token_budget
+                or num_new_seqs > budget.max_num_seqs
+                or self.block_manager.can_allocate(seq_group)
+                == AllocStatus.NEVER
+                or not self._has_lora_slot(seq_group)):
+            waiting_queue.appendleft(seq_group)
+            return 0
+
+        force_preemption_count = 0
+        while running_queue and self.policy.get_priority(
+                now, running_queue[-1]) > priority:
+            can_allocate = self.block_manager.can_allocate(seq_group)
+            if (can_allocate == AllocStatus.OK
+                    and budget.can_schedule(num_new_tokens=num_new_tokens,
+                                            num_new_seqs=num_new_seqs)):
+                break
+            victim_seq_group = running_queue[-1]
+            # Only single-sequence groups can be preempted by recomputation.
+            if victim_seq_group.get_max_num_running_seqs() != 1:
+                break
+            running_queue.pop()
+            budget.subtract_num_seqs(victim_seq_group.request_id, 1)
+            self._preempt(victim_seq_group, [], PreemptionMode.RECOMPUTE)
+            waiting_queue.appendleft(victim_seq_group)
+            force_preemption_count += 1
+
+        # The victims sort after `seq_group`; restore the policy order.
+        waiting_queue.appendleft(seq_group)
+        if force_preemption_count > 0:
+            self.waiting = self.policy.sort_by_priority(now, waiting_queue)
+        return force_preemption_count
+
+    def _has_lora_slot(self, seq_group: SequenceGroup) -> bool:
+        """Whether the LoRA of a waiting request is running or there is a
+        free slot for it next to the LoRAs of the running requests."""
+        lora_int_id = seq_group.lora_int_id
+        if not self.lora_enabled or lora_int_id == 0:
+            return True
+        assert self.lora_config is not None
+        curr_loras = set(running_seq_group.lora_int_id
+                         for running_seq_group in self.running
+                         if running_seq_group.lora_int_id > 0)
+        return (lora_int_id in curr_loras
+                or len(curr_loras) < self.lora_config.max_loras)
+
     def _schedule_default(self) -> SchedulerOutputs:
         """Schedule queued requests.
         
@@ -852,6 +969,11 @@ class Scheduler:
         for seq_group in self.running:
             budget.add_num_seqs(seq_group.request_id,
                                 seq_group.get_max_num_running_seqs())
+
+        force_preempted = 0
+        if self.scheduler_config.policy != "fcfs" and not self.swapped:
+            force_preempted = self._schedule_priority_preemption(budget)
+
         curr_loras = set(
             seq_group.lora_int_id for seq_group in self.running
             if seq_group.lora_int_id > 0) if self.lora_enabled else None
@@ -899,7 +1021,7 @@ class Scheduler:
         # Update swapped requests.
         self.swapped.extend(running_scheduled.swapped_out)
         preempted = (len(running_scheduled.preempted) +
-                     len(running_scheduled.swapped_out))
+                     len(running_scheduled.swapped_out) + force_preempted)
 
         # There should be no prefill from running queue because this policy
         # doesn't allow chunked prefills.
@@ -932,6 +1054,7 @@ class Scheduler:
             num_lookahead_slots=running_scheduled.num_lookahead_slots,
             running_queue_size=len(self.running),
             preempted=preempted,
+            kv_offload_ops=self.block_manager.get_and_reset_kv_offload_ops(),
         )
 
     def _schedule_chunked_prefill(self) -> SchedulerOutputs:
@@ -957,6 +1080,22 @@ class Scheduler:
         prefills = SchedulerPrefillOutputs.create_empty()
         swapped_in = SchedulerSwappedInOutputs.create_empty()
 
+        force_preempted = 0
+        if self.scheduler_config.policy != "fcfs" and not self.swapped:
+            # The running requests are only added to `budget` as they are
+            # scheduled below, so check the waiting request against a
+            # budget that already counts them.
+            preemption_budget = SchedulingBudget(
+                token_budget=self.scheduler_config.max_num_batched_tokens,
+                max_num_seqs=self.scheduler_config.max_num_seqs,
+            )
+            for seq_group in self.running:
+                preemption_budget.add_num_seqs(
+                    seq_group.request_id,
+                    seq_group.get_max_num_running_seqs())
+            force_preempted = self._schedule_priority_preemption(
+                preemption_budget, enable_chunking=True)
+
         # Decoding should be always scheduled first by fcfs.
         running_scheduled = self._schedule_running(budget,
                                                    curr_loras,
@@ -1010,11 +1149,16 @@ class Scheduler:
             num_lookahead_slots=running_scheduled.num_lookahead_slots,
             running_queue_size=len(self.running),
             preempted=(len(running_scheduled.preempted) +
-                       len(running_scheduled.swapped_out)),
+                       len(running_scheduled.swapped_out) + force_preempted),
+            kv_offload_ops=self.block_manager.get_and_reset_kv_offload_ops(),
         )
 
     def _schedule(self) -> SchedulerOutputs:
         """Schedule queued requests."""
+        now = time.time()
+        self.waiting = self.policy.sort_by_priority(now, self.waiting)
+        self.running = self.policy.sort_by_priority(now, self.running)
+        self.swapped = self.policy.sort_by_priority(now, self.swapped)
         if self.scheduler_config.chunked_prefill_enabled:
             return self._schedule_chunked_prefill()
         else:
@@ -1056,6 +1200,7 @@ class Scheduler:
             seq_group = scheduled_seq_group.seq_group
             token_chunk_size = scheduled_seq_group.token_chunk_size
             seq_group.maybe_set_first_scheduled_time(now)
+            self.policy.update(seq_group, token_chunk_size)
 
             # seq_id -> SequenceData
             seq_data: Dict[int, SequenceData] = {}
@@ -1224,16 +1369,17 @@ class Scheduler:
         # over sequence groups with a single sequence.
         # TODO: Support recomputation for sequence groups with multiple
         # sequences. This may require a more sophisticated CUDA kernel.
-        if self.user_specified_preemption_mode is None:
-            if seq_group.get_max_num_running_seqs() == 1:
-                preemption_mode = PreemptionMode.RECOMPUTE
-            else:
-                preemption_mode = PreemptionMode.SWAP
+        if preemption_mode is None:
+            if self.user_specified_preemption_mode is None:
+                if seq_group.get_max_num_running_seqs() == 1:
+                    preemption_mode = PreemptionMode.RECOMPUTE
+                else:
+                    preemption_mode = PreemptionMode.SWAP
 
-        elif self.user_specified_preemption_mode == "swap":
-            preemption_mode = PreemptionMode.SWAP
-        else:
-            preemption_mode = PreemptionMode.RECOMPUTE
+            elif self.user_specified_preemption_mode == "swap":
+                preemption_mode = PreemptionMode.SWAP
+            else:
+                preemption_mode = PreemptionMode.RECOMPUTE
 
         if self.num_cumulative_preemption % 50 == 0:
             logger.warning(
@@ -1,5 +1,6 @@
 """CacheEngine class for managing the KV cache."""
-from typing import List
+import tempfile
+from typing import List, Optional
 
 import torch
 
@@ -8,6 +9,7 @@ from aphrodite.common.config import (CacheConfig, DeviceConfig, ModelConfig,
                                      ParallelConfig)
 from aphrodite.common.utils import (STR_DTYPE_TO_TORCH_DTYPE, get_dtype_size,
                                     is_pin_memory_available)
+from aphrodite.processing.block.kv_offload import KVOffloadOp
 
 
 class CacheEngine:
@@ -63,6 +65,22 @@ class CacheEngine:
         self.gpu_cache = self._allocate_kv_cache(
             self.num_gpu_blocks, self.device_config.device_type)
         self.cpu_cache = self._allocate_kv_cache(self.num_cpu_blocks, "cpu")
+        self.block_dim = get_kv_cache_block_dim(self.attn_backend,
+                                                self.block_size,
+                                                self.num_kv_heads,
+                                                self.head_size)
+
+        self.kv_offload_cache: Optional[KVOffloadCache] = None
+        num_offload_cpu_blocks = (cache_config.num_kv_offload_cpu_blocks //
+                                  parallel_config.pipeline_parallel_size)
+        if num_offload_cpu_blocks > 0:
+            self.kv_offload_cache = KVOffloadCache(
+                self.gpu_cache,
+                block_dim=self.block_dim,
+                num_cpu_blocks=num_offload_cpu_blocks,
+                num_disk_blocks=(cache_config.num_kv_offload_disk_blocks //
+                                 parallel_config.pipeline_parallel_size),
+                disk_path=cache_config.kv_offload_disk_path)
 
     def _allocate_kv_cache(
         self,
@@ -98,6 +116,32 @@ class CacheEngine:
     def copy(self, src_to_dsts: torch.Tensor) -> None:
         self.attn_backend.copy_blocks(self.gpu_cache, src_to_dsts)
 
+    def kv_offload(self, ops: torch.Tensor) -> None:
+        assert self.kv_offload_cache is not None
+        self.kv_offload_cache.execute(ops)
+
+    def get_blocks(self, block_ids: List[int]) -> List[torch.Tensor]:
+        """Returns a CPU copy of the given GPU blocks of each layer."""
+        index = torch.tensor(block_ids,
+                             dtype=torch.int64,
+                             device=self.gpu_cache[0].device)
+        return [
+            layer.index_select(self.block_dim, index).cpu()
+            for layer in self.gpu_cache
+        ]
+
+    def set_blocks(self, blocks: List[torch.Tensor],
+                   block_ids: List[int]) -> None:
+        """Overwrites the given GPU blocks of each layer, the inverse of
+        get_blocks()."""
+        index = torch.tensor(block_ids,
+                             dtype=torch.int64,
+                             device=self.gpu_cache[0].device)
+        for layer, layer_blocks in zip(self.gpu_cache, blocks):
+            layer.index_copy_(self.block_dim,
+                              index,
+                              layer_blocks.to(layer.device))
+
     @staticmethod
     def get_cache_block_size(
         cache_config: CacheConfig,
@@ -119,3 +163,117 @@ class CacheEngine:
             dtype = STR_DTYPE_TO_TORCH_DTYPE[cache_config.cache_dtype]
         dtype_size = get_dtype_size(dtype)
         return dtype_size * total
+
+
+def get_kv_cache_block_dim(attn_backend, block_size: int, num_kv_heads: int,
+                           head_size: int) -> int:
+    """Returns the dimension of the attention backend's KV cache layout that
+    indexes the blocks."""
+    shape = attn_backend.get_kv_cache_shape(1, block_size, num_kv_heads,
+                                            head_size)
+    shape_2 = attn_backend.get_kv_cache_shape(2, block_size, num_kv_heads,
+                                              head_size)
+    for dim, (size, size_2) in enumerate(zip(shape, shape_2)):
+        if size != size_2:
+            return dim
+    raise ValueError("Could not find the block dimension of the KV cache")
+
+
+class KVOffloadCache:
+    """Holds the offload tiers of the prefix cache on a worker.
+
+    The CPU tier is a pinned CPU copy of the device KV cache layout, and the
+    disk tier a memory-mapped file with the same layout. The scheduler
+    decides which blocks move where (see `KVOffloadTier`); this class only
+    executes the copies.
+
+    Args:
+        device_cache: The per-layer device KV cache.
+        block_dim: The dimension of the KV cache tensors that indexes blocks.
+        num_cpu_blocks: The number of blocks in the CPU tier.
+        num_disk_blocks: The number of blocks in the disk tier.
+        disk_path: The directory of the file backing the disk tier. The file
+            is deleted when the cache is garbage collected.
+    """
+
+    def __init__(
+        self,
+        device_cache: List[torch.Tensor],
+        block_dim: int,
+        num_cpu_blocks: int,
+        num_disk_blocks: int = 0,
+        disk_path: Optional[str] = None,
+    ) -> None:
+        self.device_cache = device_cache
+        self.block_dim = block_dim
+
+        layer_shape = list(device_cache[0].shape)
+        dtype = device_cache[0].dtype
+
+        layer_shape[block_dim] = num_cpu_blocks
+        # Pinned memory only speeds up copies from and to an accelerator.
+        pin_memory = (device_cache[0].device.type != "cpu"
+                      and is_pin_memory_available())
+        self.cpu_cache = [
+            torch.zeros(layer_shape,
+                        dtype=dtype,
+                        pin_memory=pin_memory,
+                        device="cpu") for _ in device_cache
+        ]
+
+        self.disk_cache: List[torch.Tensor] = []
+        self._disk_file = None
+        if num_disk_blocks > 0:
+            assert disk_path is not None
+            layer_shape[block_dim] = num_disk_blocks
+            self._disk_file = tempfile.NamedTemporaryFile(
+                dir=disk_path, prefix="aphrodite-kv-offload-")
+            layer_numel = 1
+            for size in layer_shape:
+                layer_numel *= size
+            disk_cache = torch.from_file(self._disk_file.name,
+                                         shared=True,
+                                         size=layer_numel * len(device_cache),
+                                         dtype=dtype)
+            self.disk_cache = list(
+                disk_cache.view(len(device_cache), *layer_shape).unbind(0))
+
+    def execute(self, ops: torch.Tensor) -> None:
+        """Executes (op, src_block, dst_block) rows in order.
+
+        Consecutive ops of the same kind are batched into one copy per
+        layer, unless a destination block repeats within the batch.
+        """
+        ops_list = ops.tolist()
+        start = 0
+        while start < len(ops_list):
+            op = ops_list[start][0]
+            end = start
+            dst_blocks = set()
+            while (end < len(ops_list) and ops_list[end][0] == op
+                   and ops_list[end][2] not in dst_blocks):
+                dst_blocks.add(ops_list[end][2])
+                end += 1
+            self._copy(KVOffloadOp(op), ops[start:end, 1], ops[start:end, 2])
+            start = end
+
+    def _copy(self, op: KVOffloadOp, src_blocks: torch.Tensor,
+              dst_blocks: torch.Tensor) -> None:
+        if op == KVOffloadOp.DEVICE_TO_CPU:
+            src_cache, dst_cache = self.device_cache, self.cpu_cache
+        elif op == KVOffloadOp.CPU_TO_DISK:
+            src_cache, dst_cache = self.cpu_cache, self.disk_cache
+        elif op == KVOffloadOp.DISK_TO_CPU:
+            src_cache, dst_cache = self.disk_cache, self.cpu_cache
+        else:
+            src_cache, dst_cache = self.cpu_cache, self.device_cache
+
+        src_index = src_blocks.to(src_cache[0].device)
+        dst_index = dst_blocks.to(dst_cache[0].device)
+        for src, dst in zip(src_cache, dst_cache):
+            dst.index_copy_(
+                self.block_dim,
+                dst_index,
+                src.index_select(self.block_dim,
+                                 src_index).to(dst.device),
+            )
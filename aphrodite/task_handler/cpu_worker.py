@@ -14,6 +14,8 @@ from aphrodite.common.utils import STR_DTYPE_TO_TORCH_DTYPE
 from aphrodite.distributed import (ensure_model_parallel_initialized,
                                    init_distributed_environment)
 from aphrodite.modeling import set_random_seed
+from aphrodite.task_handler.cache_engine import (CacheEngine, KVOffloadCache,
+                                                 get_kv_cache_block_dim)
 from aphrodite.task_handler.cpu_model_runner import CPUModelRunner
 from aphrodite.task_handler.worker_base import (LocalOrDistributedWorkerBase,
                                                 LoraNotSupportedWorkerBase,
@@ -66,6 +68,21 @@ class CPUCacheEngine:
         # Initialize the cache.
         self.cpu_cache = self._allocate_kv_cache(self.num_cpu_blocks)
 
+        self.kv_offload_cache: Optional[KVOffloadCache] = None
+        num_offload_cpu_blocks = (cache_config.num_kv_offload_cpu_blocks //
+                                  parallel_config.pipeline_parallel_size)
+        if num_offload_cpu_blocks > 0:
+            self.kv_offload_cache = KVOffloadCache(
+                self.cpu_cache,
+                block_dim=get_kv_cache_block_dim(self.attn_backend,
+                                                 self.block_size,
+                                                 self.num_heads,
+                                                 self.head_size),
+                num_cpu_blocks=num_offload_cpu_blocks,
+                num_disk_blocks=(cache_config.num_kv_offload_disk_blocks //
+                                 parallel_config.pipeline_parallel_size),
+                disk_path=cache_config.kv_offload_disk_path)
+
     def _allocate_kv_cache(
         self,
         num_blocks: int,
@@ -88,6 +105,10 @@ class CPUCacheEngine:
     def copy(self, src_to_dsts: Dict[int, List[int]]) -> None:
         self.attn_backend.copy_blocks(self.cpu_cache, src_to_dsts)
 
+    def kv_offload(self, ops: torch.Tensor) -> None:
+        assert self.kv_offload_cache is not None
+        self.kv_offload_cache.execute(ops)
+
     @staticmethod
     def get_cache_block_size(
         block_size: int,
@@ -230,6 +251,10 @@ class CPUWorker(LoraNotSupportedWorkerBase, LocalOrDistributedWorkerBase):
         self._validate_num_cpu_blocks(num_cpu_blocks)
         self.cache_config.num_gpu_blocks = num_cpu_blocks
         self.cache_config.num_cpu_blocks = 0
+        self.cache_config.init_kv_offload_blocks(
+            CacheEngine.get_cache_block_size(self.cache_config,
+                                             self.model_config,
+                                             self.parallel_config))
 
         # Initialize the cache.
         self._init_cache_engine()
@@ -285,6 +310,10 @@ class CPUWorker(LoraNotSupportedWorkerBase, LocalOrDistributedWorkerBase):
         self,
         worker_input: WorkerInput,
     ) -> None:
+        if (worker_input.kv_offload_ops is not None
+                and worker_input.kv_offload_ops.numel() > 0):
+            self.cache_engine[worker_input.virtual_engine].kv_offload(
+                worker_input.kv_offload_ops)
         if (worker_input.blocks_to_copy is not None
                 and worker_input.blocks_to_copy.numel() > 0):
             self.cache_engine[worker_input.virtual_engine].copy(
@@ -300,11 +329,15 @@ class CPUWorker(LoraNotSupportedWorkerBase, LocalOrDistributedWorkerBase):
         blocks_to_copy = torch.tensor(execute_model_req.blocks_to_copy,
                                       device="cpu",
                                       dtype=torch.int64).view(-1, 2)
+        kv_offload_ops = torch.tensor(execute_model_req.kv_offload_ops,
+                                      device="cpu",
+                                      dtype=torch.int64).view(-1, 3)
         assert len(execute_model_req.blocks_to_swap_in) == 0
         assert len(execute_model_req.blocks_to_swap_out) == 0
         return WorkerInput(
             num_seq_groups=num_seq_groups,
             blocks_to_copy=blocks_to_copy,
+            kv_offload_ops=kv_offload_ops,
             virtual_engine=virtual_engine,
         )
 
@@ -35,7 +35,8 @@ from aphrodite.inputs import INPUT_REGISTRY, InputRegistry
 from aphrodite.lora.layers import LoRAMapping
 from aphrodite.lora.request import LoRARequest
 from aphrodite.lora.worker_manager import LRUCacheWorkerLoRAManager
-from aphrodite.modeling import SamplingMetadata, SamplingMetadataCache
+from aphrodite.modeling import (SamplingMetadata, SamplingMetadataCache,
+                                TokenCountCache)
 from aphrodite.modeling.model_loader import get_model
 from aphrodite.modeling.model_loader.tensorizer import TensorizerConfig
 from aphrodite.modeling.models.interfaces import (supports_lora,
@@ -892,6 +893,8 @@ class GPUModelRunnerBase(ModelRunnerBase[TModelInputForGPU]):
         self.inter_data_cache: Dict[int, PyObjectCache] = {}
         self.sampling_metadata_cache: SamplingMetadataCache = \
             SamplingMetadataCache()
+        self.token_count_cache = TokenCountCache(
+            self.scheduler_config.max_num_seqs, self.pin_memory)
 
     def load_model(self) -> None:
         tp = get_tensor_model_parallel_world_size()
@@ -1381,10 +1384,14 @@ class ModelRunner(GPUModelRunnerBase[ModelInputForGPUWithSamplingMetadata]):
         if get_pp_group().is_last_rank:
             # Sampling metadata is only required for the final pp group
             generators = self.get_generators(finished_requests_ids)
+            self.token_count_cache.release_finished_requests(
+                finished_requests_ids)
+            self.token_count_cache.add_requests(seq_group_metadata_list)
             sampling_metadata = SamplingMetadata.prepare(
                 seq_group_metadata_list, model_input.seq_lens,
                 model_input.query_lens, self.device, self.pin_memory,
-                generators, self.sampling_metadata_cache)
+                generators, self.sampling_metadata_cache,
+                self.token_count_cache)
         else:
             sampling_metadata = None
         is_prompt = (seq_group_metadata_list[0].is_prompt
@@ -387,6 +387,18 @@ class MultiStepModelRunner(GPUModelRunnerBase[StatefulModelInput]):
         if frozen_model_input.seq_lens is not None:
             for i in range(num_queries):
                 frozen_model_input.seq_lens[i] = attn_metadata.seq_lens[i]
+        sampling_metadata = frozen_model_input.sampling_metadata
+        # Every decode step samples the same sequences with the same
+        # parameters, and the penalties count the sampled tokens on device.
+        # With pipeline parallelism, the steps of the virtual engines
+        # interleave on the same sampler, which can't keep their tensors.
+        if (sampling_metadata is not None
+                and self.parallel_config.pipeline_parallel_size == 1):
+            sampling_metadata.reuse_sampling_tensors = True
+            if sampling_metadata.token_count_cache is not None:
+                sampling_metadata.token_count_cache.add_sampled_tokens(
+                    sampling_metadata,
+                    model_input.cached_outputs[-1].sampled_token_ids)
         return model_input
 
     def load_model(self) -> None:
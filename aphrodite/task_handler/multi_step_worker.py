@@ -1,3 +1,4 @@
+import dataclasses
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
 
@@ -63,7 +64,10 @@ class MultiStepWorker(Worker):
         else:
             # on subsequent steps we reuse the worker input and model input
             multi_step_state = self.multi_step_states[virtual_engine]
-            worker_input = multi_step_state.worker_input
+            # The KV offload ops move blocks between tiers and must only run
+            # once per scheduling step.
+            worker_input = dataclasses.replace(multi_step_state.worker_input,
+                                               kv_offload_ops=None)
             model_input = multi_step_state.model_input
             frozen_model_input = model_input.frozen_model_input
             assert frozen_model_input is not None
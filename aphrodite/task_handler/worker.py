@@ -7,6 +7,7 @@ from typing import Dict, List, Optional, Set, Tuple, Type, Union
 import torch
 import torch.distributed
 from loguru import logger
+from safetensors.torch import safe_open, save_file
 
 from aphrodite.common.config import (CacheConfig, DeviceConfig, LoadConfig,
                                      LoRAConfig, ModelConfig, ParallelConfig,
@@ -24,6 +25,7 @@ from aphrodite.lora.request import LoRARequest
 from aphrodite.modeling import set_random_seed
 from aphrodite.modeling.model_loader.tensorizer import TensorizerConfig
 from aphrodite.platforms import current_platform
+from aphrodite.processing.prefix_cache_snapshot import get_kv_cache_file
 from aphrodite.prompt_adapter.request import PromptAdapterRequest
 from aphrodite.task_handler.cache_engine import CacheEngine
 from aphrodite.task_handler.embedding_model_runner import EmbeddingModelRunner
@@ -174,6 +176,52 @@ class Worker(LocalOrDistributedWorkerBase):
         self.model_runner.save_tensorized_model(
             tensorizer_config=tensorizer_config, )
 
+    def save_prefix_cache_snapshot(self, path: str,
+                                   block_ids: List[List[int]]) -> None:
+        """Saves the KV cache of the given blocks of each virtual engine to
+        this rank's file of the prefix cache snapshot in `path`."""
+        tensors: Dict[str, torch.Tensor] = {}
+        for virtual_engine, ve_block_ids in enumerate(block_ids):
+            if not ve_block_ids:
+                continue
+            blocks = self.cache_engine[virtual_engine].get_blocks(ve_block_ids)
+            for layer, layer_blocks in enumerate(blocks):
+                tensors[f"{virtual_engine}.{layer}"] = layer_blocks
+        save_file(tensors, get_kv_cache_file(path, self.rank))
+
+    def load_prefix_cache_snapshot(self, path: str,
+                                   src_indices: List[List[int]],
+                                   block_ids: List[List[int]]) -> None:
+        """Loads the saved blocks at `src_indices` of each virtual engine
+        from this rank's file of the prefix cache snapshot in `path` into
+        the blocks `block_ids`."""
+        with safe_open(get_kv_cache_file(path, self.rank),
+                       framework="pt") as f:
+            for virtual_engine, (ve_src_indices, ve_block_ids) in enumerate(
+                    zip(src_indices, block_ids)):
+                if not ve_block_ids:
+                    continue
+                cache_engine = self.cache_engine[virtual_engine]
+                index = torch.tensor(ve_src_indices, dtype=torch.int64)
+                blocks = []
+                for layer, layer_cache in enumerate(cache_engine.gpu_cache):
+                    saved = f.get_tensor(f"{virtual_engine}.{layer}")
+                    block_shape = list(layer_cache.shape)
+                    del block_shape[cache_engine.block_dim]
+                    saved_block_shape = list(saved.shape)
+                    del saved_block_shape[cache_engine.block_dim]
+                    if (saved.dtype != layer_cache.dtype
+                            or saved_block_shape != block_shape):
+                        raise ValueError(
+                            "The prefix cache snapshot does not match the "
+                            f"KV cache layout: got {saved.dtype} blocks of "
+                            f"shape {saved_block_shape}, expected "
+                            f"{layer_cache.dtype} blocks of shape "
+                            f"{block_shape}.")
+                    blocks.append(
+                        saved.index_select(cache_engine.block_dim, index))
+                cache_engine.set_blocks(blocks, ve_block_ids)
+
     @torch.inference_mode()
     def determine_num_available_blocks(self) -> Tuple[int, int]:
         """Profiles the peak memory usage of the model to determine how many
@@ -242,6 +290,10 @@ class Worker(LocalOrDistributedWorkerBase):
 
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
+        self.cache_config.init_kv_offload_blocks(
+            CacheEngine.get_cache_block_size(self.cache_config,
+                                             self.model_config,
+                                             self.parallel_config))
 
         self._init_cache_engine()
         self._warm_up_model()
@@ -293,26 +345,37 @@ class Worker(LocalOrDistributedWorkerBase):
         blocks_to_copy = torch.tensor(execute_model_req.blocks_to_copy,
                                       device=self.device,
                                       dtype=torch.int64).view(-1, 2)
+        # `kv_offload_ops` is a cpu tensor, the ops are executed in order.
+        kv_offload_ops = torch.tensor(execute_model_req.kv_offload_ops,
+                                      device="cpu",
+                                      dtype=torch.int64).view(-1, 3)
 
         return WorkerInput(num_seq_groups=num_seq_groups,
                            blocks_to_swap_in=blocks_to_swap_in,
                            blocks_to_swap_out=blocks_to_swap_out,
                            blocks_to_copy=blocks_to_copy,
+                           kv_offload_ops=kv_offload_ops,
                            virtual_engine=virtual_engine,
                            num_steps=num_steps)
 
     @torch.inference_mode()
     def execute_worker(self, worker_input: WorkerInput) -> None:
         virtual_engine = worker_input.virtual_engine
-        # Issue cache operations.
-        if (worker_input.blocks_to_swap_in is not None
-                and worker_input.blocks_to_swap_in.numel() > 0):
-            self.cache_engine[virtual_engine].swap_in(
-                worker_input.blocks_to_swap_in)
+        # Issue cache operations. Blocks demoted to the offload tiers may be
+        # swapped-out blocks or blocks reused for swap in within the same
+        # step, so the offload ops run between swap out and swap in.
         if (worker_input.blocks_to_swap_out is not None
                 and worker_input.blocks_to_swap_out.numel() > 0):
             self.cache_engine[virtual_engine].swap_out(
                 worker_input.blocks_to_swap_out)
+        if (worker_input.kv_offload_ops is not None
+                and worker_input.kv_offload_ops.numel() > 0):
+            self.cache_engine[virtual_engine].kv_offload(
+                worker_input.kv_offload_ops)
+        if (worker_input.blocks_to_swap_in is not None
+                and worker_input.blocks_to_swap_in.numel() > 0):
+            self.cache_engine[virtual_engine].swap_in(
+                worker_input.blocks_to_swap_in)
         if (worker_input.blocks_to_copy is not None
                 and worker_input.blocks_to_copy.numel() > 0):
             self.cache_engine[virtual_engine].copy(worker_input.blocks_to_copy)
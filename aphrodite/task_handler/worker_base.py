@@ -127,6 +127,7 @@ class WorkerInput:
     blocks_to_swap_in: Optional[torch.Tensor] = None
     blocks_to_swap_out: Optional[torch.Tensor] = None
     blocks_to_copy: Optional[torch.Tensor] = None
+    kv_offload_ops: Optional[torch.Tensor] = None
     virtual_engine: int = 0
     num_steps: int = 1
 
@@ -144,6 +145,7 @@ class WorkerInput:
             blocks_to_swap_in=tensor_dict.pop("blocks_to_swap_in"),
             blocks_to_swap_out=tensor_dict.pop("blocks_to_swap_out"),
             blocks_to_copy=tensor_dict.pop("blocks_to_copy"),
+            kv_offload_ops=tensor_dict.pop("kv_offload_ops"),
             virtual_engine=tensor_dict["virtual_engine"],
             num_steps=tensor_dict.pop("num_steps"),
         )
@@ -158,6 +160,7 @@ class WorkerInput:
             "blocks_to_swap_in": self.blocks_to_swap_in,
             "blocks_to_swap_out": self.blocks_to_swap_out,
             "blocks_to_copy": self.blocks_to_copy,
+            "kv_offload_ops": self.kv_offload_ops,
             "virtual_engine": self.virtual_engine,
             "num_steps": self.num_steps,
         }
@@ -1,9 +1,9 @@
-from typing import Dict, List, Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
 
-from aphrodite.common.sequence import (Logprob, SamplingParams, Sequence,
-                                       SequenceGroup)
+from aphrodite.common.sequence import (FlatLogprobs, PromptLogprobs,
+                                       SamplingParams, Sequence, SequenceGroup)
 from aphrodite.transformers_utils.tokenizer_group.base_tokenizer_group import (
     BaseTokenizerGroup)
 
@@ -23,8 +23,7 @@ class Detokenizer:
         return self.tokenizer_group.get_lora_tokenizer(sequence.lora_request)
 
     def decode_prompt_logprobs_inplace(self, seq_group: SequenceGroup,
-                                       prompt_logprobs: List[Optional[Dict[
-                                           int, Logprob]]],
+                                       prompt_logprobs: PromptLogprobs,
                                        position_offset: int) -> None:
         """Decodes the logprobs for the prompt of a sequence group.
 
@@ -51,18 +50,39 @@ class Detokenizer:
         next_iter_tokens = []
         prev_tokens = None
 
-        for token_position_in_logprob, prompt_logprobs_for_token in enumerate(
-                prompt_logprobs):
+        for token_position_in_logprob in range(len(prompt_logprobs)):
 
             # Absolute token position equals the index in the logprobs
             # list plus the offset of the entire logprobs list relative
             # to the start of the sequence.
             token_position = token_position_in_logprob + position_offset
-            if not prompt_logprobs_for_token:
-                continue
-            for token_id, sample_logprob in prompt_logprobs_for_token.items():
-                if (sample_logprob.decoded_token is None
+            if isinstance(prompt_logprobs, FlatLogprobs):
+                # Decode the entries without creating the Logprob objects.
+                entries = prompt_logprobs.get_entries(
+                    token_position_in_logprob)
+                if entries.start == entries.stop:
+                    continue
+                token_ids = prompt_logprobs.token_ids[entries]
+                decoded_tokens = prompt_logprobs.decoded_tokens[entries]
+            else:
+                prompt_logprobs_for_token = prompt_logprobs[
+                    token_position_in_logprob]
+                if not prompt_logprobs_for_token:
+                    continue
+                token_ids = list(prompt_logprobs_for_token)
+                decoded_tokens = [
+                    logprob.decoded_token
+                    for logprob in prompt_logprobs_for_token.values()
+                ]
+            # A token can have several entries in FlatLogprobs, which are
+            # only decoded once.
+            new_texts = {}
+            for i, token_id in enumerate(token_ids):
+                if (decoded_tokens[i] is None
                         and token_id != INVALID_TOKEN_ID):
+                    if token_id in new_texts:
+                        decoded_tokens[i] = new_texts[token_id]
+                        continue
                     prompt_token_ids_with_token = (
                         prompt_token_ids[:token_position] + [token_id])
                     (new_tokens, new_text, new_prefix_offset,
@@ -77,7 +97,7 @@ class Detokenizer:
                          spaces_between_special_tokens,
                      )
 
-                    sample_logprob.decoded_token = new_text
+                    decoded_tokens[i] = new_texts[token_id] = new_text
 
                     # Use the offsets & prev tokens corresponding to
                     # real tokens to ensure detokenization is consistent
@@ -87,6 +107,13 @@ class Detokenizer:
                         next_iter_read_offset = new_read_offset
                         next_iter_tokens = new_tokens
 
+            if isinstance(prompt_logprobs, FlatLogprobs):
+                prompt_logprobs.decoded_tokens[entries] = decoded_tokens
+            else:
+                for logprob, decoded_token in zip(
+                        prompt_logprobs_for_token.values(), decoded_tokens):
+                    logprob.decoded_token = decoded_token
+
             # Advance to the next token position.
             prefix_offset = next_iter_prefix_offset
             read_offset = next_iter_read_offset
@@ -106,9 +133,33 @@ class Detokenizer:
         Returns:
             The number of characters added to the output text.
         """
+        new_decoded_token_text = self.decode_new_token(seq, prms)
+        seq.output_text += new_decoded_token_text
+        return len(new_decoded_token_text)
+
+    def decode_new_token(
+            self,
+            seq: Sequence,
+            prms: SamplingParams,
+            tokenizer: Optional[PreTrainedTokenizer] = None) -> str:
+        """Decodes the new token for a sequence and its logprobs, and returns
+        its text. Only updates the detokenization state of the sequence, not
+        its output text, so it can run in another thread while the outputs
+        of the sequence are built.
+
+        Args:
+            seq: The sequence to decode.
+            prms: The sampling parameters used to generate the sequence.
+            tokenizer: The tokenizer to use instead of the one of the
+                sequence, e.g. a copy owned by the calling thread.
+
+        Returns:
+            The text of the new token.
+        """
         all_input_ids = seq.get_token_ids()
         token_id_generated_this_iteration = all_input_ids[-1]
-        tokenizer = self.get_tokenizer_for_seq(seq)
+        if tokenizer is None:
+            tokenizer = self.get_tokenizer_for_seq(seq)
 
         # Convert prompt token IDs to tokens if necessary.
         # Do it here so that we don't have to repeat this
@@ -132,38 +183,41 @@ class Detokenizer:
              spaces_between_special_tokens=prms.spaces_between_special_tokens,
          )
 
-        # Decode logprobs
-        logprobs = seq.output_logprobs[-1]
-        if logprobs:
-            previous_tokens = all_input_ids[:-1]
-            for token_id, sample_logprob in logprobs.items():
-                # If the token was generated this iteration,
-                # use the provided text.
-                if token_id == token_id_generated_this_iteration:
-                    sample_logprob.decoded_token = new_decoded_token_text
-                    continue
-
-                if (sample_logprob.decoded_token is None
-                        and token_id != INVALID_TOKEN_ID):
-                    all_input_ids_with_logprob = previous_tokens + [token_id]
-                    (_, new_text, _, _) = detokenize_incrementally(
-                        tokenizer=tokenizer,
-                        all_input_ids=all_input_ids_with_logprob,
-                        prev_tokens=seq.tokens,
-                        prefix_offset=seq.prefix_offset,
-                        read_offset=seq.read_offset,
-                        skip_special_tokens=prms.skip_special_tokens,
-                        spaces_between_special_tokens=prms.
-                        spaces_between_special_tokens,
-                    )
-                    sample_logprob.decoded_token = new_text
+        # Decode logprobs, in the entries of the last position of the
+        # sequence's FlatLogprobs. The other candidates are decoded together,
+        # from the tokens before the new one.
+        logprobs = seq.output_logprobs
+        entries = logprobs.get_entries(len(logprobs) - 1)
+        decoded_tokens = logprobs.decoded_tokens
+        candidates: List[int] = []
+        for i in range(entries.start, entries.stop):
+            token_id = logprobs.token_ids[i]
+            # If the token was generated this iteration,
+            # use the provided text.
+            if token_id == token_id_generated_this_iteration:
+                decoded_tokens[i] = new_decoded_token_text
+            elif (decoded_tokens[i] is None
+                  and token_id != INVALID_TOKEN_ID):
+                candidates.append(i)
+        if candidates:
+            candidate_texts = detokenize_candidates_incrementally(
+                tokenizer=tokenizer,
+                candidate_ids=[logprobs.token_ids[i] for i in candidates],
+                prev_tokens=seq.tokens,
+                prefix_offset=seq.prefix_offset,
+                read_offset=seq.read_offset,
+                skip_special_tokens=prms.skip_special_tokens,
+                spaces_between_special_tokens=prms.
+                spaces_between_special_tokens,
+            )
+            for i, new_text in zip(candidates, candidate_texts):
+                decoded_tokens[i] = new_text
 
         seq.tokens.extend(new_tokens)
         seq.prefix_offset = prefix_offset
         seq.read_offset = read_offset
-        seq.output_text += new_decoded_token_text
 
-        return len(new_decoded_token_text)
+        return new_decoded_token_text
 
 
 def _replace_none_with_empty(tokens: List[Optional[str]]):
@@ -291,33 +345,29 @@ def detokenize_incrementally(
             [new_token_id], skip_special_tokens=skip_special_tokens)
         if isinstance(new_tokens, str):
             new_tokens = [new_tokens]
-    output_tokens = prev_tokens + new_tokens
+    # Only the tokens from prefix_offset are decoded, so that the cost
+    # doesn't depend on the length of the sequence.
+    window = prev_tokens[prefix_offset:] + new_tokens
 
     # If this is the first iteration, return all tokens.
     if is_first_iter:
-        new_tokens = output_tokens
+        new_tokens = prev_tokens + new_tokens
 
     # The prefix text is necessary only to defeat cleanup algorithms in
     # the decode which decide to add a space or not depending on the
     # surrounding ids.
-    if tokenizer.is_fast or not tokenizer.get_added_vocab():
-        prefix_text = tokenizer.convert_tokens_to_string(
-            output_tokens[prefix_offset:read_offset])
-        new_text = tokenizer.convert_tokens_to_string(
-            output_tokens[prefix_offset:])
-    else:
-        prefix_text = _convert_tokens_to_string_with_added_encoders(
-            tokenizer,
-            output_tokens[prefix_offset:read_offset],
-            skip_special_tokens=skip_special_tokens,
-            spaces_between_special_tokens=spaces_between_special_tokens,
-        )
-        new_text = _convert_tokens_to_string_with_added_encoders(
-            tokenizer,
-            output_tokens[prefix_offset:],
-            skip_special_tokens=skip_special_tokens,
-            spaces_between_special_tokens=spaces_between_special_tokens,
-        )
+    prefix_text = _convert_tokens_to_text(
+        tokenizer,
+        window[:read_offset - prefix_offset],
+        skip_special_tokens=skip_special_tokens,
+        spaces_between_special_tokens=spaces_between_special_tokens,
+    )
+    new_text = _convert_tokens_to_text(
+        tokenizer,
+        window,
+        skip_special_tokens=skip_special_tokens,
+        spaces_between_special_tokens=spaces_between_special_tokens,
+    )
 
     if len(new_text) <= len(prefix_text) or new_text.endswith("�"):
         # utf-8 char at the end means it's a potential unfinished byte sequence
@@ -327,4 +377,83 @@ def detokenize_incrementally(
         return new_tokens, "", prefix_offset, read_offset
 
     new_text = new_text[len(prefix_text):]
-    return new_tokens, new_text, read_offset, len(output_tokens)
+    return new_tokens, new_text, read_offset, prefix_offset + len(window)
+
+
+def detokenize_candidates_incrementally(
+    tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast],
+    candidate_ids: List[int],
+    prev_tokens: List[str],
+    prefix_offset: int,
+    read_offset: int,
+    skip_special_tokens: bool = False,
+    spaces_between_special_tokens: bool = True,
+) -> List[str]:
+    """Detokenizes each of the candidate ids as the next token after
+    `prev_tokens`, e.g. the top logprobs of a step, and returns their texts.
+
+    Gives the same texts as calling `detokenize_incrementally` with each
+    candidate as the new token, but the candidates are converted to tokens
+    in one call and the prefix text is decoded once for all of them.
+
+    Args:
+        tokenizer: The tokenizer to use.
+        candidate_ids: The candidate token ids.
+        prev_tokens: The previous tokens.
+        prefix_offset: The prefix offset.
+        read_offset: The read offset.
+        skip_special_tokens: Whether to skip special tokens.
+        spaces_between_special_tokens: Whether to add spaces between special
+            tokens.
+    """
+    window = prev_tokens[prefix_offset:]
+    prefix_text = _convert_tokens_to_text(
+        tokenizer,
+        window[:read_offset - prefix_offset],
+        skip_special_tokens=skip_special_tokens,
+        spaces_between_special_tokens=spaces_between_special_tokens,
+    )
+    vocab_size = len(tokenizer)
+    # Special tokens are skipped here rather than by convert_ids_to_tokens,
+    # which would drop them from the list.
+    special_ids = set(
+        tokenizer.all_special_ids) if skip_special_tokens else set()
+    tokens = iter(
+        tokenizer.convert_ids_to_tokens(
+            [token_id for token_id in candidate_ids if token_id < vocab_size]))
+
+    texts = []
+    for token_id in candidate_ids:
+        # If the token id is out of bounds, decode an empty string.
+        if token_id >= vocab_size:
+            new_tokens = [""]
+        else:
+            token = next(tokens)
+            new_tokens = [] if token_id in special_ids else [token]
+        new_text = _convert_tokens_to_text(
+            tokenizer,
+            window + new_tokens,
+            skip_special_tokens=skip_special_tokens,
+            spaces_between_special_tokens=spaces_between_special_tokens,
+        )
+        if len(new_text) <= len(prefix_text) or new_text.endswith("�"):
+            texts.append("")
+        else:
+            texts.append(new_text[len(prefix_text):])
+    return texts
+
+
+def _convert_tokens_to_text(
+    tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast],
+    tokens: List[str],
+    skip_special_tokens: bool,
+    spaces_between_special_tokens: bool,
+) -> str:
+    if tokenizer.is_fast or not tokenizer.get_added_vocab():
+        return tokenizer.convert_tokens_to_string(tokens)
+    return _convert_tokens_to_string_with_added_encoders(
+        tokenizer,
+        tokens,
+        skip_special_tokens=skip_special_tokens,
+        spaces_between_special_tokens=spaces_between_special_tokens,
+    )
@@ -5,6 +5,7 @@ from aphrodite.common.config import (ModelConfig, ParallelConfig,
 from aphrodite.executor.ray_utils import ray
 
 from .base_tokenizer_group import AnyTokenizer, BaseTokenizerGroup
+from .mp_tokenizer_group import MultiprocessingTokenizerGroupPool
 from .tokenizer_group import TokenizerGroup
 
 if ray:
@@ -44,6 +45,8 @@ def get_tokenizer_group(tokenizer_pool_config: Optional[TokenizerPoolConfig],
                 "RayTokenizerGroupPool is not available. Please install "
                 "the ray package to use the Ray tokenizer group pool.")
         tokenizer_cls = RayTokenizerGroupPool
+    elif tokenizer_pool_config.pool_type == "mp":
+        tokenizer_cls = MultiprocessingTokenizerGroupPool
     else:
         raise ValueError(
             f"Unknown pool type: {tokenizer_pool_config.pool_type}")
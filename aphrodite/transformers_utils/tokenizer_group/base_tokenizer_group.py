@@ -63,6 +63,11 @@ class BaseTokenizerGroup(ABC):
         """Get a tokenizer for a LoRA request."""
         pass
 
+    def pop_tokenization_times(self) -> List[float]:
+        """Get the latencies in seconds of the prompts encoded since the last
+        call, if the tokenizer group records them."""
+        return []
+
     def check_health(self):
         """Raise exception if the tokenizer group is unhealthy."""
         return
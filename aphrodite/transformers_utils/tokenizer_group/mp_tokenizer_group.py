@@ -0,0 +1,299 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Deque, List, NamedTuple, Optional, Type, Union
+
+from loguru import logger
+from transformers import PreTrainedTokenizer
+
+from aphrodite.common.config import TokenizerPoolConfig
+from aphrodite.constants import APHRODITE_TOKEN_ID_ARRAY_TYPE
+from aphrodite.lora.request import LoRARequest
+from aphrodite.transformers_utils.tokenizer_group.base_tokenizer_group import (
+    BaseTokenizerGroup)
+from aphrodite.transformers_utils.tokenizer_group.tokenizer_group import (
+    TokenizerGroup)
+
+# Prompts with at least this many tokens are returned through shared
+# memory instead of being pickled.
+DEFAULT_SHM_MIN_TOKENS = 1024
+
+# The most tokenization times kept until they are popped, which only happens
+# when stats are logged.
+_MAX_TOKENIZATION_TIMES = 10000
+
+# The TokenizerGroup of the worker process.
+_worker_tokenizer_group: Optional[TokenizerGroup] = None
+
+
+class _SharedTokenIds(NamedTuple):
+    """Token ids returned by a worker in a shared memory block."""
+    name: str
+    num_tokens: int
+
+
+def _init_worker(worker_cls: Type[TokenizerGroup],
+                 tokenizer_config: dict) -> None:
+    global _worker_tokenizer_group
+    _worker_tokenizer_group = worker_cls(**tokenizer_config)
+
+
+def _ping_worker() -> bool:
+    assert _worker_tokenizer_group is not None
+    return _worker_tokenizer_group.ping()
+
+
+def _encode_in_worker(
+        prompt: str, request_id: Optional[str],
+        lora_request: Optional[LoRARequest],
+        shm_min_tokens: int) -> Union[List[int], _SharedTokenIds]:
+    assert _worker_tokenizer_group is not None
+    ret = _worker_tokenizer_group.encode(prompt=prompt,
+                                         request_id=request_id,
+                                         lora_request=lora_request)
+    if len(ret) < shm_min_tokens:
+        return ret
+    token_ids = array(APHRODITE_TOKEN_ID_ARRAY_TYPE, ret)
+    num_bytes = len(token_ids) * token_ids.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=num_bytes)
+    try:
+        shm.buf[:num_bytes] = memoryview(token_ids).cast("B")
+    finally:
+        shm.close()
+    return _SharedTokenIds(shm.name, len(token_ids))
+
+
+def _read_token_ids(ret: Union[List[int], _SharedTokenIds]) -> List[int]:
+    if not isinstance(ret, _SharedTokenIds):
+        return ret
+    shm = shared_memory.SharedMemory(name=ret.name)
+    try:
+        token_ids = array(APHRODITE_TOKEN_ID_ARRAY_TYPE)
+        token_ids.frombytes(shm.buf[:ret.num_tokens * token_ids.itemsize])
+    finally:
+        shm.close()
+        shm.unlink()
+    return token_ids.tolist()
+
+
+def _release_token_ids(future: Future) -> None:
+    # The result of a cancelled encode, which nobody else will read.
+    if not future.cancelled() and future.exception() is None:
+        _read_token_ids(future.result())
+
+
+class MultiprocessingTokenizerGroupPool(BaseTokenizerGroup):
+    """A pool of TokenizerGroups in local worker processes for async
+    tokenization, which doesn't require Ray.
+
+    Long prompts are returned from the workers through shared memory. At most
+    `max_queue_size` prompts wait in the pool for a free worker, the
+    others wait in `encode_async` without being sent to the pool, so that
+    they can still be cancelled.
+    """
+
+    # Class to use for workers making up the pool.
+    _worker_cls = TokenizerGroup
+
+    @classmethod
+    def from_config(cls, tokenizer_pool_config: Optional[TokenizerPoolConfig],
+                    **init_kwargs) -> "MultiprocessingTokenizerGroupPool":
+        if not tokenizer_pool_config:
+            raise ValueError("tokenizer_pool_config must not be None.")
+        extra_config = tokenizer_pool_config.extra_config
+        init_kwargs["num_workers"] = tokenizer_pool_config.pool_size
+        init_kwargs["max_queue_size"] = extra_config.get(
+            "max_queue_size", tokenizer_pool_config.pool_size)
+        init_kwargs["shm_min_tokens"] = extra_config.get(
+            "shm_min_tokens", DEFAULT_SHM_MIN_TOKENS)
+        return cls(**init_kwargs)
+
+    def __init__(self, tokenizer_id: str, enable_lora: bool, max_num_seqs: int,
+                 max_input_length: Optional[int], num_workers: int,
+                 max_queue_size: int, shm_min_tokens: int,
+                 **tokenizer_config):
+        # Store a local copy of the TokenizerGroup for quick access
+        # to underlying HF tokenizers.
+        self._tokenizer_config = {
+            "tokenizer_id": tokenizer_id,
+            "enable_lora": enable_lora,
+            "max_num_seqs": max_num_seqs,
+            "max_input_length": max_input_length,
+            **tokenizer_config
+        }
+        self._local_tokenizer_group = self._worker_cls(
+            **self._tokenizer_config, )
+
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.shm_min_tokens = shm_min_tokens
+        self._executor = self._init_executor()
+        # Held while a broken pool is replaced, so that it is only restarted
+        # once by the callers that saw it break.
+        self._restart_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Seconds from the call to encode_async to its result, since the
+        # last call to pop_tokenization_times.
+        self._tokenization_times: Deque[float] = deque(
+            maxlen=_MAX_TOKENIZATION_TIMES)
+
+        # If set, the pool is unhealthy. Will reraise on the next
+        # check_health call.
+        self._exception: Optional[BrokenProcessPool] = None
+
+    def _init_executor(self) -> ProcessPoolExecutor:
+        # Spawn, since the workers may be started after CUDA is initialized.
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._worker_cls, self._tokenizer_config))
+
+    @property
+    def pool_size(self) -> int:
+        return self.num_workers
+
+    def ping(self):
+        return [
+            future.result() for future in [
+                self._executor.submit(_ping_worker)
+                for _ in range(self.num_workers)
+            ]
+        ]
+
+    def _ensure_slots_initialized(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.num_workers +
+                                            self.max_queue_size)
+
+    def _submit_encode(self, executor: ProcessPoolExecutor, prompt: str,
+                       request_id: Optional[str],
+                       lora_request: Optional[LoRARequest]) -> Future:
+        return executor.submit(_encode_in_worker, prompt, request_id,
+                               lora_request, self.shm_min_tokens)
+
+    def _handle_broken_pool(self, broken_executor: ProcessPoolExecutor,
+                            prompt: str, request_id: Optional[str],
+                            lora_request: Optional[LoRARequest]) -> Future:
+        # A worker died, e.g. it was killed by the OOM killer, so we first
+        # try to restart the pool. Other callers may have seen it break too,
+        # and only the first one restarts it.
+        with self._restart_lock:
+            if self._executor is broken_executor:
+                logger.warning(
+                    "A tokenizer pool worker died, restarting the pool.")
+                broken_executor.shutdown(wait=False)
+                self._executor = self._init_executor()
+            executor = self._executor
+        return self._submit_encode(executor, prompt, request_id,
+                                   lora_request)
+
+    def _mark_unhealthy(self, e: BrokenProcessPool):
+        logger.error("A tokenizer pool worker died for the second time in a "
+                     "row, marking MultiprocessingTokenizerGroupPool as "
+                     "unhealthy.")
+        if not self._exception:
+            self._exception = e
+        self.check_health()
+
+    def encode(self,
+               prompt: str,
+               request_id: Optional[str] = None,
+               lora_request: Optional[LoRARequest] = None) -> List[int]:
+        """Encode a prompt using the tokenizer group.
+
+        The prompt is encoded by a worker of the pool. This is blocking.
+        """
+        self.check_health()
+        start_time = time.perf_counter()
+        executor = self._executor
+        try:
+            # Raises BrokenProcessPool from submit if the executor already
+            # noticed the broken pool, or from result otherwise.
+            ret = self._submit_encode(executor, prompt, request_id,
+                                      lora_request).result()
+        except BrokenProcessPool:
+            try:
+                ret = self._handle_broken_pool(executor, prompt, request_id,
+                                               lora_request).result()
+            except BrokenProcessPool as e:
+                self._mark_unhealthy(e)
+        token_ids = _read_token_ids(ret)
+        self._tokenization_times.append(time.perf_counter() - start_time)
+        return token_ids
+
+    async def encode_async(
+            self,
+            prompt: str,
+            request_id: Optional[str] = None,
+            lora_request: Optional[LoRARequest] = None) -> List[int]:
+        """Encode a prompt using the tokenizer group.
+
+        The prompt is encoded by a worker of the pool. If `max_queue_size`
+        prompts are already waiting for a worker, we wait until one of them
+        is picked up before sending this one.
+        This is non-blocking.
+        """
+        self.check_health()
+        self._ensure_slots_initialized()
+        assert self._slots is not None
+
+        start_time = time.perf_counter()
+        async with self._slots:
+            executor = self._executor
+            future = self._submit_encode(executor, prompt, request_id,
+                                         lora_request)
+            try:
+                try:
+                    ret = await asyncio.wrap_future(future)
+                except BrokenProcessPool:
+                    future = self._handle_broken_pool(executor, prompt,
+                                                      request_id,
+                                                      lora_request)
+                    try:
+                        ret = await asyncio.wrap_future(future)
+                    except BrokenProcessPool as e:
+                        self._mark_unhealthy(e)
+            except asyncio.CancelledError:
+                # `future` is the retry if the pool broke, so its token ids
+                # are released too.
+                future.add_done_callback(_release_token_ids)
+                raise
+        token_ids = _read_token_ids(ret)
+        self._tokenization_times.append(time.perf_counter() - start_time)
+        return token_ids
+
+    def get_max_input_len(self,
+                          lora_request: Optional[LoRARequest] = None
+                          ) -> Optional[int]:
+        """Get the maximum input length for the LoRA request."""
+        return self._local_tokenizer_group.get_max_input_len(lora_request)
+
+    def get_lora_tokenizer(
+            self,
+            lora_request: Optional[LoRARequest] = None
+    ) -> "PreTrainedTokenizer":
+        return self._local_tokenizer_group.get_lora_tokenizer(lora_request)
+
+    async def get_lora_tokenizer_async(
+            self,
+            lora_request: Optional[LoRARequest] = None
+    ) -> "PreTrainedTokenizer":
+        return await self._local_tokenizer_group.get_lora_tokenizer_async(
+            lora_request)
+
+    def pop_tokenization_times(self) -> List[float]:
+        tokenization_times = list(self._tokenization_times)
+        self._tokenization_times.clear()
+        return tokenization_times
+
+    def check_health(self):
+        if self._exception:
+            raise RuntimeError(
+                "TokenizerGroupPool is unhealthy.") from self._exception
@@ -0,0 +1,146 @@
+import time
+
+import torch
+
+from aphrodite.common.utils import FlexibleArgumentParser
+from aphrodite.modeling.layers.sampler import _apply_dry
+
+
+def _apply_dry_loop(
+    logits: torch.Tensor,
+    input_token_ids: torch.Tensor,
+    output_token_ids: torch.Tensor,
+    multipliers: torch.Tensor,
+    bases: torch.Tensor,
+    allowed_lengths: torch.Tensor,
+    sequence_breakers_ids: torch.Tensor,
+    ranges: torch.Tensor,
+) -> torch.Tensor:
+    # The previous implementation, one row and one candidate at a time.
+    VOCAB_SIZE = logits.size(-1)
+    MAX_NGRAM = 100
+
+    applies_to = multipliers.nonzero(as_tuple=True)[0]
+    for irow in applies_to.tolist():
+        prompt_len = (len(input_token_ids[irow]) -
+                      (input_token_ids[irow] == VOCAB_SIZE).sum().item())
+        ouput_len = (len(output_token_ids[irow]) -
+                     (output_token_ids[irow] == VOCAB_SIZE).sum().item())
+        token_seq = torch.cat((input_token_ids[irow][:prompt_len],
+                               output_token_ids[irow][:ouput_len]), dim=0)
+
+        range_limit = ranges[irow].item()
+        if range_limit:
+            token_seq = token_seq[-range_limit:]
+
+        last_token = token_seq[-1].item()
+        if last_token in sequence_breakers_ids[irow]:
+            continue
+
+        break_mask = torch.zeros(len(token_seq), dtype=torch.bool,
+                                 device=logits.device)
+        for break_tok in sequence_breakers_ids[irow]:
+            break_mask.logical_or_(token_seq == break_tok)
+
+        max_ngram = 0
+        for max_ngram in range(min(len(break_mask), MAX_NGRAM + 1)):
+            if break_mask[-max_ngram - 1]:
+                break
+
+        min_ngram = allowed_lengths[irow].item()
+        if max_ngram <= min_ngram:
+            continue
+
+        ngram_lens = torch.zeros(VOCAB_SIZE, dtype=torch.int32,
+                                 device=logits.device)
+
+        endpoint_indexes = torch.nonzero(token_seq == last_token,
+                                         as_tuple=True)[0].tolist()
+        for idx in endpoint_indexes[:-1]:
+            unwind = 0
+            for unwind in range(1, min(idx, max_ngram) + 1):
+                if break_mask[idx - unwind]:
+                    break
+                if token_seq[idx - unwind] != token_seq[-unwind - 1]:
+                    break
+            next_tok = token_seq[idx + 1]
+            ngram_lens[next_tok] = max(ngram_lens[next_tok].item(), unwind + 1)
+
+        penalty_mask = ngram_lens > 0
+        scales = bases[irow]**(ngram_lens[penalty_mask] - min_ngram)
+        logits[irow][penalty_mask] -= multipliers[irow] * scales
+
+    return logits
+
+
+@torch.inference_mode()
+def main(args):
+    torch.random.manual_seed(args.seed)
+    device = torch.device(args.device)
+    vocab_size = args.vocab_size
+    num_seqs = args.num_seqs
+
+    # Generations that keep repeating a short pattern, the case DRY is for.
+    pattern = torch.randint(0, vocab_size, (num_seqs, args.pattern_len))
+    repeats = (args.prompt_len + args.output_len) // args.pattern_len + 1
+    tokens = pattern.repeat(1, repeats)
+    noise = torch.rand(tokens.shape) < args.noise
+    tokens = torch.where(noise, torch.randint_like(tokens, vocab_size), tokens)
+    prompt_tokens = tokens[:, :args.prompt_len].to(device)
+    output_tokens = tokens[:, args.prompt_len:args.prompt_len +
+                           args.output_len].to(device)
+
+    dtype = torch.float32
+    multipliers = torch.full((num_seqs, ), 0.8, dtype=dtype, device=device)
+    bases = torch.full((num_seqs, ), 1.75, dtype=dtype, device=device)
+    allowed_lengths = torch.full((num_seqs, ), 2, dtype=torch.int,
+                                 device=device)
+    # Sequence breakers outside of the vocabulary used above.
+    breakers = torch.tensor([[vocab_size + 1, vocab_size + 2]] * num_seqs,
+                            device=device)
+    ranges = torch.full((num_seqs, ), args.range, dtype=torch.int,
+                        device=device)
+    logits = torch.randn(num_seqs, vocab_size + 3, dtype=dtype, device=device)
+
+    def run(fn) -> torch.Tensor:
+        return fn(logits.clone(), prompt_tokens, output_tokens, multipliers,
+                  bases, allowed_lengths, breakers, ranges)
+
+    torch.testing.assert_close(run(_apply_dry), run(_apply_dry_loop))
+
+    for name, fn, num_iters in (("loop", _apply_dry_loop, args.num_iters_loop),
+                                ("vectorized", _apply_dry, args.num_iters)):
+        run(fn)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        for _ in range(num_iters):
+            run(fn)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        latency = (time.perf_counter() - start_time) / num_iters
+        print(f"{name}: {latency * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the DRY sampler on a batch of repetitive "
+        "sequences.")
+    parser.add_argument("--num-seqs", type=int, default=32)
+    parser.add_argument("--prompt-len", type=int, default=512)
+    parser.add_argument("--output-len", type=int, default=256)
+    parser.add_argument("--pattern-len", type=int, default=50)
+    parser.add_argument("--noise",
+                        type=float,
+                        default=0.02,
+                        help="Fraction of tokens replaced by random ones.")
+    parser.add_argument("--range", type=int, default=0)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--device",
+                        type=str,
+                        default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-iters", type=int, default=100)
+    parser.add_argument("--num-iters-loop", type=int, default=3)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,119 @@
+import time
+from typing import Callable, List, Tuple
+
+import torch
+
+from aphrodite.common.utils import FlexibleArgumentParser
+from aphrodite.modeling.layers.sampler import (_DEFAULT_SAMPLER_ORDER,
+                                               _TRUNCATION_SAMPLERS, SamplerID,
+                                               _apply_epsilon_cutoff,
+                                               _apply_eta_cutoff, _apply_min_p,
+                                               _apply_tfs, _apply_top_a,
+                                               _apply_top_k_top_p,
+                                               _apply_top_nsigma,
+                                               _apply_truncation_samplers,
+                                               _apply_typical_sampling)
+
+_UNFUSED_SAMPLERS = {
+    SamplerID.TOP_NSIGMA: _apply_top_nsigma,
+    SamplerID.TOP_P_TOP_K: _apply_top_k_top_p,
+    SamplerID.TOP_A: _apply_top_a,
+    SamplerID.MIN_P: _apply_min_p,
+    SamplerID.TFS: _apply_tfs,
+    SamplerID.ETA_CUTOFF: _apply_eta_cutoff,
+    SamplerID.EPSILON_CUTOFF: _apply_epsilon_cutoff,
+    SamplerID.TYPICAL_P: _apply_typical_sampling,
+}
+
+# Typical values of the parameters of each sampler.
+_PARAMS = {
+    SamplerID.TOP_NSIGMA: (2.0, ),
+    SamplerID.TOP_P_TOP_K: (0.95, 100),
+    SamplerID.TOP_A: (0.2, ),
+    SamplerID.MIN_P: (0.02, ),
+    SamplerID.TFS: (0.95, ),
+    SamplerID.ETA_CUTOFF: (3e-4, ),
+    SamplerID.EPSILON_CUTOFF: (3e-4, ),
+    SamplerID.TYPICAL_P: (0.95, ),
+}
+
+Samplers = List[Tuple[SamplerID, Tuple[torch.Tensor, ...]]]
+
+
+def apply_unfused(logits: torch.Tensor, samplers: Samplers) -> torch.Tensor:
+    for sampler_id, args in samplers:
+        logits = _UNFUSED_SAMPLERS[sampler_id](logits,
+                                               *(arg.clone() for arg in args))
+    return logits
+
+
+def benchmark(fn: Callable, logits: torch.Tensor, samplers: Samplers,
+              num_iters: int) -> float:
+    fn(logits.clone(), samplers)
+    if logits.is_cuda:
+        torch.cuda.synchronize()
+    start_time = time.perf_counter()
+    for _ in range(num_iters):
+        fn(logits.clone(), samplers)
+    if logits.is_cuda:
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start_time) / num_iters
+
+
+@torch.inference_mode()
+def main(args):
+    torch.random.manual_seed(args.seed)
+    device = torch.device(args.device)
+    dtype = getattr(torch, args.dtype)
+    logits = torch.randn(args.num_seqs,
+                         args.vocab_size,
+                         dtype=dtype,
+                         device=device) * 4
+
+    sampler_ids = [
+        sampler_id for sampler_id in _DEFAULT_SAMPLER_ORDER
+        if sampler_id in _TRUNCATION_SAMPLERS
+    ]
+    print(f"num_seqs={args.num_seqs}, vocab_size={args.vocab_size}, "
+          f"dtype={args.dtype}, device={args.device}")
+    print("samplers\tunfused (ms)\tfused (ms)\tspeedup")
+    for num_samplers in range(1, len(sampler_ids) + 1):
+        samplers = []
+        for sampler_id in sampler_ids[:num_samplers]:
+            samplers.append((sampler_id, tuple(
+                torch.full((args.num_seqs, ),
+                           param,
+                           dtype=torch.int if isinstance(param, int) else
+                           dtype,
+                           device=device) for param in _PARAMS[sampler_id])))
+
+        if dtype == torch.float32:
+            # In half precision, the unfused samplers round the
+            # probabilities, which can keep a different token at the cutoff.
+            torch.testing.assert_close(
+                _apply_truncation_samplers(logits.clone(), samplers),
+                apply_unfused(logits.clone(), samplers))
+        unfused = benchmark(apply_unfused, logits, samplers, args.num_iters)
+        fused = benchmark(_apply_truncation_samplers, logits, samplers,
+                          args.num_iters)
+        print(f"{num_samplers}\t\t{unfused * 1e3:.3f}\t\t{fused * 1e3:.3f}"
+              f"\t\t{unfused / fused:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the truncation samplers applied one at a time "
+        "and in one pass, by the number of active samplers.")
+    parser.add_argument("--num-seqs", type=int, default=64)
+    parser.add_argument("--vocab-size", type=int, default=128256)
+    parser.add_argument("--dtype",
+                        type=str,
+                        choices=["float16", "bfloat16", "float32"],
+                        default="float32")
+    parser.add_argument("--device",
+                        type=str,
+                        default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-iters", type=int, default=10)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,107 @@
+import random
+import time
+from typing import List
+
+from aphrodite.common.sequence import Logprob, SamplingParams, Sequence
+from aphrodite.common.utils import FlexibleArgumentParser
+from aphrodite.transformers_utils.detokenizer import (
+    Detokenizer, convert_prompt_ids_to_tokens, detokenize_incrementally)
+from aphrodite.transformers_utils.tokenizer_group import get_tokenizer_group
+
+
+def make_sequence(rng: random.Random, vocab_size: int,
+                  prompt_len: int) -> Sequence:
+    prompt_token_ids = [rng.randrange(vocab_size) for _ in range(prompt_len)]
+    return Sequence(seq_id=0,
+                    inputs={"prompt_token_ids": prompt_token_ids},
+                    block_size=16)
+
+
+def decode_per_candidate(tokenizer, seq: Sequence,
+                         prms: SamplingParams) -> None:
+    # The previous approach: every candidate is decoded on its own, after
+    # copying the token ids of the whole sequence.
+    all_input_ids = seq.get_token_ids()
+    if seq.tokens is None:
+        (seq.tokens, seq.prefix_offset,
+         seq.read_offset) = convert_prompt_ids_to_tokens(
+             tokenizer, all_input_ids[:-1], prms.skip_special_tokens)
+    (new_tokens, new_text, prefix_offset,
+     read_offset) = detokenize_incrementally(tokenizer, all_input_ids,
+                                             seq.tokens, seq.prefix_offset,
+                                             seq.read_offset,
+                                             prms.skip_special_tokens)
+    logprobs = seq.output_logprobs
+    entries = logprobs.get_entries(len(logprobs) - 1)
+    previous_tokens = all_input_ids[:-1]
+    for i in range(entries.start, entries.stop):
+        token_id = logprobs.token_ids[i]
+        if token_id == all_input_ids[-1]:
+            logprobs.decoded_tokens[i] = new_text
+            continue
+        logprobs.decoded_tokens[i] = detokenize_incrementally(
+            tokenizer, previous_tokens + [token_id], seq.tokens,
+            seq.prefix_offset, seq.read_offset, prms.skip_special_tokens)[1]
+    seq.tokens.extend(new_tokens)
+    seq.prefix_offset = prefix_offset
+    seq.read_offset = read_offset
+    seq.output_text += new_text
+
+
+def run(name: str, decode, args) -> str:
+    rng = random.Random(args.seed)
+    vocab_size = args.vocab_size
+    seq = make_sequence(rng, vocab_size, args.prompt_len)
+    prms = SamplingParams(logprobs=args.num_logprobs)
+    step_times: List[float] = []
+    for _ in range(args.output_len):
+        token_id = rng.randrange(vocab_size)
+        logprobs = {token_id: Logprob(0.0, rank=1)}
+        while len(logprobs) < args.num_logprobs + 1:
+            logprobs[rng.randrange(vocab_size)] = Logprob(-1.0)
+        seq.append_token_id(token_id, logprobs)
+        start_time = time.perf_counter()
+        decode(seq, prms)
+        step_times.append(time.perf_counter() - start_time)
+
+    window = max(len(step_times) // 10, 1)
+    first = sum(step_times[:window]) / window
+    last = sum(step_times[-window:]) / window
+    print(f"{name}: total {sum(step_times) * 1e3:.0f} ms, "
+          f"first steps {first * 1e6:.0f} us/step, "
+          f"last steps {last * 1e6:.0f} us/step")
+    return seq.output_text
+
+
+def main(args):
+    tokenizer_group = get_tokenizer_group(None,
+                                          tokenizer_id=args.tokenizer,
+                                          enable_lora=False,
+                                          max_num_seqs=1,
+                                          max_input_length=None)
+    tokenizer = tokenizer_group.get_lora_tokenizer(None)
+    detokenizer = Detokenizer(tokenizer_group)
+    if args.vocab_size is None:
+        args.vocab_size = len(tokenizer)
+
+    print(f"prompt of {args.prompt_len} tokens, {args.output_len} output "
+          f"tokens with logprobs={args.num_logprobs}")
+    expected_text = run(
+        "per candidate",
+        lambda seq, prms: decode_per_candidate(tokenizer, seq, prms), args)
+    text = run("Detokenizer", detokenizer.decode_sequence_inplace, args)
+    assert text == expected_text
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the detokenization of the top logprobs "
+        "candidates of a sequence, per generated token.")
+    parser.add_argument("--tokenizer", type=str, default="facebook/opt-125m")
+    parser.add_argument("--prompt-len", type=int, default=1024)
+    parser.add_argument("--output-len", type=int, default=4096)
+    parser.add_argument("--num-logprobs", type=int, default=20)
+    parser.add_argument("--vocab-size", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,59 @@
+import random
+import time
+
+from aphrodite.common.utils import FlexibleArgumentParser
+from aphrodite.processing.evictor_v2 import EvictionPolicy, make_evictor
+
+
+def run_workload(evictor, num_blocks: int, num_updates: int,
+                 num_tokens_per_block: int, seed: int) -> None:
+    rng = random.Random(seed)
+    now = 0.0
+
+    # Free every block, as happens when all requests finish.
+    for block_id in range(num_blocks):
+        now += 1.0
+        evictor.add(block_id, content_hash=block_id,
+                    num_hashed_tokens=(block_id % 64 + 1) *
+                    num_tokens_per_block,
+                    last_accessed=now)
+
+    # Prefix cache hits touch random free blocks.
+    for _ in range(num_updates):
+        now += 1.0
+        evictor.update(rng.randrange(num_blocks), now)
+
+    # Some of the hits bring the block back into use.
+    for block_id in rng.sample(range(num_blocks), num_blocks // 10):
+        evictor.remove(block_id)
+
+    while evictor.num_blocks > 0:
+        evictor.evict()
+
+
+def main(args):
+    print(f"num_blocks={args.num_blocks}, num_updates={args.num_updates}")
+    for policy in EvictionPolicy:
+        timings = []
+        for i in range(args.num_iters):
+            evictor = make_evictor(policy)
+            start_time = time.perf_counter()
+            run_workload(evictor, args.num_blocks, args.num_updates,
+                         args.block_size, seed=i)
+            timings.append(time.perf_counter() - start_time)
+        best = min(timings)
+        num_ops = args.num_blocks * 2 + args.num_updates
+        print(f"{policy.name}: best of {args.num_iters} runs "
+              f"{best * 1000:.2f} ms, "
+              f"{best / num_ops * 1e6:.3f} us per operation")
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description='Benchmark the overhead of the prefix caching evictor.')
+    parser.add_argument('--num-blocks', type=int, default=50000)
+    parser.add_argument('--num-updates', type=int, default=100000)
+    parser.add_argument('--block-size', type=int, default=16)
+    parser.add_argument('--num-iters', type=int, default=3)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,84 @@
+import gc
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from aphrodite.common.sequence import FlatLogprobs, Logprob
+from aphrodite.common.utils import FlexibleArgumentParser
+
+
+def make_step_logprobs(rng: random.Random, vocab_size: int,
+                       num_logprobs: int) -> Dict[int, Logprob]:
+    # The sampled token and the top logprobs of one step, decoded like the
+    # detokenizer does.
+    return {
+        rng.randrange(vocab_size):
+        Logprob(rng.uniform(-10, 0), rank=rank, decoded_token=f"tok{rank}")
+        for rank in range(1, num_logprobs + 2)
+    }
+
+
+def fill(container_factory: Callable, args) -> List:
+    rng = random.Random(args.seed)
+    sequences = [container_factory() for _ in range(args.num_seqs)]
+    for _ in range(args.output_len):
+        for output_logprobs in sequences:
+            output_logprobs.append(
+                make_step_logprobs(rng, args.vocab_size, args.num_logprobs))
+    return sequences
+
+
+def measure(name: str, container_factory: Callable, args) -> None:
+    start_time = time.perf_counter()
+    gc.collect()
+    base_gc_time = time.perf_counter() - start_time
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    sequences = fill(container_factory, args)
+    fill_time = time.perf_counter() - start_time
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # A full collection walks every container object that is alive, which
+    # is what makes long-lived logprobs slow down the engine. The time of a
+    # collection without the logprobs is subtracted.
+    start_time = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start_time - base_gc_time
+
+    # Reading all the logprobs back, like when the responses are built.
+    start_time = time.perf_counter()
+    total = 0.0
+    for output_logprobs in sequences:
+        for position_logprobs in output_logprobs:
+            total += sum(logprob.logprob
+                         for logprob in position_logprobs.values())
+    read_time = time.perf_counter() - start_time
+
+    num_entries = args.num_seqs * args.output_len * (args.num_logprobs + 1)
+    print(f"{name}: {memory / 2**20:.1f} MiB "
+          f"({memory / num_entries:.1f} bytes per entry), "
+          f"fill {fill_time * 1e3:.0f} ms, gc.collect {gc_time * 1e3:.1f} ms, "
+          f"read {read_time * 1e3:.0f} ms")
+
+
+def main(args):
+    print(f"{args.num_seqs} sequences of {args.output_len} tokens with "
+          f"logprobs={args.num_logprobs}")
+    measure("list of dicts", list, args)
+    measure("FlatLogprobs", FlatLogprobs, args)
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark the memory used to store the logprobs of the "
+        "sampled tokens of sequences, as a list of dicts of Logprob objects "
+        "and as FlatLogprobs.")
+    parser.add_argument("--num-seqs", type=int, default=8)
+    parser.add_argument("--output-len", type=int, default=4096)
+    parser.add_argument("--num-logprobs", type=int, default=20)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
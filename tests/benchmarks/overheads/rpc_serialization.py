@@ -0,0 +1,134 @@
+import time
+from array import array
+from typing import Callable, List
+
+import cloudpickle
+
+from aphrodite.common.outputs import CompletionOutput, RequestOutput
+from aphrodite.common.sequence import Logprob, RequestMetrics
+from aphrodite.common.utils import FlexibleArgumentParser
+from aphrodite.endpoints.openai.rpc import (RequestOutputAccumulator,
+                                            RequestOutputDeltaTracker,
+                                            decode_output_frame,
+                                            encode_output_frame)
+
+
+class Stream:
+    """Cumulative outputs of `num_requests` requests that are decoded
+    together, shared between steps like the engine does."""
+
+    def __init__(self, num_requests: int, prompt_len: int,
+                 num_logprobs: int):
+        self.num_logprobs = num_logprobs
+        self.token_ids = [array("l") for _ in range(num_requests)]
+        self.logprobs = [[] if num_logprobs else None
+                         for _ in range(num_requests)]
+        self.texts = [""] * num_requests
+        self.prompt_token_ids = list(range(prompt_len))
+        self.metrics = RequestMetrics(arrival_time=0.0,
+                                      last_token_time=1.0,
+                                      first_scheduled_time=0.1,
+                                      first_token_time=0.2,
+                                      time_in_queue=0.1)
+
+    def step(self, token_id: int, finished: bool) -> List[RequestOutput]:
+        outputs = []
+        for i, token_ids in enumerate(self.token_ids):
+            token_ids.append(token_id)
+            logprobs = self.logprobs[i]
+            if logprobs is not None:
+                logprobs.append({
+                    token_id + j: Logprob(-0.1 * j,
+                                          rank=j + 1,
+                                          decoded_token="ab")
+                    for j in range(self.num_logprobs)
+                })
+            self.texts[i] += "ab"
+            outputs.append(
+                RequestOutput(
+                    request_id=f"cmpl-{i}",
+                    prompt=None,
+                    prompt_token_ids=self.prompt_token_ids,
+                    prompt_logprobs=None,
+                    outputs=[
+                        CompletionOutput(index=0,
+                                         text=self.texts[i],
+                                         token_ids=token_ids,
+                                         cumulative_logprob=-1.0,
+                                         logprobs=logprobs,
+                                         finish_reason="length"
+                                         if finished else None)
+                    ],
+                    finished=finished,
+                    metrics=self.metrics,
+                ))
+        return outputs
+
+
+def pickle_stream(args) -> int:
+    # One message per output with the full output, as sent before the
+    # msgspec encoding.
+    stream = Stream(args.num_requests, args.prompt_len, args.num_logprobs)
+    num_bytes = 0
+    for step in range(args.output_len):
+        for output in stream.step(step, step == args.output_len - 1):
+            message = cloudpickle.dumps(output)
+            num_bytes += len(message)
+            cloudpickle.loads(message)
+    return num_bytes
+
+
+def delta_stream(args) -> int:
+    # One frame per step with the new tokens of all requests.
+    stream = Stream(args.num_requests, args.prompt_len, args.num_logprobs)
+    trackers = [
+        RequestOutputDeltaTracker() for _ in range(args.num_requests)
+    ]
+    accumulators = {
+        f"cmpl-{i}": RequestOutputAccumulator()
+        for i in range(args.num_requests)
+    }
+    num_bytes = 0
+    for step in range(args.output_len):
+        outputs = stream.step(step, step == args.output_len - 1)
+        message = encode_output_frame([
+            tracker.get_delta(output)
+            for tracker, output in zip(trackers, outputs)
+        ], {})
+        num_bytes += len(message)
+        for delta in decode_output_frame(message).outputs:
+            accumulators[delta.request_id].add(delta)
+    return num_bytes
+
+
+def benchmark(name: str, run: Callable, args) -> None:
+    timings = []
+    for _ in range(args.num_iters):
+        start_time = time.perf_counter()
+        num_bytes = run(args)
+        timings.append(time.perf_counter() - start_time)
+    best = min(timings)
+    num_tokens = args.num_requests * args.output_len
+    print(f"{name}: {best * 1e3:.1f} ms, "
+          f"{best / num_tokens * 1e6:.3f} us per generated token, "
+          f"{num_bytes / num_tokens:,.0f} bytes per generated token")
+
+
+def main(args):
+    print(f"num_requests={args.num_requests}, prompt_len={args.prompt_len}, "
+          f"output_len={args.output_len}, num_logprobs={args.num_logprobs}")
+    benchmark("cloudpickle, full outputs", pickle_stream, args)
+    benchmark("msgspec, coalesced deltas", delta_stream, args)
+
+
+if __name__ == "__main__":
+    parser = FlexibleArgumentParser(
+        description="Benchmark streaming outputs from the engine process to "
+        "the OpenAI server frontend.")
+    parser.add_argument("--num-requests", type=int, default=64)
+    parser.add_argument("--prompt-len", type=int, default=512)
+    parser.add_argument("--output-len", type=int, default=256)
+    parser.add_argument("--num-logprobs", type=int, default=0)
+    parser.add_argument("--num-iters", type=int, default=3)
+    args = parser.parse_args()
+    main(args)
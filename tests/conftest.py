@@ -726,9 +726,9 @@ def aphrodite_runner():
 def get_tokenizer_pool_config(tokenizer_group_type):
     if tokenizer_group_type is None:
         return None
-    if tokenizer_group_type == "ray":
+    if tokenizer_group_type in ("ray", "mp"):
         return TokenizerPoolConfig(pool_size=1,
-                                   pool_type="ray",
+                                   pool_type=tokenizer_group_type,
                                    extra_config={})
     if isinstance(tokenizer_group_type, type):
         return TokenizerPoolConfig(pool_size=1,
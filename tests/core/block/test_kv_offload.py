@@ -0,0 +1,94 @@
+from typing import List
+
+import pytest
+
+from aphrodite.processing.block.interfaces import Block
+from aphrodite.processing.block.kv_offload import KVOffloadOp, KVOffloadTier
+from aphrodite.processing.block.prefix_caching_block import (
+    PrefixCachingBlockAllocator)
+
+
+def test_kv_offload_tier_demote_and_promote():
+    tier = KVOffloadTier(num_cpu_blocks=2)
+    tier.demote(100, device_block_id=0)
+    tier.demote(101, device_block_id=1)
+    assert 100 in tier and 101 in tier
+    cpu_0 = tier.get_and_reset_ops()[0][2]
+
+    assert tier.promote(100, device_block_id=5)
+    assert tier.get_and_reset_ops() == [(KVOffloadOp.CPU_TO_DEVICE, cpu_0, 5)]
+
+    # Without a disk tier, the least recently used block is dropped.
+    tier.demote(102, device_block_id=2)
+    assert 101 not in tier
+    assert not tier.promote(101, device_block_id=6)
+    assert tier.get_and_reset_ops() == [(KVOffloadOp.DEVICE_TO_CPU, 2,
+                                         tier._cpu_blocks[102])]
+    assert tier.get_hit_rate() == 0.5
+
+    # The tiers are inclusive, so demoting a promoted block is free.
+    tier.demote(100, device_block_id=5)
+    assert tier.get_and_reset_ops() == []
+
+
+def test_kv_offload_tier_spills_to_disk():
+    tier = KVOffloadTier(num_cpu_blocks=1, num_disk_blocks=1)
+    tier.demote(100, device_block_id=0)
+    tier.demote(101, device_block_id=1)
+    assert tier.get_and_reset_ops() == [
+        (KVOffloadOp.DEVICE_TO_CPU, 0, 0),
+        (KVOffloadOp.CPU_TO_DISK, 0, 0),
+        (KVOffloadOp.DEVICE_TO_CPU, 1, 0),
+    ]
+
+    # Promoting from disk goes through the CPU tier, spilling its block.
+    assert tier.promote(100, device_block_id=2)
+    assert tier.get_and_reset_ops() == [
+        (KVOffloadOp.CPU_TO_DISK, 0, 0),
+        (KVOffloadOp.DISK_TO_CPU, 0, 0),
+        (KVOffloadOp.CPU_TO_DEVICE, 0, 2),
+    ]
+    assert 100 in tier and 101 in tier
+
+
+@pytest.mark.parametrize("block_size", [1, 16])
+def test_prefix_caching_allocator_offloads_evicted_blocks(block_size: int):
+    num_blocks = 2
+    tier = KVOffloadTier(num_cpu_blocks=4)
+    allocator = PrefixCachingBlockAllocator(num_blocks=num_blocks,
+                                            block_size=block_size,
+                                            kv_offload_tier=tier)
+
+    def allocate_chain(token_ids: List[int]) -> List[Block]:
+        blocks: List[Block] = []
+        prev_block = None
+        for i in range(0, len(token_ids), block_size):
+            prev_block = allocator.allocate_immutable_block(
+                prev_block=prev_block, token_ids=token_ids[i:i + block_size])
+            blocks.append(prev_block)
+        return blocks
+
+    first_chain = allocate_chain(list(range(num_blocks * block_size)))
+    first_block_ids = [block.block_id for block in first_chain]
+    for block in first_chain:
+        allocator.free(block)
+    assert allocator.get_and_reset_kv_offload_ops() == []
+
+    # A different prompt evicts the first chain, which is demoted.
+    second_chain = allocate_chain(
+        list(range(num_blocks * block_size, 2 * num_blocks * block_size)))
+    ops = allocator.get_and_reset_kv_offload_ops()
+    assert sorted(op[1] for op in ops) == sorted(first_block_ids)
+    assert all(op[0] == KVOffloadOp.DEVICE_TO_CPU for op in ops)
+    for block in second_chain:
+        allocator.free(block)
+
+    # The first prompt comes back: its blocks are promoted and computed.
+    first_chain = allocate_chain(list(range(num_blocks * block_size)))
+    ops = allocator.get_and_reset_kv_offload_ops()
+    promotions = [op for op in ops if op[0] == KVOffloadOp.CPU_TO_DEVICE]
+    assert [op[2] for op in promotions
+            ] == [block.block_id for block in first_chain]
+    assert all(block.computed for block in first_chain)
+    assert all(
+        allocator.block_is_computed(block.block_id) for block in first_chain)
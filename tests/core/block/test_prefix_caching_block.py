@@ -8,6 +8,7 @@ import pytest
 from aphrodite.processing.block.interfaces import Block, BlockAllocator
 from aphrodite.processing.block.prefix_caching_block import (
     PrefixCachingBlock, PrefixCachingBlockAllocator)
+from aphrodite.processing.evictor_v2 import EvictionPolicy
 
 
 class TestPrefixCachingBlock:
@@ -705,6 +706,118 @@ class TestPrefixCachingBlockAllocator:
                                                token_ids=token_ids)
         assert allocator.get_prefix_cache_hit_rate() > 0.99
 
+    @staticmethod
+    @pytest.mark.parametrize("eviction_policy", list(EvictionPolicy))
+    def test_pin_prefix(eviction_policy: EvictionPolicy):
+        block_size = 4
+        num_blocks = 4
+        allocator = PrefixCachingBlockAllocator(
+            num_blocks=num_blocks,
+            block_size=block_size,
+            eviction_policy=eviction_policy)
+        token_ids = list(range(2 * block_size + 1))
+
+        # Pin before the prefix is cached; the trailing partial block is
+        # not pinned.
+        allocator.pin_prefix("system", token_ids)
+        with pytest.raises(ValueError):
+            allocator.pin_prefix("system", token_ids)
+
+        chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=token_ids[:2 * block_size],
+            allocator=allocator,
+        )
+        pinned_block_ids = [block.block_id for block in chain]
+        for block in chain:
+            allocator.free(block)
+
+        # Pinned blocks can't be evicted, so they are not free either.
+        assert allocator.get_num_free_blocks() == num_blocks - 2
+        mutable_blocks = [
+            allocator.allocate_mutable_block(prev_block=None)
+            for _ in range(num_blocks - 2)
+        ]
+        with pytest.raises(BlockAllocator.NoFreeBlocksError):
+            allocator.allocate_mutable_block(prev_block=None)
+
+        # The pinned prefix is still cached.
+        chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=token_ids[:2 * block_size],
+            allocator=allocator,
+        )
+        assert [block.block_id for block in chain] == pinned_block_ids
+        assert all(block.computed for block in chain)
+        for block in chain + mutable_blocks:
+            allocator.free(block)
+
+        allocator.unpin_prefix("system")
+        assert allocator.get_num_free_blocks() == num_blocks
+        with pytest.raises(ValueError):
+            allocator.unpin_prefix("system")
+
+    @staticmethod
+    @pytest.mark.parametrize("eviction_policy", list(EvictionPolicy))
+    def test_restore_cached_blocks(eviction_policy: EvictionPolicy):
+        block_size = 4
+        num_blocks = 4
+        token_ids = list(range(3 * block_size))
+        allocator = PrefixCachingBlockAllocator(
+            num_blocks=8,
+            block_size=block_size,
+            eviction_policy=eviction_policy)
+        chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=token_ids,
+            allocator=allocator,
+        )
+        other_chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=[100 + token_id for token_id in token_ids],
+            allocator=allocator,
+        )
+        block_ids = [block.block_id for block in chain]
+        other_block_ids = [block.block_id for block in other_chain]
+        allocator.mark_blocks_as_accessed(other_block_ids, now=1.0)
+        allocator.mark_blocks_as_accessed(block_ids, now=2.0)
+        for block in chain + other_chain:
+            allocator.free(block)
+
+        # The most recently used prefix comes first, shallow blocks first.
+        cached_blocks = allocator.get_cached_blocks()
+        assert [block_id for _, _, block_id in cached_blocks
+                ] == block_ids + other_block_ids
+        assert [num_tokens for _, num_tokens, _ in cached_blocks
+                ] == [4, 8, 12] * 2
+        assert allocator.get_cached_blocks(max_blocks=2) == cached_blocks[:2]
+
+        # Restore into a smaller allocator, which only fits the first
+        # blocks.
+        new_allocator = PrefixCachingBlockAllocator(
+            num_blocks=num_blocks,
+            block_size=block_size,
+            eviction_policy=eviction_policy)
+        restored = new_allocator.restore_cached_blocks([
+            (content_hash, num_tokens)
+            for content_hash, num_tokens, _ in cached_blocks
+        ])
+        assert [index for index, _ in restored] == list(range(num_blocks))
+        assert new_allocator.get_num_free_blocks() == num_blocks
+
+        chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=token_ids,
+            allocator=new_allocator,
+        )
+        assert [block.block_id for block in chain
+                ] == [block_id for _, block_id in restored[:3]]
+        assert all(block.computed for block in chain)
+
+        # The restored blocks keep their order in the evictor.
+        block = new_allocator.allocate_mutable_block(prev_block=None)
+        assert block.block_id == restored[3][1]
+
     @staticmethod
     def create_immutable_chain(
         block_size: int,
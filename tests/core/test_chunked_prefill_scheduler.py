@@ -4,7 +4,7 @@ from unittest.mock import MagicMock
 import pytest  # noqa
 
 from aphrodite.common.config import CacheConfig, SchedulerConfig
-from aphrodite.common.sequence import Logprob, SequenceGroup
+from aphrodite.common.sequence import Logprob, SequenceGroup, SequenceStatus
 from aphrodite.processing.interfaces import AllocStatus
 from aphrodite.processing.scheduler import Scheduler
 
@@ -620,3 +620,39 @@ def test_perfix_caching():
     assert seq_group_meta[1].token_chunk_size == 12
     assert out.num_prefill_groups == 2
     assert out.num_batched_tokens == 62
+
+
+def test_chunked_prefill_priority_preemption():
+    """Verify an urgent waiting request preempts a less urgent running
+    request when there is no KV cache space for it."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64,
+                                       2,
+                                       16,
+                                       enable_chunked_prefill=True,
+                                       policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 3
+    cache_config.num_gpu_blocks = 3
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    # Leaves a single free block, so B cannot be allocated next to A.
+    _, seq_group_a = create_dummy_prompt("1",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=1)
+    scheduler.add_seq_group(seq_group_a)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_a]
+    append_new_token(seq_group_a, 1)
+
+    _, seq_group_b = create_dummy_prompt("2",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=0)
+    scheduler.add_seq_group(seq_group_b)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_b]
+    assert out.preempted == 1
+    assert list(scheduler.waiting) == [seq_group_a]
+    assert seq_group_a.get_seqs()[0].status == SequenceStatus.WAITING
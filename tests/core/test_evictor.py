@@ -0,0 +1,119 @@
+import pytest
+
+from aphrodite.processing.evictor_v2 import (CostAwareEvictor, EvictionPolicy,
+                                             LFUEvictor, LRUEvictor,
+                                             make_evictor)
+
+
+def test_lru_evictor_order():
+    evictor = LRUEvictor()
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=2.0)
+    evictor.add(1, content_hash=101, num_hashed_tokens=16, last_accessed=1.0)
+    # Same timestamp as block 1 but a longer prefix, so it goes first.
+    evictor.add(2, content_hash=102, num_hashed_tokens=32, last_accessed=1.0)
+    evictor.add(3, content_hash=103, num_hashed_tokens=16, last_accessed=3.0)
+
+    # Touching a block moves it behind all older blocks.
+    evictor.update(2, 4.0)
+    evictor.remove(0)
+    assert 0 not in evictor
+    assert evictor.num_blocks == 3
+
+    assert evictor.evict() == (1, 101)
+    assert evictor.evict() == (3, 103)
+    assert evictor.evict() == (2, 102)
+    assert evictor.num_blocks == 0
+    with pytest.raises(ValueError):
+        evictor.evict()
+
+
+def test_lru_evictor_readd_after_remove():
+    evictor = LRUEvictor()
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=1.0)
+    evictor.remove(0)
+    # The stale heap entry for the old content must not be returned.
+    evictor.add(0, content_hash=200, num_hashed_tokens=16, last_accessed=1.0)
+    assert evictor.evict() == (0, 200)
+    assert evictor.num_blocks == 0
+
+
+def test_lru_evictor_heap_cleanup():
+    evictor = LRUEvictor()
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=0.0)
+    for i in range(1, 10 * LRUEvictor.CLEANUP_THRESHOLD):
+        evictor.update(0, float(i))
+    assert len(evictor.priority_queue) <= LRUEvictor.CLEANUP_THRESHOLD + 1
+    assert evictor.evict() == (0, 100)
+
+
+def test_lfu_evictor_prefers_frequently_used_blocks():
+    evictor = LFUEvictor()
+    # Block 0 is used three times, block 1 once, though more recently.
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=1.0)
+    evictor.remove(0)
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=2.0)
+    evictor.update(0, 3.0)
+    evictor.add(1, content_hash=101, num_hashed_tokens=16, last_accessed=4.0)
+
+    assert evictor.evict() == (1, 101)
+    assert evictor.age == 1
+
+    # Aging: a newly added block starts from the age of the cache, so it
+    # competes with the old hot block instead of being evicted right away.
+    evictor.add(2, content_hash=102, num_hashed_tokens=16, last_accessed=5.0)
+    evictor.add(1, content_hash=201, num_hashed_tokens=16, last_accessed=6.0)
+    assert evictor.evict() == (2, 102)
+    # The evicted block's frequency is not inherited by new content.
+    assert evictor.evict() == (1, 201)
+    assert evictor.evict() == (0, 100)
+
+
+def test_cost_aware_evictor_keeps_shallow_blocks():
+    evictor = CostAwareEvictor()
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=2.0)
+    evictor.add(1, content_hash=101, num_hashed_tokens=64, last_accessed=3.0)
+    evictor.add(2, content_hash=102, num_hashed_tokens=32, last_accessed=1.0)
+
+    # The deepest block is the cheapest to lose, even if recently used.
+    assert evictor.evict() == (1, 101)
+    assert evictor.evict() == (2, 102)
+
+    # Aging lets deep blocks outlive a shallow block that is never used
+    # again: every eviction raises the keys of newly added blocks.
+    evicted = []
+    for i in range(3, 100):
+        evictor.add(i, content_hash=100 + i, num_hashed_tokens=512,
+                    last_accessed=float(i))
+        evicted.append(evictor.evict())
+        if evicted[-1] == (0, 100):
+            break
+    assert evicted[0] == (3, 103)
+    assert evicted[-1] == (0, 100)
+
+
+@pytest.mark.parametrize("policy", list(EvictionPolicy))
+def test_evictor_pinned_blocks_are_never_evicted(policy: EvictionPolicy):
+    evictor = make_evictor(policy)
+    evictor.pin(100)
+    evictor.add(0, content_hash=100, num_hashed_tokens=16, last_accessed=1.0)
+    evictor.add(1, content_hash=101, num_hashed_tokens=16, last_accessed=2.0)
+    evictor.add(2, content_hash=102, num_hashed_tokens=32, last_accessed=3.0)
+    # Pinning a hash also pins a block that is already in the evictor.
+    evictor.pin(102)
+
+    assert 0 in evictor and 2 in evictor
+    assert evictor.num_blocks == 1
+    evictor.update(0, 4.0)
+    assert evictor.evict() == (1, 101)
+    with pytest.raises(ValueError):
+        evictor.evict()
+
+    evictor.unpin(100)
+    assert evictor.num_blocks == 1
+    assert evictor.evict() == (0, 100)
+
+    # A pinned block can still be taken back into use.
+    evictor.remove(2)
+    assert 2 not in evictor
+    evictor.unpin(102)
+    assert evictor.num_blocks == 0
@@ -0,0 +1,26 @@
+import os
+
+from aphrodite.processing.prefix_cache_snapshot import (METADATA_FILE_NAME,
+                                                        load_metadata,
+                                                        remove_metadata,
+                                                        save_metadata)
+
+FINGERPRINT = {"model": "facebook/opt-125m", "block_size": 16, "dtype": "fp16"}
+
+
+def test_metadata_round_trip(tmp_path):
+    path = str(tmp_path)
+    assert load_metadata(path, FINGERPRINT) is None
+
+    blocks = [[(-123456789, 16), (987654321, 32)], []]
+    save_metadata(path, FINGERPRINT, blocks)
+    assert load_metadata(path, dict(FINGERPRINT)) == blocks
+
+    # A snapshot of another configuration is ignored.
+    assert load_metadata(path, {**FINGERPRINT, "block_size": 32}) is None
+
+    remove_metadata(path)
+    assert not os.path.exists(os.path.join(path, METADATA_FILE_NAME))
+    assert load_metadata(path, FINGERPRINT) is None
+    # Removing a missing snapshot is fine.
+    remove_metadata(path)
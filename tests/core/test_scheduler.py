@@ -9,6 +9,7 @@ from aphrodite.common.config import CacheConfig, LoRAConfig, SchedulerConfig
 from aphrodite.common.sequence import SequenceGroup, SequenceStatus
 from aphrodite.lora.request import LoRARequest
 from aphrodite.processing.interfaces import AllocStatus
+from aphrodite.processing.policy import PolicyFactory
 from aphrodite.processing.scheduler import Scheduler, SchedulingBudget
 
 from .utils import (append_new_token, append_new_token_seq_group,
@@ -287,14 +288,167 @@ def test_swapped_out_prioritized():
     assert out.blocks_to_swap_out == []
 
 
+def test_scheduler_priority_policy():
+    """Verify waiting requests are scheduled by priority, then arrival."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 16, policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    _, seq_group_a = create_dummy_prompt("1", block_size, priority=2)
+    _, seq_group_b = create_dummy_prompt("2", block_size, priority=0)
+    _, seq_group_c = create_dummy_prompt("3", block_size, priority=0)
+    for seq_group in (seq_group_a, seq_group_b, seq_group_c):
+        scheduler.add_seq_group(seq_group)
+
+    # Only two sequences fit, so the lowest priority request has to wait.
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_b, seq_group_c]
+    assert list(scheduler.waiting) == [seq_group_a]
+
+
+def test_scheduler_priority_preemption():
+    """Verify an urgent waiting request preempts a less urgent running
+    request when there is no KV cache space for it."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 16, policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 3
+    cache_config.num_gpu_blocks = 3
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    # Leaves a single free block, so B cannot be allocated next to A.
+    _, seq_group_a = create_dummy_prompt("1",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=1)
+    scheduler.add_seq_group(seq_group_a)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_a]
+    append_new_token(out, 1)
+
+    _, seq_group_b = create_dummy_prompt("2",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=0)
+    scheduler.add_seq_group(seq_group_b)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_b]
+    assert out.preempted == 1
+    assert list(scheduler.waiting) == [seq_group_a]
+    assert seq_group_a.get_seqs()[0].status == SequenceStatus.WAITING
+
+
+def test_scheduler_priority_no_preemption_for_unschedulable():
+    """Verify running requests are not preempted for an urgent waiting
+    request that can never be allocated."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 4, 64, policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    running = []
+    for i in range(3):
+        _, seq_group = create_dummy_prompt(str(i),
+                                           block_size,
+                                           block_size=block_size,
+                                           priority=5)
+        scheduler.add_seq_group(seq_group)
+        running.append(seq_group)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert set(get_sequence_groups(out)) == set(running)
+    append_new_token(out, 1)
+
+    # Needs 12 blocks, more than the whole KV cache.
+    _, seq_group = create_dummy_prompt("3",
+                                       block_size * 12,
+                                       block_size=block_size,
+                                       priority=0)
+    scheduler.add_seq_group(seq_group)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert out.preempted == 0
+    assert out.ignored_seq_groups == [seq_group]
+    assert set(get_sequence_groups(out)) == set(running)
+    assert not scheduler.waiting
+
+
+def test_scheduler_fcfs_does_not_preempt_for_waiting():
+    """The same setup as above does not preempt with the default policy."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64, 2, 16)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 3
+    cache_config.num_gpu_blocks = 3
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    _, seq_group_a = create_dummy_prompt("1",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=1)
+    scheduler.add_seq_group(seq_group_a)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    append_new_token(out, 1)
+
+    _, seq_group_b = create_dummy_prompt("2",
+                                         block_size * 2,
+                                         block_size=block_size,
+                                         priority=0)
+    scheduler.add_seq_group(seq_group_b)
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_a]
+    assert out.preempted == 0
+
+
+def test_scheduler_edf_policy():
+    scheduler = initialize_scheduler(policy="edf")
+    _, seq_group_a = create_dummy_prompt("1", 4)
+    _, seq_group_b = create_dummy_prompt("2", 4, deadline=10.0)
+    _, seq_group_c = create_dummy_prompt("3", 4, deadline=1.0)
+    for seq_group in (seq_group_a, seq_group_b, seq_group_c):
+        scheduler.add_seq_group(seq_group)
+
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert get_sequence_groups(out) == [seq_group_c, seq_group_b, seq_group_a]
+
+
+def test_fair_share_policy():
+    policy = PolicyFactory.get_policy("fair", tenant_weights={2: 2.0})
+    _, seq_group_a = create_dummy_prompt("1", 4)
+    _, seq_group_b = create_dummy_prompt(
+        "2", 4, lora_request=LoRARequest("lora", 2, "/fake"))
+    _, seq_group_c = create_dummy_prompt("3", 4)
+    now = time.time()
+    queue = deque([seq_group_a, seq_group_b, seq_group_c])
+
+    # No usage yet, so arrival order is kept.
+    assert list(policy.sort_by_priority(now, queue)) == list(queue)
+
+    # The base model tenant consumed more than the weighted LoRA tenant.
+    policy.update(seq_group_a, 8)
+    policy.update(seq_group_b, 8)
+    assert list(policy.sort_by_priority(now, queue)) == [
+        seq_group_b, seq_group_a, seq_group_c
+    ]
+
+    with pytest.raises(ValueError):
+        PolicyFactory.get_policy("unknown")
+
+
 def initialize_scheduler(*,
                          max_num_seqs=1000,
                          max_token_budget=1000,
                          max_model_len=1000,
-                         lora_config=None):
+                         lora_config=None,
+                         policy="fcfs"):
     block_size = 4
-    scheduler_config = SchedulerConfig(max_token_budget, max_num_seqs,
-                                       max_model_len)
+    scheduler_config = SchedulerConfig(max_token_budget,
+                                       max_num_seqs,
+                                       max_model_len,
+                                       policy=policy)
     cache_config = CacheConfig(block_size, 1.0, 1, "auto")
     cache_config.num_cpu_blocks = 8
     cache_config.num_gpu_blocks = 8
@@ -1,14 +1,22 @@
 # This unit test should be moved to a new
 # tests/test_guided_decoding directory.
+import os
+import pickle
+import stat
+import threading
+import time
+
 import pytest
 import torch
+from outlines.fsm.guide import RegexGuide
 from transformers import AutoTokenizer
 
 from aphrodite.endpoints.openai.protocol import CompletionRequest
 from aphrodite.modeling.guided_decoding import (
     get_guided_decoding_logits_processor)
+from aphrodite.modeling.guided_decoding.outlines_guide_cache import GuideCache
 from aphrodite.modeling.guided_decoding.outlines_logits_processors import (
-    JSONLogitsProcessor, RegexLogitsProcessor)
+    JSONLogitsProcessor, RegexLogitsProcessor, _adapt_tokenizer)
 
 
 def test_guided_logits_processors(sample_regex, sample_json_schema):
@@ -37,6 +45,33 @@ def test_guided_logits_processors(sample_regex, sample_json_schema):
     assert not torch.allclose(tensor, original_tensor)
 
 
+def test_guided_logits_processor_seq_state(sample_regex):
+    """Verify that the FSM state kept by sequence id gives the same logits
+    as the state computed from all the tokens, for a sequence advanced one
+    token at a time and for a sequence seen for the first time."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    regex_LP = RegexLogitsProcessor(sample_regex, tokenizer)
+    token_ids = tokenizer.encode("192.168.1.1", add_special_tokens=False)
+
+    def check(input_ids, seq_id):
+        tensor = torch.rand(32000)
+        expected = regex_LP(input_ids, tensor.clone())
+        assert torch.equal(regex_LP(input_ids, tensor.clone(), seq_id=seq_id),
+                           expected)
+
+    for num_tokens in range(len(token_ids) + 1):
+        check(token_ids[:num_tokens], seq_id=0)
+    # E.g. forked from sequence 0.
+    check(token_ids[:2], seq_id=1)
+    check(token_ids[:3], seq_id=1)
+    # The sequence id reused for other tokens of the same length, e.g. by
+    # the temporary sequences of speculative decoding.
+    other_token_ids = tokenizer.encode("10.0.0.255", add_special_tokens=False)
+    check(token_ids[:2], seq_id=2)
+    check(other_token_ids[:2], seq_id=2)
+    check(other_token_ids[:3], seq_id=2)
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("backend", ["outlines", "lm-format-enforcer"])
 async def test_guided_logits_processor_black_box(backend: str, sample_regex,
@@ -70,3 +105,107 @@ async def test_guided_logits_processor_black_box(backend: str, sample_regex,
     tensor = json_lp(token_ids, tensor)
     assert tensor.shape == original_tensor.shape
     assert not torch.allclose(tensor, original_tensor)
+
+
+def test_allowed_tokens_masks_shared_after_pickling(sample_regex):
+    """Processors unpickled from different requests, as the OpenAI server
+    does, share the allowed tokens masks of their guide."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    processors = [
+        pickle.loads(
+            pickle.dumps(RegexLogitsProcessor(sample_regex, tokenizer)))
+        for _ in range(2)
+    ]
+    assert processors[0]._guide is not processors[1]._guide
+    masks = [
+        processor.get_allowed_tokens_mask([], 32000)
+        for processor in processors
+    ]
+    assert masks[0] is masks[1]
+
+
+def test_guide_cache(sample_regex, tmp_path):
+    """Guides are compiled once, then found in memory, then on disk."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    compiled = []
+
+    def get_guide(cache: GuideCache, regex: str) -> RegexGuide:
+
+        def compile_guide():
+            compiled.append(regex)
+            return RegexGuide(regex, _adapt_tokenizer(tokenizer))
+
+        return cache.get("regex", regex, tokenizer, compile_guide,
+                         persist=True)
+
+    def assert_same_guide(loaded: RegexGuide, guide: RegexGuide):
+        assert loaded is not guide
+        assert loaded.states_to_token_maps == guide.states_to_token_maps
+        assert loaded.final_states == guide.final_states
+        assert loaded.eos_token_id == guide.eos_token_id
+        assert (loaded.get_next_instruction(loaded.initial_state).tokens ==
+                guide.get_next_instruction(guide.initial_state).tokens)
+
+    cache = GuideCache(max_size=1, cache_dir=str(tmp_path))
+    guide = get_guide(cache, sample_regex)
+    assert isinstance(guide, RegexGuide)
+    assert get_guide(cache, sample_regex) is guide
+    assert compiled == [sample_regex]
+
+    # Evicted from memory by another guide, but loaded back from disk.
+    get_guide(cache, "[0-9]+")
+    assert compiled == [sample_regex, "[0-9]+"]
+    assert_same_guide(get_guide(cache, sample_regex), guide)
+    assert compiled == [sample_regex, "[0-9]+"]
+
+    # A new cache, as after a restart, finds it on disk too.
+    cache = GuideCache(max_size=1, cache_dir=str(tmp_path))
+    assert_same_guide(get_guide(cache, sample_regex), guide)
+    assert compiled == [sample_regex, "[0-9]+"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Needs POSIX permissions")
+def test_guide_cache_dir_permissions(sample_regex, tmp_path):
+    """The cache directory is created private, and a directory other users
+    can write to is not used."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    cache_dir = tmp_path / "guides"
+    cache = GuideCache(max_size=1, cache_dir=str(cache_dir))
+    cache.get("regex", sample_regex, tokenizer, lambda: {}, persist=True)
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+    assert len(list(cache_dir.iterdir())) == 1
+
+    shared_dir = tmp_path / "shared"
+    shared_dir.mkdir()
+    shared_dir.chmod(0o777)
+    cache = GuideCache(max_size=1, cache_dir=str(shared_dir))
+    cache.get("regex", sample_regex, tokenizer, lambda: {}, persist=True)
+    assert cache.cache_dir is None
+    assert not list(shared_dir.iterdir())
+
+
+def test_guide_cache_compiles_once(sample_regex):
+    """Threads asking for the same guide at once compile it once."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    compiled = []
+
+    def compile_guide():
+        compiled.append(sample_regex)
+        time.sleep(0.1)
+        return {"regex": sample_regex}
+
+    cache = GuideCache(max_size=1)
+    guides = []
+    threads = [
+        threading.Thread(target=lambda: guides.append(
+            cache.get("regex", sample_regex, tokenizer, compile_guide)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(compiled) == 1
+    assert all(guide is guides[0] for guide in guides)
+    # The lock of the guide is dropped once its last user is done.
+    assert not cache._compile_locks
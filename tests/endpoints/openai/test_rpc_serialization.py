@@ -0,0 +1,163 @@
+from array import array
+from collections import defaultdict
+
+from aphrodite.common.outputs import CompletionOutput, RequestOutput
+from aphrodite.common.sampling_params import SamplingParams
+from aphrodite.common.sequence import Logprob, RequestMetrics
+from aphrodite.endpoints.openai.rpc import (RequestOutputAccumulator,
+                                            RequestOutputDeltaTracker,
+                                            RPCAbortRequest,
+                                            RPCGenerateRequest,
+                                            RPCUtilityRequest,
+                                            decode_output_frame,
+                                            decode_rpc_request,
+                                            encode_output_frame,
+                                            encode_rpc_request)
+from aphrodite.lora.request import LoRARequest
+
+
+def _logits_processor(token_ids, logits):
+    return logits
+
+
+def test_rpc_request_round_trip():
+    request = RPCGenerateRequest(
+        inputs={"prompt_token_ids": [1, 2, 3]},
+        sampling_params=SamplingParams(temperature=0.5,
+                                       max_tokens=16,
+                                       stop=["\n"]),
+        request_id="request-0",
+        lora_request=LoRARequest("adapter", 1, lora_path="/path/to/adapter"),
+    )
+    decoded = decode_rpc_request(encode_rpc_request(request))
+    assert isinstance(decoded, RPCGenerateRequest)
+    assert decoded == request
+
+    # Values without a schema are still supported.
+    request.sampling_params.logits_processors = [_logits_processor]
+    decoded = decode_rpc_request(encode_rpc_request(request))
+    assert decoded.sampling_params.logits_processors == [_logits_processor]
+
+    assert decode_rpc_request(encode_rpc_request(
+        RPCAbortRequest("request-0"))) == RPCAbortRequest("request-0")
+    for utility_request in RPCUtilityRequest:
+        assert decode_rpc_request(
+            encode_rpc_request(utility_request)) is utility_request
+
+
+def _make_output(request_id, token_ids, text, finished=False):
+    return RequestOutput(
+        request_id=request_id,
+        prompt="Hello",
+        prompt_token_ids=[1, 2],
+        prompt_logprobs=[None, {
+            2: Logprob(-0.25, rank=1, decoded_token=" world")
+        }],
+        outputs=[
+            CompletionOutput(
+                index=0,
+                text=text,
+                token_ids=array("l", token_ids),
+                cumulative_logprob=-0.5 * len(token_ids),
+                logprobs=[{
+                    token_id: Logprob(-0.5)
+                } for token_id in token_ids],
+                finish_reason="stop" if finished else None,
+                stop_reason=token_ids[-1] if finished else None)
+        ],
+        finished=finished,
+        metrics=RequestMetrics(arrival_time=1.0,
+                               last_token_time=2.0,
+                               first_scheduled_time=1.5,
+                               first_token_time=None,
+                               time_in_queue=0.5),
+    )
+
+
+def _stream(steps, use_beam_search=False):
+    """Sends the outputs of each step in one frame and returns the outputs
+    rebuilt by the client, as they were when received."""
+    trackers = defaultdict(
+        lambda: RequestOutputDeltaTracker(use_beam_search))
+    accumulators = defaultdict(RequestOutputAccumulator)
+    received = []
+    for outputs in steps:
+        deltas = [
+            trackers[output.request_id].get_delta(output)
+            for output in outputs
+        ]
+        frame = decode_output_frame(encode_output_frame(deltas, {}))
+        assert not frame.errors
+        received.append([
+            repr(accumulators[delta.request_id].add(delta))
+            for delta in frame.outputs
+        ])
+    return received
+
+
+def _as_sent(output):
+    # Token id arrays are sent as lists.
+    for completion in output.outputs:
+        completion.token_ids = list(completion.token_ids)
+    return repr(output)
+
+
+def test_output_frame_round_trip():
+    steps = [
+        [_make_output("a", [3], " the"),
+         _make_output("b", [5], " a")],
+        [_make_output("a", [3, 4], " there")],
+        [
+            _make_output("a", [3, 4, 6], " there!", finished=True),
+            _make_output("b", [5, 7], " ab", finished=True)
+        ],
+    ]
+    received = _stream(steps)
+    for outputs, received_outputs in zip(steps, received):
+        assert received_outputs == [_as_sent(output) for output in outputs]
+
+    # Only the new tokens are sent after the first frame.
+    tracker = RequestOutputDeltaTracker()
+    tracker.get_delta(_make_output("a", [3], " the"))
+    delta = tracker.get_delta(_make_output("a", [3, 4], " there"))
+    request_id, completions, finished, _, reset, prompt_logprobs = delta
+    assert (request_id, finished, reset, prompt_logprobs) == ("a", False,
+                                                              False, None)
+    assert completions[0][1:3] == ("re", array("l", [4]))
+
+
+def test_output_frame_reset():
+    # Beam search replaces its outputs.
+    steps = [[_make_output("a", [3, 4], " there")],
+             [_make_output("a", [5, 6, 7], " b c")]]
+    received = _stream(steps, use_beam_search=True)
+    assert received[1][0] == _as_sent(steps[1][0])
+
+    # So does an output that got shorter.
+    steps = [[_make_output("a", [3, 4], " there")],
+             [_make_output("a", [3], " the")]]
+    received = _stream(steps)
+    assert received[1][0] == _as_sent(steps[1][0])
+
+
+def test_output_frame_errors():
+    tracker = RequestOutputDeltaTracker()
+    frame = decode_output_frame(
+        encode_output_frame([tracker.get_delta(_make_output("a", [3], "a"))],
+                            {"b": ValueError("failed")}))
+    assert [delta.request_id for delta in frame.outputs] == ["a"]
+    assert isinstance(frame.errors["b"], ValueError)
+    assert str(frame.errors["b"]) == "failed"
+
+
+def test_output_frame_delta_outputs():
+    # Outputs of RequestOutputKind.DELTA requests are sent as is.
+    tracker = RequestOutputDeltaTracker(delta_outputs=True)
+    accumulator = RequestOutputAccumulator(delta_outputs=True)
+    for output in [
+            _make_output("a", [3], " the"),
+            _make_output("a", [4], "re", finished=True)
+    ]:
+        frame = decode_output_frame(
+            encode_output_frame([tracker.get_delta(output)], {}))
+        assert repr(accumulator.add(frame.outputs[0])) == _as_sent(output)
@@ -0,0 +1,195 @@
+from unittest.mock import MagicMock
+
+import pytest
+from transformers import PreTrainedTokenizer
+
+from aphrodite.common.config import SchedulerConfig
+from aphrodite.common.sampling_params import SamplingParams
+from aphrodite.common.sequence import (CompletionSequenceGroupOutput, Logprob,
+                                       SequenceOutput, SequenceStatus)
+from aphrodite.common.utils import Counter
+from aphrodite.engine.output_processor.single_step import (
+    SingleStepOutputProcessor)
+from aphrodite.engine.output_processor.stop_checker import StopChecker
+from aphrodite.processing.scheduler import Scheduler
+from aphrodite.transformers_utils.detokenizer import Detokenizer
+
+from ...core.utils import create_seq_group
+
+
+def decode_new_token(seq, prms, tokenizer=None):
+    # Each token id is decoded as one letter.
+    return chr(ord("a") + seq.get_last_token_id())
+
+
+def create_output_processor(detokenizer_pool_size: int,
+                            async_output_proc: bool = False):
+    detokenizer = MagicMock(spec=Detokenizer)
+    detokenizer.decode_new_token.side_effect = decode_new_token
+
+    def decode_sequence_inplace(seq, prms):
+        new_text = decode_new_token(seq, prms)
+        seq.output_text += new_text
+        return len(new_text)
+
+    detokenizer.decode_sequence_inplace.side_effect = decode_sequence_inplace
+    scheduler_config = SchedulerConfig(
+        max_num_batched_tokens=2048,
+        max_num_seqs=8,
+        max_model_len=2048,
+        detokenizer_pool_size=detokenizer_pool_size,
+        async_output_proc=async_output_proc)
+    stop_checker = StopChecker(
+        max_model_len=2048,
+        get_tokenizer_for_seq=lambda _: MagicMock(spec=PreTrainedTokenizer))
+    return SingleStepOutputProcessor(scheduler_config, detokenizer,
+                                     [MagicMock(spec=Scheduler)], Counter(),
+                                     stop_checker)
+
+
+def create_output(seq, token_id: int):
+    return CompletionSequenceGroupOutput(
+        samples=[
+            SequenceOutput(
+                parent_seq_id=seq.seq_id,
+                output_token=token_id,
+                logprobs={token_id: Logprob(0.0)},
+            )
+        ],
+        prompt_logprobs=None,
+    )
+
+
+@pytest.mark.parametrize("detokenizer_pool_size", [0, 2])
+@pytest.mark.skip_global_cleanup
+def test_stop_string_with_detokenizer_pool(detokenizer_pool_size: int):
+    """Verify that a stop string matched one step late with the detokenizer
+    pool gives the same output as when it is matched on the engine thread.
+    """
+    output_processor = create_output_processor(detokenizer_pool_size)
+    seq_group = create_seq_group(
+        seq_prompt_len=4,
+        seq_output_lens=[0],
+        sampling_params=SamplingParams(stop=["cd"], ignore_eos=True),
+    )
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    for token_id in range(8):
+        output_processor.process_outputs(seq_group,
+                                         [create_output(seq, token_id)])
+        if seq.is_finished():
+            break
+
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.stop_reason == "cd"
+    assert seq.output_text == "ab"
+    # The token after the stop string is dropped.
+    assert list(seq.get_output_token_ids()) == [0, 1, 2, 3]
+
+
+@pytest.mark.skip_global_cleanup
+def test_last_token_detokenized_with_detokenizer_pool():
+    """Verify that the text of the last token of a sequence is in its output
+    with the detokenizer pool.
+    """
+    output_processor = create_output_processor(detokenizer_pool_size=1)
+    seq_group = create_seq_group(
+        seq_prompt_len=4,
+        seq_output_lens=[0],
+        sampling_params=SamplingParams(max_tokens=4, ignore_eos=True),
+    )
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    for token_id in range(4):
+        output_processor.process_outputs(seq_group,
+                                         [create_output(seq, token_id)])
+
+    assert seq.status == SequenceStatus.FINISHED_LENGTH_CAPPED
+    assert seq.pending_token_text is None
+    assert seq.output_text == "abcd"
+
+
+@pytest.mark.skip_global_cleanup
+def test_detokenizer_pool_tokenizer_copies():
+    """Verify that each detokenizer worker decodes with its own copy of the
+    tokenizer, never the one shared with the engine thread, and that the
+    workers are stopped on shutdown.
+    """
+    output_processor = create_output_processor(detokenizer_pool_size=2)
+    detokenizer = output_processor.detokenizer
+    shared_tokenizer = MagicMock()
+    detokenizer.get_tokenizer_for_seq.return_value = shared_tokenizer
+    used_tokenizers = {}
+
+    def record_decode_new_token(seq, prms, tokenizer=None):
+        used_tokenizers.setdefault(seq.seq_id, set()).add(id(tokenizer))
+        return decode_new_token(seq, prms)
+
+    detokenizer.decode_new_token.side_effect = record_decode_new_token
+
+    seq_groups = [
+        create_seq_group(
+            seq_prompt_len=4,
+            seq_output_lens=[0],
+            request_id=str(seq_id),
+            seq_id_start=seq_id,
+            sampling_params=SamplingParams(max_tokens=8, ignore_eos=True),
+        ) for seq_id in range(2)
+    ]
+    for token_id in range(4):
+        for seq_group in seq_groups:
+            seq = seq_group.get_seqs()[0]
+            seq.status = SequenceStatus.RUNNING
+            output_processor.process_outputs(seq_group,
+                                             [create_output(seq, token_id)])
+    for seq_group in seq_groups:
+        seq_group.get_seqs()[0].pending_token_text.result()
+
+    # Each sequence always goes to the same worker, whose copy of the
+    # tokenizer is not used by the other worker.
+    assert len(used_tokenizers[0]) == len(used_tokenizers[1]) == 1
+    assert used_tokenizers[0] != used_tokenizers[1]
+    assert id(shared_tokenizer) not in used_tokenizers[0] | used_tokenizers[1]
+
+    workers = output_processor.detokenizer_pool
+    output_processor.shutdown()
+    assert not output_processor.detokenizer_pool
+    for worker in workers:
+        with pytest.raises(RuntimeError):
+            worker.executor.submit(lambda: None)
+
+
+@pytest.mark.skip_global_cleanup
+def test_stop_string_with_async_output_proc():
+    """Verify that with asynchronous output processing a stop string is
+    matched by process_deferred_outputs, and the token of the next step is
+    dropped.
+    """
+    output_processor = create_output_processor(detokenizer_pool_size=0,
+                                               async_output_proc=True)
+    seq_group = create_seq_group(
+        seq_prompt_len=4,
+        seq_output_lens=[0],
+        sampling_params=SamplingParams(stop=["cd"], ignore_eos=True),
+    )
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+
+    for token_id in range(4):
+        output_processor.process_outputs(seq_group,
+                                         [create_output(seq, token_id)])
+        assert seq.output_text == "abcd"[:token_id]
+        stopped_seq_groups = output_processor.process_deferred_outputs()
+        if token_id < 3:
+            assert seq.output_text == "abcd"[:token_id + 1]
+            assert not stopped_seq_groups
+    assert stopped_seq_groups == [seq_group]
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.output_text == "ab"
+
+    # The token of the step that ran meanwhile is dropped.
+    output_processor.process_outputs(seq_group, [create_output(seq, 4)])
+    assert list(seq.get_output_token_ids()) == [0, 1, 2, 3]
+    assert not output_processor.process_deferred_outputs()
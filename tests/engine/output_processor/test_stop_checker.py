@@ -1,3 +1,5 @@
+import random
+from typing import List
 from unittest.mock import MagicMock
 
 import pytest
@@ -83,3 +85,87 @@ def test_stop_on_eos_token(text_wo_eos: str, eos_token: str, eos_token_id: int,
     else:
         assert seq.status == SequenceStatus.FINISHED_STOPPED
         assert seq.output_text == text_wo_eos
+
+
+def _reference_check_stop_strings(text: str, new_char_count: int,
+                                  stop: List[str],
+                                  include_stop_str_in_output: bool):
+    """Checks the stop strings one at a time."""
+    if not new_char_count:
+        return None, text
+    for stop_str in stop:
+        stop_index = text.find(stop_str, -new_char_count - len(stop_str))
+        if stop_index == -1:
+            continue
+        if include_stop_str_in_output:
+            stop_index += len(stop_str)
+        return stop_str, text[:stop_index]
+    return None, text
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("include_stop_str_in_output", [True, False])
+@pytest.mark.skip_global_cleanup
+def test_stop_strings(seed: int, include_stop_str_in_output: bool):
+    random.seed(seed)
+    stop = list({
+        "".join(random.choices("abc", k=random.randint(1, 4)))
+        for _ in range(random.randint(1, 30))
+    })
+    sampling_params = SamplingParams(
+        stop=stop, include_stop_str_in_output=include_stop_str_in_output)
+    seq = Sequence(seq_id=0,
+                   inputs={"prompt_token_ids": [0]},
+                   block_size=16)
+
+    text = ""
+    while True:
+        new_text = "".join(random.choices("abcd", k=random.randint(0, 3)))
+        text += new_text
+        seq.output_text = text
+        # Occasionally skip a check, as done with min_tokens.
+        if random.random() < 0.1:
+            continue
+        stop_str = StopChecker._check_stop_strings(seq, len(new_text),
+                                                   sampling_params)
+        expected_stop_str, expected_text = _reference_check_stop_strings(
+            text, len(new_text), stop, include_stop_str_in_output)
+        assert stop_str == expected_stop_str
+        assert seq.output_text == expected_text
+        if stop_str is not None:
+            break
+
+
+@pytest.mark.parametrize("include_stop_str_in_output", [True, False])
+@pytest.mark.skip_global_cleanup
+def test_stop_token_sequences(include_stop_str_in_output: bool):
+    tokenizer = MagicMock(spec=PreTrainedTokenizer)
+    tokenizer.decode.return_value = " B C"
+    stop_checker = StopChecker(
+        max_model_len=1024,
+        get_tokenizer_for_seq=MagicMock(return_value=tokenizer))
+    sampling_params = SamplingParams(
+        stop_token_sequences=[[5, 6, 7], [2, 3], [1, 2, 3, 4]],
+        min_tokens=2,
+        include_stop_str_in_output=include_stop_str_in_output)
+    seq = Sequence(seq_id=0,
+                   inputs={"prompt_token_ids": [2]},
+                   block_size=16,
+                   eos_token_id=0)
+
+    # The prompt is not part of the stop token sequences, and the first
+    # token is not checked because of min_tokens.
+    for token_id, text in [(3, " A"), (1, " Z"), (2, " B"), (3, " C")]:
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        seq.output_text += text
+        assert seq.status == SequenceStatus.WAITING
+        stop_checker.maybe_stop_sequence(seq, len(text), sampling_params)
+
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.stop_reason == 3
+    if include_stop_str_in_output:
+        assert seq.output_text == " A Z B C"
+    else:
+        tokenizer.decode.assert_called_once_with([2, 3],
+                                                 skip_special_tokens=True)
+        assert seq.output_text == " A Z"
@@ -1,8 +1,9 @@
-# Test the AsyncLLMEngine with multi-step-decoding
+# Test the AsyncLLMEngine and the LLM class with multi-step-decoding
 from typing import List
 
 import pytest
 
+from ..models.utils import check_outputs_equal
 from ..utils import RemoteOpenAIServer
 
 MODELS = [
@@ -90,3 +91,46 @@ async def test_multi_step(
     ref_generations = get_text_generations(ref_completions)
     test_generations = get_text_generations(test_completions)
     assert ref_generations == test_generations
+
+
+@pytest.mark.parametrize("model", MODELS)
+@pytest.mark.parametrize(
+    ("tp_size, pp_size"),
+    [
+        (1, 1),
+        (2, 2),
+    ],
+)
+@pytest.mark.parametrize("num_scheduler_steps", NUM_SCHEDULER_STEPS)
+@pytest.mark.parametrize("max_tokens", [5])
+def test_multi_step_llm(
+    aphrodite_runner,
+    example_prompts,
+    model: str,
+    tp_size: int,
+    pp_size: int,
+    num_scheduler_steps: int,
+    max_tokens: int,
+):
+    """Test the synchronous engine, used by the LLM class, with multi-step
+    decoding and pipeline parallelism."""
+    distributed_args = dict(tensor_parallel_size=tp_size,
+                            pipeline_parallel_size=pp_size,
+                            distributed_executor_backend="mp",
+                            use_v2_block_manager=True,
+                            enforce_eager=True)
+    with aphrodite_runner(model, **distributed_args) as aphrodite_model:
+        ref_outputs = aphrodite_model.generate_greedy(example_prompts,
+                                                      max_tokens)
+    with aphrodite_runner(model,
+                          num_scheduler_steps=num_scheduler_steps,
+                          **distributed_args) as aphrodite_model:
+        test_outputs = aphrodite_model.generate_greedy(example_prompts,
+                                                       max_tokens)
+
+    check_outputs_equal(
+        outputs_0_lst=ref_outputs,
+        outputs_1_lst=test_outputs,
+        name_0="single_step",
+        name_1="multi_step",
+    )
@@ -0,0 +1,102 @@
+import random
+from typing import List
+
+import pytest
+import torch
+
+from aphrodite.modeling.layers.sampler import _apply_dry
+
+VOCAB_SIZE = 16
+MAX_NGRAM = 100
+
+
+def _dry_penalties(token_seq: List[int], multiplier: float, base: float,
+                   allowed_length: int, breakers: List[int],
+                   range_limit: int) -> List[float]:
+    """Reference DRY penalties of one sequence."""
+    penalties = [0.0] * VOCAB_SIZE
+    if multiplier == 0:
+        return penalties
+    if range_limit:
+        token_seq = token_seq[-range_limit:]
+    is_break = [token in breakers for token in token_seq]
+    if is_break[-1]:
+        return penalties
+
+    max_ngram = 0
+    for max_ngram in range(min(len(token_seq), MAX_NGRAM + 1)):
+        if is_break[-max_ngram - 1]:
+            break
+    if max_ngram <= allowed_length:
+        return penalties
+
+    ngram_lens = [0] * VOCAB_SIZE
+    for idx in range(len(token_seq) - 1):
+        if token_seq[idx] != token_seq[-1]:
+            continue
+        unwind = 0
+        for unwind in range(1, min(idx, max_ngram) + 1):
+            if (is_break[idx - unwind]
+                    or token_seq[idx - unwind] != token_seq[-unwind - 1]):
+                break
+        next_tok = token_seq[idx + 1]
+        ngram_lens[next_tok] = max(ngram_lens[next_tok], unwind + 1)
+
+    for token, ngram_len in enumerate(ngram_lens):
+        if ngram_len > 0:
+            penalties[token] = multiplier * base**(ngram_len - allowed_length)
+    return penalties
+
+
+def _pad(seqs: List[List[int]]) -> torch.Tensor:
+    width = max(len(seq) for seq in seqs)
+    return torch.tensor([seq + [VOCAB_SIZE] * (width - len(seq))
+                         for seq in seqs])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_apply_dry(seed: int):
+    rng = random.Random(seed)
+    batch_size = 8
+    # Few distinct tokens so that long repetitions are common.
+    num_tokens = rng.randint(2, VOCAB_SIZE)
+    prompts, outputs, token_seqs = [], [], []
+    for _ in range(batch_size):
+        prompt = [rng.randrange(num_tokens) for _ in range(rng.randint(1, 60))]
+        output = [rng.randrange(num_tokens) for _ in range(rng.randint(0, 60))]
+        if rng.random() < 0.3:
+            # A long exact repetition, longer than MAX_NGRAM.
+            output = prompt * (MAX_NGRAM // len(prompt) + 2)
+        prompts.append(prompt)
+        outputs.append(output)
+        token_seqs.append(prompt + output)
+    multipliers = [rng.choice([0.0, 0.8, 1.5]) for _ in range(batch_size)]
+    bases = [rng.choice([1.75, 2.0]) for _ in range(batch_size)]
+    allowed_lengths = [rng.randint(0, 4) for _ in range(batch_size)]
+    breakers = [
+        rng.sample(range(num_tokens), rng.randint(0, 2))
+        for _ in range(batch_size)
+    ]
+    ranges = [rng.choice([0, 0, 5, 40, 500]) for _ in range(batch_size)]
+
+    # The breakers are padded with token 0 like in SamplingTensors, which
+    # makes 0 a breaker of the shorter lists.
+    breaker_width = max(len(b) for b in breakers)
+    breakers_t = torch.tensor([
+        b + [0] * (breaker_width - len(b)) for b in breakers
+    ]).reshape(batch_size, breaker_width)
+    breakers = [b + [0] if len(b) < breaker_width else b for b in breakers]
+
+    logits = torch.randn(batch_size, VOCAB_SIZE, dtype=torch.float64)
+    expected = logits - torch.tensor([
+        _dry_penalties(*args) for args in zip(token_seqs, multipliers, bases,
+                                              allowed_lengths, breakers,
+                                              ranges)
+    ], dtype=torch.float64)
+
+    actual = _apply_dry(logits.clone(), _pad(prompts), _pad(outputs),
+                        torch.tensor(multipliers, dtype=torch.float64),
+                        torch.tensor(bases, dtype=torch.float64),
+                        torch.tensor(allowed_lengths, dtype=torch.int),
+                        breakers_t, torch.tensor(ranges, dtype=torch.int))
+    torch.testing.assert_close(actual, expected)
@@ -9,11 +9,15 @@ import pytest
 import torch
 from transformers import GenerationConfig, GenerationMixin
 
-from aphrodite.common.sequence import (SamplingParams, SequenceData,
+import aphrodite.modeling.layers.sampler as sampler_module
+from aphrodite.common.sequence import (Logprob, SamplingParams, SequenceData,
                                        SequenceGroupMetadata)
 from aphrodite.common.utils import Counter, is_pin_memory_available
 from aphrodite.constants import APHRODITE_TOKEN_ID_ARRAY_TYPE
-from aphrodite.modeling.layers.sampler import Sampler
+from aphrodite.modeling.layers.sampler import (Sampler, SamplerID,
+                                               _apply_no_repeat_ngram,
+                                               _get_logprobs,
+                                               _get_no_repeat_ngram_bans)
 from aphrodite.modeling.sampling_metadata import SamplingMetadata
 from aphrodite.modeling.utils import set_random_seed
 
@@ -805,6 +809,145 @@ def test_sampler_no_repeat_ngram(seed: int, device: str):
         "No-repeat-ngram sampling is not deterministic with same seed"
 
 
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_sampler_priority_mixed(device: str):
+    """Requests with different sampler orders in one batch get the same
+    probabilities as when they are sampled alone."""
+    set_random_seed(0)
+    vocab_size = 64
+    fake_logits = torch.randn(4, vocab_size, device=device)
+    reversed_order = [sampler_id.name for sampler_id in reversed(SamplerID)]
+    sampling_params = [
+        SamplingParams(temperature=2.0, min_p=0.2, repetition_penalty=1.3),
+        SamplingParams(temperature=0.5, min_p=0.2, temperature_last=True),
+        SamplingParams(temperature=0.7,
+                       top_k=5,
+                       sampler_priority=reversed_order),
+        SamplingParams(temperature=1.3,
+                       presence_penalty=1.0,
+                       no_repeat_ngram_size=2),
+    ]
+
+    def get_probs(rows: List[int]) -> torch.Tensor:
+        seq_group_metadata_list = [
+            SequenceGroupMetadata(
+                request_id=f"test_{i}",
+                is_prompt=True,
+                seq_data={
+                    0:
+                    SequenceData(
+                        array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
+                              [1, 2, 3, 1, 2, 5, 1, 2]))
+                },
+                sampling_params=sampling_params[i],
+                block_tables={0: [1]},
+            ) for i in rows
+        ]
+        seq_lens = [8] * len(rows)
+        sampling_metadata = SamplingMetadata.prepare(
+            seq_group_metadata_list,
+            seq_lens,
+            query_lens=seq_lens,
+            device=device,
+            pin_memory=is_pin_memory_available())
+        sampler = Sampler()
+        sampler.include_gpu_probs_tensor = True
+        sampler_output = sampler(logits=fake_logits[rows].clone(),
+                                 sampling_metadata=sampling_metadata)
+        return sampler_output.sampled_token_probs
+
+    probs = get_probs(list(range(len(sampling_params))))
+    for i in range(len(sampling_params)):
+        torch.testing.assert_close(probs[i], get_probs([i])[0])
+
+
+def test_apply_no_repeat_ngram():
+    # (token ids, no_repeat_ngram_size, banned tokens)
+    cases = [
+        ([1, 2, 3, 1, 2], 3, [3]),
+        ([4, 5, 4, 6, 4], 2, [5, 6]),
+        ([1, 2, 3], 2, []),
+        ([1, 1, 1], 0, []),
+        ([7, 7], 1, [7]),
+    ]
+    seq_group_metadata_list = [
+        SequenceGroupMetadata(
+            request_id=f"test_{i}",
+            is_prompt=True,
+            seq_data={
+                0: SequenceData(array(APHRODITE_TOKEN_ID_ARRAY_TYPE, tokens))
+            },
+            sampling_params=SamplingParams(no_repeat_ngram_size=ngram_size),
+            block_tables={0: [1]},
+        ) for i, (tokens, ngram_size, _) in enumerate(cases)
+    ]
+    seq_lens = [len(tokens) for tokens, _, _ in cases]
+    sampling_metadata = SamplingMetadata.prepare(seq_group_metadata_list,
+                                                 seq_lens,
+                                                 query_lens=seq_lens,
+                                                 device="cpu",
+                                                 pin_memory=False)
+
+    logits = _apply_no_repeat_ngram(
+        torch.zeros(len(cases), 8),
+        _get_no_repeat_ngram_bans(sampling_metadata, torch.device("cpu")))
+    for row, (_, _, banned) in zip(logits, cases):
+        assert torch.isinf(row).nonzero().flatten().tolist() == banned
+
+
+def test_get_logprobs(monkeypatch):
+    # Compare a few rows at a time.
+    monkeypatch.setattr(sampler_module, "_RANKS_CHUNK_NUMEL", 3 * VOCAB_SIZE)
+    prompt = [1, 2, 3, 4, 5, 6, 7]
+    seq_group_metadata_list = [
+        SequenceGroupMetadata(
+            request_id="prompt",
+            is_prompt=True,
+            seq_data={0: SequenceData(array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
+                                            prompt))},
+            sampling_params=SamplingParams(prompt_logprobs=2, logprobs=3),
+            block_tables={0: [1]},
+        ),
+        SequenceGroupMetadata(
+            request_id="decode",
+            is_prompt=False,
+            seq_data={1: SequenceData(array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
+                                            prompt))},
+            sampling_params=SamplingParams(logprobs=0),
+            block_tables={1: [1]},
+        ),
+    ]
+    sampling_metadata = SamplingMetadata.prepare(seq_group_metadata_list,
+                                                 [len(prompt), len(prompt)],
+                                                 query_lens=[len(prompt), 1],
+                                                 device="cpu",
+                                                 pin_memory=False)
+    logprobs = torch.log_softmax(torch.randn(len(prompt) + 1, VOCAB_SIZE),
+                                 dim=-1)
+    sample_results = [([10], [0]), ([20], [0])]
+    prompt_logprobs, sample_logprobs = _get_logprobs(logprobs,
+                                                     sampling_metadata,
+                                                     sample_results)
+
+    def expected_logprobs(row: int, token_id: int, num_logprobs: int):
+        row_logprobs = logprobs[row]
+        rank = int((row_logprobs > row_logprobs[token_id]).sum()) + 1
+        expected = {token_id: Logprob(row_logprobs[token_id].item(), rank)}
+        top_logprobs, top_token_ids = row_logprobs.topk(num_logprobs)
+        for i, (logprob, top_id) in enumerate(
+                zip(top_logprobs.tolist(), top_token_ids.tolist())):
+            expected[top_id] = Logprob(logprob, i + 1)
+        return expected
+
+    assert prompt_logprobs[0] == [
+        expected_logprobs(row, token_id, 2)
+        for row, token_id in enumerate(prompt[1:])
+    ]
+    assert prompt_logprobs[1] is None
+    assert sample_logprobs == [[expected_logprobs(len(prompt) - 1, 10, 3)],
+                               [expected_logprobs(len(prompt), 20, 0)]]
+
+
 @pytest.mark.parametrize("device", CUDA_DEVICES)
 def test_sampler_dry(device: str):
     vocab_size = 8
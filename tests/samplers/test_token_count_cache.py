@@ -0,0 +1,177 @@
+import random
+from array import array
+from typing import Dict, List
+
+import torch
+
+from aphrodite.common.sequence import (SamplingParams, SequenceData,
+                                       SequenceGroupMetadata)
+from aphrodite.common.utils import make_tensor_with_pad
+from aphrodite.constants import APHRODITE_TOKEN_ID_ARRAY_TYPE
+from aphrodite.modeling.layers.sampler import _get_bin_counts_and_mask
+from aphrodite.modeling.sampling_metadata import (SamplingMetadata,
+                                                  TokenCountCache)
+
+VOCAB_SIZE = 32
+
+
+def _expected_counts(sampling_metadata: SamplingMetadata, num_rows: int):
+    prompt_tokens: List[array] = [array(APHRODITE_TOKEN_ID_ARRAY_TYPE)
+                                  ] * num_rows
+    output_tokens = list(prompt_tokens)
+    for seq_group in sampling_metadata.seq_groups:
+        if seq_group.sampling_params.repetition_penalty == 1.0:
+            continue
+        for seq_id, row in zip(seq_group.seq_ids, seq_group.sample_indices):
+            seq_data = seq_group.seq_data[seq_id]
+            prompt_tokens[row] = seq_data.prompt_token_ids_array
+            output_tokens[row] = seq_data.output_token_ids_array
+    _, prompt_mask = _get_bin_counts_and_mask(
+        make_tensor_with_pad(prompt_tokens, VOCAB_SIZE, dtype=torch.long),
+        VOCAB_SIZE, num_rows)
+    output_counts, _ = _get_bin_counts_and_mask(
+        make_tensor_with_pad(output_tokens, VOCAB_SIZE, dtype=torch.long),
+        VOCAB_SIZE, num_rows)
+    return prompt_mask, output_counts
+
+
+def test_token_count_cache():
+    rng = random.Random(0)
+    cache = TokenCountCache(max_num_seqs=4, pin_memory=False)
+    penalized = SamplingParams(repetition_penalty=1.2)
+    running: Dict[str, SequenceGroupMetadata] = {}
+    next_id = 0
+    for _ in range(100):
+        finished_requests_ids = [
+            request_id for request_id in running if rng.random() < 0.1
+        ]
+        for request_id in finished_requests_ids:
+            del running[request_id]
+        while len(running) < 6:
+            # Some requests without penalties, and some with prompt logprobs
+            # that have more logits rows than sequences.
+            params = penalized if rng.random() < 0.7 else SamplingParams()
+            if rng.random() < 0.3:
+                params = params.clone()
+                params.prompt_logprobs = 1
+            prompt = [rng.randrange(VOCAB_SIZE) for _ in range(8)]
+            running[str(next_id)] = SequenceGroupMetadata(
+                request_id=str(next_id),
+                is_prompt=True,
+                seq_data={
+                    next_id:
+                    SequenceData(array(APHRODITE_TOKEN_ID_ARRAY_TYPE, prompt))
+                },
+                sampling_params=params,
+                block_tables={next_id: [1]},
+            )
+            next_id += 1
+
+        # A subset of the running requests, like with pipeline parallelism.
+        batch = rng.sample(list(running.values()), rng.randint(1, 6))
+        seq_lens = [
+            next(iter(seq_group_metadata.seq_data.values())).get_len()
+            for seq_group_metadata in batch
+        ]
+        query_lens = [
+            seq_len if seq_group_metadata.is_prompt else 1
+            for seq_len, seq_group_metadata in zip(seq_lens, batch)
+        ]
+        cache.release_finished_requests(finished_requests_ids)
+        cache.add_requests(batch)
+        sampling_metadata = SamplingMetadata.prepare(batch,
+                                                     seq_lens,
+                                                     query_lens,
+                                                     device="cpu",
+                                                     pin_memory=False,
+                                                     token_count_cache=cache)
+        num_rows = sum(
+            len(seq_group.prompt_logprob_indices) +
+            len(seq_group.sample_indices)
+            for seq_group in sampling_metadata.seq_groups)
+
+        prompt_mask, output_counts = cache.get_counts(sampling_metadata,
+                                                      num_rows, VOCAB_SIZE,
+                                                      torch.device("cpu"))
+        expected_mask, expected_counts = _expected_counts(
+            sampling_metadata, num_rows)
+        assert torch.equal(prompt_mask, expected_mask)
+        assert torch.equal(output_counts.long(), expected_counts)
+        # The rows are reused past max_num_seqs, unless a batch needs more.
+        assert cache.prompt_mask.shape[0] <= 7
+
+        for seq_group_metadata in batch:
+            seq_group_metadata.is_prompt = False
+            for seq_data in seq_group_metadata.seq_data.values():
+                seq_data.append_token_id(rng.randrange(VOCAB_SIZE), 0.0)
+
+
+def test_token_count_cache_multi_step():
+    """The steps of a multi-step decode count their sampled tokens on device,
+    and the tokens are not counted again once the sequences get them."""
+    rng = random.Random(0)
+    cache = TokenCountCache(max_num_seqs=4, pin_memory=False)
+    batch = [
+        SequenceGroupMetadata(
+            request_id=str(i),
+            is_prompt=False,
+            seq_data={
+                i:
+                SequenceData(
+                    array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
+                          [rng.randrange(VOCAB_SIZE) for _ in range(8)]))
+            },
+            sampling_params=SamplingParams(
+                repetition_penalty=1.2 if i % 2 else 1.0),
+            block_tables={i: [1]},
+        ) for i in range(4)
+    ]
+    cache.add_requests(batch)
+    penalized_rows = torch.tensor([0, 1, 0, 1], dtype=torch.bool)
+    num_rows = len(batch)
+    device = torch.device("cpu")
+
+    def prepare() -> SamplingMetadata:
+        seq_lens = [
+            next(iter(seq_group_metadata.seq_data.values())).get_len()
+            for seq_group_metadata in batch
+        ]
+        return SamplingMetadata.prepare(batch,
+                                        seq_lens, [1] * num_rows,
+                                        device="cpu",
+                                        pin_memory=False,
+                                        token_count_cache=cache)
+
+    for _ in range(3):
+        sampling_metadata = prepare()
+        cache.get_counts(sampling_metadata, num_rows, VOCAB_SIZE, device)
+        expected_mask, expected_counts = _expected_counts(
+            sampling_metadata, num_rows)
+        # Like the multi-step runner, the tokens of all the steps but the
+        # last are added on device, as the sequences only get them after
+        # the last step.
+        steps = [[rng.randrange(VOCAB_SIZE) for _ in range(num_rows)]
+                 for _ in range(4)]
+        for step in steps[:-1]:
+            sampled_token_ids = torch.tensor(step).unsqueeze(-1)
+            cache.add_sampled_tokens(sampling_metadata, sampled_token_ids)
+            expected_counts[torch.arange(num_rows)[penalized_rows],
+                            sampled_token_ids[penalized_rows, 0]] += 1
+            prompt_mask, output_counts = cache.get_last_counts(
+                sampling_metadata, num_rows, VOCAB_SIZE, device)
+            assert torch.equal(prompt_mask, expected_mask)
+            assert torch.equal(output_counts.long(), expected_counts)
+
+        for step in steps:
+            for token_id, seq_group_metadata in zip(step, batch):
+                for seq_data in seq_group_metadata.seq_data.values():
+                    seq_data.append_token_id(token_id, 0.0)
+        # The next batch counts the tokens of the last step only.
+        sampling_metadata = prepare()
+        prompt_mask, output_counts = cache.get_counts(sampling_metadata,
+                                                      num_rows, VOCAB_SIZE,
+                                                      device)
+        expected_mask, expected_counts = _expected_counts(
+            sampling_metadata, num_rows)
+        assert torch.equal(prompt_mask, expected_mask)
+        assert torch.equal(output_counts.long(), expected_counts)
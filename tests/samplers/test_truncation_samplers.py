@@ -0,0 +1,94 @@
+import random
+
+import pytest
+import torch
+
+from aphrodite.modeling.layers.sampler import (_TRUNCATION_SAMPLERS, SamplerID,
+                                               _apply_epsilon_cutoff,
+                                               _apply_eta_cutoff, _apply_min_p,
+                                               _apply_tfs, _apply_top_a,
+                                               _apply_top_k_top_p,
+                                               _apply_top_nsigma,
+                                               _apply_truncation_samplers,
+                                               _apply_typical_sampling,
+                                               _plan_truncation_samplers)
+
+VOCAB_SIZE = 200
+BATCH_SIZE = 16
+
+_SAMPLERS = {
+    SamplerID.TOP_NSIGMA: (_apply_top_nsigma, lambda rng: rng.uniform(0.5, 3)),
+    SamplerID.TOP_P_TOP_K: (_apply_top_k_top_p, lambda rng:
+                            (rng.uniform(0.3, 1), rng.randint(1, VOCAB_SIZE))),
+    SamplerID.TOP_A: (_apply_top_a, lambda rng: rng.uniform(0, 1)),
+    SamplerID.MIN_P: (_apply_min_p, lambda rng: rng.uniform(0, 0.2)),
+    SamplerID.TFS: (_apply_tfs, lambda rng: rng.uniform(0.5, 1)),
+    SamplerID.ETA_CUTOFF: (_apply_eta_cutoff, lambda rng: rng.uniform(0, 0.05)),
+    SamplerID.EPSILON_CUTOFF: (_apply_epsilon_cutoff,
+                               lambda rng: rng.uniform(0, 0.05)),
+    SamplerID.TYPICAL_P: (_apply_typical_sampling,
+                          lambda rng: rng.uniform(0.3, 1)),
+}
+
+_NEUTRAL_PARAMS = {
+    SamplerID.TOP_NSIGMA: 0.0,
+    SamplerID.TOP_P_TOP_K: (1.0, VOCAB_SIZE),
+    SamplerID.TOP_A: 0.0,
+    SamplerID.MIN_P: 0.0,
+    SamplerID.TFS: 1.0,
+    SamplerID.ETA_CUTOFF: 0.0,
+    SamplerID.EPSILON_CUTOFF: 0.0,
+    SamplerID.TYPICAL_P: 1.0,
+}
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_apply_truncation_samplers(seed: int):
+    rng = random.Random(seed)
+    torch.manual_seed(seed)
+    sampler_ids = rng.sample(
+        [s for s in _SAMPLERS if s != SamplerID.TYPICAL_P], rng.randint(1, 7))
+    if rng.random() < 0.5:
+        sampler_ids.append(SamplerID.TYPICAL_P)
+
+    samplers = []
+    for sampler_id in sampler_ids:
+        # Some rows don't use the sampler, like in a mixed batch.
+        params = [
+            _SAMPLERS[sampler_id][1](rng)
+            if rng.random() < 0.8 else _NEUTRAL_PARAMS[sampler_id]
+            for _ in range(BATCH_SIZE)
+        ]
+        if sampler_id == SamplerID.TOP_P_TOP_K:
+            top_ps, top_ks = zip(*params)
+            args = (torch.tensor(top_ps, dtype=torch.float64),
+                    torch.tensor(top_ks, dtype=torch.int))
+        else:
+            args = (torch.tensor(params, dtype=torch.float64), )
+        assert len(args) == len(_TRUNCATION_SAMPLERS[sampler_id])
+        samplers.append((sampler_id, args))
+
+    logits = torch.randn(BATCH_SIZE, VOCAB_SIZE, dtype=torch.float64) * 3
+    # Banned tokens.
+    logits[0, :10] = -float("inf")
+
+    expected = logits.clone()
+    for sampler_id, args in samplers:
+        expected = _SAMPLERS[sampler_id][0](
+            expected, *(arg.clone() for arg in args))
+    actual = _apply_truncation_samplers(logits.clone(), samplers)
+    torch.testing.assert_close(actual, expected)
+
+
+def test_plan_truncation_samplers():
+    order = (SamplerID.TEMPERATURE, SamplerID.TOP_P_TOP_K, SamplerID.MIN_P,
+             SamplerID.TYPICAL_P, SamplerID.TFS, SamplerID.EPSILON_CUTOFF,
+             SamplerID.XTC, SamplerID.TOP_A, SamplerID.ETA_CUTOFF)
+    enabled = set(order) - {SamplerID.MIN_P, SamplerID.EPSILON_CUTOFF}
+    assert _plan_truncation_samplers(order, enabled) == [
+        SamplerID.TEMPERATURE,
+        (SamplerID.TOP_P_TOP_K, SamplerID.TYPICAL_P),
+        SamplerID.TFS,
+        SamplerID.XTC,
+        (SamplerID.TOP_A, SamplerID.ETA_CUTOFF),
+    ]
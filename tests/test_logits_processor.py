@@ -95,3 +95,59 @@ def test_logits_processors(seed: int, device: str):
                                fake_logits[:, 1],
                                rtol=1e-4,
                                atol=0.0)
+
+
+class AllowedTokensProcessor:
+    """Allows a single token, given as a packed mask."""
+
+    def __init__(self, token_id: int):
+        self.token_id = token_id
+
+    def get_allowed_tokens_mask(self, input_ids, vocab_size, seq_id=None):
+        mask = torch.zeros((vocab_size + 7) // 8,
+                           dtype=torch.uint8,
+                           device="cpu")
+        mask[self.token_id // 8] = 1 << (self.token_id % 8)
+        return mask
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_allowed_tokens_masks(device: str):
+    set_random_seed(0)
+    torch.set_default_device(device)
+    batch_size = 8
+    input_tensor, fake_logits, logits_processor = _prepare_test(batch_size)
+
+    seq_group_metadata_list = []
+    seq_lens = []
+    for i in range(batch_size):
+        # Only the odd rows are masked.
+        logits_processors = [AllowedTokensProcessor(i)] if i % 2 else []
+        seq_group_metadata_list.append(
+            SequenceGroupMetadata(
+                request_id=f"test_{i}",
+                is_prompt=True,
+                seq_data={0: SequenceData([1, 2, 3])},
+                sampling_params=SamplingParams(
+                    temperature=0, logits_processors=logits_processors),
+                block_tables={0: [1]},
+            ))
+        seq_lens.append(seq_group_metadata_list[-1].seq_data[0].get_len())
+
+    sampling_metadata = SamplingMetadata.prepare(
+        seq_group_metadata_list,
+        seq_lens,
+        query_lens=seq_lens,
+        device=device,
+        pin_memory=is_pin_memory_available())
+    logits_processor_output = logits_processor(
+        lm_head=None,
+        hidden_states=input_tensor,
+        sampling_metadata=sampling_metadata)
+
+    for i in range(batch_size):
+        row = logits_processor_output[i]
+        if i % 2:
+            assert torch.isfinite(row).nonzero().flatten().tolist() == [i]
+        else:
+            assert torch.isfinite(row).all()
@@ -1,6 +1,9 @@
 """Tests for the SamplingParams class.
 """
+import pytest
+
 from aphrodite import SamplingParams
+from aphrodite.common.sampling_params import RequestOutputKind
 
 
 def test_max_tokens_none():
@@ -8,6 +11,21 @@ def test_max_tokens_none():
     SamplingParams(temperature=0.01, top_p=0.1, max_tokens=None)
 
 
+def test_delta_outputs_beam_search():
+    """Delta outputs are not supported with beam search"""
+    with pytest.raises(ValueError):
+        SamplingParams(use_beam_search=True,
+                       best_of=2,
+                       temperature=0.0,
+                       output_kind=RequestOutputKind.DELTA)
+
+
+def test_stop_token_sequences():
+    sampling_params = SamplingParams(stop_token_sequences=[(1, 2), [3]])
+    assert sampling_params.stop_token_sequences == [[1, 2], [3]]
+    with pytest.raises(ValueError):
+        SamplingParams(stop_token_sequences=[[1, 2], []])
+
+
 if __name__ == "__main__":
-    import pytest
     pytest.main([__file__])
@@ -1,8 +1,17 @@
+import random
+from array import array
+
+import msgspec
 import pytest
 
+from aphrodite.common.outputs import RequestOutput
+from aphrodite.common.sampling_params import RequestOutputKind, SamplingParams
 from aphrodite.common.sequence import (CompletionSequenceGroupOutput,
-                                       SamplerOutput, SequenceData,
-                                       SequenceOutput)
+                                       FlatLogprobs, Logprob, SamplerOutput,
+                                       SequenceData, SequenceOutput,
+                                       SequenceStatus)
+from aphrodite.constants import APHRODITE_TOKEN_ID_ARRAY_TYPE
+from aphrodite.executor.msgspec_utils import encode_hook
 
 from .core.utils import create_dummy_prompt
 
@@ -75,6 +84,34 @@ def test_sequence_data_prefill():
     assert seq_data.get_num_computed_tokens() == 0
 
 
+@pytest.mark.parametrize("ngram_size", [1, 2, 3, 5])
+def test_banned_ngram_tokens(ngram_size: int):
+    rng = random.Random(ngram_size)
+    seq_data = SequenceData(
+        array(APHRODITE_TOKEN_ID_ARRAY_TYPE,
+              [rng.randrange(4) for _ in range(10)]))
+    for _ in range(200):
+        token_ids = seq_data.get_token_ids()
+        # Every n-gram of the sequence, as in HF transformers.
+        expected = {
+            token_ids[i + ngram_size - 1]
+            for i in range(len(token_ids) - ngram_size + 1)
+            if token_ids[i:i + ngram_size - 1] ==
+            token_ids[len(token_ids) - ngram_size + 1:]
+        }
+        assert seq_data.get_banned_ngram_tokens(ngram_size) == expected
+        seq_data.append_token_id(rng.randrange(4), logprob=0.0)
+
+    # The index is rebuilt when the output tokens are replaced.
+    seq_data.output_token_ids = [0, 1, 2]
+    token_ids = seq_data.get_token_ids()
+    banned = seq_data.get_banned_ngram_tokens(2)
+    assert banned == {
+        token_ids[i + 1]
+        for i in range(len(token_ids) - 1) if token_ids[i] == token_ids[-1]
+    }
+
+
 def test_sequence_group_stage():
     _, seq_group = create_dummy_prompt("1", 12)
     assert seq_group.is_prefill() is True
@@ -96,3 +133,83 @@ def test_sequence_group_stage():
     assert seq_group.is_prefill() is True
     seq_group.update_num_computed_tokens(1)
     assert seq_group.is_prefill() is False
+
+
+def test_delta_request_outputs():
+    seq, seq_group = create_dummy_prompt("1", prompt_length=4)
+    # The text ends with up to 2 characters of a stop string, held back
+    # until the sequence finishes.
+    seq_group.sampling_params = SamplingParams(
+        logprobs=0, stop=["xyz"], output_kind=RequestOutputKind.DELTA)
+    seq_group.prompt_logprobs = [None, {1: Logprob(-1.0)}]
+
+    seq.append_token_id(10, {10: Logprob(-0.5)})
+    seq.output_text = "ab"
+    output = RequestOutput.from_seq_group(seq_group)
+    assert output.prompt_logprobs == [None, {1: Logprob(-1.0)}]
+    assert output.outputs[0].text == ""
+    assert list(output.outputs[0].token_ids) == [10]
+    assert output.outputs[0].logprobs == [{10: Logprob(-0.5)}]
+
+    seq.append_token_id(11, {11: Logprob(-0.25)})
+    seq.append_token_id(12, {12: Logprob(-0.125)})
+    seq.output_text = "abcde"
+    output = RequestOutput.from_seq_group(seq_group)
+    assert output.prompt_logprobs is None
+    assert output.outputs[0].text == "abc"
+    assert list(output.outputs[0].token_ids) == [11, 12]
+    assert output.outputs[0].logprobs == [{
+        11: Logprob(-0.25)
+    }, {
+        12: Logprob(-0.125)
+    }]
+
+    seq.status = SequenceStatus.FINISHED_STOPPED
+    output = RequestOutput.from_seq_group(seq_group)
+    assert output.outputs[0].text == "de"
+    assert list(output.outputs[0].token_ids) == []
+    assert output.outputs[0].logprobs == []
+    assert output.finished
+
+
+def test_flat_logprobs():
+    positions = [
+        None,
+        {
+            5: Logprob(-0.5, 2, "a"),
+            7: Logprob(-0.1, 1)
+        },
+        {
+            3: Logprob(-1.0, 1, "b")
+        },
+        None,
+    ]
+    flat = FlatLogprobs()
+    flat.extend(positions[:2])
+    flat.append(positions[2])
+    flat += positions[3:]
+    assert len(flat) == 4
+    assert flat == positions and list(flat) == positions
+    assert flat[1] == positions[1] and flat[-1] is None
+    with pytest.raises(IndexError):
+        flat[4]
+    assert flat[1:3] == positions[1:3] and flat[::2] == positions[::2]
+    assert flat[3:1] == []
+    assert [None] + flat[1:] == positions
+    assert flat[:2] + flat[2:] == positions
+    assert isinstance([None] + flat[1:], FlatLogprobs)
+
+    # A token that occurs twice takes the values of its last entry.
+    duplicates = FlatLogprobs([0, 2], [4, 4], [-0.5, -0.5], [3, 1],
+                              [None, "c"])
+    assert duplicates[0] == {4: Logprob(-0.5, 1, "c")}
+
+    # The columns are arrays, sent as lists like by the Ray workers.
+    assert isinstance(flat.token_ids, array)
+    output = CompletionSequenceGroupOutput(samples=[], prompt_logprobs=flat)
+    encoded = msgspec.msgpack.Encoder(enc_hook=encode_hook).encode(output)
+    decoded = msgspec.msgpack.decode(encoded,
+                                     type=CompletionSequenceGroupOutput)
+    assert isinstance(decoded.prompt_logprobs, FlatLogprobs)
+    assert isinstance(decoded.prompt_logprobs.token_ids, array)
+    assert decoded == output
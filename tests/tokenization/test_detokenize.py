@@ -3,10 +3,11 @@ from typing import Any, Dict, List, Optional
 import pytest
 from transformers import AutoTokenizer
 
-from aphrodite.common.sequence import (Logprob, SamplingParams, Sequence,
-                                       SequenceGroup)
-from aphrodite.transformers_utils.detokenizer import (Detokenizer,
-                                                      detokenize_incrementally)
+from aphrodite.common.sequence import (FlatLogprobs, Logprob, SamplingParams,
+                                       Sequence, SequenceGroup)
+from aphrodite.transformers_utils.detokenizer import (
+    Detokenizer, convert_prompt_ids_to_tokens,
+    detokenize_candidates_incrementally, detokenize_incrementally)
 from aphrodite.transformers_utils.tokenizer_group import get_tokenizer_group
 
 TRUTH = [
@@ -92,6 +93,41 @@ def test_decode_streaming(tokenizer_id, truth, with_prompt,
     assert decoded_text == ''
 
 
+@pytest.mark.parametrize("truth", TRUTH)
+@pytest.mark.parametrize("tokenizer_id", TOKENIZERS)
+@pytest.mark.parametrize("skip_special_tokens", (True, False))
+def test_decode_candidates(tokenizer_id, truth, skip_special_tokens):
+    """Verify the candidates decoded together get the same texts as when
+    each is decoded as the new token."""
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+    truth_tokens = tokenizer(truth, add_special_tokens=False)["input_ids"]
+    prev_tokens, prefix_offset, read_offset = convert_prompt_ids_to_tokens(
+        tokenizer, truth_tokens, skip_special_tokens=skip_special_tokens)
+    candidate_ids = truth_tokens + [
+        tokenizer.eos_token_id,
+        len(tokenizer),
+    ]
+
+    candidate_texts = detokenize_candidates_incrementally(
+        tokenizer,
+        candidate_ids,
+        prev_tokens,
+        prefix_offset,
+        read_offset,
+        skip_special_tokens=skip_special_tokens)
+
+    expected_texts = [
+        detokenize_incrementally(tokenizer,
+                                 truth_tokens + [candidate_id],
+                                 prev_tokens,
+                                 prefix_offset,
+                                 read_offset,
+                                 skip_special_tokens=skip_special_tokens)[1]
+        for candidate_id in candidate_ids
+    ]
+    assert candidate_texts == expected_texts
+
+
 @pytest.fixture
 def detokenizer(tokenizer_name: str) -> Detokenizer:
     init_kwargs = dict(
@@ -226,6 +262,46 @@ def test_decode_prompt_logprobs(complete_sequence_token_ids: List[int],
     ])
 
 
+@pytest.mark.parametrize("complete_sequence", TRUTH)
+@pytest.mark.parametrize("tokenizer_name", TOKENIZERS)
+def test_decode_flat_prompt_logprobs(complete_sequence_token_ids: List[int],
+                                     detokenizer: Detokenizer):
+    """Verify FlatLogprobs prompt logprobs decode like the list ones."""
+    sampling_params = SamplingParams(skip_special_tokens=True,
+                                     prompt_logprobs=1)
+
+    def decode(prompt_logprobs):
+        seq = create_sequence(complete_sequence_token_ids)
+        seq_group = SequenceGroup(request_id="1",
+                                  seqs=[seq],
+                                  sampling_params=sampling_params,
+                                  arrival_time=0.0)
+        detokenizer.decode_prompt_logprobs_inplace(seq_group,
+                                                   prompt_logprobs,
+                                                   position_offset=0)
+        return prompt_logprobs
+
+    list_logprobs = decode(
+        create_dummy_prompt_logprobs(complete_sequence_token_ids))
+    flat_logprobs = FlatLogprobs()
+    # The first position has no logprobs, as prepended by the output
+    # processor.
+    flat_logprobs.extend(
+        create_dummy_prompt_logprobs(complete_sequence_token_ids))
+    flat_logprobs = decode(flat_logprobs)
+
+    assert flat_logprobs[0] is None
+    for list_position, flat_position in zip(list_logprobs[1:],
+                                            flat_logprobs[1:]):
+        assert {
+            token_id: logprob.decoded_token
+            for token_id, logprob in list_position.items()
+        } == {
+            token_id: logprob.decoded_token
+            for token_id, logprob in flat_position.items()
+        }
+
+
 @pytest.mark.parametrize("model", ["facebook/opt-125m"])
 @pytest.mark.parametrize("chunked_prefill_token_size", [1, 4, 7, 16, -1])
 def test_decode_prompt_logprobs_chunked_prefill(
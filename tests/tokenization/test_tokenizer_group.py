@@ -1,12 +1,17 @@
 import asyncio
 import os
 import sys
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 from typing import List, Optional
 from unittest.mock import patch
 
 import pytest
 from transformers import AutoTokenizer, PreTrainedTokenizerBase
 
+from aphrodite.common.config import TokenizerPoolConfig
 from aphrodite.transformers_utils.tokenizer_group import (TokenizerGroup,
                                                           get_tokenizer_group)
 from aphrodite.transformers_utils.tokenizer_group.ray_tokenizer_group import (
@@ -28,7 +33,7 @@ class CustomTokenizerGroup(TokenizerGroup):
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize("tokenizer_group_type",
-                         [None, "ray", CustomTokenizerGroup])
+                         [None, "ray", "mp", CustomTokenizerGroup])
 async def test_tokenizer_group(tokenizer_group_type):
     reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
     tokenizer_group = get_tokenizer_group(
@@ -52,7 +57,7 @@ async def test_tokenizer_group(tokenizer_group_type):
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("tokenizer_group_type", ["ray"])
+@pytest.mark.parametrize("tokenizer_group_type", ["ray", "mp"])
 async def test_tokenizer_group_pool(tokenizer_group_type):
     reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
     tokenizer_group_pool = get_tokenizer_group(
@@ -79,6 +84,37 @@ async def test_tokenizer_group_pool(tokenizer_group_type):
     assert results == expected_results
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("shm_min_tokens", [1, 1024])
+async def test_tokenizer_group_mp_pool_shared_memory(shm_min_tokens):
+    """Test that the multiprocessing pool returns the same token ids through
+    shared memory, and records the tokenization latencies."""
+    reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    tokenizer_pool_config = TokenizerPoolConfig(
+        pool_size=2,
+        pool_type="mp",
+        extra_config={
+            "max_queue_size": 1,
+            "shm_min_tokens": shm_min_tokens
+        })
+    tokenizer_group_pool = get_tokenizer_group(tokenizer_pool_config,
+                                               tokenizer_id="gpt2",
+                                               enable_lora=False,
+                                               max_num_seqs=1,
+                                               max_input_length=None)
+    prompts = [f"prompt {i} " * (i + 1) for i in range(10)]
+    results = await asyncio.gather(*[
+        tokenizer_group_pool.encode_async(
+            request_id=str(i), prompt=prompt, lora_request=None)
+        for i, prompt in enumerate(prompts)
+    ])
+    assert results == [reference_tokenizer.encode(p) for p in prompts]
+    assert tokenizer_group_pool.encode(
+        prompt=prompts[0]) == reference_tokenizer.encode(prompts[0])
+    assert len(tokenizer_group_pool.pop_tokenization_times()) == 11
+    assert tokenizer_group_pool.pop_tokenization_times() == []
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("tokenizer_group_type", ["ray"])
 async def test_tokenizer_group_ray_pool_env_var_propagation(
@@ -117,6 +153,91 @@ async def test_tokenizer_group_ray_pool_env_var_propagation(
         tokenizer_pool.ping()
 
 
+@pytest.mark.asyncio
+async def test_tokenizer_group_mp_pool_restarts_once():
+    """Test that the multiprocessing pool is restarted once when several
+    encodes see its workers die."""
+    reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    tokenizer_pool_config = TokenizerPoolConfig(pool_size=2,
+                                                pool_type="mp",
+                                                extra_config={})
+    tokenizer_group_pool = get_tokenizer_group(tokenizer_pool_config,
+                                               tokenizer_id="gpt2",
+                                               enable_lora=False,
+                                               max_num_seqs=1,
+                                               max_input_length=None)
+    await tokenizer_group_pool.encode_async(prompt="prompt")
+    broken_executor = tokenizer_group_pool._executor
+    for process in list(broken_executor._processes.values()):
+        process.kill()
+    # Let the executor notice that its workers died.
+    await asyncio.sleep(1)
+
+    with patch.object(tokenizer_group_pool,
+                      "_init_executor",
+                      wraps=tokenizer_group_pool._init_executor) as init:
+        results = await asyncio.gather(*[
+            tokenizer_group_pool.encode_async(prompt=f"prompt {i}")
+            for i in range(4)
+        ])
+    assert results == [
+        reference_tokenizer.encode(f"prompt {i}") for i in range(4)
+    ]
+    assert init.call_count == 1
+    assert tokenizer_group_pool._executor is not broken_executor
+    tokenizer_group_pool.check_health()
+
+
+@pytest.mark.asyncio
+async def test_tokenizer_group_mp_pool_cancelled_retry():
+    """Test that the shared memory of an encode cancelled while it is
+    retried on the restarted pool is released."""
+    tokenizer_pool_config = TokenizerPoolConfig(
+        pool_size=1, pool_type="mp", extra_config={"shm_min_tokens": 1})
+    tokenizer_group_pool = get_tokenizer_group(tokenizer_pool_config,
+                                               tokenizer_id="gpt2",
+                                               enable_lora=False,
+                                               max_num_seqs=1,
+                                               max_input_length=None)
+    submit_encode = tokenizer_group_pool._submit_encode
+    futures: List[Future] = []
+
+    def break_first_submit(*args, **kwargs):
+        if not futures:
+            future: Future = Future()
+            future.set_exception(BrokenProcessPool())
+        else:
+            future = submit_encode(*args, **kwargs)
+        futures.append(future)
+        return future
+
+    with patch.object(tokenizer_group_pool,
+                      "_submit_encode",
+                      side_effect=break_first_submit):
+        task = asyncio.create_task(
+            tokenizer_group_pool.encode_async(prompt="prompt " * 64))
+        # Cancel the encode once the retry was sent to the restarted pool,
+        # which loads its tokenizer before running it.
+        while len(futures) < 2 or not (futures[1].running()
+                                       or futures[1].done()):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    shm_name = futures[1].result(timeout=60).name
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            shared_memory.SharedMemory(name=shm_name).close()
+        except FileNotFoundError:
+            break
+        await asyncio.sleep(0.01)
+    else:
+        raise AssertionError("The shared memory of the retry was not "
+                             "released.")
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("tokenizer_group_type", ["ray"])
 async def test_tokenizer_group_ray_pool_fault_tolerance(tokenizer_group_type):
@@ -0,0 +1,60 @@
+import pytest
+import torch
+
+from aphrodite.processing.block.kv_offload import KVOffloadOp, KVOffloadTier
+from aphrodite.task_handler.cache_engine import KVOffloadCache
+
+
+@pytest.mark.parametrize("block_dim", [0, 1])
+def test_kv_offload_cache_round_trip(tmp_path, block_dim: int):
+    num_layers = 2
+    num_device_blocks = 4
+    shape = [2, 8, 16]
+    shape.insert(block_dim, num_device_blocks)
+    device_cache = [
+        torch.randn(shape, dtype=torch.bfloat16) for _ in range(num_layers)
+    ]
+    original = [layer.clone() for layer in device_cache]
+
+    tier = KVOffloadTier(num_cpu_blocks=1, num_disk_blocks=2)
+    cache = KVOffloadCache(device_cache,
+                           block_dim=block_dim,
+                           num_cpu_blocks=1,
+                           num_disk_blocks=2,
+                           disk_path=str(tmp_path))
+
+    def execute():
+        ops = torch.tensor(tier.get_and_reset_ops(),
+                           dtype=torch.int64).view(-1, 3)
+        cache.execute(ops)
+
+    # Evict blocks 0 and 1 from the device, spilling block 0 to disk, and
+    # overwrite them in the forward pass.
+    tier.demote(100, device_block_id=0)
+    tier.demote(101, device_block_id=1)
+    execute()
+    for layer in device_cache:
+        layer.index_fill_(block_dim, torch.tensor([0, 1]), 0)
+
+    # Promote both back into other device blocks, block 0 from disk.
+    assert tier.promote(100, device_block_id=2)
+    assert tier.promote(101, device_block_id=3)
+    execute()
+    for layer, orig in zip(device_cache, original):
+        assert torch.equal(layer.select(block_dim, 2),
+                           orig.select(block_dim, 0))
+        assert torch.equal(layer.select(block_dim, 3),
+                           orig.select(block_dim, 1))
+
+
+def test_kv_offload_cache_repeated_destination():
+    device_cache = [torch.arange(3, dtype=torch.float32).view(3, 1)]
+    cache = KVOffloadCache(device_cache, block_dim=0, num_cpu_blocks=1)
+    # The second write to the CPU block must win.
+    cache.execute(
+        torch.tensor([
+            [KVOffloadOp.DEVICE_TO_CPU, 0, 0],
+            [KVOffloadOp.DEVICE_TO_CPU, 1, 0],
+            [KVOffloadOp.CPU_TO_DEVICE, 0, 2],
+        ]))
+    assert device_cache[0].view(-1).tolist() == [0, 1, 1]